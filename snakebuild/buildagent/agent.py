@@ -18,17 +18,23 @@
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 ''' The snakebuild build agent run function to start a build agent. '''
 
+import sys
 import logging
 
 from snakebuild.common import output
 from snakebuild.common import Daemon
 from snakebuild.i18n import _
 from snakebuild.commands import handle_cmd
-from snakebuild.communication import Server
+from snakebuild.common.versioneddir import ReposConfig, \
+        VersionedDirException
+from snakebuild.communication import Server, get_engine, \
+        ClientCommunicationException
 # this needs to be imported to fill the REMOTE_COMMANDS
 import snakebuild.buildagent.agentcmds
-#from snakebuild.buildagent.buildagent import BuildAgent
-from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
+from snakebuild.buildagent.buildagent import BuildAgent
+from snakebuild.buildagent.commandlineparser import SHELL_COMMANDS, command
+from snakebuild.remote.buildagent import BuildAgent as RemoteBuildAgent, \
+        BuildAgentError
 
 LOG = logging.getLogger('snakebuild.buildagent.agent')
 
@@ -88,8 +94,71 @@ def start_agent(args, config):
     host = config.get_s('buildagent', 'hostname')
     port = config.get_s('buildagent', 'port')
     name = "ba_{0}".format(args.name.lower())
+    engine = get_engine(config.get_s('buildagent', 'server_engine'))
+    worker_count = config.get_s('buildagent', 'worker_count')
+    backlog = config.get_s('buildagent', 'backlog')
 
-#    agent = BuildAgent()
-    agent = None
-    Daemon(Server(host, port, name, agent), Daemon.START)
+    mirror_path = config.get_s('buildagent', 'repository_mirror')
+    try:
+        repos_config = ReposConfig(config.get_s('buildagent',
+                'repository_type'), config.get_s('buildagent',
+                'repository_source'), mirror_path if mirror_path else None)
+    except VersionedDirException, exc:
+        output.error(_('The repository source of the jobs is not valid. Fix '
+                'the configuration: {0}').format(exc))
+        return False
+    local_path = config.get_s('buildagent', 'repository_local')
+    # the budget is configured in MB
+    disk_budget = config.get_s('buildagent', 'worktree_budget') * 1024 * 1024
+    log_dir = config.get_s('buildagent', 'step_log_dir')
+    agent = BuildAgent(repos_config, local_path, disk_budget,
+            log_dir if log_dir else None)
+    Daemon(Server(host, port, name, agent, engine, worker_count, backlog),
+            Daemon.START)
+    return True
+
+
+@command('log', (
+    (('name',), {'help': _('The name of the log of the build step.')}),
+    (('--offset',), {'help': _('The offset (in bytes) to start at.'),
+        'type': int, 'default': 0}),
+    (('--follow',), {'action': 'store_true',
+        'help': _('Keep printing the log while it gets written until the '
+        'build step finished.'), 'default': False}),
+    (('--host',), {'help': _('The host of the build agent.'),
+        'default': 'localhost'}),
+    (('--port',), {'help': _('The network port of the build agent.'),
+        'type': int, 'default': None}),
+    ))
+def show_log(args, config):
+    ''' Print the log of a build step running on a build agent.
+
+        @param args: The arguments given with the command.
+        @param config: The config object to use
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    port = args.port
+    if port is None:
+        port = config.get_s('buildagent', 'port')
+    agent = RemoteBuildAgent(args.host, port, keep_alive=args.follow)
+    try:
+        if args.follow:
+            for data in agent.follow_log(args.name, args.offset):
+                sys.stdout.write(data.encode('utf-8'))
+                sys.stdout.flush()
+        else:
+            offset = args.offset
+            while True:
+                answer = agent.get_log(args.name, offset)
+                if len(answer['data']) == 0:
+                    break
+                sys.stdout.write(answer['data'].encode('utf-8'))
+                offset = answer['offset']
+    except (BuildAgentError, ClientCommunicationException), exc:
+        output.error(_('Could not read the log: {0}').format(exc))
+        return False
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
     return True
@@ -19,3 +19,4 @@
 ''' The snakebuild build agent remote commands package. '''
 
 import status
+import log_tail
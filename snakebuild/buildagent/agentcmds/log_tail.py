@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild build agent remote command log_tail. This command returns
+    a piece of the log of a build step and waits for it if the log did not
+    grow yet.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error, DeferredAnswer
+from snakebuild.communication.server import remote_command
+from snakebuild.buildagent.logtail import LogTailException, CHUNK_SIZE
+
+LOG = logging.getLogger('snakebuild.buildagent.commands')
+
+
+@remote_command('log_tail', False)
+def log_tail(buildagent, name, offset=0, size=CHUNK_SIZE, wait=None):
+    ''' This command returns the log of a build step from the given offset.
+        If there is nothing to read yet and a wait time is given the answer
+        is deferred until the log grows, is finished or the wait time is
+        over. A client follows a log by sending the offset of the answer
+        with the next request.
+
+        @param buildagent: The buildagent instance
+        @param name: The name of the log
+        @param offset: The offset (in bytes) to read from
+        @param size: The maximum number of bytes to return
+        @param wait: The maximum time in seconds to wait for the log to grow
+        @return: The answer object to return to the client or a
+            DeferredAnswer if the request has to wait
+    '''
+    if buildagent is None or buildagent.logs is None:
+        return prepare_error(_('The build agent does not provide its logs.'))
+    if type(offset) is not int or offset < 0:
+        return prepare_error(_('Illegal value for the offset. Expected a '
+                'positive integer but got {0}').format(offset))
+    if type(size) is not int or size <= 0 or size > CHUNK_SIZE:
+        return prepare_error(_('Illegal value for the size. Expected an '
+                'integer between 1 and {0:d} but got {1}').format(CHUNK_SIZE,
+                size))
+    if wait is not None and (type(wait) not in (int, float) or wait < 0):
+        return prepare_error(_('Illegal value for the wait time. Expected a '
+                'positive number but got {0}').format(wait))
+
+    try:
+        answer = buildagent.logs.read(name, offset, size)
+        if len(answer['data']) > 0 or answer['finished'] or not wait:
+            return prepare_answer(answer)
+
+        deferred = DeferredAnswer()
+        waiter = buildagent.logs.wait(name, offset, lambda:
+                deferred.set_answer(_read_answer(buildagent.logs, name,
+                offset, size)), wait)
+        deferred.add_cancel_callback(waiter.cancel)
+        return deferred
+    except LogTailException, exc:
+        return prepare_error(str(exc))
+
+
+def _read_answer(logs, name, offset, size):
+    ''' Read the log for a deferred answer.
+
+        @param logs: The LogTail object
+        @param name: The name of the log
+        @param offset: The offset to read from
+        @param size: The maximum number of bytes to read
+        @return: The answer object to return to the client
+    '''
+    try:
+        return prepare_answer(logs.read(name, offset, size))
+    except LogTailException, exc:
+        return prepare_error(str(exc))
@@ -18,6 +18,18 @@
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 ''' The snakebuild build agent instance that does all the building. '''
 
+import os
+import logging
+import threading
+
+from snakebuild.i18n import _
+from snakebuild.common.versioneddir import VersionedDirException, \
+        clone_repo, get_versioned_directory
+from snakebuild.common.worktreepool import WorktreePool
+from snakebuild.buildagent.logtail import LogTail
+
+LOG = logging.getLogger('snakebuild.buildagent.buildagent')
+
 
 class BuildAgent(object):
     ''' This is the BuildAgent object which runs a given script step by step.
@@ -30,24 +42,180 @@ class BuildAgent(object):
     '''
     IDLE, STARTING, RUNNING, WAITING, FINISH = range(5)
 
-    def __init__(self, repository_config):
+    def __init__(self, repository_config, local_path=None, disk_budget=0,
+            log_dir=None):
         ''' Create the BuildAgent object.
+
+            @param repository_config: The ReposConfig of the jobs
+            @param local_path: The directory to store the local clones and the
+                    checkouts of the jobs in
+            @param disk_budget: The maximum number of bytes the unused
+                    checkouts of one job might use, 0 for no limit.
+            @param log_dir: The directory with the logs of the build steps
+                    which can be read remotely (None for no access)
         '''
         self.is_running = False
         self.repository_config = repository_config
+        self.local_path = local_path
+        self.disk_budget = disk_budget
+        # the worktree pools for each job name and the (pool, worktree)
+        # of each running build by build id
+        self.pools = {}
+        self.builds = {}
+        self.pools_lock = threading.Lock()
+        self.logs = None
+        if log_dir is not None:
+            self.logs = LogTail(log_dir)
 
-    def start_build(self, job_name, version_name):
+    def start_build(self, job_name, version_name, build_id=None):
         ''' Start a build.
 
             @param job_name: The name of the job to build (the name of the
                     repository on the remote location.)
             @param version_name: The name of the version to use for building
                     this is might be the tag or branch name
+            @param build_id: The id of the build for finish_build and
+                    abort_build, the job name if None.
 
             @return: True on success (job got started), False on error
         '''
+        if build_id is None:
+            build_id = job_name
+        with self.pools_lock:
+            if build_id in self.builds:
+                LOG.error(_('The build {0} is already running.').format(
+                        build_id))
+                return False
+            # reserve the id while checking out
+            self.builds[build_id] = None
+            self.is_running = True
+        if self.local_path is None:
+            return True
+
+        try:
+            pool = self._get_pool(job_name)
+            worktree = pool.acquire(version_name)
+        except VersionedDirException, exc:
+            LOG.error(_('Could not check out the version {0} of the job '
+                    '{1}: {2}').format(version_name, job_name, exc))
+            self._end_build(build_id)
+            return False
+        with self.pools_lock:
+            self.builds[build_id] = (pool, worktree)
         return True
 
+    def get_worktree(self, build_id):
+        ''' Get the checkout of the given running build.
+
+            @param build_id: The id of the build (see start_build)
+            @return: The Worktree object or None
+        '''
+        with self.pools_lock:
+            build = self.builds.get(build_id)
+        if build is None:
+            return None
+        return build[1]
+
+    def finish_build(self, build_id):
+        ''' The build is finished, give its checkout back.
+
+            @param build_id: The id of the build (see start_build)
+        '''
+        self._end_build(build_id)
+
+    def abort_build(self, build_id):
+        ''' The build got stopped before it finished, give its checkout
+            back. The checkout gets cleaned before it is used again.
+
+            @param build_id: The id of the build (see start_build)
+        '''
+        LOG.warning(_('The build {0} got aborted.').format(build_id))
+        self._end_build(build_id)
+
+    def _end_build(self, build_id):
+        ''' Forget the given build and give its checkout back to the pool.
+
+            @param build_id: The id of the build
+        '''
+        with self.pools_lock:
+            build = self.builds.pop(build_id, None)
+            self.is_running = len(self.builds) > 0
+        if build is not None:
+            pool, worktree = build
+            pool.release(worktree)
+
+    def run_step(self, step, values, log_name):
+        ''' Run the given build step with its log (and the logs of its sub
+            steps) within the log directory. The clients following a log
+            are informed as soon as the log is complete.
+
+            @param step: The BuildStep object to run
+            @param values: The dictionary with the input values of the step
+            @param log_name: The name of the log within the log directory
+                    (the path of the log if there is no log directory)
+            @return: (status, output_dictionary)
+        '''
+        log_file_name = log_name
+        if self.logs is not None:
+            log_file_name = os.path.join(self.logs.directory, log_name)
+        step.log_callback = self.log_finished
+        try:
+            return step.run(values, log_file_name)
+        finally:
+            self.log_finished(log_file_name)
+
+    def log_finished(self, log_file_name):
+        ''' The log with the given path is complete, the clients following
+            it get informed.
+
+            @param log_file_name: The path of the log file
+        '''
+        if self.logs is None:
+            return
+        name = os.path.relpath(os.path.abspath(log_file_name),
+                os.path.abspath(self.logs.directory))
+        if name.startswith(os.pardir):
+            # not within the log directory
+            return
+        self.logs.finish(name)
+
+    def shutdown(self):
+        ''' Abort the running builds, remove the unused checkouts of all
+            the jobs and stop following the logs.
+        '''
+        if self.logs is not None:
+            self.logs.close()
+        with self.pools_lock:
+            build_ids = self.builds.keys()
+        for build_id in build_ids:
+            self.abort_build(build_id)
+        with self.pools_lock:
+            pools = self.pools.values()
+            self.pools = {}
+        for pool in pools:
+            pool.close()
+            pool.repo.close()
+
+    def _get_pool(self, job_name):
+        ''' Get the worktree pool of the given job. The repository gets
+            cloned on the first use and updated on every call.
+
+            @param job_name: The name of the job (repository)
+            @return: The WorktreePool object
+        '''
+        with self.pools_lock:
+            pool = self.pools.get(job_name)
+            if pool is None:
+                path = os.path.join(self.local_path, job_name)
+                if not os.path.isdir(path):
+                    clone_repo(job_name, path, self.repository_config)
+                pool = WorktreePool(get_versioned_directory(path),
+                        os.path.join(self.local_path,
+                        '{0}.worktrees'.format(job_name)), self.disk_budget)
+                self.pools[job_name] = pool
+        pool.repo.pull_remote()
+        return pool
+
     def status(self):
         ''' Get the current status of the agent. If it is building then get
             the current job step and if there where any errors or warnings.
@@ -20,5 +20,8 @@
 
 from snakebuild.buildagent.buildstep.buildstep import BuildStep, \
         BuildStepException, load_step
+from snakebuild.buildagent.buildstep.logchecker import LogChecker
+from snakebuild.buildagent.buildstep.multibuildstep import MultiBuildStep
 from snakebuild.buildagent.buildstep.pythonbuildstep import PythonBuildStep
 from snakebuild.buildagent.buildstep.shellbuildstep import ShellBuildStep
+from snakebuild.buildagent.buildstep.stepcache import StepCache
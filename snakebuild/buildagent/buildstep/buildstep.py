@@ -21,6 +21,7 @@
 import json
 import os
 import copy
+import hashlib
 import shutil
 import logging
 import subprocess
@@ -59,7 +60,7 @@ def load_step(filename):
             return PythonBuildStep(data)
         elif data["type"] == "multi":
             from multibuildstep import MultiBuildStep
-            return MultiBuildStep(data)
+            return MultiBuildStep(data, os.path.dirname(filename))
         else:
             LOG.error(_('The given build type for the build step is not '
                     'supported: {0} ({1})').format(data["type"], filename))
@@ -89,6 +90,22 @@ class BuildStep(object):
         # TODO do something more here
         self.log_check = stepdesc['checks']['log_check']
         self.on_error = stepdesc['checks']['on_error']
+        # the regular expressions of the log lines with errors or warnings
+        self.error_patterns = stepdesc['checks'].get('error_patterns', [])
+        self.warning_patterns = stepdesc['checks'].get('warning_patterns',
+                [])
+        # the glob patterns of the files the step creates
+        self.artifacts = stepdesc.get('artifacts', [])
+        # the result might be taken from the StepCache (steps depending on
+        # anything else than the input values and the sources opt out)
+        self.cacheable = stepdesc.get('cache', True)
+        self.definition = stepdesc
+        # the function called with (name, value) as soon as the step sets an
+        # output value while it runs
+        self.output_callback = None
+        # the function called by the runner with the log file name as soon
+        # as a run of the step wrote its log completely
+        self.log_callback = None
 
         self.result_status = self.NOTHING
         self.run_status = self.NOT_STARTED
@@ -105,6 +122,18 @@ class BuildStep(object):
         '''
         raise BuildStepException('NOT IMPLEMENTED')
 
+    def fingerprint(self):
+        ''' Get the hash of the definition and the script of this step.
+
+            @return: The hash as a hex string
+        '''
+        digest = hashlib.sha1(json.dumps(self.definition, sort_keys=True))
+        if os.path.isfile(self.script):
+            with open(self.script, 'rb') as sfl:
+                for data in iter(lambda: sfl.read(65536), ''):
+                    digest.update(data)
+        return digest.hexdigest()
+
 
 class Checks(object):
     ''' The input/output check handler '''
@@ -224,6 +253,26 @@ def _is_valid(data):
     if not isinstance(data["checks"]["on_error"], (str, unicode)):
         LOG.error(_('The on_error entry within checks is not a string.'))
         return False
+    for name in ('error_patterns', 'warning_patterns'):
+        if not name in data["checks"]:
+            continue
+        if (not isinstance(data["checks"][name], list) or
+                not all(isinstance(pattern, (str, unicode))
+                for pattern in data["checks"][name])):
+            LOG.error(_('The {0} entry within checks is not a list of '
+                    'strings.').format(name))
+            return False
+
+    if 'cache' in data and not isinstance(data['cache'], bool):
+        LOG.error(_('The cache entry within the build step is not a '
+                'boolean.'))
+        return False
+    if 'artifacts' in data and (not isinstance(data['artifacts'], list) or
+            not all(isinstance(pattern, (str, unicode))
+            for pattern in data['artifacts'])):
+        LOG.error(_('The artifacts entry within the build step is not a '
+                'list of strings.'))
+        return False
 
     return True
 
@@ -291,31 +340,16 @@ def _check_input_values(values, input_vars):
         result[name] = _check_value(result[name], description)
     return result
 
-def _parse_output_file(filename, output_vars):
-    ''' Parse the given output file. The values must be stored as key value
-        pairs. Where as the key and value are seperated with a equal sign.
-        The value might have double quotes to mark the beginning and the end
-        of the value.
-        If the value is stored in one line the double quotes are not
-        necessary.
+def _check_output_values(values, output_vars):
+    ''' Check the output values received from the build step against the
+        output variables specified. The values not set get their default
+        value and all the values are converted to the type specified.
 
-        @param filename: The file with the key value pairs.
+        @param values: The dictionary with the values received
         @param output_vars: The variables
-        @return: a dictionary with the key value pairs.
+        @return: a dictionary with the checked values.
     '''
-    result = {}
-    # parse file
-    if os.path.isfile(filename):
-        with open(filename, 'r') as retfile:
-            for line in retfile.readlines():
-                values = line.split('=')
-                if len(values) == 2:
-                    value = values[1].strip()
-                    if value.startswith('"'):
-                        value = value[1:]
-                    if value.endswith('"'):
-                        value = value[:-1]
-                    result[values[0].strip()] = value
+    result = dict(values)
 
     # check with defined output variables
     for name, description in output_vars.iteritems():
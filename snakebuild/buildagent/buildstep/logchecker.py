@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The LogChecker searches the output of a build step for errors and
+    warnings while the step runs. The output is given piece by piece as it
+    is read, only the last incomplete line is kept, therefore the memory
+    used does not depend on the size of the log.
+'''
+
+import re
+
+from snakebuild.buildagent.buildstep.buildstep import BuildStepException
+
+# the maximum length of a line, longer lines get checked in pieces
+MAX_LINE_LENGTH = 65536
+# the number of matches kept to report
+MAX_MATCHES = 100
+# the maximum length of a matching line kept
+MAX_MATCH_LENGTH = 512
+
+# the parts of a pattern which change their meaning within a combined
+# regular expression: backreferences and inline flags
+_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[iLmsux]+\)')
+
+
+class LogChecker(object):
+    ''' Check the log lines against the error and warning patterns. All the
+        patterns of one kind are combined into one regular expression, a line
+        is checked with one search per kind. A line matching an error
+        pattern is not checked for warnings.
+    '''
+    ERROR, WARNING = 'error', 'warning'
+
+    def __init__(self, error_patterns, warning_patterns):
+        ''' Create the log checker.
+
+            @param error_patterns: The list of the regular expressions of the
+                    lines showing an error
+            @param warning_patterns: The list of the regular expressions of
+                    the lines showing a warning
+        '''
+        self.matchers = [(self.ERROR, _PatternSet(error_patterns)),
+                (self.WARNING, _PatternSet(warning_patterns))]
+        # the number of lines per kind and per pattern
+        self.counts = {self.ERROR: 0, self.WARNING: 0}
+        self.pattern_counts = dict((pattern, 0) for pattern in
+                error_patterns + warning_patterns)
+        # the first matches: (kind, line number, pattern, line)
+        self.matches = []
+        self.line_number = 0
+        self.rest = ''
+
+    @property
+    def errors(self):
+        ''' The number of lines with an error found. '''
+        return self.counts[self.ERROR]
+
+    @property
+    def warnings(self):
+        ''' The number of lines with a warning found. '''
+        return self.counts[self.WARNING]
+
+    def check(self, data):
+        ''' Check the given output. The last line is kept until the rest of
+            it arrives (or finish is called).
+
+            @param data: The output read
+            @return: True if an error was found within the complete lines
+        '''
+        lines = (self.rest + data).split('\n')
+        self.rest = lines.pop()
+        if len(self.rest) > MAX_LINE_LENGTH:
+            lines.append(self.rest)
+            self.rest = ''
+        errors = self.errors
+        for line in lines:
+            self._check_line(line)
+        return self.errors > errors
+
+    def finish(self):
+        ''' Check the last line if the output does not end with a newline.
+
+            @return: True if an error was found within the last line
+        '''
+        if len(self.rest) == 0:
+            return False
+        line = self.rest
+        self.rest = ''
+        errors = self.errors
+        self._check_line(line)
+        return self.errors > errors
+
+    def _check_line(self, line):
+        ''' Check one line and count the match.
+
+            @param line: The line (without newline)
+        '''
+        self.line_number += 1
+        for kind, matcher in self.matchers:
+            pattern = matcher.search(line)
+            if pattern is None:
+                continue
+            self.counts[kind] += 1
+            self.pattern_counts[pattern] += 1
+            if len(self.matches) < MAX_MATCHES:
+                self.matches.append((kind, self.line_number, pattern,
+                        line[:MAX_MATCH_LENGTH]))
+            return
+
+
+class _PatternSet(object):
+    ''' A list of regular expressions combined into one. Most of the lines
+        do not match, they are rejected with one search. Only for a matching
+        line the patterns are checked one by one to find the one matching.
+        Patterns which change their meaning when joined (group names,
+        backreferences, inline flags) are searched on their own.
+    '''
+
+    def __init__(self, patterns):
+        ''' Compile the patterns.
+
+            @param patterns: The list of the regular expressions
+        '''
+        self.patterns = []
+        # the patterns not part of the combined regular expression
+        self.separate = []
+        combined = []
+        for pattern in patterns:
+            try:
+                compiled = re.compile(pattern)
+            except re.error, exc:
+                raise BuildStepException('The log pattern is not a valid '
+                        'regular expression: {0} ({1})'.format(pattern, exc))
+            self.patterns.append((pattern, compiled))
+            if compiled.groupindex or _NOT_COMBINABLE.search(pattern):
+                self.separate.append(compiled)
+            else:
+                combined.append(pattern)
+
+        self.regex = None
+        if len(combined) > 0:
+            try:
+                self.regex = re.compile('|'.join('(?:{0})'.format(pattern)
+                        for pattern in combined))
+            except (re.error, OverflowError, AssertionError):
+                # the joined patterns are not valid (python 2 raises an
+                # AssertionError for more than 100 groups), they only work
+                # one by one
+                self.separate = [compiled for _pattern, compiled in
+                        self.patterns]
+
+    def search(self, line):
+        ''' Search the line for the patterns.
+
+            @param line: The line to check
+            @return: The pattern found or None
+        '''
+        if ((self.regex is None or self.regex.search(line) is None) and
+                not any(compiled.search(line) is not None
+                    for compiled in self.separate)):
+            return None
+        for pattern, compiled in self.patterns:
+            if compiled.search(line) is not None:
+                return pattern
+        return None
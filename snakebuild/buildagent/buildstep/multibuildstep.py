@@ -16,31 +16,132 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
-''' The build step for the build steps on the build agent. '''
+''' The build step running other build steps. The sub steps are run as a
+    dependency graph: a step which uses the output of another step as input
+    (or lists it within its 'after' entry) waits for it, all the other steps
+    run in parallel on a bounded number of threads.
 
+    The sub steps are specified within the 'build_steps' list of the step
+    file. Each entry has a unique 'name', the 'type' which is the name of the
+    step file (without the .step extension) within the same directory and the
+    'input' values. A value starting with a $ is a reference: '$name' is the
+    input value with the given name of this step and '$step.name' the output
+    value with the given name of a sub step specified before. The 'results'
+    dictionary maps the output values of this step the same way. If a sub
+    step fails the steps depending on it get cancelled, if its on_error check
+    is 'abort' all the steps not yet started get cancelled. The number of
+    threads is given with 'workers' (the number of cores by default). If the
+    cache attribute is set to a StepCache the sub steps are run through it.
+
+    A sub step with 'stream' set to true does not wait for the steps it
+    takes values from to finish, it starts as soon as all the values it uses
+    are set (the steps listed within 'after' are still waited for). The
+    output values of this step mapped from the values of a sub step are
+    handed to the output callback as soon as the sub step sets them.
+
+        "build_steps": [
+            {"name": "compile", "type": "compile",
+                "input": {"version": "$version"}},
+            {"name": "test", "type": "test", "stream": true,
+                "input": {"binary": "$compile.binary"}},
+            {"name": "docs", "type": "docs", "input": {}}
+        ],
+        "results": {"binary": "$compile.binary"},
+        "workers": 2
+'''
+
+import os
+import re
+import time
+import hashlib
+import Queue
 import logging
+import multiprocessing
 
 from snakebuild.i18n import _
+from snakebuild.communication.workerpool import WorkerPool
 from snakebuild.buildagent.buildstep.buildstep import BuildStepException, \
-        BuildStep, _get_env_values, _parse_output_file
+        BuildStep, load_step, _check_input_values, _check_value
 
 LOG = logging.getLogger('snakebuild.buildagent.buildstep.multibuildstep')
 
+# the state of the sub steps while running
+_PENDING, _RUNNING, _DONE, _CANCELLED = range(4)
+# the events put into the queue by the sub steps
+_VALUE, _FINISHED = range(2)
+
 
 class MultiBuildStep(BuildStep):
     ''' The build step calling other build steps. '''
 
-    def __init__(self, data):
-        self.BuildStep.__init__(data)
+    def __init__(self, data, directory=None):
+        ''' Create the build step and load all the sub steps.
+
+            @param data: The dictionary of the step file
+            @param directory: The directory with the step files of the sub
+                    steps (None for the current directory)
+        '''
+        BuildStep.__init__(self, data)
+        if directory is None:
+            directory = os.getcwd()
+        self.directory = directory
+
+        # the maximum number of sub steps running at the same time
+        self.workers = data.get('workers', 0)
+        if not isinstance(self.workers, int) or self.workers < 1:
+            self.workers = _cpu_count()
+
+        # the sub steps by name, the names in the given order and the names
+        # of the steps each step depends on
+        self.steps = {}
+        self.order = []
+        self.inputs = {}
+        self.dependencies = {}
+        # the steps each step runs after, the output values it uses by step
+        # and the names of the steps which start as soon as the values used
+        # are set
+        self.after = {}
+        self.uses = {}
+        self.streams = set()
+        for entry in data.get('build_steps', []):
+            self._add_step(entry)
+        self.cacheable = self.cacheable and all(step.cacheable
+                for step in self.steps.itervalues())
+        self.dependents = dict((name, []) for name in self.order)
+        for name in self.order:
+            for dependency in self.dependencies[name]:
+                self.dependents[dependency].append(name)
+
+        self.results = data.get('results', {})
+        for name, value in self.results.iteritems():
+            if not name in self.output_vars:
+                raise BuildStepException('The result {0} is not an output '
+                        'value of the build step {1}.'.format(name,
+                        self.name))
+            self._check_reference(value, name)
+
+        # the timing report of the last run
+        self.report = None
+        # the StepCache for the sub steps and the revision of the sources
+        # (the results are only cached if the revision is known)
+        self.cache = None
+        self.revision = None
 
-    def run(self, values):
+    def run(self, values, log_file_name):
         ''' Run this Build Step. To run it you need to provide a dictionary
             with all the input variables stored within a dictionary.
             This method will return a tuple with the result status and the
             dictionary with the output variables.
 
+            The log of each sub step is written next to the given log file
+            with the name of the sub step added. The given log file gets the
+            timing report of the run.
+
             @param values: the dictionary with all the entries for all input
                     variables.
+            @param log_file_name: The name of the logfile to create for this
+                    run this has to be the full path. If the file exists it
+                    will be overwritten.
             @return: (status, output_dictionary)
         '''
         self.run_status = BuildStep.STARTING
@@ -54,8 +155,443 @@ class MultiBuildStep(BuildStep):
             self.result_status = BuildStep.ERROR
             raise x
 
-        # TODO run now!!!
+        self.run_status = BuildStep.RUNNING
+        self.result_status = BuildStep.SUCCESS
+        outputs, timings, states = self._run_steps(values, log_file_name)
+        self.report = _create_report(self.order, self.dependencies, timings,
+                states)
+
+        try:
+            with open(log_file_name, 'w') as logf:
+                logf.write(_format_report(self.report))
+        except IOError, x:
+            LOG.error(_('could not create the output log file for the build '
+                    'step: {0}:\n{1}').format(log_file_name, x))
+            self.run_status = BuildStep.FINISHED
+            self.result_status = BuildStep.ERROR
+            raise BuildStepException('could not create the output log file '
+                    'for the build step: {0}:\n{1}'.format(log_file_name, x))
+
+        self.output_dictionary = self._get_results(values, outputs)
         self.run_status = BuildStep.FINISHED
-        self.result_status = BuildStep.ERROR
+        return (self.result_status, self.output_dictionary)
+
+    def fingerprint(self):
+        ''' Get the hash of the definition of this step and all the sub
+            steps.
+
+            @return: The hash as a hex string
+        '''
+        digest = hashlib.sha1(BuildStep.fingerprint(self))
+        for name in self.order:
+            digest.update(self.steps[name].fingerprint())
+        return digest.hexdigest()
+
+    def _run_steps(self, values, log_file_name):
+        ''' Run all the sub steps, each step gets started as soon as all the
+            steps it depends on are done.
+
+            @param values: The checked input values of this step
+            @param log_file_name: The log file name of this step
+            @return: (outputs, timings, states) the output dictionaries, the
+                    (start, end, status) tuples and the state of each step
+        '''
+        outputs = {}
+        # the output values set by the steps still running
+        streamed = {}
+        timings = {}
+        states = dict((name, _PENDING) for name in self.order)
+        waiting = dict((name, set(self.dependencies[name]))
+                for name in self.order)
+        finished = Queue.Queue()
+        if len(self.order) == 0:
+            return outputs, timings, states
+
+        pool = WorkerPool(min(self.workers, len(self.order)),
+                'multibuildstep')
+        running = 0
+        ready = [name for name in self.order if len(waiting[name]) == 0]
+        try:
+            while True:
+                for name in ready:
+                    states[name] = _RUNNING
+                    running += 1
+                    available = dict(streamed)
+                    available.update(outputs)
+                    self.steps[name].log_callback = self.log_callback
+                    pool.execute(_run_step, name, self.steps[name],
+                            self._get_inputs(name, values, available),
+                            _sub_log_file_name(log_file_name, name), finished,
+                            self.cache, self.revision)
+                ready = []
+                if running == 0:
+                    break
+
+                event = finished.get()
+                if event[0] == _VALUE:
+                    ready = self._add_streamed(event[1:], streamed, waiting,
+                            states)
+                    continue
+                name, status, output, start, end = event[1:]
+                running -= 1
+                states[name] = _DONE
+                timings[name] = (start, end, status)
+
+                if status in (BuildStep.SUCCESS, BuildStep.WARNING):
+                    if status == BuildStep.WARNING:
+                        self._set_result(BuildStep.WARNING)
+                    outputs[name] = output
+                    for dependent in self.dependents[name]:
+                        waiting[dependent].discard(name)
+                        if (len(waiting[dependent]) == 0 and
+                                states[dependent] == _PENDING):
+                            ready.append(dependent)
+                    continue
+
+                self._set_result(BuildStep.ERROR)
+                if self.steps[name].on_error.lower() == 'abort':
+                    LOG.error(_('The build step {0} failed, abort the build '
+                            'step {1}.').format(name, self.name))
+                    cancel = [step for step in self.order
+                            if states[step] == _PENDING]
+                else:
+                    LOG.error(_('The build step {0} failed, cancel the steps '
+                            'depending on it.').format(name))
+                    cancel = _get_dependents(name, self.dependents)
+                for step in cancel:
+                    if states[step] == _PENDING:
+                        states[step] = _CANCELLED
+        finally:
+            pool.stop()
+        return outputs, timings, states
+
+    def _add_streamed(self, value, streamed, waiting, states):
+        ''' Add the output value set by a running sub step. The steps
+            streaming the values of this step get ready as soon as all the
+            values they use are set.
+
+            @param value: The (name, var, value) set by the sub step
+            @param streamed: The output values set by the running steps
+            @param waiting: The steps each step still waits for
+            @param states: The state of each step
+            @return: The list of the steps ready to run
+        '''
+        name, var, value = value
+        streamed.setdefault(name, {})[var] = value
+        for result, reference in self.results.iteritems():
+            if _parse_reference(reference) == (name, var):
+                self._set_output(result, value)
+
+        ready = []
+        for dependent in self.dependents[name]:
+            if (dependent in self.streams and name in waiting[dependent] and
+                    not name in self.after[dependent] and
+                    self.uses[dependent][name] <= set(streamed[name])):
+                waiting[dependent].discard(name)
+                if (len(waiting[dependent]) == 0 and
+                        states[dependent] == _PENDING):
+                    ready.append(dependent)
+        return ready
+
+    def _set_output(self, name, value):
+        ''' Set an output value of this step while it runs and hand it to
+            the output callback.
+
+            @param name: The name of the output value
+            @param value: The value
+        '''
+        try:
+            value = _check_value(value, self.output_vars[name])
+        except BuildStepException, exc:
+            LOG.warning(_('The output value {0} of the build step {1} is '
+                    'not valid: {2}').format(name, self.name, exc))
+            return
+        self.output_dictionary[name] = value
+        if self.output_callback is not None:
+            self.output_callback(name, value)
+
+    def _set_result(self, status):
+        ''' Set the result status of this step unless it is already worse.
+
+            @param status: The status of a sub step (WARNING or ERROR)
+        '''
+        if self.result_status == BuildStep.ERROR:
+            return
+        if (status == BuildStep.ERROR or
+                self.result_status == BuildStep.SUCCESS):
+            self.result_status = status
+
+    def _add_step(self, entry):
+        ''' Load the sub step of the given entry and get its dependencies.
+
+            @param entry: The entry of the build_steps list
+        '''
+        if not isinstance(entry, dict) or not 'name' in entry:
+            raise BuildStepException('The build step {0} has a sub step '
+                    'without a name.'.format(self.name))
+        name = entry['name']
+        if name in self.steps:
+            raise BuildStepException('The sub step {0} is specified twice '
+                    'within the build step {1}.'.format(name, self.name))
+        if not 'type' in entry:
+            raise BuildStepException('The sub step {0} does not have a '
+                    'type.'.format(name))
+
+        self.steps[name] = load_step(os.path.join(self.directory,
+                '{0}.step'.format(entry['type'])))
+        self.order.append(name)
+        self.inputs[name] = entry.get('input', {})
+
+        dependencies = set()
+        self.uses[name] = {}
+        for var, value in self.inputs[name].iteritems():
+            if not var in self.steps[name].input_vars:
+                raise BuildStepException('The input value {0} is not '
+                        'specified by the sub step {1}.'.format(var, name))
+            step = self._check_reference(value, var)
+            if step is not None:
+                dependencies.add(step)
+                self.uses[name].setdefault(step, set()).add(
+                        _parse_reference(value)[1])
+        self.after[name] = set(entry.get('after', []))
+        for step in self.after[name]:
+            if not step in self.steps:
+                raise BuildStepException('The sub step {0} runs after the '
+                        'unknown step {1}.'.format(name, step))
+            dependencies.add(step)
+        self.dependencies[name] = sorted(dependencies)
+        if entry.get('stream', False):
+            self.streams.add(name)
+
+    def _check_reference(self, value, var):
+        ''' Check that the given value references a known value.
+
+            @param value: The value specified (might be a reference)
+            @param var: The name of the variable set to the value
+            @return: The name of the sub step referenced or None
+        '''
+        reference = _parse_reference(value)
+        if reference is None:
+            return None
+        step, name = reference
+        if step is None:
+            if not name in self.input_vars:
+                raise BuildStepException('The value of {0} references the '
+                        'unknown input value {1}.'.format(var, name))
+            return None
+        if not step in self.steps:
+            raise BuildStepException('The value of {0} references the '
+                    'unknown or later specified step {1}.'.format(var, step))
+        if not name in self.steps[step].output_vars:
+            raise BuildStepException('The value of {0} references the '
+                    'unknown output value {1} of the step {2}.'.format(var,
+                    name, step))
+        return step
+
+    def _get_inputs(self, name, values, outputs):
+        ''' Get the input values of the given sub step.
+
+            @param name: The name of the sub step
+            @param values: The input values of this step
+            @param outputs: The output values of the steps already done (and
+                    the ones set by the running steps)
+            @return: The dictionary with the input values of the sub step
+        '''
+        return dict((var, _resolve(value, values, outputs))
+                for var, value in self.inputs[name].iteritems())
+
+    def _get_results(self, values, outputs):
+        ''' Get the output values of this step from the sub steps. If a sub
+            step did not run the default value gets used.
+
+            @param values: The input values of this step
+            @param outputs: The output values of the steps done
+            @return: The output dictionary
+        '''
+        result = {}
+        for name, description in self.output_vars.iteritems():
+            if name in self.results:
+                reference = _parse_reference(self.results[name])
+                if (reference is None or reference[0] is None or
+                        reference[0] in outputs):
+                    result[name] = _check_value(_resolve(self.results[name],
+                            values, outputs), description)
+                    continue
+            if 'default' in description:
+                result[name] = description['default']
+            elif self.result_status != BuildStep.ERROR:
+                LOG.error(_('Not all required variable names are defined.'
+                        ' Missing: {0}').format(name))
+                self.result_status = BuildStep.ERROR
+        return result
+
+
+def _run_step(name, step, values, log_file_name, finished, cache=None,
+        revision=None):
+    ''' Run the given sub step and put the result into the finished queue.
+
+        @param name: The name of the sub step
+        @param step: The BuildStep object
+        @param values: The input values of the step
+        @param log_file_name: The log file of the step
+        @param finished: The queue to put the (_VALUE, name, var, value)
+                tuples of the output values set while running and the
+                (_FINISHED, name, status, output, start, end) tuple of the
+                finished step into
+        @param cache: The StepCache to take the result from or None
+        @param revision: The revision of the sources for the cache
+    '''
+    status, output = BuildStep.ERROR, {}
+    step.output_callback = lambda var, value: finished.put((_VALUE, name,
+            var, value))
+    start = time.time()
+    try:
+        if cache is None:
+            status, output = step.run(values, log_file_name)
+        else:
+            status, output = cache.run(step, values, log_file_name,
+                    revision)
+    except BuildStepException, exc:
+        LOG.error(_('The build step {0} failed: {1}').format(name, exc))
+    except Exception, exc:
+        LOG.exception(_('The build step {0} failed: {1}').format(name, exc))
+    if step.log_callback is not None:
+        try:
+            step.log_callback(log_file_name)
+        except Exception, exc:
+            LOG.exception(_('Could not report the log of the build step {0} '
+                    'as finished: {1}').format(name, exc))
+    finished.put((_FINISHED, name, status, output, start, time.time()))
+
+
+def _parse_reference(value):
+    ''' Parse the given value if it is a reference.
+
+        @param value: The value to check
+        @return: None if not a reference, otherwise the tuple (step, name)
+                where step is None for the input values of the step itself
+    '''
+    if not isinstance(value, (str, unicode)) or not value.startswith('$'):
+        return None
+    if '.' in value:
+        step, name = value[1:].rsplit('.', 1)
+        return step, name
+    return None, value[1:]
+
+
+def _resolve(value, values, outputs):
+    ''' Get the value of the given reference.
+
+        @param value: The value or reference
+        @param values: The input values of the step
+        @param outputs: The output dictionaries of the sub steps
+        @return: The value
+    '''
+    reference = _parse_reference(value)
+    if reference is None:
+        return value
+    step, name = reference
+    if step is None:
+        return values[name]
+    return outputs[step][name]
+
+
+def _get_dependents(name, dependents):
+    ''' Get all the steps depending directly or indirectly on the given step.
+
+        @param name: The name of the step
+        @param dependents: The names of the steps depending on each step
+        @return: The list of the step names
+    '''
+    result = []
+    pending = list(dependents[name])
+    while len(pending) > 0:
+        step = pending.pop()
+        if not step in result:
+            result.append(step)
+            pending.extend(dependents[step])
+    return result
+
+
+def _create_report(order, dependencies, timings, states):
+    ''' Create the timing report of a run. The critical path is the chain of
+        steps which determined the duration of the run: starting with the
+        step finished last each step waited for the dependency finished last.
+
+        @param order: The names of the steps
+        @param dependencies: The names of the steps each step depends on
+        @param timings: The (start, end, status) tuple of each step run
+        @param states: The state of each step
+        @return: The report dictionary
+    '''
+    report = {'duration': 0.0, 'steps': {}, 'critical_path': [],
+            'critical_duration': 0.0, 'cancelled': []}
+    report['cancelled'] = [name for name in order
+            if states[name] == _CANCELLED]
+    if len(timings) == 0:
+        return report
+
+    begin = min(timing[0] for timing in timings.itervalues())
+    for name, (start, end, status) in timings.iteritems():
+        report['steps'][name] = {'status': status, 'start': start - begin,
+                'end': end - begin, 'duration': end - start}
+    report['duration'] = max(step['end']
+            for step in report['steps'].itervalues())
+
+    current = max(timings, key=lambda name: timings[name][1])
+    path = []
+    while current is not None:
+        path.append(current)
+        report['critical_duration'] += report['steps'][current]['duration']
+        ran = [name for name in dependencies[current] if name in timings]
+        current = None
+        if len(ran) > 0:
+            current = max(ran, key=lambda name: timings[name][1])
+    path.reverse()
+    report['critical_path'] = path
+    return report
+
+
+def _format_report(report):
+    ''' Format the timing report for the log file.
+
+        @param report: The report dictionary
+        @return: The report as a string
+    '''
+    lines = ['{0:<30} {1:>10} {2:>10} {3:>10} {4}'.format('step', 'start',
+            'end', 'duration', 'status')]
+    for name, step in sorted(report['steps'].iteritems(),
+            key=lambda item: item[1]['start']):
+        lines.append('{0:<30} {1:>10.3f} {2:>10.3f} {3:>10.3f} {4:d}'.format(
+                name, step['start'], step['end'], step['duration'],
+                step['status']))
+    for name in report['cancelled']:
+        lines.append('{0:<30} cancelled'.format(name))
+    lines.append('')
+    lines.append('total: {0:.3f}s'.format(report['duration']))
+    lines.append('critical path ({0:.3f}s): {1}'.format(
+            report['critical_duration'],
+            ' -> '.join(report['critical_path'])))
+    return '\n'.join(lines) + '\n'
+
+
+def _sub_log_file_name(log_file_name, name):
+    ''' Get the log file name of the given sub step.
+
+        @param log_file_name: The log file of the multi step
+        @param name: The name of the sub step
+        @return: The full path of the log file of the sub step
+    '''
+    base, ext = os.path.splitext(log_file_name)
+    return '{0}.{1}{2}'.format(base, re.sub(r'[^\w.-]+', '_', name), ext)
+
+
+def _cpu_count():
+    ''' Get the number of cores of this agent.
 
-        return self.result_status, self.output_dictionary
+        @return: The number of cores (1 if it is not known)
+    '''
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The OutputChannel receives the output values of a running build step. The
+    script sets a value with the sb_set command which connects to the unix
+    socket of the channel and sends a record: the length of the json string
+    (4 bytes, big-endian) followed by the json object with the 'name' and the
+    'value'. The records are parsed as soon as they arrive, the values might
+    contain any character (including '=' and new lines) and keep the json
+    type they are sent with.
+
+    The sb_set command given by SET_COMMAND is a python script on its own, it
+    does not need the snakebuild package:
+
+        sb_set NAME VALUE           set the string value
+        sb_set --json NAME VALUE    set the json encoded value
+'''
+
+import os
+import json
+import errno
+import select
+import socket
+import time
+import struct
+import logging
+
+from snakebuild.i18n import _
+
+LOG = logging.getLogger('snakebuild.buildagent.buildstep.outputchannel')
+
+# the header of a record with the length of the json string
+RECORD_HEADER = struct.Struct('>I')
+# the maximum length of the json string of one record
+MAX_RECORD_SIZE = 1048576
+# the number of bytes read from a connection at once
+_READ_SIZE = 65536
+
+# the sb_set command (format it with the python executable to use)
+SET_COMMAND = '''#!{0}
+import os
+import sys
+import json
+import socket
+import struct
+
+if len(sys.argv) == 4 and sys.argv[1] == '--json':
+    name, value = sys.argv[2], json.loads(sys.argv[3])
+elif len(sys.argv) == 3:
+    name, value = sys.argv[1], sys.argv[2]
+else:
+    sys.stderr.write('usage: sb_set [--json] NAME VALUE\\n')
+    sys.exit(2)
+
+data = json.dumps({{'name': name, 'value': value}}).encode('utf-8')
+sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+sock.connect(os.environ['SNAKEBUILD_OUTPUT'])
+sock.sendall(struct.pack('>I', len(data)) + data)
+sock.close()
+'''
+
+
+def encode_record(name, value):
+    ''' Encode the given value as a record of the channel.
+
+        @param name: The name of the output value
+        @param value: The value (any json type)
+        @return: The record as a string
+    '''
+    data = json.dumps({'name': name, 'value': value})
+    return RECORD_HEADER.pack(len(data)) + data
+
+
+class OutputChannel(object):
+    ''' The unix socket the output values of a build step get sent to. Each
+        sb_set call opens a connection of its own, the records of parallel
+        calls can not get mixed up.
+    '''
+
+    def __init__(self, path, callback=None):
+        ''' Create the socket of the channel.
+
+            @param path: The file name of the socket
+            @param callback: The function called with (name, value) as soon
+                    as a value is received or None
+        '''
+        self.path = path
+        self.callback = callback
+        # the values received by name
+        self.values = {}
+        # the data not yet parsed by connection
+        self.connections = {}
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(16)
+        self.listener.setblocking(False)
+
+    def sockets(self):
+        ''' Get the sockets to wait for with select.
+
+            @return: The list of the sockets
+        '''
+        return [self.listener] + self.connections.keys()
+
+    def handle(self, sock):
+        ''' Handle the given socket which is ready for reading: accept the
+            new connections or read the records sent.
+
+            @param sock: One of the sockets returned by sockets
+        '''
+        if sock is self.listener:
+            self._accept()
+            return
+        try:
+            data = sock.recv(_READ_SIZE)
+        except socket.error, exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = ''
+        if len(data) == 0:
+            self._close_connection(sock)
+            return
+        rest = self._parse(self.connections[sock] + data)
+        if rest is None:
+            self._close_connection(sock)
+        else:
+            self.connections[sock] = rest
+
+    def drain(self, timeout):
+        ''' Read the records sent before the script ended. Wait until all
+            the connections got closed by the sb_set commands.
+
+            @param timeout: The maximum time in seconds to wait
+        '''
+        end = time.time() + timeout
+        self._accept()
+        while len(self.connections) > 0:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            try:
+                readable = select.select(self.connections.keys(), [], [],
+                        remaining)[0]
+            except select.error, exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            for sock in readable:
+                self.handle(sock)
+            self._accept()
+        for sock in self.connections.keys():
+            self._close_connection(sock)
+
+    def close(self):
+        ''' Close the socket and all the connections. '''
+        for sock in self.connections.keys():
+            sock.close()
+        self.connections = {}
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _accept(self):
+        ''' Accept all the connections waiting. '''
+        while True:
+            try:
+                sock = self.listener.accept()[0]
+            except socket.error, exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            sock.setblocking(False)
+            self.connections[sock] = ''
+
+    def _close_connection(self, sock):
+        ''' Close the given connection.
+
+            @param sock: The socket of the connection
+        '''
+        if len(self.connections.pop(sock, '')) > 0:
+            LOG.warning(_('An incomplete output record was sent by the '
+                    'build step.'))
+        sock.close()
+
+    def _parse(self, data):
+        ''' Parse the complete records within the given data.
+
+            @param data: The data received
+            @return: The rest of the data (incomplete record) or None if the
+                    data is not valid
+        '''
+        while len(data) >= RECORD_HEADER.size:
+            length = RECORD_HEADER.unpack(data[:RECORD_HEADER.size])[0]
+            if length > MAX_RECORD_SIZE:
+                LOG.warning(_('The output record sent by the build step is '
+                        'too big: {0:d} bytes').format(length))
+                return None
+            if len(data) < RECORD_HEADER.size + length:
+                break
+            self._add_record(data[RECORD_HEADER.size:RECORD_HEADER.size +
+                    length])
+            data = data[RECORD_HEADER.size + length:]
+        return data
+
+    def _add_record(self, record):
+        ''' Add the value of the given record.
+
+            @param record: The json string of the record
+        '''
+        try:
+            record = json.loads(record)
+            name, value = record['name'], record['value']
+        except (ValueError, KeyError, TypeError):
+            LOG.warning(_('The output record sent by the build step is not '
+                    'valid: {0}').format(record))
+            return
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.values[name] = value
+        if self.callback is not None:
+            self.callback(name, value)
@@ -22,7 +22,7 @@ import logging
 
 from snakebuild.i18n import _
 from snakebuild.buildagent.buildstep.buildstep import BuildStepException, \
-        BuildStep, _get_env_values, _parse_output_file
+        BuildStep, _get_env_values
 
 LOG = logging.getLogger('snakebuild.buildagent.buildstep.pythonbuildstep')
 
@@ -31,7 +31,7 @@ class PythonBuildStep(BuildStep):
     ''' The build step calling python functions. '''
 
     def __init__(self, data):
-        self.BuildStep.__init__(data)
+        BuildStep.__init__(self, data)
 
         self.python_version = None
         if 'python_version' in data:
@@ -19,6 +19,9 @@
 ''' The build steps for the build agent. '''
 
 import os
+import sys
+import errno
+import select
 import shutil
 import logging
 import subprocess
@@ -26,19 +29,33 @@ import tempfile
 
 from snakebuild.i18n import _
 from snakebuild.buildagent.buildstep.buildstep import BuildStepException, \
-        BuildStep, _get_env_values, _parse_output_file
+        BuildStep, _get_env_values, _check_output_values, _check_value
+from snakebuild.buildagent.buildstep.logchecker import LogChecker
+from snakebuild.buildagent.buildstep.outputchannel import OutputChannel, \
+        SET_COMMAND
 
 LOG = logging.getLogger('snakebuild.buildagent.buildstep.shellbuildstep')
 
+# the number of bytes read from the output of the script at once
+_READ_SIZE = 65536
+# the time in seconds after which the script gets checked if it ended while
+# no output arrives (a process started by the script might keep the output
+# open after the script ended)
+_EXIT_CHECK_INTERVAL = 1.0
+
 
 class ShellBuildStep(BuildStep):
-    ''' The build step running a shell script. '''
-    SHELL_COMMANDS = ('#!/bin/sh\n\n'
-            'echo $1=\\"$2\\" >> $SNAKEBUILD_RETURN')
+    ''' The build step running a shell script. The script sets its output
+        values with the sb_set command, they are received over the
+        OutputChannel while the script runs.
+    '''
+    SHELL_COMMANDS = SET_COMMAND.format(sys.executable)
 
     def __init__(self, data):
         BuildStep.__init__(self, data)
         self.tmp_storage_dir = tempfile.mkdtemp()
+        # the LogChecker of the last run (if the log gets checked)
+        self.log_checker = None
 
         self.executable = '/bin/sh'
         if 'shell' in data:
@@ -72,31 +89,50 @@ class ShellBuildStep(BuildStep):
             self.result_status = BuildStep.ERROR
             raise x
 
-        env_values = self._create_tmpfiles(env_values)
-
         log_checker = None
         if self.log_check.lower() == 'full':
-            # TODO implementd the log cheker here
-            pass
+            try:
+                log_checker = LogChecker(self.error_patterns,
+                        self.warning_patterns)
+            except BuildStepException, x:
+                LOG.error(_('The log patterns of the build step {0} are not '
+                        'valid: {1}').format(self.name, x))
+                self.run_status = BuildStep.FINISHED
+                self.result_status = BuildStep.ERROR
+                raise x
+        self.log_checker = log_checker
+
+        env_values = self._create_tmpfiles(env_values)
+        channel = OutputChannel(env_values['SNAKEBUILD_OUTPUT'],
+                self._set_output)
 
-        # use line buffered mode
         try:
             with open(log_file_name, 'w') as logf:
                 self.run_status = BuildStep.RUNNING
                 self.result_status = BuildStep.SUCCESS
 
                 worker = subprocess.Popen([self.executable, self.script],
-                        bufsize=1, stderr=subprocess.STDOUT, stdout=logf,
-                        env=env_values)
-
-                while worker.poll() is None:
-                    if log_checker is not None:
-                        # TODO implementd the log checker here
-                        pass
-
+                        stderr=subprocess.STDOUT, stdout=subprocess.PIPE,
+                        env=env_values, close_fds=True)
+                returncode = _follow_output(worker, logf, log_checker,
+                        self.on_error.lower() == 'abort', channel)
+
+                if log_checker is not None:
+                    log_checker.finish()
+                    if log_checker.errors > 0:
+                        self.result_status = BuildStep.ERROR
+                    elif log_checker.warnings > 0:
+                        self.result_status = BuildStep.WARNING
+                if returncode != 0:
+                    # the caller stops or continues the build as given with
+                    # the on_error check
+                    LOG.error(_('The script of the build step {0} ended with '
+                            'the exit code {1} (on_error: {2}).').format(
+                            self.name, returncode, self.on_error))
+                    self.result_status = BuildStep.ERROR
                 self.run_status = BuildStep.FINISHED
-                self.output_dictionary = _parse_output_file(
-                        env_values['SNAKEBUILD_RETURN'], self.output_vars)
+                self.output_dictionary = _check_output_values(
+                        self.output_dictionary, self.output_vars)
                 return (self.result_status, self.output_dictionary)
         except IOError, x:
             LOG.error(_('could not create the output log file for the build '
@@ -105,14 +141,17 @@ class ShellBuildStep(BuildStep):
             self.result_status = BuildStep.ERROR
             raise BuildStepException('could not create the output log file '
                     'for the build step: {0}:\n{1}'.format(log_file_name, x))
+        finally:
+            channel.close()
         self.run_status = BuildStep.FINISHED
         self.result_status = BuildStep.ERROR
         return (self.result_status, {})
 
     def _create_tmpfiles(self, env_values):
-        ''' Creates the temporary results directory and the bin directory for
-            the custom commands. The directory will be created on run and
-            will be removed at the end of the run.
+        ''' Creates the temporary directory with the bin directory for the
+            custom commands. The directory will be created on run and will be
+            removed at the end of the run. The socket of the output channel
+            is created within this directory as well.
 
             @param env_values: The dictionary with all the env values, the
                     PATH value will be changed.
@@ -120,21 +159,96 @@ class ShellBuildStep(BuildStep):
         if os.path.isdir(self.tmp_storage_dir):
             shutil.rmtree(self.tmp_storage_dir)
 
-        return_path = os.path.join(self.tmp_storage_dir, 'return')
         bin_path = os.path.join(self.tmp_storage_dir, 'bin')
-
-        os.makedirs(return_path)
         os.makedirs(bin_path)
 
         with open(os.path.join(bin_path, 'sb_set'), 'w') as sbfile:
             os.chmod(os.path.join(bin_path, 'sb_set'), 0755)
             sbfile.write(self.SHELL_COMMANDS)
 
-        env_values['SNAKEBUILD_RETURN'] = os.path.join(return_path, 'answer')
+        env_values['SNAKEBUILD_OUTPUT'] = os.path.join(self.tmp_storage_dir,
+                'output')
         env_values['PATH'] = '{0}:{1}'.format(bin_path, env_values['PATH'])
         return env_values
 
+    def _set_output(self, name, value):
+        ''' Called by the output channel as soon as the script sets a value.
+            The value is available within the output dictionary right away
+            and handed to the output callback.
+
+            @param name: The name of the output value
+            @param value: The value received
+        '''
+        if name in self.output_vars:
+            try:
+                value = _check_value(value, self.output_vars[name])
+            except BuildStepException, exc:
+                LOG.warning(_('The build step {0} set the output value {1} '
+                        'to an illegal value: {2}').format(self.name, name,
+                        exc))
+                return
+        self.output_dictionary[name] = value
+        if self.output_callback is not None:
+            self.output_callback(name, value)
+
     def _clean_up(self):
         ''' clean up all temporary files '''
         if os.path.isdir(self.tmp_storage_dir):
             shutil.rmtree(self.tmp_storage_dir)
+
+
+def _follow_output(worker, logf, log_checker=None, abort=False,
+        channel=None):
+    ''' Copy the output of the worker process into the log file until the
+        process ended. The function blocks within select until output is
+        available, it does not use any CPU time while the process runs
+        without writing output. The records sent to the output channel are
+        read within the same loop.
+
+        @param worker: The Popen object of the process, its stdout must be a
+                pipe
+        @param logf: The open log file to write the output to
+        @param log_checker: The LogChecker to check the output with or None
+        @param abort: Terminate the process as soon as the log checker finds
+                an error
+        @param channel: The OutputChannel of the process or None
+        @return: The return code of the process
+    '''
+    pipe = worker.stdout.fileno()
+    sockets = []
+    while True:
+        if channel is not None:
+            sockets = channel.sockets()
+        try:
+            readable = select.select([pipe] + sockets, [], [],
+                    _EXIT_CHECK_INTERVAL)[0]
+        except select.error, exc:
+            if exc.args[0] == errno.EINTR:
+                continue
+            raise
+        if len(readable) == 0:
+            if worker.poll() is not None:
+                break
+            continue
+        for sock in readable:
+            if sock is not pipe:
+                channel.handle(sock)
+        if not pipe in readable:
+            continue
+
+        data = os.read(pipe, _READ_SIZE)
+        if len(data) == 0:
+            break
+        logf.write(data)
+        logf.flush()
+        if (log_checker is not None and log_checker.check(data) and abort and
+                worker.poll() is None):
+            LOG.info(_('Error found within the output, stop the build '
+                    'step.'))
+            worker.terminate()
+
+    worker.stdout.close()
+    result = worker.wait()
+    if channel is not None:
+        channel.drain(_EXIT_CHECK_INTERVAL)
+    return result
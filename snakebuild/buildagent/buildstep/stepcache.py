@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The StepCache stores the results of the build steps run on the local disk
+    to skip a step which already ran with the same definition, script, input
+    values and source revision. The result is found with the hash of these
+    values, it contains the status, the output values, the log and the
+    artifacts of the step. The least recently used results are removed as
+    soon as the cache uses more disk space than allowed. If a remote build
+    cache is given the results not found locally are looked up there and
+    the results of the steps run are uploaded to it.
+
+    The logs and the artifacts are kept as blobs within a ChunkStore, the
+    same content is stored only once even if it is used by many results.
+    The cache directory contains:
+
+        <key[:2]>/<key>/result.json     status, output values and the
+                                        hashes of the log and artifacts
+        store/                          the ChunkStore with the blobs
+'''
+
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+from snakebuild.i18n import _
+from snakebuild.common.chunkstore import ChunkStore, ChunkStoreException
+from snakebuild.common.filetools import disk_usage
+from snakebuild.communication.client import ClientCommunicationException
+from snakebuild.remote.buildcache import BuildCacheError
+from snakebuild.buildagent.buildstep.buildstep import BuildStepException, \
+        BuildStep, _check_input_values, _check_value
+
+LOG = logging.getLogger('snakebuild.buildagent.buildstep.stepcache')
+
+# the directories of the results (the first two characters of the key)
+_PREFIX_RE = re.compile(r'^[0-9a-f]{2}$')
+
+
+class StepCache(object):
+    ''' The cache of the build step results within one directory. The cache
+        can be used from multiple threads.
+    '''
+
+    def __init__(self, directory, max_size=0, remote=None):
+        ''' Create the cache, the results already stored within the
+            directory are kept.
+
+            @param directory: The directory to store the results in
+            @param max_size: The maximum number of bytes the results might
+                    use, 0 for no limit.
+            @param remote: The remote BuildCache shared with the other
+                    agents or None
+        '''
+        self.directory = directory
+        self.max_size = max_size
+        self.remote = remote
+        self.lock = threading.Lock()
+        # the (size, last used, blobs) of each result by key
+        self.entries = {}
+        # the number of bytes used by the results without their blobs
+        self.entries_size = 0
+        # the number of restores running for each result by key
+        self.pinned = {}
+        # the number of results using each blob
+        self.blobs = {}
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.blob_store = ChunkStore(os.path.join(directory, 'store'))
+        for prefix in os.listdir(directory):
+            if prefix == 'store':
+                continue
+            if prefix.startswith('tmp'):
+                shutil.rmtree(os.path.join(directory, prefix), True)
+                continue
+            if (not _PREFIX_RE.match(prefix) or
+                    not os.path.isdir(os.path.join(directory, prefix))):
+                # not created by the cache
+                continue
+            for key in os.listdir(os.path.join(directory, prefix)):
+                path = self._get_path(key)
+                try:
+                    with open(os.path.join(path, 'result.json'), 'r') as rfl:
+                        blobs = _get_blobs(json.load(rfl))
+                except (IOError, ValueError, KeyError, AttributeError):
+                    shutil.rmtree(path, True)
+                    continue
+                self.entries[key] = (disk_usage(path),
+                        os.path.getmtime(path), blobs)
+                self.entries_size += self.entries[key][0]
+                for digest in blobs:
+                    self.blobs[digest] = self.blobs.get(digest, 0) + 1
+        # the blobs left over by an interrupted store
+        for dirpath, dirnames, filenames in os.walk(os.path.join(directory,
+                'store', 'blobs')):
+            for name in filenames:
+                if not name[:-len('.json')] in self.blobs:
+                    self.blob_store.remove(name[:-len('.json')])
+
+    @property
+    def size(self):
+        ''' The number of bytes used by the results and the blobs. '''
+        return self.entries_size + self.blob_store.size
+
+    def get_key(self, step, values, revision=None):
+        ''' Get the key of the result of the given step.
+
+            @param step: The BuildStep object
+            @param values: The input values for the step
+            @param revision: The revision of the sources the step runs on
+            @return: The key (hex string) or None if the step can not be
+                    cached (or the revision of the sources is not known)
+        '''
+        if not step.cacheable or revision is None:
+            return None
+        try:
+            values = _check_input_values(values, step.input_vars)
+        except BuildStepException:
+            return None
+        values = dict((name, values[name]) for name in step.input_vars)
+        return hashlib.sha1(json.dumps([step.fingerprint(), values,
+                revision], sort_keys=True)).hexdigest()
+
+    def run(self, step, values, log_file_name, revision=None,
+            directory=None):
+        ''' Run the given step unless its result is within the cache. A
+            successful result gets stored.
+
+            @param step: The BuildStep object
+            @param values: The input values for the step
+            @param log_file_name: The log file of the step
+            @param revision: The revision of the sources the step runs on,
+                    if None the step runs without the cache
+            @param directory: The directory the artifacts are relative to
+                    (None for the current directory)
+            @return: (status, output_dictionary)
+        '''
+        if directory is None:
+            directory = os.getcwd()
+        key = self.get_key(step, values, revision)
+        if key is not None:
+            result = self.restore(key, step, log_file_name, directory)
+            if (result is None and self.remote is not None and
+                    self._fetch(key)):
+                result = self.restore(key, step, log_file_name, directory)
+            if result is not None:
+                LOG.info(_('Use the cached result of the build step '
+                        '{0}.').format(step.name))
+                return result
+
+        result = step.run(values, log_file_name)
+        if (key is not None and result[0] in (BuildStep.SUCCESS,
+                BuildStep.WARNING) and
+                self.store(key, step, result, log_file_name, directory) and
+                self.remote is not None):
+            self._push(key)
+        return result
+
+    def restore(self, key, step, log_file_name, directory):
+        ''' Restore the result with the given key. The log and the artifacts
+            are copied back and the step gets the cached status and output.
+
+            @param key: The key of the result
+            @param step: The BuildStep object
+            @param log_file_name: The log file to write the cached log to
+            @param directory: The directory to write the artifacts to
+            @return: (status, output_dictionary) or None if not cached
+        '''
+        path = self._get_path(key)
+        with self.lock:
+            if not key in self.entries:
+                return None
+            size, last_used, blobs = self.entries[key]
+            self.entries[key] = (size, time.time(), blobs)
+            # the result and its blobs are not evicted while it is pinned
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+
+        try:
+            os.utime(path, None)
+            with open(os.path.join(path, 'result.json'), 'r') as rfl:
+                result = json.load(rfl)
+            self.blob_store.extract(result['log'], log_file_name)
+            for name, digest in result['artifacts'].iteritems():
+                target = os.path.join(directory, name)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                self.blob_store.extract(digest, target)
+        except (IOError, OSError, ValueError, KeyError,
+                ChunkStoreException), exc:
+            LOG.warning(_('Could not restore the cached result {0}: '
+                    '{1}').format(key, exc))
+            return None
+        finally:
+            with self.lock:
+                self.pinned[key] -= 1
+                if self.pinned[key] == 0:
+                    del self.pinned[key]
+                    # an eviction might have skipped the result
+                    self._evict()
+
+        output = {}
+        for name, description in step.output_vars.iteritems():
+            if name in result['output']:
+                output[name] = _check_value(result['output'][name],
+                        description)
+        step.run_status = BuildStep.FINISHED
+        step.result_status = result['status']
+        step.output_dictionary = output
+        return (result['status'], output)
+
+    def store(self, key, step, result, log_file_name, directory):
+        ''' Store the result of the given step and remove the least recently
+            used results if the cache gets too big.
+
+            @param key: The key of the result
+            @param step: The BuildStep object
+            @param result: The (status, output_dictionary) of the run
+            @param log_file_name: The log file of the step
+            @param directory: The directory the artifacts are relative to
+            @return: True if the result got stored
+        '''
+        tmp_path = tempfile.mkdtemp(prefix='tmp', dir=self.directory)
+        artifacts = {}
+        try:
+            for name in _find_artifacts(step.artifacts, directory):
+                artifacts[name] = self.blob_store.add_file(os.path.join(
+                        directory, name))
+            if not os.path.isfile(log_file_name):
+                open(log_file_name, 'w').close()
+            with open(os.path.join(tmp_path, 'result.json'), 'w') as rfl:
+                json.dump({'status': result[0], 'output': result[1],
+                        'log': self.blob_store.add_file(log_file_name),
+                        'artifacts': artifacts}, rfl)
+        except (IOError, OSError, ChunkStoreException), exc:
+            LOG.warning(_('Could not store the result of the build step '
+                    '{0}: {1}').format(step.name, exc))
+            shutil.rmtree(tmp_path, True)
+            # the blobs already added are not used by any result
+            with self.lock:
+                self._remove_unused(set(artifacts.values()))
+            return False
+        return self._add(key, tmp_path)
+
+    def has(self, key):
+        ''' Check if the result with the given key is cached.
+
+            @param key: The key of the result
+            @return: True if available
+        '''
+        with self.lock:
+            return key in self.entries
+
+    def _add(self, key, tmp_path):
+        ''' Move the result prepared within the temporary directory into the
+            cache. Its blobs must be stored already.
+
+            @param key: The key of the result
+            @param tmp_path: The temporary directory with the result
+            @return: True if the result got added
+        '''
+        path = self._get_path(key)
+        size = disk_usage(tmp_path)
+        with open(os.path.join(tmp_path, 'result.json'), 'r') as rfl:
+            blobs = _get_blobs(json.load(rfl))
+        with self.lock:
+            # a blob might got evicted in the mean time
+            manifests = [self.blob_store.get_manifest(digest)
+                    for digest in blobs]
+            if (key in self.entries or None in manifests or
+                    (self.max_size > 0 and size + sum(manifest['size']
+                    for manifest in manifests) > self.max_size)):
+                shutil.rmtree(tmp_path, True)
+                self._remove_unused(blobs)
+                return False
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            os.rename(tmp_path, path)
+            self.entries[key] = (size, time.time(), blobs)
+            self.entries_size += size
+            for digest in blobs:
+                self.blobs[digest] = self.blobs.get(digest, 0) + 1
+            self._evict()
+        return True
+
+    def _fetch(self, key):
+        ''' Download the result with the given key from the remote cache.
+
+            @param key: The key of the result
+            @return: True if the result got added to this cache
+        '''
+        tmp_path = tempfile.mkdtemp(prefix='tmp', dir=self.directory)
+        try:
+            result = self.remote.get_result(key)
+            if result is None:
+                shutil.rmtree(tmp_path, True)
+                return False
+            for name in result['artifacts']:
+                if (os.path.isabs(name) or
+                        os.path.normpath(name).startswith(os.pardir)):
+                    raise IOError('The artifact name is not valid: '
+                            '{0}'.format(name))
+            for digest in _get_blobs(result):
+                self.remote.fetch_blob(self.blob_store, digest)
+            with open(os.path.join(tmp_path, 'result.json'), 'w') as rfl:
+                json.dump({'status': result['status'],
+                        'output': result['output'], 'log': result['log'],
+                        'artifacts': result['artifacts']}, rfl)
+        except (BuildCacheError, ClientCommunicationException, IOError,
+                OSError, KeyError, TypeError, AttributeError), exc:
+            LOG.warning(_('Could not get the result {0} from the remote '
+                    'cache: {1}').format(key, exc))
+            shutil.rmtree(tmp_path, True)
+            return False
+        LOG.debug(_('Got the result {0} from the remote cache.').format(key))
+        return self._add(key, tmp_path)
+
+    def _push(self, key):
+        ''' Upload the result with the given key to the remote cache.
+
+            @param key: The key of the result
+        '''
+        path = self._get_path(key)
+        try:
+            if self.remote.has([key])[0]:
+                return
+            with open(os.path.join(path, 'result.json'), 'r') as rfl:
+                result = json.load(rfl)
+            for digest in _get_blobs(result):
+                self.remote.push_blob(self.blob_store, digest)
+            self.remote.put_result(key, result)
+        except (BuildCacheError, ClientCommunicationException, IOError,
+                OSError, ValueError, ChunkStoreException), exc:
+            LOG.warning(_('Could not upload the result {0} to the remote '
+                    'cache: {1}').format(key, exc))
+
+    def _evict(self):
+        ''' Remove the least recently used results until the cache uses
+            less disk space than allowed. The results pinned by a running
+            restore are kept. Must be called with the lock held.
+        '''
+        if self.max_size <= 0 or self.size <= self.max_size:
+            return
+        for key in sorted(self.entries, key=lambda key: self.entries[key][1]):
+            if self.size <= self.max_size:
+                break
+            if key in self.pinned:
+                continue
+            LOG.debug(_('Remove the cached result {0}').format(key))
+            size, last_used, blobs = self.entries.pop(key)
+            self.entries_size -= size
+            shutil.rmtree(self._get_path(key), True)
+            for digest in blobs:
+                self.blobs[digest] -= 1
+                if self.blobs[digest] == 0:
+                    del self.blobs[digest]
+            self._remove_unused(blobs)
+
+    def _remove_unused(self, blobs):
+        ''' Remove the given blobs from the store if no result uses them.
+            Must be called with the lock held.
+
+            @param blobs: The hashes of the blobs
+        '''
+        for digest in blobs:
+            if not digest in self.blobs:
+                self.blob_store.remove(digest)
+
+    def _get_path(self, key):
+        ''' Get the directory of the result with the given key.
+
+            @param key: The key of the result
+            @return: The path of the directory
+        '''
+        return os.path.join(self.directory, key[:2], key)
+
+
+def _find_artifacts(patterns, directory):
+    ''' Find the files matching the given glob patterns.
+
+        @param patterns: The list of the glob patterns relative to the
+                directory
+        @param directory: The directory to search in
+        @return: The sorted list of the file names relative to the directory
+    '''
+    result = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            if os.path.isfile(path):
+                result.add(os.path.relpath(path, directory))
+    return sorted(result)
+
+
+def _get_blobs(result):
+    ''' Get the blobs used by the given result.
+
+        @param result: The result dictionary
+        @return: The set of the hashes of the log and the artifacts
+    '''
+    return set([result['log']] + result['artifacts'].values())
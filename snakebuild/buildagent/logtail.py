@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The LogTail gives access to the log files of the build steps while they
+    are written. A client reads a log piece by piece from a given offset and
+    can wait for the next piece. All the clients following the same log share
+    one open file and one watch: the changes of the files are reported by
+    inotify, if it is not available the followed files are polled.
+'''
+
+import os
+import errno
+import select
+import logging
+import threading
+
+from snakebuild.i18n import _
+from snakebuild.common.timerqueue import TimerQueue
+from snakebuild.common.inotify import Inotify, InotifyException, \
+        IN_MODIFY, IN_CLOSE_WRITE, IN_DELETE_SELF, IN_MOVE_SELF, IN_IGNORED
+
+LOG = logging.getLogger('snakebuild.buildagent.logtail')
+
+# the maximum number of bytes returned with one piece of a log
+CHUNK_SIZE = 65536
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class LogTailException(BaseException):
+    ''' The exception thrown if a log can not be read. '''
+
+
+class LogWaiter(object):
+    ''' A client waiting for the log to grow. '''
+
+    def __init__(self, logfile, offset, callback):
+        ''' Create the waiter.
+
+            @param logfile: The _LogFile waited for
+            @param offset: The offset the client wants to read from
+            @param callback: The function to call (without parameters) as
+                    soon as there is something to read or the timeout is
+                    over
+        '''
+        self.logfile = logfile
+        self.offset = offset
+        self.callback = callback
+        self.timer = None
+        self.done = False
+
+    def cancel(self):
+        ''' Stop waiting, the callback does not get called. '''
+        self.logfile.tail._remove_waiter(self)
+
+
+class _LogFile(object):
+    ''' One log file followed, shared by all the clients. '''
+
+    def __init__(self, tail, name, path):
+        ''' Open the log file.
+
+            @param tail: The LogTail object
+            @param name: The name of the log
+            @param path: The full path of the log file
+        '''
+        self.tail = tail
+        self.name = name
+        self.path = path
+        try:
+            self.file = open(path, 'rb')
+        except IOError, exc:
+            raise LogTailException(_('The log can not be read: {0} '
+                    '({1})').format(name, exc.strerror))
+        self.lock = threading.Lock()
+        self.size = 0
+        # the size without the start of a character at the end (see
+        # _partial_length), what can be read while the log is written
+        self.complete = 0
+        self.stamp = None
+        self.update_size()
+        self.waiters = []
+        self.watch = None
+
+    def read(self, offset, size):
+        ''' Read a piece of the log.
+
+            @param offset: The offset to read from
+            @param size: The maximum number of bytes to read
+            @return: The data read
+        '''
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+
+    def update_size(self):
+        ''' Get the current size and stamp of the file. '''
+        size = self.size
+        self.stamp = _get_stamp(os.fstat(self.file.fileno()))
+        self.size = self.stamp[0]
+        if self.size != size or self.complete > self.size:
+            start = max(self.size - 3, 0)
+            self.complete = self.size - _partial_length(self.read(start,
+                    self.size - start))
+
+    def close(self):
+        ''' Close the file. '''
+        self.file.close()
+
+
+class LogTail(object):
+    ''' Read the logs of the build steps within a directory while they are
+        written.
+    '''
+
+    def __init__(self, directory, poll_interval=0.5, use_inotify=True):
+        ''' Create the object, the thread watching the files is started as
+            soon as the first client waits.
+
+            @param directory: The directory with the log files
+            @param poll_interval: The time in seconds between the checks of
+                    the files if inotify is not available
+            @param use_inotify: Set to False to poll the files (for example
+                    on network file systems where inotify does not work)
+        '''
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.lock = threading.Lock()
+        # the files followed by their name
+        self.files = {}
+        # the stamps (see _get_stamp) of the logs completely written by
+        # their name, a log written again afterwards is not finished
+        self.finished = {}
+        self.watches = {}
+        self.inotify = None
+        self.thread = None
+        self.running = True
+        self.wakeup = None
+        self.timers = TimerQueue('logtail')
+
+    def read(self, name, offset=0, size=CHUNK_SIZE):
+        ''' Read a piece of the given log.
+
+            @param name: The name of the log (the path within the directory)
+            @param offset: The offset to read from
+            @param size: The maximum number of bytes to read
+            @return: A dictionary with the data read ('data'), the offset to
+                    read the next piece from ('offset'), the current size of
+                    the log ('size') and if the log is finished ('finished')
+        '''
+        path = self._get_path(name)
+        with self.lock:
+            logfile = self.files.get(name)
+            if logfile is not None:
+                # the file of the clients waiting for the log
+                logfile.update_size()
+                finished = self.finished.get(name) == logfile.stamp
+                data = _read_text(logfile, offset, size, finished)
+                total = logfile.size
+        if logfile is None:
+            logfile = _LogFile(self, name, path)
+            try:
+                with self.lock:
+                    finished = self.finished.get(name) == logfile.stamp
+                data = _read_text(logfile, offset, size, finished)
+                total = logfile.size
+            finally:
+                logfile.close()
+
+        offset = min(offset, total) + len(data)
+        return {'data': data.decode('utf-8', 'replace'), 'offset': offset,
+                'size': total, 'finished': finished and offset >= total}
+
+    def wait(self, name, offset, callback, timeout=None):
+        ''' Wait until the log grows beyond the given offset or is finished.
+
+            @param name: The name of the log
+            @param offset: The offset the client wants to read from
+            @param callback: The function to call (without parameters) as
+                    soon as there is something to read or the timeout is
+                    over. It might be called before this method returns.
+            @param timeout: The maximum time in seconds to wait
+            @return: The LogWaiter object to cancel the waiting
+        '''
+        path = self._get_path(name)
+        with self.lock:
+            logfile = self.files.get(name)
+            if logfile is None:
+                logfile = _LogFile(self, name, path)
+                self.files[name] = logfile
+                self._watch(logfile)
+            waiter = LogWaiter(logfile, offset, callback)
+            logfile.waiters.append(waiter)
+            logfile.update_size()
+            finished = self.finished.get(name) == logfile.stamp
+            ready = logfile.complete > offset or finished
+            if not ready:
+                self._start_thread()
+        if ready:
+            self._notify(logfile, finished)
+        elif timeout is not None:
+            waiter.timer = self.timers.schedule(timeout, self._expire,
+                    waiter)
+        return waiter
+
+    def finish(self, name):
+        ''' Mark the log as completely written, the clients waiting for it
+            get informed. As soon as the log gets written again (the next
+            run of the step) it is not finished anymore.
+
+            @param name: The name of the log
+        '''
+        try:
+            stamp = _get_stamp(os.stat(self._get_path(name)))
+        except (OSError, LogTailException), exc:
+            LOG.debug(_('The finished log is not available: {0}').format(exc))
+            return
+        with self.lock:
+            self.finished[name] = stamp
+            logfile = self.files.get(name)
+        if logfile is not None:
+            self._notify(logfile, True)
+
+    def close(self):
+        ''' Stop the thread and close all the files, the waiting clients
+            get informed.
+        '''
+        with self.lock:
+            self.running = False
+            files = self.files.values()
+            thread = self.thread
+        self._wake_thread()
+        for logfile in files:
+            self._notify(logfile, True)
+        self.timers.stop(True)
+        if thread is not None:
+            thread.join()
+        if self.inotify is not None:
+            self.inotify.close()
+        if self.wakeup is not None:
+            os.close(self.wakeup[0])
+            os.close(self.wakeup[1])
+            self.wakeup = None
+
+    def _get_path(self, name):
+        ''' Get the path of the log with the given name.
+
+            @param name: The name of the log
+            @return: The full path of the log file
+        '''
+        path = os.path.normpath(os.path.join(self.directory, name))
+        if (os.path.isabs(name) or
+                not path.startswith(os.path.join(self.directory, ''))):
+            raise LogTailException(_('The log name is not valid: '
+                    '{0}').format(name))
+        if not os.path.isfile(path):
+            raise LogTailException(_('The log does not exist: '
+                    '{0}').format(name))
+        return path
+
+    def _watch(self, logfile):
+        ''' Start watching the given file if inotify is available. The lock
+            must be held.
+
+            @param logfile: The _LogFile object
+        '''
+        if self.wakeup is None:
+            self.wakeup = os.pipe()
+            if self.use_inotify:
+                try:
+                    self.inotify = Inotify()
+                except InotifyException, exc:
+                    LOG.info(_('Inotify is not available, poll the logs: '
+                            '{0}').format(exc))
+        if self.inotify is None:
+            return
+        try:
+            logfile.watch = self.inotify.add_watch(logfile.path, _WATCH_MASK)
+            self.watches[logfile.watch] = logfile
+        except InotifyException, exc:
+            LOG.warning(_('Could not watch the log {0}, poll it: '
+                    '{1}').format(logfile.name, exc))
+
+    def _start_thread(self):
+        ''' Start the thread watching the files if it is not running. The
+            lock must be held.
+        '''
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='logtail')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _wake_thread(self):
+        ''' Wake the thread up to check its state. '''
+        if self.wakeup is not None:
+            os.write(self.wakeup[1], 'x')
+
+    def _run(self):
+        ''' Wait for the changes of the files and inform the waiting
+            clients.
+        '''
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                polled = [logfile for logfile in self.files.itervalues()
+                        if logfile.watch is None]
+            readable = [self.wakeup[0]]
+            if self.inotify is not None:
+                readable.append(self.inotify.fileno())
+            timeout = None
+            if len(polled) > 0:
+                timeout = self.poll_interval
+            try:
+                ready = select.select(readable, [], [], timeout)[0]
+            except select.error, exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            changed = set(polled)
+            if self.wakeup[0] in ready:
+                os.read(self.wakeup[0], 512)
+            if self.inotify is not None and self.inotify.fileno() in ready:
+                with self.lock:
+                    for wdesc, mask, name in self.inotify.read_events():
+                        logfile = self.watches.get(wdesc)
+                        if logfile is None:
+                            continue
+                        if mask & IN_IGNORED:
+                            del self.watches[wdesc]
+                            logfile.watch = None
+                        changed.add(logfile)
+            for logfile in changed:
+                with self.lock:
+                    if logfile.file.closed:
+                        # no one waits for it anymore
+                        continue
+                    logfile.update_size()
+                self._notify(logfile)
+
+    def _notify(self, logfile, everyone=False):
+        ''' Call the waiting clients which can read something now.
+
+            @param logfile: The _LogFile object
+            @param everyone: Call all the waiting clients (log finished)
+        '''
+        with self.lock:
+            waiters = [waiter for waiter in logfile.waiters
+                    if everyone or logfile.complete > waiter.offset]
+            for waiter in waiters:
+                self._drop_waiter(waiter)
+        for waiter in waiters:
+            waiter.callback()
+
+    def _expire(self, waiter):
+        ''' The timeout of the waiting client is over.
+
+            @param waiter: The LogWaiter object
+        '''
+        with self.lock:
+            if waiter.done:
+                return
+            self._drop_waiter(waiter)
+        waiter.callback()
+
+    def _remove_waiter(self, waiter):
+        ''' Stop waiting without calling the callback.
+
+            @param waiter: The LogWaiter object
+        '''
+        with self.lock:
+            if not waiter.done:
+                self._drop_waiter(waiter)
+
+    def _drop_waiter(self, waiter):
+        ''' Remove the waiting client, the file is closed if no one waits
+            for it anymore. The lock must be held.
+
+            @param waiter: The LogWaiter object
+        '''
+        waiter.done = True
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+        logfile = waiter.logfile
+        logfile.waiters.remove(waiter)
+        if len(logfile.waiters) > 0:
+            return
+        if self.files.get(logfile.name) is logfile:
+            del self.files[logfile.name]
+        if logfile.watch is not None:
+            self.watches.pop(logfile.watch, None)
+            self.inotify.rm_watch(logfile.watch)
+            logfile.watch = None
+        logfile.close()
+
+
+def _get_stamp(stat):
+    ''' Get the stamp of a log file which changes as soon as the file is
+        written.
+
+        @param stat: The result of os.stat of the file
+        @return: The tuple (size, modification time)
+    '''
+    return (stat.st_size, stat.st_mtime)
+
+
+def _read_text(logfile, offset, size, finished):
+    ''' Read a piece of the log which does not end within a UTF-8 character
+        (unless the character is cut off at the end of a finished log). The
+        rest of the character is read with the next piece.
+
+        @param logfile: The _LogFile object
+        @param offset: The offset to read from
+        @param size: The maximum number of bytes to read
+        @param finished: True if the log is completely written
+        @return: The data read
+    '''
+    data = logfile.read(offset, size)
+    if finished and offset + len(data) >= logfile.size:
+        return data
+    partial = _partial_length(data)
+    if partial > 0:
+        return data[:-partial]
+    return data
+
+
+def _partial_length(data):
+    ''' Get the number of bytes of the start of a UTF-8 character at the
+        end of the data (the rest of the character is missing).
+
+        @param data: The data (the last three bytes are enough)
+        @return: The number of bytes, 0 if the data ends with a complete
+                character
+    '''
+    for cnt in range(1, min(4, len(data)) + 1):
+        byte = ord(data[-cnt])
+        if byte & 0xc0 == 0x80:
+            continue
+        if byte & 0x80 and cnt < _utf8_length(byte):
+            return cnt
+        break
+    return 0
+
+
+def _utf8_length(byte):
+    ''' Get the number of bytes of the UTF-8 character starting with the
+        given byte.
+
+        @param byte: The first byte as an integer
+        @return: The number of bytes
+    '''
+    if byte >= 0xf0:
+        return 4
+    if byte >= 0xe0:
+        return 3
+    return 2
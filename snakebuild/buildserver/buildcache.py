@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The BuildCache stores the build step results shared by the build agents.
+    A result refers to its log and artifacts by the sha1 hash of their
+    content, the blobs are kept within a ChunkStore: they are split into
+    chunks stored by their own hash, the chunks the blobs have in common are
+    stored and transferred only once. A blob is uploaded chunk by chunk
+    followed by its manifest, an interrupted upload only sends the chunks
+    still missing.
+
+    The cache directory contains:
+
+        results/<key[:2]>/<key>.json    the results
+        store/                          the ChunkStore with the blobs
+'''
+
+import os
+import json
+import logging
+import tempfile
+
+from snakebuild.i18n import _
+from snakebuild.common.chunkstore import ChunkStore, ChunkStoreException, \
+        check_hash
+
+LOG = logging.getLogger('snakebuild.buildserver.buildcache')
+
+
+class BuildCacheException(BaseException):
+    ''' The exception thrown if a request to the build cache is not valid.
+    '''
+
+
+class BuildCache(object):
+    ''' The storage of the shared build cache. It can be used from multiple
+        threads.
+    '''
+
+    def __init__(self, directory):
+        ''' Create the cache within the given directory, the results already
+            stored are kept.
+
+            @param directory: The directory to store the results in
+        '''
+        self.directory = directory
+        if not os.path.isdir(os.path.join(directory, 'results')):
+            os.makedirs(os.path.join(directory, 'results'))
+        self.store = ChunkStore(os.path.join(directory, 'store'))
+
+    def has(self, keys=(), blobs=(), chunks=()):
+        ''' Check which of the given results, blobs and chunks are stored.
+
+            @param keys: The keys of the results to check
+            @param blobs: The hashes of the blobs to check
+            @param chunks: The hashes of the chunks to check
+            @return: (keys, blobs, chunks) the lists of the ones stored
+        '''
+        try:
+            missing = set(self.store.missing(chunks))
+            return ([key for key in keys
+                    if os.path.isfile(self._get_result_path(key))],
+                    [digest for digest in blobs if self.store.has(digest)],
+                    [digest for digest in chunks if not digest in missing])
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+
+    def get_result(self, key):
+        ''' Get the result with the given key.
+
+            @param key: The key of the result
+            @return: The result dictionary or None if not stored
+        '''
+        try:
+            with open(self._get_result_path(key), 'r') as rfl:
+                return json.load(rfl)
+        except (IOError, ValueError):
+            return None
+
+    def put_result(self, key, result):
+        ''' Store the given result, all the blobs it refers to must be
+            stored already.
+
+            @param key: The key of the result
+            @param result: The dictionary with the status ('status'), the
+                    output values ('output'), the hash of the log ('log') and
+                    the hashes of the artifacts by file name ('artifacts')
+        '''
+        path = self._get_result_path(key)
+        if (not isinstance(result, dict) or
+                not isinstance(result.get('status'), int) or
+                not isinstance(result.get('output'), dict) or
+                not isinstance(result.get('artifacts'), dict)):
+            raise BuildCacheException(_('The result {0} is not valid.').format(
+                    key))
+        try:
+            for digest in [result.get('log')] + result['artifacts'].values():
+                if not self.store.has(digest):
+                    raise BuildCacheException(_('The blob {0} of the result '
+                            '{1} is not stored.').format(digest, key))
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'w') as rfl:
+            json.dump(result, rfl)
+        os.rename(tmp_path, path)
+
+    def get_manifest(self, digest):
+        ''' Get the manifest of the given blob.
+
+            @param digest: The hash of the blob
+            @return: The manifest dictionary with the size ('size') and the
+                    list of the [hash, size] of the chunks ('chunks') or None
+                    if the blob is not stored
+        '''
+        try:
+            return self.store.get_manifest(digest)
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+
+    def locate(self, digest, offset):
+        ''' Find the part of the given blob to send from the given offset.
+            The part ends with the chunk containing the offset, this way it
+            can be sent from the chunk file directly.
+
+            @param digest: The hash of the blob
+            @param offset: The offset within the blob
+            @return: (path, chunk_offset, length, size) the file of the
+                    chunk, the offset within the chunk, the number of bytes
+                    to send and the size of the blob
+        '''
+        try:
+            return self.store.locate(digest, offset)
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+
+    def put_chunk(self, digest, data):
+        ''' Store the given chunk of a blob.
+
+            @param digest: The hash of the chunk
+            @param data: The content of the chunk
+        '''
+        try:
+            self.store.add_chunk(digest, data)
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+
+    def put_blob(self, digest, manifest):
+        ''' Store the blob with the given manifest, all its chunks must be
+            stored already.
+
+            @param digest: The hash of the blob
+            @param manifest: The manifest dictionary (see get_manifest)
+        '''
+        try:
+            self.store.add_manifest(digest, manifest)
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+        LOG.debug(_('Stored the blob {0} ({1} bytes)').format(digest,
+                manifest['size']))
+
+    def _get_result_path(self, key):
+        ''' Get the file name of the given result.
+
+            @param key: The key of the result
+            @return: The path of the file
+        '''
+        try:
+            check_hash(key)
+        except ChunkStoreException, exc:
+            raise BuildCacheException(str(exc))
+        return os.path.join(self.directory, 'results', key[:2],
+                '{0}.json'.format(key))
@@ -20,6 +20,16 @@
 
 import logging
 
+from snakebuild.common import output
+from snakebuild.common import Daemon
+from snakebuild.i18n import _
+from snakebuild.commands import handle_cmd
+from snakebuild.communication import Server, get_engine
+# this needs to be imported to fill the REMOTE_COMMANDS
+import snakebuild.buildserver.servercmds
+from snakebuild.buildserver.buildcache import BuildCache
+from snakebuild.buildserver.commandlineparser import SHELL_COMMANDS, command
+
 
 LOG = logging.getLogger('snakebuild.buildserver.server')
 
@@ -32,4 +42,57 @@ def run_server(arguments, config):
 
         @return true or false depends on success or failure
     '''
+    try:
+        return handle_cmd(SHELL_COMMANDS, arguments, config)
+    except KeyboardInterrupt:
+        output.error(_('Abort by keyboard interrupt.'))
+        return False
+
+
+@command('stop', (
+    (('--name',), {'help': _('The name of the build server to stop.'),
+        'default': 'buildserver'}),
+    ))
+def stop_server(args, config):
+    ''' Stop the build server that is running in the background.
+
+        @param args: The arguments given with the command.
+        @param config: The config object to use
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    host = config.get_s('buildserver', 'hostname')
+    port = config.get_s('buildserver', 'port')
+
+    Daemon(Server(host, port, args.name), Daemon.STOP)
+    return True
+
+
+@command('start', (
+    (('--background',), {'action': 'store_true',
+        'help': _('Run the build server as a daemon (background)'),
+        'default': False}),
+    (('--name',), {'help': _('The name of the build server to start. This '
+        'name has to be unique on one server.'), 'default': 'buildserver'})
+    ))
+def start_server(args, config):
+    ''' Start the build server. It provides the build cache shared by the
+        build agents.
+
+        @param args: The arguments given with the command.
+        @param config: The config object to use
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    host = config.get_s('buildserver', 'hostname')
+    port = config.get_s('buildserver', 'port')
+    engine = get_engine(config.get_s('buildserver', 'server_engine'))
+    worker_count = config.get_s('buildserver', 'worker_count')
+    backlog = config.get_s('buildserver', 'backlog')
+
+    buildcache = BuildCache(config.get_s('buildserver', 'cache_dir'))
+    server = Server(host, port, args.name, buildcache, engine, worker_count,
+            backlog)
+    if args.background:
+        Daemon(server, Daemon.START)
+    else:
+        Daemon(server, Daemon.FOREGROUND)
     return True
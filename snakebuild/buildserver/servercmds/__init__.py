@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmds package where all the server cmds
+    are handled.
+'''
+
+import snakebuild.buildserver.servercmds.cache_has
+import snakebuild.buildserver.servercmds.cache_get
+import snakebuild.buildserver.servercmds.cache_put
+import snakebuild.buildserver.servercmds.blob_get
+import snakebuild.buildserver.servercmds.blob_put
+import snakebuild.buildserver.servercmds.blob_manifest
+import snakebuild.buildserver.servercmds.chunk_put
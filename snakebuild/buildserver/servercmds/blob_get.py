@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd blob_get. This command returns a
+    part of a blob (log or artifact) stored within the build cache.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error, BinaryAnswer
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('blob_get', False)
+def blob_get(buildcache, digest, offset=0):
+    ''' This command returns the part of the blob from the given offset to
+        the end of the chunk containing it. The data is sent as binary
+        payload straight from the chunk file. A client reads the whole blob
+        by sending the offset of the answer with the next request until it
+        is finished.
+
+        @param buildcache: The BuildCache instance
+        @param digest: The hash of the blob
+        @param offset: The offset (in bytes) to read from
+        @return: the binary answer to return to the client (a plain
+                answer if the offset is at the end of the blob)
+    '''
+    if type(offset) is not int or offset < 0:
+        return prepare_error(_('Illegal value for the offset. Expected a '
+                'positive integer but got {0}').format(offset))
+    try:
+        path, chunk_offset, length, total = buildcache.locate(digest, offset)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+
+    answer = prepare_answer()
+    answer['offset'] = offset + length
+    answer['size'] = total
+    answer['finished'] = offset + length >= total
+    if path is None:
+        # the offset is at the end of the blob, there is nothing to send
+        answer['offset'] = offset
+        return answer
+    return BinaryAnswer(answer, path, chunk_offset, length)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd blob_manifest. This command returns
+    the list of the chunks of a blob stored within the build cache.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('blob_manifest', False)
+def blob_manifest(buildcache, digest):
+    ''' This command returns the manifest of the given blob. A client only
+        needs to download the chunks it does not have already.
+
+        @param buildcache: The BuildCache instance
+        @param digest: The hash of the blob
+        @return: the answer object to return to the client
+    '''
+    try:
+        manifest = buildcache.get_manifest(digest)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+    if manifest is None:
+        return prepare_error(_('The blob is not stored: {0}').format(digest))
+
+    answer = prepare_answer()
+    answer['manifest'] = manifest
+    return answer
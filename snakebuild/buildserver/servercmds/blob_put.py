@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd blob_put. This command stores a blob
+    (log or artifact) from the chunks uploaded before within the build
+    cache.
+'''
+
+import logging
+
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('blob_put', False)
+def blob_put(buildcache, digest, manifest):
+    ''' This command stores the blob with the given manifest. All the chunks
+        listed must be stored with chunk_put before, the content gets
+        checked against the hash of the blob.
+
+        @param buildcache: The BuildCache instance
+        @param digest: The hash of the blob
+        @param manifest: The manifest with the size ('size') and the list of
+                the [hash, size] of the chunks ('chunks')
+        @return: the answer object to return to the client
+    '''
+    try:
+        buildcache.put_blob(digest, manifest)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+    return prepare_answer()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd cache_get. This command returns a
+    build step result stored within the build cache.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('cache_get', False)
+def cache_get(buildcache, key):
+    ''' This command returns the result with the given key. The log and the
+        artifacts are given as the hashes of the blobs to get with the
+        blob_get command.
+
+        @param buildcache: The BuildCache instance
+        @param key: The key of the result
+        @return: the answer object to return to the client
+    '''
+    try:
+        result = buildcache.get_result(key)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+    if result is None:
+        return prepare_error(_('The result is not stored: {0}').format(key))
+
+    answer = prepare_answer()
+    answer['result'] = result
+    return answer
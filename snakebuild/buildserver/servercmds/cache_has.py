@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd cache_has. This command checks which
+    of the given build step results, blobs and chunks are stored within the
+    build cache.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('cache_has', False)
+def cache_has(buildcache, keys=None, blobs=None, chunks=None):
+    ''' This command returns the keys of the results and the hashes of the
+        blobs and chunks stored within the cache.
+
+        @param buildcache: The BuildCache instance
+        @param keys: The list of the keys of the results to check
+        @param blobs: The list of the hashes of the blobs to check
+        @param chunks: The list of the hashes of the chunks to check
+        @return: the answer object to return to the client
+    '''
+    if keys is None:
+        keys = []
+    if blobs is None:
+        blobs = []
+    if chunks is None:
+        chunks = []
+    if (not isinstance(keys, list) or not isinstance(blobs, list) or
+            not isinstance(chunks, list)):
+        return prepare_error(_('The keys, the blobs and the chunks must be '
+                'given as lists.'))
+    try:
+        keys, blobs, chunks = buildcache.has(keys, blobs, chunks)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+
+    answer = prepare_answer()
+    answer['keys'] = keys
+    answer['blobs'] = blobs
+    answer['chunks'] = chunks
+    return answer
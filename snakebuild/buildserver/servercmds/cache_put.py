@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd cache_put. This command stores a
+    build step result within the build cache.
+'''
+
+import logging
+
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('cache_put', False)
+def cache_put(buildcache, key, result):
+    ''' This command stores the result with the given key. The blobs of the
+        log and the artifacts must be stored before with blob_put.
+
+        @param buildcache: The BuildCache instance
+        @param key: The key of the result
+        @param result: The result dictionary with the status ('status'), the
+                output values ('output'), the hash of the log ('log') and the
+                hashes of the artifacts by file name ('artifacts')
+        @return: the answer object to return to the client
+    '''
+    try:
+        buildcache.put_result(key, result)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+    return prepare_answer()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.buildserver.servercmd chunk_put. This command stores a
+    chunk of a blob within the build cache.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.buildserver.buildcache import BuildCacheException
+
+LOG = logging.getLogger('snakebuild.buildserver.commands')
+
+
+@remote_command('chunk_put', False)
+def chunk_put(buildcache, digest, payload=None):
+    ''' This command stores the chunk sent as binary payload with the
+        message. The data gets checked against the hash.
+
+        @param buildcache: The BuildCache instance
+        @param digest: The hash of the chunk
+        @param payload: The content of the chunk
+        @return: the answer object to return to the client
+    '''
+    if payload is None:
+        return prepare_error(_('The chunk must be sent as binary data.'))
+    try:
+        buildcache.put_chunk(digest, payload)
+    except BuildCacheException, exc:
+        return prepare_error(str(exc))
+    return prepare_answer()
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The ChunkStore stores files (blobs) by the sha1 hash of their content.
+    Each blob is split into chunks of CHUNK_SIZE bytes which are stored by
+    their own hash, a chunk used by multiple blobs (or multiple times within
+    one blob) is stored only once. A blob is described by its manifest: the
+    size and the list of the hashes and sizes of its chunks. The hashes are
+    computed while reading the file, it is read only once.
+
+    The store directory contains:
+
+        chunks/<hash[:2]>/<hash>        the chunks
+        blobs/<hash[:2]>/<hash>.json    the manifests of the blobs
+'''
+
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+from snakebuild.i18n import _
+
+LOG = logging.getLogger('snakebuild.common.chunkstore')
+
+# the size of the chunks the blobs are split into
+CHUNK_SIZE = 1048576
+
+_HASH_RE = re.compile('^[0-9a-f]{40}$')
+
+
+class ChunkStoreException(BaseException):
+    ''' The exception thrown if a blob or a chunk is not valid or not
+        stored.
+    '''
+
+
+class ChunkStore(object):
+    ''' The store of the blobs within one directory. It can be used from
+        multiple threads.
+    '''
+
+    def __init__(self, directory):
+        ''' Create the store, the blobs already stored within the directory
+            are kept. The chunks not used by any blob (left over by an
+            interrupted upload) are removed.
+
+            @param directory: The directory to store the blobs in
+        '''
+        self.directory = directory
+        self.lock = threading.Lock()
+        # the number of times each chunk is used by the blobs
+        self.refs = {}
+        # the number of bytes used by the chunks
+        self.size = 0
+
+        for name in ('chunks', 'blobs', 'tmp'):
+            if not os.path.isdir(os.path.join(directory, name)):
+                os.makedirs(os.path.join(directory, name))
+        for name in os.listdir(os.path.join(directory, 'tmp')):
+            os.remove(os.path.join(directory, 'tmp', name))
+        for dirpath, dirnames, filenames in os.walk(os.path.join(directory,
+                'blobs')):
+            for name in filenames:
+                try:
+                    with open(os.path.join(dirpath, name), 'r') as mfl:
+                        manifest = json.load(mfl)
+                except (IOError, ValueError):
+                    os.remove(os.path.join(dirpath, name))
+                    continue
+                for digest, size in manifest['chunks']:
+                    self.refs[digest] = self.refs.get(digest, 0) + 1
+        for dirpath, dirnames, filenames in os.walk(os.path.join(directory,
+                'chunks')):
+            for name in filenames:
+                if name in self.refs:
+                    self.size += os.path.getsize(os.path.join(dirpath, name))
+                else:
+                    os.remove(os.path.join(dirpath, name))
+
+    def has(self, digest):
+        ''' Check if the given blob is stored.
+
+            @param digest: The hash of the blob
+            @return: True if it is stored
+        '''
+        return os.path.isfile(self._get_manifest_path(digest))
+
+    def missing(self, chunks):
+        ''' Get the chunks which are not stored.
+
+            @param chunks: The list of the hashes of the chunks
+            @return: The list of the hashes not stored
+        '''
+        return [digest for digest in chunks
+                if not os.path.isfile(self.chunk_path(digest))]
+
+    def get_manifest(self, digest):
+        ''' Get the manifest of the given blob.
+
+            @param digest: The hash of the blob
+            @return: The manifest dictionary with the size ('size') and the
+                    list of the [hash, size] of the chunks ('chunks') or None
+                    if the blob is not stored
+        '''
+        try:
+            with open(self._get_manifest_path(digest), 'r') as mfl:
+                return json.load(mfl)
+        except (IOError, ValueError):
+            return None
+
+    def add_file(self, path):
+        ''' Add the given file as a blob. Only the chunks not yet stored are
+            written.
+
+            @param path: The file to add
+            @return: The hash of the blob
+        '''
+        blob_digest = hashlib.sha1()
+        chunks = []
+        size = 0
+        try:
+            with open(path, 'rb') as bfl:
+                for data in iter(lambda: bfl.read(CHUNK_SIZE), ''):
+                    blob_digest.update(data)
+                    digest = hashlib.sha1(data).hexdigest()
+                    # counted right away, a concurrent remove keeps it
+                    self._write_chunk(digest, data, True)
+                    chunks.append([digest, len(data)])
+                    size += len(data)
+        except:
+            with self.lock:
+                self._drop_refs(chunks)
+            raise
+        digest = blob_digest.hexdigest()
+        self._add_manifest(digest, {'size': size, 'chunks': chunks}, True)
+        return digest
+
+    def add_chunk(self, digest, data):
+        ''' Add a chunk received from somewhere else.
+
+            @param digest: The hash of the chunk
+            @param data: The content of the chunk
+        '''
+        if hashlib.sha1(data).hexdigest() != digest:
+            raise ChunkStoreException(_('The data of the chunk {0} does not '
+                    'match its hash.').format(digest))
+        if len(data) > CHUNK_SIZE:
+            raise ChunkStoreException(_('The chunk {0} is bigger than '
+                    '{1:d} bytes.').format(digest, CHUNK_SIZE))
+        self._write_chunk(digest, data)
+
+    def add_manifest(self, digest, manifest):
+        ''' Add a blob from its manifest, all the chunks must be stored
+            already. The content of the blob gets checked against its hash.
+
+            @param digest: The hash of the blob
+            @param manifest: The manifest dictionary (see get_manifest)
+        '''
+        try:
+            chunks = [[str(chunk), int(size)]
+                    for chunk, size in manifest['chunks']]
+            size = int(manifest['size'])
+        except (KeyError, TypeError, ValueError):
+            raise ChunkStoreException(_('The manifest of the blob {0} is '
+                    'not valid.').format(digest))
+        missing = self.missing([chunk for chunk, chunk_size in chunks])
+        if len(missing) > 0:
+            raise ChunkStoreException(_('The chunks of the blob {0} are not '
+                    'stored: {1}').format(digest, ', '.join(missing)))
+        blob_digest = hashlib.sha1()
+        total = 0
+        for chunk, chunk_size in chunks:
+            with open(self.chunk_path(chunk), 'rb') as cfl:
+                data = cfl.read()
+            if len(data) != chunk_size:
+                raise ChunkStoreException(_('The size of the chunk {0} does '
+                        'not match the manifest.').format(chunk))
+            blob_digest.update(data)
+            total += chunk_size
+        if total != size or blob_digest.hexdigest() != digest:
+            raise ChunkStoreException(_('The chunks do not match the blob '
+                    '{0}.').format(digest))
+        self._add_manifest(digest, {'size': size, 'chunks': chunks})
+
+    def locate(self, digest, offset):
+        ''' Find the chunk with the given offset of a blob.
+
+            @param digest: The hash of the blob
+            @param offset: The offset within the blob
+            @return: (path, chunk_offset, length, size) the file of the
+                    chunk, the offset within the chunk, the number of bytes
+                    left within the chunk and the size of the blob
+        '''
+        manifest = self.get_manifest(digest)
+        if manifest is None:
+            raise ChunkStoreException(_('The blob {0} is not stored.').format(
+                    digest))
+        start = 0
+        for chunk, size in manifest['chunks']:
+            if offset < start + size:
+                return (self.chunk_path(chunk), offset - start,
+                        start + size - offset, manifest['size'])
+            start += size
+        return None, 0, 0, manifest['size']
+
+    def read(self, digest, offset, size):
+        ''' Read from the given blob.
+
+            @param digest: The hash of the blob
+            @param offset: The offset to read from
+            @param size: The maximum number of bytes to read, the data
+                    returned does not go beyond the end of the chunk
+            @return: The data read (empty at the end of the blob)
+        '''
+        path, chunk_offset, length, total = self.locate(digest, offset)
+        if path is None:
+            return ''
+        with open(path, 'rb') as cfl:
+            cfl.seek(chunk_offset)
+            return cfl.read(min(size, length))
+
+    def extract(self, digest, target):
+        ''' Write the content of the given blob into a file.
+
+            @param digest: The hash of the blob
+            @param target: The file to write
+        '''
+        manifest = self.get_manifest(digest)
+        if manifest is None:
+            raise ChunkStoreException(_('The blob {0} is not stored.').format(
+                    digest))
+        with open(target, 'wb') as tfl:
+            for chunk, size in manifest['chunks']:
+                with open(self.chunk_path(chunk), 'rb') as cfl:
+                    tfl.write(cfl.read())
+
+    def remove(self, digest):
+        ''' Remove the given blob and the chunks no other blob uses.
+
+            @param digest: The hash of the blob
+        '''
+        manifest = self.get_manifest(digest)
+        if manifest is None:
+            return
+        with self.lock:
+            try:
+                os.remove(self._get_manifest_path(digest))
+            except OSError:
+                return
+            self._drop_refs(manifest['chunks'])
+
+    def chunk_path(self, digest):
+        ''' Get the file name of the given chunk.
+
+            @param digest: The hash of the chunk
+            @return: The path of the file
+        '''
+        check_hash(digest)
+        return os.path.join(self.directory, 'chunks', digest[:2], digest)
+
+    def _get_manifest_path(self, digest):
+        ''' Get the file name of the manifest of the given blob.
+
+            @param digest: The hash of the blob
+            @return: The path of the file
+        '''
+        check_hash(digest)
+        return os.path.join(self.directory, 'blobs', digest[:2],
+                '{0}.json'.format(digest))
+
+    def _write_chunk(self, digest, data, count=False):
+        ''' Write the given chunk if it is not stored yet.
+
+            @param digest: The hash of the chunk
+            @param data: The content of the chunk
+            @param count: Count the use of the chunk (under the same lock as
+                    the check if it is stored)
+        '''
+        path = self.chunk_path(digest)
+        with self.lock:
+            stored = os.path.isfile(path)
+            if count:
+                self._add_ref(digest, len(data))
+        if stored:
+            return
+        try:
+            _write_file(path, os.path.join(self.directory, 'tmp'), data)
+        except:
+            if count:
+                with self.lock:
+                    self._drop_refs([[digest, len(data)]])
+            raise
+
+    def _add_manifest(self, digest, manifest, counted=False):
+        ''' Store the manifest of a blob and count the chunks used. If the
+            chunks are not counted yet they must be stored.
+
+            @param digest: The hash of the blob
+            @param manifest: The manifest dictionary
+            @param counted: True if the chunks are counted already (while
+                    they got written)
+        '''
+        path = self._get_manifest_path(digest)
+        with self.lock:
+            if os.path.isfile(path):
+                if counted:
+                    self._drop_refs(manifest['chunks'])
+                return
+            if not counted:
+                # checked again, a remove might have deleted one since
+                missing = self.missing([chunk for chunk, size in
+                        manifest['chunks']])
+                if len(missing) > 0:
+                    raise ChunkStoreException(_('The chunks of the blob {0} '
+                            'are not stored: {1}').format(digest,
+                            ', '.join(missing)))
+            try:
+                _write_file(path, os.path.join(self.directory, 'tmp'),
+                        json.dumps(manifest))
+            except:
+                if counted:
+                    self._drop_refs(manifest['chunks'])
+                raise
+            if not counted:
+                for chunk, size in manifest['chunks']:
+                    self._add_ref(chunk, size)
+
+    def _add_ref(self, chunk, size):
+        ''' Count one more use of the given chunk. The lock must be held.
+
+            @param chunk: The hash of the chunk
+            @param size: The size of the chunk
+        '''
+        if not chunk in self.refs:
+            self.refs[chunk] = 0
+            self.size += size
+        self.refs[chunk] += 1
+
+    def _drop_refs(self, chunks):
+        ''' Count one use less of the given chunks, the chunks not used
+            anymore are removed. The lock must be held.
+
+            @param chunks: The list of the [hash, size] of the chunks
+        '''
+        for chunk, size in chunks:
+            self.refs[chunk] -= 1
+            if self.refs[chunk] > 0:
+                continue
+            del self.refs[chunk]
+            self.size -= size
+            try:
+                os.remove(self.chunk_path(chunk))
+            except OSError:
+                pass
+
+
+def get_file_manifest(path):
+    ''' Split the given file into chunks the way the store does without
+        storing it. The file is read only once.
+
+        @param path: The file to read
+        @return: (digest, manifest) the hash and the manifest of the blob
+    '''
+    blob_digest = hashlib.sha1()
+    chunks = []
+    size = 0
+    with open(path, 'rb') as bfl:
+        for data in iter(lambda: bfl.read(CHUNK_SIZE), ''):
+            blob_digest.update(data)
+            chunks.append([hashlib.sha1(data).hexdigest(), len(data)])
+            size += len(data)
+    return blob_digest.hexdigest(), {'size': size, 'chunks': chunks}
+
+
+def _write_file(path, tmp_dir, data):
+    ''' Write the file atomically: it is written into the temporary
+        directory first and moved to its place afterwards.
+
+        @param path: The file to write
+        @param tmp_dir: The temporary directory on the same file system
+        @param data: The content of the file
+    '''
+    if not os.path.isdir(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # created by another thread
+            pass
+    handle, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    with os.fdopen(handle, 'wb') as tfl:
+        tfl.write(data)
+    os.rename(tmp_path, path)
+
+
+def check_hash(value):
+    ''' Check that the given value is a valid sha1 hex string (it is used
+        within the file names).
+
+        @param value: The value to check
+    '''
+    if not isinstance(value, (str, unicode)) or not _HASH_RE.match(value):
+        raise ChunkStoreException(_('Not a valid hash: {0}').format(value))
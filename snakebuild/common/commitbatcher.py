@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The CommitBatcher collects the changes of files within a versioned
+    directory and commits them together. A commit is made after a time
+    window since the first change or as soon as enough files changed. The
+    commits are pushed to the remote repository within a separate thread,
+    therefore the callers never wait for git.
+'''
+
+import os
+import logging
+import threading
+
+from snakebuild.i18n import _
+from snakebuild.common.timerqueue import TimerQueue
+from snakebuild.common.versioneddir import VersionedDirException
+
+LOG = logging.getLogger('snakebuild.common.commitbatcher')
+
+
+class CommitResult(object):
+    ''' The result of a batch of changes. It gets the commit id as soon as
+        the batch is commited and the information if the commit got pushed.
+    '''
+
+    def __init__(self):
+        ''' Create the result of a batch not yet commited. '''
+        self.revision = None
+        self.error = None
+        # None until the push is done (or not done since there is no push)
+        self.pushed = None
+        self._commited = threading.Event()
+        self._push_done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def wait(self, timeout=None):
+        ''' Wait for the commit.
+
+            @param timeout: The maximum time to wait in seconds, None waits
+                    until the commit is done.
+            @return: The commit id or None if there is no commit (yet)
+        '''
+        self._commited.wait(timeout)
+        return self.revision
+
+    def wait_pushed(self, timeout=None):
+        ''' Wait for the push of the commit.
+
+            @param timeout: The maximum time to wait in seconds, None waits
+                    until the push is done.
+            @return: True if the commit got pushed
+        '''
+        self._push_done.wait(timeout)
+        return self.pushed is True
+
+    def add_callback(self, callback):
+        ''' Register a function to call as soon as the batch is commited (or
+            failed). If it is already commited the function is called right
+            away.
+
+            @param callback: The function to call with this object as the
+                    only parameter.
+        '''
+        with self._lock:
+            if not self._commited.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_revision(self, revision, error=None):
+        ''' Set the commit id (or the error) and call the callbacks.
+
+            @param revision: The commit id or None on error
+            @param error: The error message if the commit failed
+        '''
+        with self._lock:
+            self.revision = revision
+            self.error = error
+            self._commited.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+    def set_pushed(self, pushed):
+        ''' Set the result of the push.
+
+            @param pushed: True if the commit got pushed
+        '''
+        self.pushed = pushed
+        self._push_done.set()
+
+
+class CommitBatcher(object):
+    ''' Collect the changes of the files within a versioned directory and
+        commit them as one commit.
+    '''
+
+    def __init__(self, repo, author_name, author_email, window=1.0,
+            max_changes=100, push=True):
+        ''' Create the batcher.
+
+            @param repo: The versioned directory to change
+            @param author_name: The name of the author of the commits
+            @param author_email: The email address of the author
+            @param window: The number of seconds to wait after the first
+                    change of a batch before commiting it
+            @param max_changes: The number of changed files which causes a
+                    commit right away
+            @param push: Push the commits to the remote repository
+        '''
+        self.repo = repo
+        self.author_name = author_name
+        self.author_email = author_email
+        self.window = window
+        self.max_changes = max_changes
+        self.push = push
+
+        self.lock = threading.Lock()
+        # the open batch: {name: content or None to remove}
+        self.changes = {}
+        self.comments = []
+        self.result = None
+        self.timer = None
+        # the full batches not yet commited (changes, comments, result)
+        self.batches = []
+        self.commit_lock = threading.Lock()
+        # the commits made and not yet pushed (CommitResult objects)
+        self.unpushed = []
+        self.timers = TimerQueue('commitbatcher')
+        self.pushes = TimerQueue('commitbatcher-push')
+
+    def write(self, name, content, comment=None):
+        ''' Change the content of the given file (or add the file).
+
+            @param name: The path of the file within the repository
+            @param content: The new content of the file
+            @param comment: The text to add to the commit message
+            @return: The CommitResult of the batch containing the change
+            @raise VersionedDirException: If the name is not within the
+                    repository
+        '''
+        return self._add_change(name, content, comment)
+
+    def remove(self, name, comment=None):
+        ''' Remove the given file.
+
+            @param name: The path of the file within the repository
+            @param comment: The text to add to the commit message
+            @return: The CommitResult of the batch containing the change
+            @raise VersionedDirException: If the name is not within the
+                    repository
+        '''
+        return self._add_change(name, None, comment)
+
+    def flush(self):
+        ''' Commit the open batch (and the full batches not yet commited)
+            right away and schedule the push.
+
+            @return: The CommitResult of the open batch or None if there was
+                    no open batch.
+        '''
+        with self.lock:
+            batch = self._take_batch()
+            if batch is not None:
+                self.batches.append(batch)
+        self._commit_batches()
+        if batch is None:
+            return None
+        return batch[2]
+
+    def close(self):
+        ''' Commit the open batch and wait until all the commits got
+            pushed, afterwards the batcher can not be used anymore.
+        '''
+        self.timers.stop(True)
+        self.flush()
+        with self.lock:
+            unpushed = list(self.unpushed)
+        for result in unpushed:
+            result.wait_pushed()
+        self.pushes.stop(True)
+
+    def _commit_batches(self):
+        ''' Commit the batches taken in the order they got taken. '''
+        with self.commit_lock:
+            while True:
+                with self.lock:
+                    if len(self.batches) == 0:
+                        return
+                    batch = self.batches.pop(0)
+                self._commit(*batch)
+
+    def _take_batch(self):
+        ''' Take the open batch, the next change starts a new one. The lock
+            must be held.
+
+            @return: A tuple with the changes, the comments and the
+                    CommitResult or None if there is no open batch
+        '''
+        if self.result is None:
+            return None
+        batch = (self.changes, self.comments, self.result)
+        self.timer.cancel()
+        self.changes = {}
+        self.comments = []
+        self.result = None
+        self.timer = None
+        return batch
+
+    def _commit(self, changes, comments, result):
+        ''' Commit the given batch and schedule its push.
+
+            @param changes: The dictionary of the changes {name: content}
+            @param comments: The list of the comments for the message
+            @param result: The CommitResult of the batch
+            @return: The CommitResult
+        '''
+        try:
+            with self.repo.lock:
+                for name in sorted(changes):
+                    _apply_change(self.repo, name, changes[name])
+                if self.repo.has_changes():
+                    self.repo.commit(self.author_name, self.author_email,
+                            _commit_message(changes, comments))
+                revision = self.repo.get_revision()
+        except (VersionedDirException, IOError, OSError), exc:
+            LOG.error(_('Could not commit the changes: {0}').format(exc))
+            _reset_changes(self.repo)
+            result.set_revision(None, str(exc))
+            result.set_pushed(False)
+            return result
+
+        result.set_revision(revision)
+        if self.push and self.repo.has_remote():
+            with self.lock:
+                self.unpushed.append(result)
+            self.pushes.schedule(0, self._push)
+        else:
+            result.set_pushed(False)
+        return result
+
+    def _add_change(self, name, content, comment):
+        ''' Add the change to the open batch and start a new batch if there
+            is none.
+
+            @param name: The path of the file within the repository
+            @param content: The new content or None to remove the file
+            @param comment: The text for the commit message or None
+            @return: The CommitResult of the batch
+        '''
+        _check_name(self.repo, name)
+        with self.lock:
+            self.changes[name] = content
+            if comment is not None:
+                self.comments.append(comment)
+            result = self.result
+            if result is None:
+                result = self.result = CommitResult()
+                self.timer = self.timers.schedule(self.window, self.flush)
+            if len(self.changes) >= self.max_changes:
+                # the batch is full, do not wait for the end of the window
+                self.batches.append(self._take_batch())
+                self.timers.schedule(0, self._commit_batches)
+        return result
+
+    def _push(self):
+        ''' Push all the commits made so far. '''
+        with self.lock:
+            results = self.unpushed
+            self.unpushed = []
+        if len(results) == 0:
+            # already pushed together with an earlier commit
+            return
+        try:
+            self.repo.push_remote()
+            pushed = True
+        except VersionedDirException, exc:
+            LOG.warning(_('Could not push the commits: {0}').format(exc))
+            pushed = False
+        for result in results:
+            result.set_pushed(pushed)
+
+
+def _check_name(repo, name):
+    ''' Check that the given file name is within the repository.
+
+        @param repo: The versioned directory
+        @param name: The path of the file within the repository
+    '''
+    root = os.path.join(os.path.normpath(repo.path), '')
+    path = os.path.normpath(repo.get_local_path(name))
+    if os.path.isabs(name) or not path.startswith(root) or \
+            path.startswith(os.path.join(root, '.git', '')):
+        raise VersionedDirException(_('The file name is not within the '
+                'repository: {0}').format(name))
+
+
+def _reset_changes(repo):
+    ''' Drop the changes of a failed commit from the index, otherwise they
+        would be commited with the next batch.
+
+        @param repo: The versioned directory
+    '''
+    try:
+        repo.reset_changes()
+    except VersionedDirException, exc:
+        LOG.error(_('Could not reset the changes: {0}').format(exc))
+
+
+def _apply_change(repo, name, content):
+    ''' Write (or remove) the given file and add the change to the
+        repository.
+
+        @param repo: The versioned directory
+        @param name: The path of the file within the repository
+        @param content: The new content or None to remove the file
+    '''
+    path = repo.get_local_path(name)
+    if content is None:
+        if os.path.exists(path):
+            repo.remove(name)
+        return
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    cfile = open(path, 'w')
+    cfile.write(content)
+    cfile.close()
+    repo.add(name)
+
+
+def _commit_message(changes, comments):
+    ''' Create the commit message of a batch.
+
+        @param changes: The dictionary of the changes {name: content}
+        @param comments: The list of the comments given with the changes
+        @return: The commit message
+    '''
+    if len(comments) == 0:
+        return 'Changed {0:d} files'.format(len(changes))
+    return '\n'.join(comments)
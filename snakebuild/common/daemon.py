@@ -45,7 +45,7 @@ import os
 import sys
 import time
 import logging
-from signal import signal, SIGTERM
+from signal import signal, SIGTERM, SIGHUP
 
 from snakebuild.i18n import _
 from snakebuild.common import output
@@ -70,7 +70,7 @@ class Daemon(object):
 
         * The instance object MUST provide a global (and named as) pidfile.
     '''
-    START, STOP, RESTART, FOREGROUND, UNKNOWN = range(5)
+    START, STOP, RESTART, FOREGROUND, UNKNOWN, RELOAD = range(6)
     UMASK = 0
     WORKDIR = "."
     instance = None
@@ -81,7 +81,8 @@ class Daemon(object):
             will be run as a daemonized process. This will happen if the action
             is set to START or RESTART. On STOP the former running instance
             should be stoped. This only works if the pid file is stored
-            correctly.
+            correctly. On RELOAD the running instance gets a SIGHUP signal,
+            which calls the reload method of the instance (if it has one).
             The instance needs to have a method run and and the following
             instance variables:
               * pidfile    holds the path to a file to store the proces
@@ -96,6 +97,7 @@ class Daemon(object):
         self.instance = instance
         self.startstop(action)
         signal(SIGTERM, self.shutdown)
+        signal(SIGHUP, self.reload)
         try:
             instance.run()
         except KeyboardInterrupt:
@@ -111,6 +113,16 @@ class Daemon(object):
         self.instance.shutdown()
         return True
 
+    def reload(self, signum, frame):
+        """ The signal handler for the SIGHUP signal.
+            @param signum: The signal number must be SIGHUP
+            @param frame: The stack frame (not used)
+        """
+        LOG.info(_("SIGHUP received reload."))
+        if hasattr(self.instance, 'reload'):
+            self.instance.reload()
+        return True
+
     def deamonize(self):
         """Fork the process into the background.
         """
@@ -199,6 +211,17 @@ class Daemon(object):
                 else:
                     print str(err)
                     sys.exit(1)
+        if action == self.RELOAD:
+            if not pid:
+                LOG.error(_("Could not reload, pid file '{0}' "
+                        "missing.").format(self.instance.pidfile))
+                sys.exit(1)
+            try:
+                os.kill(pid, SIGHUP)
+            except OSError, err:
+                LOG.error(_("Could not reload: {0}").format(err))
+                sys.exit(1)
+            sys.exit(0)
         if action == self.START:
             if pid:
                 LOG.error(_("Start aborted since pid file '{0}' "
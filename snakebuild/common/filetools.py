@@ -66,3 +66,24 @@ def read_full_line(ofile):
         return line
     ofile.seek(where)
     return None
+
+
+def disk_usage(path, skip=()):
+    ''' Get the number of bytes used by the files within the given directory
+        (and its sub directories). Links are counted with their own size.
+
+        @param path: The directory to check
+        @param skip: The names of the files within the directory itself
+                (not the sub directories) which are not counted
+        @return: The number of bytes
+    '''
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            if dirpath == path and filename in skip:
+                continue
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
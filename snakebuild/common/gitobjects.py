@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' Read the objects (files and directories) of a git repository without a
+    working tree. The objects are read with two long running git cat-file
+    processes, one to look up the object id of a name (for example
+    master:resources/test.resource) and one to read the content of an object.
+    The objects are immutable, therefore the content is cached by the object
+    id and only the look up of the name has to ask git each time.
+'''
+
+import subprocess
+import threading
+import collections
+import logging
+
+LOG = logging.getLogger('snakebuild.common.gitobjects')
+
+# the mode of a directory within a tree object
+TREE_MODE = '40000'
+
+
+class GitObjectException(BaseException):
+    ''' The exception thrown if an object could not be read. '''
+
+
+class GitObjectReader(object):
+    ''' Read the objects of the git repository at the given path. The
+        reader can be used from multiple threads.
+    '''
+
+    def __init__(self, path, cache_size=16 * 1024 * 1024):
+        ''' Create the reader, the git processes are started with the first
+            request.
+
+            @param path: The path of the git repository (working tree or bare)
+            @param cache_size: The maximum number of bytes of the object
+                    contents to keep within the cache.
+        '''
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+        self.check_process = None
+        self.read_process = None
+
+    def resolve(self, name):
+        ''' Get the object id and the type of the given name.
+
+            @param name: The name of the object, anything git rev-parse
+                    accepts (for example a commit id, master or
+                    v1.0:path/file).
+            @return: A tuple with the object id and the type (blob, tree,
+                    commit or tag) or None if the object does not exist.
+        '''
+        _check_name(name)
+        with self.lock:
+            self.check_process = self._request(self.check_process,
+                    '--batch-check', name)
+            header = self.check_process.stdout.readline()
+            parts = header.split()
+            if len(parts) != 3:
+                return None
+            return parts[0], parts[1]
+
+    def read(self, object_id):
+        ''' Get the content of the object with the given id.
+
+            @param object_id: The id of the object (see resolve)
+            @return: A tuple with the type and the content of the object
+        '''
+        _check_name(object_id)
+        with self.lock:
+            entry = self.cache.pop(object_id, None)
+            if entry is None:
+                entry = self._read(object_id)
+                self.cached_bytes += len(entry[1])
+                while self.cached_bytes > self.cache_size and self.cache:
+                    self.cached_bytes -= len(self.cache.popitem(False)[1][1])
+            self.cache[object_id] = entry
+            return entry
+
+    def read_blob(self, revision, name):
+        ''' Get the content of the file with the given name.
+
+            @param revision: The commit, branch or tag to read the file from
+            @param name: The path of the file within the repository
+            @return: The content or None if there is no file with this name.
+        '''
+        found = self.resolve('{0}:{1}'.format(revision, name))
+        if found is None or found[1] != 'blob':
+            return None
+        return self.read(found[0])[1]
+
+    def list_tree(self, revision, name=''):
+        ''' Get the entries of the directory with the given name.
+
+            @param revision: The commit, branch or tag to read the directory
+                    from
+            @param name: The path of the directory within the repository, an
+                    empty string for the top directory.
+            @return: A list with a (name, is_directory, object_id) tuple for
+                    each entry or None if there is no directory with this
+                    name.
+        '''
+        found = self.resolve('{0}:{1}'.format(revision, name))
+        if found is None or found[1] != 'tree':
+            return None
+        return _parse_tree(found[0], self.read(found[0])[1])
+
+    def close(self):
+        ''' Stop the git processes, they get started again on the next
+            request.
+        '''
+        with self.lock:
+            for process in (self.check_process, self.read_process):
+                if process is not None:
+                    process.stdin.close()
+                    process.wait()
+            self.check_process = None
+            self.read_process = None
+
+    def _read(self, object_id):
+        ''' Read the object with the given id from git. The lock must be
+            held.
+
+            @param object_id: The id of the object
+            @return: A tuple with the type and the content of the object
+        '''
+        self.read_process = self._request(self.read_process, '--batch',
+                object_id)
+        header = self.read_process.stdout.readline()
+        parts = header.split()
+        if len(parts) != 3:
+            raise GitObjectException('The object does not exist: {0}'.format(
+                    object_id))
+        size = int(parts[2])
+        content = self.read_process.stdout.read(size)
+        # every object is followed by a new line
+        self.read_process.stdout.read(1)
+        if len(content) != size:
+            self._kill(self.read_process)
+            self.read_process = None
+            raise GitObjectException('Could not read the object {0} from the '
+                    'repository {1}'.format(object_id, self.path))
+        return parts[1], content
+
+    def _request(self, process, mode, name):
+        ''' Send the given name to the cat-file process. The process is
+            started if there is none or if it died. The lock must be held.
+
+            @param process: The current process or None
+            @param mode: The cat-file mode (--batch or --batch-check)
+            @param name: The name of the object to request
+            @return: The process the request got sent to
+        '''
+        for attempt in range(2):
+            if process is None or process.poll() is not None:
+                process = subprocess.Popen(['git', 'cat-file', mode],
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                        cwd=self.path)
+            try:
+                process.stdin.write(name + '\n')
+                process.stdin.flush()
+                return process
+            except IOError, exc:
+                LOG.debug('The git cat-file process is gone: {0}'.format(exc))
+                self._kill(process)
+                process = None
+        raise GitObjectException('Could not start git cat-file for the '
+                'repository: {0}'.format(self.path))
+
+    def _kill(self, process):
+        ''' Stop the given process, it is not usable anymore.
+
+            @param process: The Popen object
+        '''
+        try:
+            process.kill()
+        except OSError:
+            pass
+        process.wait()
+
+
+def _check_name(name):
+    ''' Check that the given name can be sent to git cat-file.
+
+        @param name: The name of the object
+    '''
+    if len(name) == 0 or '\n' in name:
+        raise GitObjectException('Illegal object name: {0!r}'.format(name))
+
+
+def _parse_tree(object_id, content):
+    ''' Parse the content of a tree object. Each entry is stored as
+        "<mode> <name>\\0<binary object id>".
+
+        @param object_id: The id of the tree (gives the length of the ids)
+        @param content: The content of the tree object
+        @return: A list with a (name, is_directory, object_id) tuple for each
+                entry
+    '''
+    id_length = len(object_id) / 2
+    entries = []
+    position = 0
+    while position < len(content):
+        end = content.index('\0', position)
+        mode, name = content[position:end].split(' ', 1)
+        entry_id = content[end + 1:end + 1 + id_length].encode('hex')
+        entries.append((name, mode == TREE_MODE, entry_id))
+        position = end + 1 + id_length
+    return entries
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' Read the references (HEAD, branches, tags and remotes) of a git
+    repository directly from the files within the .git directory instead of
+    asking git. The references are cached, the cache is read again as soon
+    as the modification time of HEAD, packed-refs, the config or of one of
+    the directories below refs changes (git replaces a reference file with a
+    new one, which changes its directory).
+
+    A linked working tree (git worktree add) has its own HEAD, all the other
+    references are shared within the common directory of the repository.
+'''
+
+import os
+import re
+import threading
+
+# the prefix of a symbolic reference (HEAD -> refs/heads/master)
+SYMBOLIC_PREFIX = 'ref: '
+
+
+class GitRefException(BaseException):
+    ''' The exception thrown if the references could not be read. '''
+
+
+class GitRefCache(object):
+    ''' The cache of the references of one git repository. The cache can be
+        used from multiple threads.
+    '''
+
+    def __init__(self, path):
+        ''' Create the cache for the given repository, the references are
+            read with the first request.
+
+            @param path: The path of the working tree or of the .git
+                    directory
+        '''
+        self.git_dir = _find_git_dir(path)
+        self.common_dir = _find_common_dir(self.git_dir)
+        self.lock = threading.Lock()
+        self.stamp = None
+        # the directories below refs found with the last read
+        self.ref_dirs = []
+        self.head = None
+        self.refs = {}
+        self.remotes = []
+
+    def get_head(self):
+        ''' Get the current HEAD.
+
+            @return: A tuple with the reference HEAD points to (None if
+                    detached) and the object id of HEAD (None if the
+                    branch has no commit yet).
+        '''
+        with self.lock:
+            self._refresh()
+            return self.head
+
+    def get_refs(self, prefix='refs/'):
+        ''' Get the references starting with the given prefix. Symbolic
+            references are resolved.
+
+            @param prefix: The prefix of the references (for example
+                    refs/heads/), it is removed from the names.
+            @return: A dictionary with the object id for each name.
+        '''
+        with self.lock:
+            self._refresh()
+            return dict((name[len(prefix):], object_id) for name, object_id
+                    in self.refs.iteritems() if name.startswith(prefix))
+
+    def get_remotes(self):
+        ''' Get the names of the configured remote repositories.
+
+            @return: The sorted list of the remote names
+        '''
+        with self.lock:
+            self._refresh()
+            return list(self.remotes)
+
+    def _refresh(self):
+        ''' Read the references again if one of the files changed. The lock
+            must be held.
+        '''
+        stamp = self._get_stamp()
+        if stamp == self.stamp:
+            return
+
+        refs = {}
+        symbolic = {}
+        ref_dirs = []
+        packed = os.path.join(self.common_dir, 'packed-refs')
+        if os.path.isfile(packed):
+            for line in _read_lines(packed):
+                # comments and the peeled object ids of the annotated tags
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                parts = line.split(' ', 1)
+                if len(parts) == 2:
+                    refs[parts[1]] = parts[0]
+
+        refs_dir = os.path.join(self.common_dir, 'refs')
+        for dirpath, dirnames, filenames in os.walk(refs_dir):
+            ref_dirs.append(dirpath)
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.common_dir).replace(os.sep,
+                        '/')
+                if name.endswith('.lock'):
+                    continue
+                value = _read_value(path)
+                if value is None:
+                    continue
+                if value.startswith(SYMBOLIC_PREFIX):
+                    symbolic[name] = value[len(SYMBOLIC_PREFIX):]
+                else:
+                    refs[name] = value
+        for name, target in symbolic.iteritems():
+            if target in refs:
+                refs[name] = refs[target]
+
+        head = _read_value(os.path.join(self.git_dir, 'HEAD'))
+        if head is None:
+            raise GitRefException('Could not read the HEAD of the git '
+                    'repository: {0}'.format(self.git_dir))
+        if head.startswith(SYMBOLIC_PREFIX):
+            target = head[len(SYMBOLIC_PREFIX):]
+            self.head = (target, refs.get(target))
+        else:
+            self.head = (None, head)
+
+        self.refs = refs
+        self.remotes = _read_remotes(os.path.join(self.common_dir, 'config'))
+        if ref_dirs == self.ref_dirs:
+            self.stamp = stamp
+        else:
+            # the stamp does not cover the new directories, take it again
+            # with the next request
+            self.ref_dirs = ref_dirs
+            self.stamp = None
+
+    def _get_stamp(self):
+        ''' Get the modification times of HEAD, packed-refs, the config and
+            of the directories with the references (not of every reference
+            file).
+
+            @return: A list with the stamp of each file and directory
+        '''
+        stamp = [_stat(os.path.join(self.git_dir, 'HEAD'))]
+        for name in ('packed-refs', 'config'):
+            stamp.append(_stat(os.path.join(self.common_dir, name)))
+        for path in self.ref_dirs:
+            stamp.append(_stat(path))
+        return stamp
+
+
+def _find_git_dir(path):
+    ''' Get the .git directory of the given repository. A .git file (used by
+        the linked working trees) points to the directory.
+
+        @param path: The path of the working tree or of the .git directory
+        @return: The path of the .git directory
+    '''
+    if os.path.isfile(os.path.join(path, 'HEAD')):
+        return path
+    git_dir = os.path.join(path, '.git')
+    if os.path.isfile(git_dir):
+        value = _read_value(git_dir)
+        if value is not None and value.startswith('gitdir: '):
+            return os.path.join(path, value[len('gitdir: '):])
+    if not os.path.isdir(git_dir):
+        raise GitRefException('The given directory is not a git repository: '
+                '{0}'.format(path))
+    return git_dir
+
+
+def _find_common_dir(git_dir):
+    ''' Get the directory with the references shared by all the working
+        trees. The .git directory of a linked working tree points to it with
+        the commondir file.
+
+        @param git_dir: The path of the .git directory
+        @return: The path of the common directory
+    '''
+    value = _read_value(os.path.join(git_dir, 'commondir'))
+    if value is None:
+        return git_dir
+    return os.path.normpath(os.path.join(git_dir, value))
+
+
+def _stat(path):
+    ''' Get the modification time, the size and the inode of the given
+        file or directory. Git replaces a file with a new one on every change.
+
+        @param path: The path of the file
+        @return: A tuple with the modification time, the size and the inode
+                or None if the file does not exist
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+def _read_lines(path):
+    ''' Read the lines of the given file.
+
+        @param path: The path of the file
+        @return: The list of the lines without the line ends
+    '''
+    try:
+        with open(path, 'r') as refs_file:
+            return refs_file.read().splitlines()
+    except IOError:
+        return []
+
+
+def _read_value(path):
+    ''' Read the first line of the given file.
+
+        @param path: The path of the file
+        @return: The value or None if the file could not be read
+    '''
+    lines = _read_lines(path)
+    if len(lines) == 0:
+        return None
+    return lines[0].strip()
+
+
+def _read_remotes(path):
+    ''' Get the names of the remotes configured within the given git config
+        file.
+
+        @param path: The path of the config file
+        @return: The sorted list of the remote names
+    '''
+    pattern = re.compile(r'^\s*\[remote\s+"(.*)"\s*\]')
+    remotes = set()
+    for line in _read_lines(path):
+        match = pattern.match(line)
+        if match is not None:
+            remotes.add(match.group(1))
+    return sorted(remotes)
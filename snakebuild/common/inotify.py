@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' Access to the inotify interface of Linux to get informed about changes
+    of files without polling them. The functions of the C library are called
+    with ctypes. On other systems (or if the C library does not offer
+    inotify) creating an Inotify object raises an InotifyException, the
+    callers are expected to fall back to polling.
+'''
+
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+
+# the events (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+
+_IN_NONBLOCK = 0x800
+_IN_CLOEXEC = 0x80000
+# the header of an event: watch descriptor, mask, cookie and name length
+_EVENT_HEADER = struct.Struct('iIII')
+
+_LIBC = None
+
+
+class InotifyException(BaseException):
+    ''' The exception thrown if inotify is not available or a call of it
+        fails.
+    '''
+
+
+def _get_libc():
+    ''' Load the C library with the inotify functions.
+
+        @return: The ctypes library object
+    '''
+    global _LIBC
+    if _LIBC is None:
+        name = ctypes.util.find_library('c')
+        if name is None:
+            raise InotifyException('The C library could not be found.')
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise InotifyException('The C library does not offer inotify.')
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _LIBC = libc
+    return _LIBC
+
+
+class Inotify(object):
+    ''' One inotify instance. The file descriptor is non blocking, use
+        select on fileno to wait for the events.
+    '''
+
+    def __init__(self):
+        ''' Create the inotify instance. '''
+        self.libc = _get_libc()
+        self.fd = self.libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyException('Could not create the inotify instance: '
+                    '{0}'.format(os.strerror(ctypes.get_errno())))
+
+    def fileno(self):
+        ''' Get the file descriptor to wait for events with select. '''
+        return self.fd
+
+    def add_watch(self, path, mask):
+        ''' Watch the given file or directory.
+
+            @param path: The path to watch
+            @param mask: The events to report (IN_* values combined)
+            @return: The watch descriptor
+        '''
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        wdesc = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wdesc < 0:
+            raise InotifyException('Could not watch {0}: {1}'.format(path,
+                    os.strerror(ctypes.get_errno())))
+        return wdesc
+
+    def rm_watch(self, wdesc):
+        ''' Stop watching. The errors are ignored since the watch is removed
+            by the kernel as soon as the file is deleted.
+
+            @param wdesc: The watch descriptor of add_watch
+        '''
+        self.libc.inotify_rm_watch(self.fd, wdesc)
+
+    def read_events(self):
+        ''' Read the events available.
+
+            @return: A list of tuples (watch descriptor, mask, name), the
+                    name is empty for the events of a watched file.
+        '''
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError, exc:
+            if exc.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise InotifyException('Could not read the inotify events: '
+                    '{0}'.format(exc))
+
+        events = []
+        position = 0
+        while position + _EVENT_HEADER.size <= len(data):
+            wdesc, mask, cookie, length = _EVENT_HEADER.unpack_from(data,
+                    position)
+            position += _EVENT_HEADER.size
+            name = data[position:position + length].rstrip('\0')
+            position += length
+            events.append((wdesc, mask, name))
+        return events
+
+    def close(self):
+        ''' Close the inotify instance, all the watches are removed. '''
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
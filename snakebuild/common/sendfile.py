@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' Send a part of a file over a socket without copying it through Python.
+    The sendfile function of the C library is called with ctypes (Python 2
+    does not offer os.sendfile), the kernel copies the data from the page
+    cache to the socket. If sendfile is not available the file gets mapped
+    into memory and sent from there.
+'''
+
+import os
+import mmap
+import errno
+import select
+import socket
+import ctypes
+import ctypes.util
+
+_LIBC = None
+# the maximum number of bytes mapped for one send of send_file_part
+_MAPPED_CHUNK = 1048576
+
+
+def sendfile(sock, filename, offset, count):
+    ''' Send the given part of the file over the socket. The function
+        returns as soon as everything is sent.
+
+        @param sock: The connected socket (blocking or not)
+        @param filename: The file to send from
+        @param offset: The offset within the file to start at
+        @param count: The number of bytes to send
+    '''
+    with open(filename, 'rb') as sfl:
+        libc = _get_libc()
+        if libc is not None:
+            sent = _send_native(libc, sock, sfl.fileno(), offset, count)
+            offset += sent
+            count -= sent
+        if count > 0:
+            _send_mapped(sock, sfl.fileno(), offset, count)
+
+
+def send_file_part(sock, fileno, offset, count):
+    ''' Send as much of the given part of the file as the socket takes
+        without waiting (for the non blocking sockets of an event loop).
+
+        @param sock: The connected non blocking socket
+        @param fileno: The file descriptor of the file to send from
+        @param offset: The offset within the file to start at
+        @param count: The number of bytes to send
+        @return: The number of bytes sent, 0 if the socket is not ready
+    '''
+    libc = _get_libc()
+    if libc is not None:
+        position = ctypes.c_int64(offset)
+        result = libc.sendfile(sock.fileno(), fileno, ctypes.byref(position),
+                count)
+        if result > 0:
+            return result
+        if result == 0:
+            # the file got shorter
+            raise IOError(errno.EIO, 'Unexpected end of the file.')
+        error = ctypes.get_errno()
+        if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+            return 0
+        elif error not in (errno.EINVAL, errno.ENOSYS):
+            raise IOError(error, os.strerror(error))
+
+    count = min(count, _MAPPED_CHUNK)
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    mapped = mmap.mmap(fileno, offset - start + count, access=mmap.ACCESS_READ,
+            offset=start)
+    try:
+        return sock.send(buffer(mapped, offset - start, count))
+    except socket.error, exc:
+        if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+            return 0
+        raise
+    finally:
+        mapped.close()
+
+
+def _get_libc():
+    ''' Load the C library with the sendfile function.
+
+        @return: The ctypes library object or None if sendfile is not
+                available
+    '''
+    global _LIBC
+    if _LIBC is None:
+        name = ctypes.util.find_library('c')
+        libc = False
+        if name is not None:
+            libc = ctypes.CDLL(name, use_errno=True)
+            if hasattr(libc, 'sendfile'):
+                libc.sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                        ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+                libc.sendfile.restype = ctypes.c_ssize_t
+            else:
+                libc = False
+        _LIBC = libc
+    if _LIBC is False:
+        return None
+    return _LIBC
+
+
+def _send_native(libc, sock, fileno, offset, count):
+    ''' Send the part of the file with sendfile.
+
+        @param libc: The C library
+        @param sock: The socket to send to
+        @param fileno: The file descriptor of the file
+        @param offset: The offset to start at
+        @param count: The number of bytes to send
+        @return: The number of bytes sent, less than count if sendfile does
+                not support the file or the socket
+    '''
+    position = ctypes.c_int64(offset)
+    sent = 0
+    while sent < count:
+        result = libc.sendfile(sock.fileno(), fileno, ctypes.byref(position),
+                count - sent)
+        if result > 0:
+            sent += result
+            continue
+        if result == 0:
+            # the file got shorter
+            raise IOError(errno.EIO, 'Unexpected end of the file.')
+        error = ctypes.get_errno()
+        if error == errno.EINTR:
+            continue
+        elif error in (errno.EAGAIN, errno.EWOULDBLOCK):
+            select.select([], [sock], [])
+        elif error in (errno.EINVAL, errno.ENOSYS):
+            break
+        else:
+            raise IOError(error, os.strerror(error))
+    return sent
+
+
+def _send_mapped(sock, fileno, offset, count):
+    ''' Send the part of the file by mapping it into memory.
+
+        @param sock: The socket to send to
+        @param fileno: The file descriptor of the file
+        @param offset: The offset to start at
+        @param count: The number of bytes to send
+    '''
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    mapped = mmap.mmap(fileno, offset - start + count, access=mmap.ACCESS_READ,
+            offset=start)
+    try:
+        sock.sendall(buffer(mapped, offset - start, count))
+    finally:
+        mapped.close()
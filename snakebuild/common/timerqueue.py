@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The TimerQueue calls functions after a given delay. All the timers share
+    one thread which sleeps until the next timer is due, instead of having a
+    thread for each timer (like threading.Timer).
+
+    A cancelled timer is not removed from the heap right away. The cancelled
+    timers at the top of the heap are dropped without waiting until they are
+    due, and the heap is built again as soon as more than half of its timers
+    are cancelled.
+'''
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+from snakebuild.i18n import _
+
+LOG = logging.getLogger('snakebuild.common.timerqueue')
+
+
+class Timer(object):
+    ''' A timer scheduled within a TimerQueue. '''
+
+    def __init__(self, due, function, args, queue=None):
+        ''' Create the timer.
+
+            @param due: The time (time.time()) when the timer is due
+            @param function: The function to call
+            @param args: The arguments for the function
+            @param queue: The TimerQueue the timer is scheduled in
+        '''
+        self.due = due
+        self.function = function
+        self.args = args
+        self.queue = queue
+        self.cancelled = False
+        # True while the timer is within the heap of the queue
+        self.queued = False
+
+    def cancel(self):
+        ''' Cancel the timer, the function does not get called. '''
+        if self.queue is None:
+            self.cancelled = True
+        else:
+            self.queue._cancel(self)
+
+
+class TimerQueue(object):
+    ''' Call functions after a given delay within one thread. The thread is
+        started with the first timer scheduled. If the process got forked
+        (for example to run as daemon) the thread does not exist anymore
+        within the child, it is started again with the next timer scheduled
+        or by calling start.
+    '''
+
+    def __init__(self, name='timer'):
+        ''' Create the queue without starting the thread.
+
+            @param name: The name of the thread
+        '''
+        self.name = name
+        self.timers = []
+        # the number of cancelled timers within the heap
+        self.cancelled = 0
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = True
+
+    def schedule(self, delay, function, *args):
+        ''' Call the given function after the given delay.
+
+            @param delay: The delay in seconds
+            @param function: The function to call
+            @param args: The arguments for the function
+            @return: The Timer object to cancel the timer
+        '''
+        timer = Timer(time.time() + delay, function, args, self)
+        with self.condition:
+            if not self.running:
+                timer.cancelled = True
+                return timer
+            heapq.heappush(self.timers, (timer.due, self.counter.next(),
+                    timer))
+            timer.queued = True
+            if not self._start_thread() and self.timers[0][2] is timer:
+                # the new timer is the next one due
+                self.condition.notify()
+        return timer
+
+    def start(self):
+        ''' Start the thread if there are timers scheduled and the thread is
+            not running (anymore).
+        '''
+        with self.condition:
+            if self.running and len(self.timers) > 0:
+                self._start_thread()
+
+    def stop(self, wait=False):
+        ''' Stop the thread, the timers not yet due are not called.
+
+            @param wait: Wait until the thread ended (not possible from within
+                    a timer function)
+        '''
+        with self.condition:
+            self.running = False
+            for entry in self.timers:
+                entry[2].queued = False
+            self.timers = []
+            self.cancelled = 0
+            self.condition.notify()
+            thread = self.thread
+        if (wait and thread is not None and
+                thread is not threading.current_thread()):
+            thread.join()
+
+    def _cancel(self, timer):
+        ''' Cancel the given timer. The heap is built again if more than
+            half of its timers are cancelled.
+
+            @param timer: The Timer object to cancel
+        '''
+        with self.condition:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            if not timer.queued:
+                return
+            self.cancelled += 1
+            if self.cancelled * 2 > len(self.timers):
+                for entry in self.timers:
+                    if entry[2].cancelled:
+                        entry[2].queued = False
+                self.timers = [entry for entry in self.timers
+                        if entry[2].queued]
+                heapq.heapify(self.timers)
+                self.cancelled = 0
+
+    def _drop_cancelled(self):
+        ''' Remove the cancelled timers from the top of the heap. The
+            condition must be held.
+        '''
+        while len(self.timers) > 0 and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)[2].queued = False
+            self.cancelled -= 1
+
+    def _start_thread(self):
+        ''' Start the thread if it is not running. The condition must be
+            held.
+
+            @return: True if the thread got started
+        '''
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.thread = threading.Thread(target=self._run, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def _run(self):
+        ''' Wait for the next timer and call its function. '''
+        while True:
+            with self.condition:
+                while self.running:
+                    self._drop_cancelled()
+                    if len(self.timers) == 0:
+                        self.condition.wait()
+                        continue
+                    delay = self.timers[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                if not self.running:
+                    return
+                timer = heapq.heappop(self.timers)[2]
+                timer.queued = False
+
+            if timer.cancelled:
+                continue
+            try:
+                timer.function(*timer.args)
+            except Exception:
+                LOG.exception(_('The timer function failed: {0}').format(
+                        timer.function))
@@ -20,12 +20,23 @@
     that use version control for the files.
     The main goal of this is to be able to get a controlled latest version and
     to add change comments if files change during usage.
+
+    The git commands get the directory of the repository as their working
+    directory, the working directory of the process is never changed.
+    Therefore the repositories can be used from multiple threads. The
+    commands changing a repository are serialized by a lock per repository
+    (shared by all the objects using the same directory).
 '''
 
 import os.path
 import sys
 import re
 import subprocess
+import threading
+import functools
+
+from snakebuild.common.gitobjects import GitObjectReader, GitObjectException
+from snakebuild.common.gitrefs import GitRefCache
 
 
 class VersionedDirException(BaseException):
@@ -34,6 +45,37 @@ class VersionedDirException(BaseException):
     '''
 
 
+# the locks of the repositories by their real path
+_REPO_LOCKS = {}
+_REPO_LOCKS_LOCK = threading.Lock()
+
+
+def get_repo_lock(directory):
+    ''' Get the lock used to serialize the changes of the repository within
+        the given directory.
+
+        @param directory: The path of the repository
+        @return: The (reentrant) lock of the repository
+    '''
+    path = os.path.realpath(directory)
+    with _REPO_LOCKS_LOCK:
+        if not path in _REPO_LOCKS:
+            _REPO_LOCKS[path] = threading.RLock()
+        return _REPO_LOCKS[path]
+
+
+def _locked(function):
+    ''' Decorator for the methods changing the repository, they are called
+        with the lock of the repository held.
+    '''
+    @functools.wraps(function)
+    def locked_function(self, *args, **kwargs):
+        ''' Call the method with the lock held. '''
+        with self.lock:
+            return function(self, *args, **kwargs)
+    return locked_function
+
+
 def get_versioned_directory(directory):
     ''' Get a versioned directory object. It will return an object matching
         the VCS used to store the config files.
@@ -73,16 +115,25 @@ def create_new_repo(name, local_repos_config):
         raise VersionedDirException('The given VCS type is not supported.')
 
 
-def clone_repo(name, directory, local_repos_config):
+def clone_repo(name, directory, local_repos_config, depth=None,
+        sparse=None):
     ''' Clone a given respository to start using it. The repos has to exist.
+        If the configuration has a mirror path the objects are taken from
+        the local mirror of the repository, which only fetches the changes
+        since the last clone.
 
         @param name: The name of the repos to access
         @param directory: The directory to create
         @param local_repos_config: The configuration to access the local repos
                 to clone the repo from (ReposConfig type)
+        @param depth: The number of commits of the history to get (shallow
+                clone) or None for the whole history
+        @param sparse: The list of the directories to check out or None for
+                all the files
     '''
     if local_repos_config.repo_type == local_repos_config.GIT:
-        _clone_git_repo(name, directory, local_repos_config.path)
+        _clone_git_repo(name, directory, local_repos_config.path,
+                local_repos_config.mirror_path, depth, sparse)
     else:
         raise VersionedDirException('The given VCS type is not supported.')
 
@@ -104,11 +155,14 @@ class ReposConfig(object):
     # the supported VCS currently only GIT
     GIT, UNKNOWN = range(2)
 
-    def __init__(self, repo_type, path):
+    def __init__(self, repo_type, path, mirror_path=None):
         ''' Create the ReposConfig object. Currently on GIT is supported
             @param repo_type: The type of the repository, use the types
                     defined
             @param path: The path where to find the repository.
+            @param mirror_path: The local path to keep the mirrors of the
+                    repositories in, used to clone from (None to always
+                    clone everything from the path)
         '''
         if type(repo_type) == str or type(repo_type) == unicode:
             if repo_type.lower() == 'git':
@@ -131,6 +185,7 @@ class ReposConfig(object):
                 raise VersionedDirException('The given path for the bar git '
                         'repos is not writeable: {0}'.format(path))
         self.path = path
+        self.mirror_path = mirror_path
 
 
 class VersionedDirBase(object):
@@ -191,6 +246,15 @@ class VersionedDirBase(object):
         '''
         raise VersionedDirException('get_local_path is not implemented.')
 
+    def remove(self, name):
+        ''' Remove a file from the repository. This does not commit the
+            change, only prepares it.
+
+            @param name: The name of the file to remove (path within the
+                repository
+        '''
+        raise VersionedDirException('remove is not implemented.')
+
     def branch(self, name):
         ''' Create a new branch from the current position (tag, branch). This
             command will make sure that the newly created branch will be
@@ -224,6 +288,19 @@ class VersionedDirBase(object):
         '''
         raise VersionedDirException('get_local_path is not implemented.')
 
+    def has_changes(self):
+        ''' Check if there are changes added but not yet commited.
+
+            @return: True if there is something to commit
+        '''
+        raise VersionedDirException('has_changes is not implemented.')
+
+    def reset_changes(self):
+        ''' Drop the changes added but not yet commited from the index, the
+            files within the directory are not changed.
+        '''
+        raise VersionedDirException('reset_changes is not implemented.')
+
     def short_log(self, name=None, limit=None):
         ''' Get the short log messages this will be tuples with all the
             messages.
@@ -259,6 +336,49 @@ class VersionedDirBase(object):
         '''
         raise VersionedDirException('get_local_path is not implemented.')
 
+    def get_revision(self):
+        ''' Get the id of the current revision.
+
+            @return: The revision id or None if there is no revision yet.
+        '''
+        raise VersionedDirException('get_revision is not implemented.')
+
+    def get_changed_files(self, old, new):
+        ''' Get the files changed between the two given revisions.
+
+            @param old: The id of the old revision
+            @param new: The id of the new revision
+            @return: A list with a (status, path) tuple for each file changed.
+        '''
+        raise VersionedDirException('get_changed_files is not implemented.')
+
+    def list_files(self, revision, name=None):
+        ''' Get the names of the files within the given directory of the
+            given revision without changing the files within the directory.
+
+            @param revision: The revision, branch or tag to read from
+            @param name: The path of the directory within the repository (see
+                    get_local_path) or None for the top directory.
+            @return: The sorted list of the file names (no directories).
+        '''
+        raise VersionedDirException('list_files is not implemented.')
+
+    def read_file(self, revision, name):
+        ''' Get the content of the given file of the given revision without
+            changing the files within the directory.
+
+            @param revision: The revision, branch or tag to read from
+            @param name: The path of the file within the repository (see
+                    get_local_path)
+            @return: The content of the file as a string.
+        '''
+        raise VersionedDirException('read_file is not implemented.')
+
+    def close(self):
+        ''' Release the resources (processes) used to access the repository.
+        '''
+        pass
+
 
 class VersionedGitDir(VersionedDirBase):
     ''' This class gives access to the files and helps to select a certain
@@ -274,8 +394,10 @@ class VersionedGitDir(VersionedDirBase):
             raise VersionedDirException('The given directory is not a git'
                     'repository: {0}'.format(directory))
         self.path = directory
-        self.prevdir = None
+        self.lock = get_repo_lock(directory)
         self.new_repo = False
+        self.objects = GitObjectReader(directory)
+        self.refs = GitRefCache(directory)
         if len(self.get_branchs()) == 0:
             self.new_repo = True
 
@@ -297,53 +419,46 @@ class VersionedGitDir(VersionedDirBase):
 
     def get_tags(self):
         ''' Get all tag names of the repository. '''
-        cmd = self._git('tag')
-        stdout, stderr = cmd.communicate()
-        tags = [value for value in stdout.split()]
-        return tags
+        return sorted(self.refs.get_refs('refs/tags/'))
 
     def get_branchs(self):
-        ''' Get all tag names of the repository. '''
-        cmd = self._git('branch', '-a')
-        stdout, stderr = cmd.communicate()
-        branchs = []
-        for value in stdout.split('\n'):
-            if value.startswith('*'):
-                branchs.append(value[2:].strip())
-            elif len(value) > 0:
-                new_value = value.strip()
-                if new_value.startswith('remotes'):
-                    new_value = new_value.split('/')[-1].strip()
-
-                if not new_value in branchs:
-                    branchs.append(new_value)
+        ''' Get all branch names of the repository (local and remote). '''
+        branchs = sorted(self.refs.get_refs('refs/heads/'))
+        for name in sorted(self.refs.get_refs('refs/remotes/')):
+            new_value = name.split('/')[-1]
+            if new_value != 'HEAD' and not new_value in branchs:
+                branchs.append(new_value)
         return branchs
 
     def get_current_branch(self):
         ''' Get the current branch. If currently no branch is selected (not
             ready to commit) None is returned
         '''
-        cmd = self._git('branch')
-        stdout, stderr = cmd.communicate()
-        branchs = [value for value in stdout.split('\n')]
-        for branch in branchs:
-            if branch.startswith('*') and not branch == "* (no branch)":
-                return branch[2:].strip()
-
-        return None
+        target, object_id = self.refs.get_head()
+        if (target is None or object_id is None or
+                not target.startswith('refs/heads/')):
+            return None
+        return target[len('refs/heads/'):]
 
     def get_current_tag(self):
         ''' Get the current tag name if the current repos is on a tag.
-            Otherwise None
+            Otherwise None. Like git describe only annotated tags are used.
         '''
-        cmd = self._git('describe')
-        stdout, stderr = cmd.communicate()
-        tag = stdout.strip()
-        tags = self.get_tags()
-        if tag in tags:
-            return tag
+        object_id = self.refs.get_head()[1]
+        if object_id is None:
+            return None
+        for name, tag_id in sorted(self.refs.get_refs(
+                'refs/tags/').iteritems()):
+            try:
+                tag_type, content = self.objects.read(tag_id)
+            except GitObjectException:
+                continue
+            if tag_type == 'tag' and content.startswith('object {0}\n'.format(
+                    object_id)):
+                return name
         return None
 
+    @_locked
     def update(self, name):
         ''' Make sure that the given file is a the given tag/branch and that
             it is up to date. If there are uncommited changed overwrite them
@@ -363,6 +478,7 @@ class VersionedGitDir(VersionedDirBase):
         if self.has_remote() and self.get_current_branch() is not None:
             self.pull_remote()
 
+    @_locked
     def add(self, name):
         ''' Add a new file to the repository to be managed by this repo. This
             does not commit the change, only prepares it.
@@ -384,6 +500,25 @@ class VersionedGitDir(VersionedDirBase):
             raise VersionedDirException('File to add to the repository could '
                     'not be added: {0}'.format(name))
 
+    @_locked
+    def remove(self, name):
+        ''' Remove a file from the repository. This does not commit the
+            change, only prepares it.
+
+            @param name: The name of the file to remove (path within the
+                repository
+        '''
+        if self.get_current_branch() == None:
+            raise VersionedDirException('The current repository is not within '
+                    'a valid branch, therefore no remove allowed. create a '
+                    'branch first.')
+        if type(name) == list:
+            name = os.path.join(*name)
+        if self._gitr('rm', '-q', name):
+            raise VersionedDirException('File to remove from the repository '
+                    'could not be removed: {0}'.format(name))
+
+    @_locked
     def branch(self, name):
         ''' Create a new branch from the current position (tag, branch). This
             command will make sure that the newly created branch will be
@@ -413,6 +548,7 @@ class VersionedGitDir(VersionedDirBase):
                 raise VersionedDirException('Could not checkout the new '
                         'branch.')
 
+    @_locked
     def tag(self, name, author_name, author_email, comment):
         ''' Add a tag to the current position (tag, branch). This creates the
             tag but the push_remote must be called to get it on to the server.
@@ -438,6 +574,7 @@ class VersionedGitDir(VersionedDirBase):
                 raise VersionedDirException('Could not push git repository: '
                         '{0}'.format(self.path))
 
+    @_locked
     def commit(self, author_name, author_email, comment):
         ''' Commit all open changes within the repository.
 
@@ -456,6 +593,22 @@ class VersionedGitDir(VersionedDirBase):
                 GIT_COMMITTER_EMAIL=author_email):
             raise VersionedDirException('Could not commit to the repository.')
 
+    def has_changes(self):
+        ''' Check if there are changes added but not yet commited.
+
+            @return: True if there is something to commit
+        '''
+        return self._gitr('diff', '--cached', '--quiet') != 0
+
+    @_locked
+    def reset_changes(self):
+        ''' Drop the changes added but not yet commited from the index, the
+            files within the directory are not changed.
+        '''
+        if self._gitr('reset', '-q'):
+            raise VersionedDirException('Could not reset the index of the '
+                    'repository: {0}'.format(self.path))
+
     def short_log(self, name=None, limit=None):
         ''' Get the short log messages this will be tuples with all the
             messages.
@@ -482,6 +635,7 @@ class VersionedGitDir(VersionedDirBase):
 
         return results
 
+    @_locked
     def push_remote(self):
         ''' Push all the changes to the configured remote repository.
         '''
@@ -495,6 +649,7 @@ class VersionedGitDir(VersionedDirBase):
             raise VersionedDirException('Could not push git repository: {0}'.
                     format(self.path))
 
+    @_locked
     def pull_remote(self):
         ''' Push all the changes to the configured remote repository.
 
@@ -514,12 +669,79 @@ class VersionedGitDir(VersionedDirBase):
     def has_remote(self):
         ''' Check if the given git repos has a remot repos configured.
         '''
-        cmd = self._git('remote')
+        return len(self.refs.get_remotes()) > 0
+
+    def get_revision(self):
+        ''' Get the id of the current revision (HEAD).
+
+            @return: The revision id or None if there is no commit yet.
+        '''
+        return self.refs.get_head()[1]
+
+    def get_changed_files(self, old, new):
+        ''' Get the files changed between the two given revisions. A renamed
+            file is given as deleted and added.
+
+            @param old: The id of the old revision
+            @param new: The id of the new revision
+            @return: A list with a (status, path) tuple for each file changed.
+                    The status is A (added), D (deleted) or M (modified) (see
+                    git diff --name-status).
+        '''
+        cmd = self._git('diff', '--name-status', '--no-renames', old, new)
         stdout, stderr = cmd.communicate()
-        if len(stdout.split('\n')) == 1:
-            if len(stdout) == 0:
-                return False
-        return True
+        if cmd.returncode != 0:
+            raise VersionedDirException('Could not get the changes between '
+                    '{0} and {1}: {2}'.format(old, new, stderr.strip()))
+        results = []
+        for line in stdout.split('\n'):
+            if len(line.strip()) == 0:
+                continue
+            status, path = line.split('\t', 1)
+            results.append((status.strip(), path))
+        return results
+
+    def list_files(self, revision, name=None):
+        ''' Get the names of the files within the given directory of the
+            given revision. The files are read from the object store of git,
+            the working tree is not used.
+
+            @param revision: The revision, branch or tag to read from
+            @param name: The path of the directory within the repository (see
+                    get_local_path) or None for the top directory.
+            @return: The sorted list of the file names (no directories).
+        '''
+        try:
+            entries = self.objects.list_tree(revision, _repo_path(name))
+        except GitObjectException, exc:
+            raise VersionedDirException(str(exc))
+        if entries is None:
+            raise VersionedDirException('The directory does not exist: '
+                    '{0}:{1}'.format(revision, _repo_path(name)))
+        return sorted(entry[0] for entry in entries if not entry[1])
+
+    def read_file(self, revision, name):
+        ''' Get the content of the given file of the given revision. The file
+            is read from the object store of git, the working tree is not
+            used.
+
+            @param revision: The revision, branch or tag to read from
+            @param name: The path of the file within the repository (see
+                    get_local_path)
+            @return: The content of the file as a string.
+        '''
+        try:
+            content = self.objects.read_blob(revision, _repo_path(name))
+        except GitObjectException, exc:
+            raise VersionedDirException(str(exc))
+        if content is None:
+            raise VersionedDirException('The file does not exist: '
+                    '{0}:{1}'.format(revision, _repo_path(name)))
+        return content
+
+    def close(self):
+        ''' Stop the git processes used to read the files. '''
+        self.objects.close()
 
     def _git(self, *args, **flags):
         ''' call the git command and return the command it self to use the
@@ -529,16 +751,13 @@ class VersionedGitDir(VersionedDirBase):
             @**flags: The env variables which should be set for this call
             @return: The Popen return value
         '''
-        self._change_to_repo()
         env = os.environ.copy()
         if flags is not None and len(flags) > 0:
             env.update(flags)
 
-        cmd = subprocess.Popen(['git'] + list(args), stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-
-        self._change_back()
-        return cmd
+        return subprocess.Popen(['git'] + list(args), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                cwd=self.path)
 
     def _gitr(self, *args, **flags):
         ''' call the git command and only read the return value.
@@ -551,16 +770,19 @@ class VersionedGitDir(VersionedDirBase):
         stdout, stderr = cmd.communicate()
         return cmd.returncode
 
-    def _change_to_repo(self):
-        ''' switch to the current repo directory to call the git commands. '''
-        self.prevdir = os.getcwd()
-        os.chdir(self.path)
 
-    def _change_back(self):
-        ''' switch back to the previous directory. '''
-        if self.prevdir is not None:
-            os.chdir(self.prevdir)
-            self.prevdir = None
+def _repo_path(name):
+    ''' Get the path within the repository as git expects it.
+
+        @param name: The path as a string, a list (see get_local_path) or
+                None for the top directory
+        @return: The path with / as separator
+    '''
+    if name is None:
+        return ''
+    if type(name) is list:
+        return '/'.join(name)
+    return name
 
 
 def _check_email_format(email):
@@ -603,37 +825,87 @@ def _create_git_repo(name, path):
                 os.path.join(path, name)))
 
     os.mkdir(os.path.join(path, "{0}.git".format(name)))
-    prevdir = os.getcwd()
-    os.chdir(os.path.join(path, "{0}.git".format(name)))
     cmd = subprocess.Popen(['git', 'init', '--bare'], stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE, stderr=sys.stderr)
+            stdout=subprocess.PIPE, stderr=sys.stderr,
+            cwd=os.path.join(path, "{0}.git".format(name)))
     stdout, stderr = cmd.communicate()
-    os.chdir(prevdir)
 
     if cmd.returncode != 0:
         raise VersionedDirException('Could not initialize git repos: {0}'.
                 format(os.path.join(path, name)))
 
 
-def _clone_git_repo(name, directory, path):
+def _clone_git_repo(name, directory, path, mirror_path=None, depth=None,
+        sparse=None):
     ''' Create a clone from a given central git repository.
 
         @param name: The name of the repository to clone
         @param directory: The directory to create
         @param path: The path where the bare git repos is stored
+        @param mirror_path: The path where the mirror of the repository is
+                kept or None to clone without a mirror
+        @param depth: The number of commits to get or None for all
+        @param sparse: The list of the directories to check out or None
     '''
-    if not os.path.isdir(os.path.join(path, '{0}.git'.format(name))):
+    source = os.path.join(path, '{0}.git'.format(name))
+    if not os.path.isdir(source):
         raise VersionedDirException('The given bare repo does not exist: '
-                '{0}'.format(os.path.join(path, '{0}.git'.format(name))))
+                '{0}'.format(source))
     if os.path.exists(directory):
         raise VersionedDirException('The target directory already exists: '
                 '{0}'.format(directory))
 
-    cmd = subprocess.Popen(['git', 'clone', os.path.join(path,
-            '{0}.git'.format(name)), directory], stdin=subprocess.PIPE,
+    args = ['git', 'clone']
+    if mirror_path is not None:
+        mirror = _update_git_mirror(source, os.path.join(mirror_path,
+                '{0}.git'.format(name)))
+        # without --no-local git copies all the objects of the source
+        args.extend(['--reference', mirror, '--no-local'])
+    if depth is not None:
+        # a shallow clone of a local repository needs an url
+        args.extend(['--depth', str(depth), '--no-single-branch'])
+        source = 'file://{0}'.format(os.path.abspath(source))
+    if sparse is not None:
+        args.append('--sparse')
+
+    cmd = subprocess.Popen(args + [source, directory], stdin=subprocess.PIPE,
             stdout=subprocess.PIPE, stderr=sys.stderr)
     stdout, stderr = cmd.communicate()
 
     if cmd.returncode != 0:
         raise VersionedDirException('Could not clone bare git repos: {0}'.
                 format(os.path.join(path, name)))
+
+    if sparse is not None and len(sparse) > 0:
+        cmd = subprocess.Popen(['git', 'sparse-checkout', 'set'] +
+                list(sparse), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=sys.stderr, cwd=directory)
+        stdout, stderr = cmd.communicate()
+        if cmd.returncode != 0:
+            raise VersionedDirException('Could not set the sparse checkout '
+                    'of the git repos: {0}'.format(directory))
+
+
+def _update_git_mirror(source, mirror):
+    ''' Create the mirror of the given repository or fetch the changes
+        into it if it exists. The mirror never removes objects (no automatic
+        gc) since the clones using it as a reference still need them.
+
+        @param source: The path of the bare git repository
+        @param mirror: The path of the mirror
+        @return: The path of the mirror
+    '''
+    with get_repo_lock(mirror):
+        if os.path.isdir(mirror):
+            commands = [(['git', 'fetch', '-q', '--prune'], mirror)]
+        else:
+            commands = [(['git', 'clone', '-q', '--mirror', source, mirror],
+                    None), (['git', 'config', 'gc.auto', '0'], mirror)]
+        for args, cwd in commands:
+            cmd = subprocess.Popen(args, stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=sys.stderr, cwd=cwd)
+            stdout, stderr = cmd.communicate()
+            if cmd.returncode != 0:
+                raise VersionedDirException('Could not update the mirror of '
+                        'the git repos: {0}'.format(mirror))
+    return mirror
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The WorktreePool hands out checkouts of a git repository for a given tag,
+    branch or revision. The checkouts are git worktrees of one local clone,
+    they share its object store, therefore a new checkout only has to write
+    the files. A released checkout is kept and given out again (reset to the
+    requested revision) and the least recently used ones are removed as soon
+    as the checkouts use more disk space than allowed.
+'''
+
+import os
+import time
+import shutil
+import logging
+import itertools
+import threading
+
+from snakebuild.i18n import _
+from snakebuild.common.filetools import disk_usage
+from snakebuild.common.versioneddir import VersionedDirException
+
+LOG = logging.getLogger('snakebuild.common.worktreepool')
+
+
+class Worktree(object):
+    ''' One checkout of the pool. '''
+
+    def __init__(self, path):
+        ''' Create the worktree object.
+
+            @param path: The path of the checkout
+        '''
+        self.path = path
+        # the name and the commit id of the version checked out
+        self.version = None
+        self.revision = None
+        # the disk space used (measured on release) in bytes
+        self.size = 0
+        self.last_used = time.time()
+        self.in_use = False
+
+
+class WorktreePool(object):
+    ''' The pool of the checkouts of one repository. The pool can be used
+        from multiple threads.
+    '''
+
+    def __init__(self, repo, directory, disk_budget=0):
+        ''' Create the pool. The checkouts left over within the directory
+            (for example after a crash) are removed.
+
+            @param repo: The VersionedGitDir of the local clone
+            @param directory: The directory to create the checkouts in
+            @param disk_budget: The maximum number of bytes the unused
+                    checkouts might use, 0 for no limit.
+        '''
+        self.repo = repo
+        self.directory = directory
+        self.disk_budget = disk_budget
+        self.lock = threading.Lock()
+        self.worktrees = []
+        self.counter = itertools.count()
+
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                shutil.rmtree(os.path.join(directory, name), True)
+        else:
+            os.makedirs(directory)
+        with self.repo.lock:
+            self.repo._gitr('worktree', 'prune')
+
+    def acquire(self, version):
+        ''' Get a checkout of the given version. An unused checkout of the
+            same revision is preferred, otherwise the least recently used
+            checkout is reset to the revision or a new one is created.
+
+            @param version: The tag, branch or revision to check out
+            @return: The Worktree object, it must be given back with release
+        '''
+        revision = self._resolve(version)
+        with self.lock:
+            worktree = _select(self.worktrees, revision)
+            if worktree is None:
+                worktree = Worktree(os.path.join(self.directory,
+                        'worktree{0}'.format(self.counter.next())))
+                self.worktrees.append(worktree)
+                created = True
+            else:
+                created = False
+            worktree.in_use = True
+
+        try:
+            if created:
+                LOG.debug(_('Create the worktree {0} for {1}').format(
+                        worktree.path, version))
+                with self.repo.lock:
+                    if self.repo._gitr('worktree', 'add', '--detach',
+                            '-f', worktree.path, revision):
+                        raise VersionedDirException(_('Could not create '
+                                'the worktree: {0}').format(worktree.path))
+            elif worktree.revision == revision:
+                _reset(self.repo, worktree.path, None)
+            else:
+                _reset(self.repo, worktree.path, revision)
+        except VersionedDirException:
+            with self.lock:
+                self.worktrees.remove(worktree)
+            self._remove(worktree)
+            raise
+
+        worktree.version = version
+        worktree.revision = revision
+        return worktree
+
+    def release(self, worktree):
+        ''' Give the given checkout back to the pool. If the unused
+            checkouts use more than the disk budget the least recently used
+            ones are removed.
+
+            @param worktree: The Worktree object from acquire
+        '''
+        size = disk_usage(worktree.path, ('.git',))
+        with self.lock:
+            worktree.size = size
+            worktree.last_used = time.time()
+            worktree.in_use = False
+            evicted = self._evict()
+        for other in evicted:
+            self._remove(other)
+
+    def prepare(self, version, count=1):
+        ''' Create checkouts of the given version ahead of time.
+
+            @param version: The tag, branch or revision to check out
+            @param count: The number of checkouts to prepare
+        '''
+        worktrees = [self.acquire(version) for cnt in range(count)]
+        for worktree in worktrees:
+            self.release(worktree)
+
+    def close(self):
+        ''' Remove all the unused checkouts. '''
+        with self.lock:
+            unused = [worktree for worktree in self.worktrees
+                    if not worktree.in_use]
+            for worktree in unused:
+                self.worktrees.remove(worktree)
+        for worktree in unused:
+            self._remove(worktree)
+
+    def _resolve(self, version):
+        ''' Get the commit id of the given version. A branch which only
+            exists on a remote repository is found as well.
+
+            @param version: The tag, branch or revision
+            @return: The commit id
+        '''
+        names = [version] + ['{0}/{1}'.format(remote, version)
+                for remote in self.repo.refs.get_remotes()]
+        for name in names:
+            found = self.repo.objects.resolve('{0}^{{commit}}'.format(name))
+            if found is not None:
+                return found[0]
+        raise VersionedDirException(_('The version does not exist: '
+                '{0}').format(version))
+
+    def _evict(self):
+        ''' Select the least recently used checkouts to remove until the
+            unused checkouts fit into the disk budget. The lock must be held.
+
+            @return: The list of the Worktree objects removed from the pool
+        '''
+        if self.disk_budget <= 0:
+            return []
+        unused = sorted((worktree for worktree in self.worktrees
+                if not worktree.in_use), key=lambda worktree:
+                worktree.last_used)
+        total = sum(worktree.size for worktree in unused)
+        evicted = []
+        for worktree in unused:
+            if total <= self.disk_budget:
+                break
+            total -= worktree.size
+            self.worktrees.remove(worktree)
+            evicted.append(worktree)
+        return evicted
+
+    def _remove(self, worktree):
+        ''' Remove the checkout from the disk and from the repository.
+
+            @param worktree: The Worktree object
+        '''
+        LOG.debug(_('Remove the worktree {0}').format(worktree.path))
+        with self.repo.lock:
+            if self.repo._gitr('worktree', 'remove', '--force',
+                    worktree.path):
+                shutil.rmtree(worktree.path, True)
+                self.repo._gitr('worktree', 'prune')
+
+
+def _select(worktrees, revision):
+    ''' Select the unused worktree to use for the given revision.
+
+        @param worktrees: The list of the Worktree objects
+        @param revision: The commit id requested
+        @return: The most recently used worktree of the revision, the least
+                recently used other one or None if all are in use.
+    '''
+    unused = [worktree for worktree in worktrees if not worktree.in_use]
+    same = [worktree for worktree in unused if worktree.revision == revision]
+    if len(same) > 0:
+        return max(same, key=lambda worktree: worktree.last_used)
+    if len(unused) > 0:
+        return min(unused, key=lambda worktree: worktree.last_used)
+    return None
+
+
+def _reset(repo, path, revision):
+    ''' Reset the checkout to the given revision and remove all the files
+        not within the repository.
+
+        @param repo: The VersionedGitDir the checkout belongs to
+        @param path: The path of the checkout
+        @param revision: The commit id or None to keep the current one
+    '''
+    if revision is None:
+        result = repo._gitr('-C', path, 'reset', '-q', '--hard')
+    else:
+        result = repo._gitr('-C', path, 'checkout', '-q', '-f', '--detach',
+                revision)
+    if result or repo._gitr('-C', path, 'clean', '-q', '-fdx'):
+        raise VersionedDirException(_('Could not reset the worktree: '
+                '{0}').format(path))
@@ -23,6 +23,6 @@
 from snakebuild.communication.client import Client, \
         ClientCommunicationException
 from snakebuild.communication.server import Server, \
-        ServerCommunicationException
+        ServerCommunicationException, get_engine
 from snakebuild.communication.commandstructure import command_register, \
-        prepare_error, prepare_answer
+        prepare_error, prepare_answer, DeferredAnswer, BinaryAnswer
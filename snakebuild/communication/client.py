@@ -22,9 +22,16 @@
 
 import socket
 import json
+import logging
+import itertools
+import threading
 
 from snakebuild.i18n import _
-from snakebuild.communication.messages import prepare_sjson_data
+from snakebuild.common.sendfile import sendfile
+from snakebuild.communication.messages import prepare_sjson_data, \
+        prepare_binary_data, receive_data, BINARY_HEADER
+
+LOG = logging.getLogger('snakebuild.communication.client')
 
 
 class ClientCommunicationException(BaseException):
@@ -39,24 +46,37 @@ class Client(object):
         protocoll where the first byte sent defines the type of the message
         currently only one type is supported.
 
+        By default every message is sent over its own connection. If the
+        client is created with keep_alive enabled one connection is kept open
+        and used for all the messages. The requests are tagged with an id and
+        the answers are matched by this id, therefore multiple threads can
+        use the same client at once and a long running command does not block
+        the others.
+
         See the Snake-Build Dev documentation for more information about the
         protocol.
     '''
     # this defines the known message types
     SJSON, SJSON_SIGNED, UNKNWON = range(3)
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, keep_alive=False):
         ''' Create a client with the given host address and network port
             to connect to. The connection will not be used until a messages
             is sent.
 
             @param host: The host address (as a string)
             @param port: The network port to use for the connection (as int)
+            @param keep_alive: If set to True the connection is kept open and
+                    shared by all the messages sent with this client.
         '''
         self.host = host
         self.port = port
+        self.keep_alive = keep_alive
 
-    def send(self, mtype, cmd, param, no_answer=False):
+        self._connection = None
+        self._connection_lock = threading.Lock()
+
+    def send(self, mtype, cmd, param, no_answer=False, payload=None):
         ''' Send a message to the server ans try to receive an answer if this
             isn't disabled.
 
@@ -77,15 +97,25 @@ class Client(object):
                     None)
             @param no_answer: If set to true no answer expected so don't wait
                     for it.
+            @param payload: A part of a file to send as binary data with the
+                    message given as (filename, offset, length) tuple, the
+                    param must be a dictionary. The server hands the data to
+                    the command as the payload parameter.
 
             @return: The answer from the server as a tuple (cmd, parameters)
+                    if the server answers with binary data it is stored as
+                    'payload' within the parameters.
         '''
         if mtype >= self.UNKNWON:
             raise ClientCommunicationException(_('The given message type is '
                     'not supported.'))
 
+        if self.keep_alive:
+            return self._get_connection().request(cmd, param, no_answer,
+                    payload)
+
         if mtype == self.SJSON:
-            data = prepare_sjson_data({'cmd': cmd, 'parameters': param})
+            message = {'cmd': cmd, 'parameters': param}
 #        elif mytype == OTHER:
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -96,8 +126,9 @@ class Client(object):
             raise ClientCommunicationException(_('Could not connect to the '
                     'server: {0}').format(emsg))
         try:
-            sock.send(data)
-        except socket.error, emsg:
+            _send_message(sock, message, payload)
+        except (socket.error, IOError), emsg:
+            sock.close()
             raise ClientCommunicationException(_('Could not send the data to '
                     'the server: {0}').format(emsg))
 
@@ -112,6 +143,199 @@ class Client(object):
         sock.close()
         return result
 
+    def close(self):
+        ''' Close the connection kept open for the keep alive mode. All the
+            requests still waiting for an answer will fail. A new connection
+            gets opened on the next send.
+        '''
+        with self._connection_lock:
+            connection = self._connection
+            self._connection = None
+        if connection is not None:
+            connection.close()
+
+    def _get_connection(self):
+        ''' Get the open connection for the keep alive mode. If there is
+            no connection or the connection got closed a new one is created.
+
+            @return: The _Connection object to use
+        '''
+        with self._connection_lock:
+            if self._connection is None or self._connection.closed:
+                self._connection = _Connection(self.host, self.port)
+            return self._connection
+
+
+class _PendingAnswer(object):
+    ''' The place holder for an answer which has not yet been received. '''
+
+    def __init__(self):
+        ''' Create an empty pending answer. '''
+        self.received = threading.Event()
+        self.answer = None
+        self.error = None
+
+    def set_answer(self, answer):
+        ''' Store the received answer and wake up the waiting thread.
+
+            @param answer: The answer as a tuple (cmd, parameters)
+        '''
+        self.answer = answer
+        self.received.set()
+
+    def set_error(self, error):
+        ''' Store the error that prevents the answer from being received
+            and wake up the waiting thread.
+
+            @param error: The message of the error.
+        '''
+        self.error = error
+        self.received.set()
+
+    def wait(self):
+        ''' Wait until the answer is available.
+
+            @return: The answer as a tuple (cmd, parameters)
+        '''
+        # wait with a timeout, otherwise a keyboard interrupt would not be
+        # handled until the answer arrives.
+        while not self.received.wait(1.0):
+            pass
+        if self.error is not None:
+            raise ClientCommunicationException(self.error)
+        return self.answer
+
+
+class _Connection(object):
+    ''' A connection to the server which is kept open and used for multiple
+        requests. Each request gets a unique id and a reader thread hands the
+        answers over to the threads waiting for them, the order of the
+        answers does not matter.
+    '''
+
+    def __init__(self, host, port):
+        ''' Open the connection to the server and start the reader thread.
+
+            @param host: The host address (as a string)
+            @param port: The network port to use for the connection (as int)
+        '''
+        self.closed = False
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.sock.connect((host, port))
+        except socket.error, emsg:
+            self.closed = True
+            raise ClientCommunicationException(_('Could not connect to the '
+                    'server: {0}').format(emsg))
+
+        self.reader = threading.Thread(target=self._read_answers)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def request(self, cmd, param, no_answer, payload=None):
+        ''' Send a request over this connection and wait for the answer.
+
+            @param cmd: The command to send to the server.
+            @param param: The message parameters to send.
+            @param no_answer: If set to true no answer expected so don't wait
+                    for it.
+            @param payload: The (filename, offset, length) of the binary data
+                    to send with the message or None
+
+            @return: The answer from the server as a tuple (cmd, parameters)
+        '''
+        pending = _PendingAnswer()
+        with self.lock:
+            if self.closed:
+                raise ClientCommunicationException(_('The connection to the '
+                        'server is closed.'))
+            request_id = self.request_ids.next()
+            if not no_answer:
+                self.pending[request_id] = pending
+
+        message = {'cmd': cmd, 'parameters': param, 'id': request_id}
+        try:
+            with self.send_lock:
+                _send_message(self.sock, message, payload)
+        except (socket.error, IOError), emsg:
+            self._fail(_('Could not send the data to the server: '
+                    '{0}').format(emsg))
+            raise ClientCommunicationException(_('Could not send the data to '
+                    'the server: {0}').format(emsg))
+
+        if no_answer:
+            return (None, None)
+        return pending.wait()
+
+    def close(self):
+        ''' Close the connection, all the pending requests will fail. '''
+        self._fail(_('The connection to the server got closed.'))
+
+    def _read_answers(self):
+        ''' Read the answers from the server and hand them over to the
+            waiting requests. This runs within its own thread until the
+            connection gets closed.
+        '''
+        while True:
+            try:
+                answer = _receive_message(self.sock)
+            except (ClientCommunicationException, socket.error,
+                    ValueError), exc:
+                self._fail(_('Lost the connection to the server: '
+                        '{0}').format(exc))
+                return
+            if answer is None:
+                continue
+
+            with self.lock:
+                pending = self.pending.pop(answer.get('id'), None)
+            if pending is None:
+                LOG.warning(_('Received an answer for an unknown request: '
+                        '{0}').format(answer.get('id')))
+                continue
+            pending.set_answer((answer['cmd'], answer['parameters']))
+
+    def _fail(self, message):
+        ''' Mark the connection as closed and let all the waiting requests
+            fail with the given message.
+
+            @param message: The error message for the waiting requests.
+        '''
+        with self.lock:
+            if self.closed and len(self.pending) == 0:
+                return
+            self.closed = True
+            pending = self.pending.values()
+            self.pending = {}
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        for answer in pending:
+            answer.set_error(message)
+
+
+def _send_message(sock, message, payload):
+    ''' Send the message with the binary data if there is any.
+
+        @param sock: The socket to send the message with
+        @param message: The message dictionary
+        @param payload: The (filename, offset, length) of the binary data or
+                None
+    '''
+    if payload is None:
+        sock.sendall(prepare_sjson_data(message))
+        return
+    filename, offset, length = payload
+    sock.sendall(prepare_binary_data(message, length))
+    sendfile(sock, filename, offset, length)
+
 
 def _receive(sock):
     ''' Wait for a messag from the server and parse it acording to the
@@ -120,6 +344,20 @@ def _receive(sock):
         @param sock: The socket to use for receiving the data
         @return: the command param tuple (cmd, parameters)
     '''
+    answer = _receive_message(sock)
+    if answer is None:
+        return None
+    return answer['cmd'], answer['parameters']
+
+
+def _receive_message(sock):
+    ''' Wait for a message from the server and return the complete message
+        as it was received. This includes the request id if the message has
+        one.
+
+        @param sock: The socket to use for receiving the data
+        @return: the message dictionary or None for an empty message
+    '''
     mtype = sock.recv(1)
     if len(mtype) != 1:
         sock.close()
@@ -127,13 +365,46 @@ def _receive(sock):
                 'type from the server.'))
 
     if ord(mtype) == 0x61:
-        return _parse_sjson_data(sock)
+        return _read_sjson_message(sock)
+    elif ord(mtype) == 0x63:
+        return _read_binary_message(sock)
     else:
         sock.close()
         raise ClientCommunicationException(_('Received an unsuported '
             'communication type. Got: 0x{0:02x}').format(ord(mtype)))
 
 
+def _read_binary_message(sock):
+    ''' Read the sjson object followed by binary data from the given socket.
+        The data is stored as 'payload' within the parameters.
+
+        @param sock: The socket to read the rest of the message only the
+                message type should be read from the socket.
+        @return: the message dictionary
+    '''
+    header = receive_data(sock, BINARY_HEADER.size)
+    if not len(header) == BINARY_HEADER.size:
+        raise ClientCommunicationException(_('Could not receive the binary '
+                'message header.'))
+    length, size = BINARY_HEADER.unpack(header)
+    data = receive_data(sock, length)
+    payload = receive_data(sock, size)
+    if not len(data) == length or not len(payload) == size:
+        raise ClientCommunicationException(_('Could not receive all the data'
+                ' from the server. Expected {0:d} bytes but got: '
+                '{1:d}').format(length + size, len(data) + len(payload)))
+
+    answer = json.loads(data)
+    if not 'cmd' in answer:
+        raise ClientCommunicationException(_('The answer received did not '
+                "have a 'cmd' key."))
+    if not isinstance(answer.get('parameters'), dict):
+        raise ClientCommunicationException(_('The answer received did not '
+                "have a 'parameters' dictionary."))
+    answer['parameters']['payload'] = payload
+    return answer
+
+
 def _parse_sjson_data(sock):
     ''' Read the sjson object from the given socket. Only the message type
         must be read from the sock object.
@@ -146,7 +417,22 @@ def _parse_sjson_data(sock):
                 message type should be read from the socket.
         @return: a tuple (command, parameters)
     '''
-    size_data = sock.recv(4)
+    answer = _read_sjson_message(sock)
+    if answer is None:
+        return None
+    return answer['cmd'], answer['parameters']
+
+
+def _read_sjson_message(sock):
+    ''' Read the sjson object from the given socket and check that it has
+        the required keys. Only the message type must be read from the sock
+        object.
+
+        @param sock: The socket to read the rest of the message only the
+                message type should be read from the socket.
+        @return: the message dictionary or None for an empty message
+    '''
+    size_data = receive_data(sock, 4)
     if not len(size_data) == 4:
         raise ClientCommunicationException(_('Could not receive the message'
                 "header. Expected 4 bytes but got: {0:d}").format(
@@ -156,7 +442,7 @@ def _parse_sjson_data(sock):
     if length == 0:
         return None
 
-    data = sock.recv(length)
+    data = receive_data(sock, length)
     if not len(data) == length:
         raise ClientCommunicationException(_('Could not receive all the data'
                 ' from the client. Expected {0:d} bytes but got: '
@@ -170,4 +456,4 @@ def _parse_sjson_data(sock):
         raise ClientCommunicationException(_('The answer received did not '
                 "have a 'parameters' key."))
 
-    return answer['cmd'], answer['parameters']
+    return answer
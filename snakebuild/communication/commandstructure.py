@@ -41,9 +41,24 @@
     If there are optional paramters just write their name within square
     bracket. Example:
     [test]
+
+    A command which has to wait for something before it can answer (for
+    example an acquire waiting for a free resource) can return a
+    DeferredAnswer instead of the answer dictionary. The server sends the
+    answer as soon as it gets set, without blocking a thread in the meantime.
+    If the answer can't be delivered (the client closed the connection) the
+    server cancels the DeferredAnswer, this way the command can clean up (for
+    example release the resource again).
+
+    A command returning bytes (for example a part of a file) returns a
+    BinaryAnswer. The answer dictionary is sent as a binary message with the
+    bytes following it unencoded, the file is sent straight from the disk.
+    A client can send bytes with a request the same way, they are handed to
+    the command as the 'payload' parameter.
 '''
 
 import inspect
+import threading
 
 from snakebuild.i18n import _
 
@@ -59,6 +74,138 @@ ERROR = 'error'
 SUCCESS = 'success'
 
 
+class BinaryAnswer(object):
+    ''' The answer of a command with a part of a file following it. '''
+
+    def __init__(self, answer, filename, offset, length):
+        ''' Create the answer.
+
+            @param answer: The answer dictionary
+            @param filename: The file to send the data from
+            @param offset: The offset within the file
+            @param length: The number of bytes to send
+        '''
+        self.answer = answer
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        ''' Read the data to send (for the servers which can not send the
+            file directly).
+
+            @return: The data as a string
+        '''
+        with open(self.filename, 'rb') as bfl:
+            bfl.seek(self.offset)
+            return bfl.read(self.length)
+
+
+class DeferredAnswer(object):
+    ''' The answer of a command which is not yet available when the command
+        returns. The command keeps a reference to this object and sets the
+        answer later on. Who ever needs the answer registers a callback or
+        waits for it.
+    '''
+
+    def __init__(self):
+        ''' Create an answer object without an answer. '''
+        self._lock = threading.Lock()
+        self._available = threading.Event()
+        self._answer = None
+        self._callbacks = []
+        self._cancel_callbacks = []
+        self._cancelled = False
+
+    @property
+    def done(self):
+        ''' True if the answer is available. '''
+        return self._available.is_set()
+
+    @property
+    def cancelled(self):
+        ''' True if the answer got cancelled. '''
+        return self._cancelled
+
+    def set_answer(self, answer):
+        ''' Set the answer and inform all the registered callbacks. The
+            answer can only be set once.
+
+            @param answer: The answer dictionary (see prepare_answer and
+                    prepare_error)
+            @return: True if the answer was set, False if there was already
+                    an answer.
+        '''
+        with self._lock:
+            if self._available.is_set() or self._cancelled:
+                return False
+            self._answer = answer
+            self._available.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        for callback in callbacks:
+            callback(answer)
+        return True
+
+    def add_callback(self, callback):
+        ''' Register a function to call with the answer as soon as it is
+            available. If the answer is already available the function is
+            called right away.
+
+            @param callback: The function to call with the answer as the
+                    only parameter.
+        '''
+        with self._lock:
+            if not self._available.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self._answer)
+
+    def add_cancel_callback(self, callback):
+        ''' Register a function to call if the answer gets cancelled.
+
+            @param callback: The function to call without parameters.
+        '''
+        with self._lock:
+            if not self._cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        ''' Cancel the answer since it can't be delivered. This calls the
+            cancel callbacks once, even if the answer was already set. If the
+            answer is not available yet the answer callbacks are not called
+            anymore and wait returns None.
+
+            @return: True if the answer got cancelled, False if it was
+                    cancelled before.
+        '''
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._cancelled = True
+            self._callbacks = []
+            self._available.set()
+            callbacks = self._cancel_callbacks
+            self._cancel_callbacks = []
+
+        for callback in callbacks:
+            callback()
+        return True
+
+    def wait(self, timeout=None):
+        ''' Wait for the answer.
+
+            @param timeout: The maximum time to wait in seconds, None waits
+                    until the answer is available.
+            @return: The answer or None if it is not available yet.
+        '''
+        self._available.wait(timeout)
+        return self._answer
+
+
 def command_register(table):
     ''' With this function a decorator to register the commands is created.
         All the commands are beeing added to the given table.
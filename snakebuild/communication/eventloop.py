@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The EventLoopTCPServer handles all the connections of a server within one
+    thread. The sockets are watched with epoll (or poll if epoll is not
+    available) and only complete requests are handed over to a fixed number
+    of worker threads for executing the commands. An idle connection or a
+    command which returned a DeferredAnswer does not occupy any thread.
+    The DeferredAnswers not yet sent get cancelled if the connection closes.
+    The answers wait within a queue of pieces for the socket to be writable,
+    the file part of a BinaryAnswer is sent with sendfile piece by piece
+    without reading it into memory.
+'''
+
+import os
+import json
+import errno
+import socket
+import logging
+import threading
+import collections
+
+from snakebuild.i18n import _
+from snakebuild.communication.messages import prepare_sjson_data, \
+        prepare_binary_data, BINARY_HEADER
+from snakebuild.communication.messagehandler import _handle_cmd
+from snakebuild.communication.commandstructure import DeferredAnswer, \
+        BinaryAnswer, prepare_error
+from snakebuild.communication.workerpool import WorkerPool
+from snakebuild.communication.poller import Poller, READ, WRITE, ERROR
+from snakebuild.common.sendfile import send_file_part
+
+LOG = logging.getLogger('snakebuild.communication.eventloop')
+
+# the maximum size of the answers joined into one piece of the output queue
+_JOIN_SIZE = 65536
+
+
+class EventLoopTCPServer(object):
+    ''' A socket server with the same interface as the SocketServer classes
+        used by the Server (serve_forever, shutdown, server_close) but which
+        uses one thread for all the connections.
+    '''
+
+    def __init__(self, server_address, worker_count, backlog):
+        ''' Create the server and start listening.
+
+            @param server_address: The (host, port) tuple to listen on
+            @param worker_count: The number of threads executing the commands
+            @param backlog: The number of connections which might wait to be
+                    accepted.
+        '''
+        self.commands = None
+        self.data = None
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.socket.bind(server_address)
+            self.socket.listen(backlog)
+        except socket.error:
+            self.socket.close()
+            raise
+        self.socket.setblocking(0)
+        self.server_address = self.socket.getsockname()
+
+        self.workers = WorkerPool(worker_count, 'request')
+        self.connections = {}
+        self.poller = Poller()
+        self.poller.register(self.socket.fileno(), READ)
+
+        # the answers are handed over from the worker threads to the loop
+        # through this queue, the pipe wakes the loop up.
+        self.answers = collections.deque()
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        self.poller.register(self.wakeup_read, READ)
+
+        self.running = False
+        self.is_shut_down = threading.Event()
+        self.is_shut_down.set()
+
+    def serve_forever(self, poll_interval=0.5):
+        ''' Handle the connections until shutdown gets called.
+
+            @param poll_interval: The maximum time to wait for an event
+                    before checking for the shutdown request.
+        '''
+        self.running = True
+        self.is_shut_down.clear()
+        try:
+            while self.running:
+                for fileno, event in self.poller.poll(poll_interval):
+                    if fileno == self.socket.fileno():
+                        self._accept()
+                    elif fileno == self.wakeup_read:
+                        self._send_answers()
+                    elif fileno in self.connections:
+                        self._handle_event(self.connections[fileno], event)
+        finally:
+            self.is_shut_down.set()
+
+    def shutdown(self):
+        ''' Stop the serve_forever loop and wait until it is stopped. '''
+        self.running = False
+        self._wakeup()
+        self.is_shut_down.wait()
+
+    def server_close(self):
+        ''' Close the listening socket, all connections and stop the
+            worker threads.
+        '''
+        for connection in self.connections.values():
+            self._close(connection)
+        self.socket.close()
+        self.workers.stop()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+
+    def _accept(self):
+        ''' Accept all the waiting connections. '''
+        while True:
+            try:
+                sock, address = self.socket.accept()
+            except socket.error, exc:
+                if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                        errno.EINTR):
+                    LOG.error(_('Could not accept a new connection: '
+                            '{0}').format(exc))
+                return
+            sock.setblocking(0)
+            connection = _LoopConnection(sock, address)
+            self.connections[sock.fileno()] = connection
+            self.poller.register(sock.fileno(), READ)
+
+    def _handle_event(self, connection, event):
+        ''' Handle an event of one of the connections.
+
+            @param connection: The _LoopConnection object
+            @param event: The poll event mask
+        '''
+        if event & READ:
+            try:
+                data = connection.sock.recv(65536)
+            except socket.error, exc:
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                        errno.EINTR):
+                    return
+                data = ''
+            if not data:
+                self._close(connection)
+                return
+            connection.in_chunks.append(data)
+            connection.in_size += len(data)
+            if not self._parse_requests(connection):
+                self._close(connection)
+                return
+        elif event & ERROR:
+            self._close(connection)
+            return
+
+        if event & WRITE:
+            self._write(connection)
+
+    def _parse_requests(self, connection):
+        ''' Parse all the complete requests within the input buffer of the
+            connection and hand them over to the workers. The chunks read
+            are only joined if they hold the number of bytes the next
+            request needs (known from its length prefix).
+
+            @param connection: The _LoopConnection object
+            @return: False if the connection must be closed
+        '''
+        if connection.in_size < connection.in_needed:
+            return True
+        data = ''.join(connection.in_chunks)
+        pos = 0
+        while True:
+            needed, message, payload = _split_request(data, pos)
+            if needed is None:
+                return False
+            if message is None:
+                break
+            pos += needed
+            self._handle_request(connection, message, payload)
+
+        rest = data[pos:]
+        connection.in_chunks = [rest] if rest else []
+        connection.in_size = len(rest)
+        connection.in_needed = needed
+        return True
+
+    def _handle_request(self, connection, message, payload):
+        ''' Check the request received and hand it over to the workers.
+
+            @param connection: The _LoopConnection object
+            @param message: The json string of the request
+            @param payload: The binary data of the request or None
+        '''
+        try:
+            request = json.loads(message)
+        except ValueError:
+            LOG.error(_('Could not parse the received data. Not a valid '
+                    'json string.'))
+            return
+        if not 'cmd' in request:
+            LOG.error(_("The message received did not have a 'cmd' key."))
+            return
+        if not 'parameters' in request:
+            LOG.error(_("The message received did not have a 'parameters' "
+                    "key."))
+            return
+        if payload is not None:
+            if not isinstance(request['parameters'], dict):
+                LOG.error(_("The binary message received did not have a "
+                        "'parameters' dictionary."))
+                return
+            request['parameters']['payload'] = payload
+
+        if 'id' in request:
+            self.workers.execute(self._execute, connection, request)
+        elif connection.busy:
+            # the requests without id are answered in order
+            connection.waiting.append(request)
+        else:
+            connection.busy = True
+            self.workers.execute(self._execute, connection, request)
+
+    def _execute(self, connection, request):
+        ''' Execute the command of a request, this runs within a worker
+            thread.
+
+            @param connection: The _LoopConnection object
+            @param request: The request dictionary
+        '''
+        answer = _handle_cmd(request['cmd'], request['parameters'],
+                self.commands, self.data, False)
+        if not isinstance(answer, DeferredAnswer):
+            self._queue_answer(connection, request, answer, None)
+            return
+
+        with connection.lock:
+            closed = connection.closed
+            if not closed:
+                connection.pending.add(answer)
+        if closed:
+            answer.cancel()
+        else:
+            answer.add_callback(lambda result: self._queue_answer(connection,
+                    request, result, answer))
+
+    def _queue_answer(self, connection, request, answer, deferred):
+        ''' Hand the answer over to the loop thread for sending it.
+
+            @param connection: The _LoopConnection object
+            @param request: The request dictionary
+            @param answer: The answer of the command
+            @param deferred: The DeferredAnswer of the answer or None
+        '''
+        part = None
+        if isinstance(answer, BinaryAnswer):
+            try:
+                part = _FilePart(answer.filename, answer.offset,
+                        answer.length)
+                answer = answer.answer
+            except (IOError, OSError), exc:
+                answer = prepare_error(_('Could not read the data: '
+                        '{0}').format(exc))
+        message = {'cmd': request['cmd'], 'parameters': answer}
+        if 'id' in request:
+            message['id'] = request['id']
+        if part is None:
+            pieces = [prepare_sjson_data(message)]
+        else:
+            pieces = [prepare_binary_data(message, part.count), part]
+        self.answers.append((connection, 'id' in request, pieces, deferred))
+        self._wakeup()
+
+    def _send_answers(self):
+        ''' Move the answers from the worker threads to the output buffers of
+            the connections and start the next request without id.
+        '''
+        try:
+            os.read(self.wakeup_read, 4096)
+        except OSError:
+            pass
+        while len(self.answers) > 0:
+            connection, tagged, pieces, deferred = self.answers.popleft()
+            if deferred is not None:
+                with connection.lock:
+                    connection.pending.discard(deferred)
+                if connection.closed:
+                    deferred.cancel()
+                    _close_pieces(pieces)
+                    continue
+                connection.unsent.append(deferred)
+            if connection.closed:
+                _close_pieces(pieces)
+                continue
+            for piece in pieces:
+                connection.add_output(piece)
+            if not tagged:
+                if len(connection.waiting) > 0:
+                    self.workers.execute(self._execute, connection,
+                            connection.waiting.popleft())
+                else:
+                    connection.busy = False
+            self._write(connection)
+
+    def _write(self, connection):
+        ''' Send as much of the output queue as possible and watch the
+            socket for writing if there is data left.
+
+            @param connection: The _LoopConnection object
+        '''
+        try:
+            while len(connection.out_queue) > 0 and connection.send_output():
+                pass
+        except socket.error, exc:
+            if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                    errno.EINTR):
+                LOG.warning(_('Could not send the answer to the client: '
+                        '{0}').format(exc))
+                self._close(connection)
+                return
+        except (IOError, OSError, ValueError), exc:
+            # the file part can not be sent, the answer is broken
+            LOG.error(_('Could not send the data to the client: '
+                    '{0}').format(exc))
+            self._close(connection)
+            return
+
+        if len(connection.out_queue) > 0:
+            self.poller.modify(connection.sock.fileno(), READ | WRITE)
+        else:
+            connection.unsent = []
+            self.poller.modify(connection.sock.fileno(), READ)
+
+    def _close(self, connection):
+        ''' Close the given connection and cancel the deferred answers which
+            were not sent.
+
+            @param connection: The _LoopConnection object
+        '''
+        if connection.closed:
+            return
+        with connection.lock:
+            connection.closed = True
+            cancelled = list(connection.pending) + connection.unsent
+            connection.pending.clear()
+            connection.unsent = []
+        _close_pieces(connection.out_queue)
+        connection.out_queue.clear()
+        fileno = connection.sock.fileno()
+        self.poller.unregister(fileno)
+        del self.connections[fileno]
+        connection.sock.close()
+
+        for deferred in cancelled:
+            deferred.cancel()
+
+    def _wakeup(self):
+        ''' Wake the loop thread up. '''
+        try:
+            os.write(self.wakeup_write, 'x')
+        except OSError:
+            pass
+
+
+def _split_request(data, pos):
+    ''' Get the request starting at the given position of the input
+        buffer.
+
+        @param data: The input buffer
+        @param pos: The position of the request within the buffer
+        @return: A tuple with the number of bytes of the request, the json
+                string and the binary payload (or None). If the request is
+                not complete yet the json string is None and the number of
+                bytes is the number needed to continue. If the message type
+                is not supported the number of bytes is None.
+    '''
+    available = len(data) - pos
+    if available < 5:
+        return 5, None, None
+    if ord(data[pos]) == 0x61:
+        length = ((ord(data[pos + 1]) << 24) + (ord(data[pos + 2]) << 16) +
+                (ord(data[pos + 3]) << 8) + ord(data[pos + 4]))
+        if available < length + 5:
+            return length + 5, None, None
+        return length + 5, data[pos + 5:pos + length + 5], None
+    elif ord(data[pos]) == 0x63:
+        start = BINARY_HEADER.size + 1
+        if available < start:
+            return start, None, None
+        length, size = BINARY_HEADER.unpack(data[pos + 1:pos + start])
+        if available < start + length + size:
+            return start + length + size, None, None
+        message = data[pos + start:pos + start + length]
+        payload = data[pos + start + length:pos + start + length + size]
+        return start + length + size, message, payload
+    LOG.error(_('The message type received is not supported. got: '
+            '0x{0:02x}').format(ord(data[pos])))
+    return None, None, None
+
+
+class _LoopConnection(object):
+    ''' The state of one connection handled by the EventLoopTCPServer. '''
+
+    def __init__(self, sock, address):
+        ''' Create the connection state.
+
+            @param sock: The socket of the connection
+            @param address: The address of the client
+        '''
+        self.sock = sock
+        self.address = address
+        # the chunks read and not yet parsed, their size and the number of
+        # bytes the next request needs at least
+        self.in_chunks = []
+        self.in_size = 0
+        self.in_needed = 5
+        # the strings and _FileParts to send and the number of bytes of the
+        # first string already sent
+        self.out_queue = collections.deque()
+        self.out_offset = 0
+        self.closed = False
+        # a request without id is in progress and the waiting ones
+        self.busy = False
+        self.waiting = collections.deque()
+        # the deferred answers not yet available and the ones within the
+        # output buffer
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.unsent = []
+
+
+    def add_output(self, piece):
+        ''' Add a piece to the output queue, small answers are joined with
+            the last piece not yet being sent.
+
+            @param piece: The string or the _FilePart to send
+        '''
+        if (isinstance(piece, str) and len(self.out_queue) > 0 and
+                isinstance(self.out_queue[-1], str) and
+                (len(self.out_queue) > 1 or self.out_offset == 0) and
+                len(self.out_queue[-1]) + len(piece) <= _JOIN_SIZE):
+            self.out_queue[-1] += piece
+        else:
+            self.out_queue.append(piece)
+
+    def send_output(self):
+        ''' Send the first piece of the output queue (or a part of it).
+
+            @return: True if the piece is sent completely
+        '''
+        piece = self.out_queue[0]
+        if isinstance(piece, _FilePart):
+            piece.send(self.sock)
+            done = piece.count == 0
+            if done:
+                piece.close()
+        else:
+            self.out_offset += self.sock.send(buffer(piece, self.out_offset))
+            done = self.out_offset == len(piece)
+            if done:
+                self.out_offset = 0
+        if done:
+            self.out_queue.popleft()
+        return done
+
+
+class _FilePart(object):
+    ''' A part of a file to send (the data of a BinaryAnswer). '''
+
+    def __init__(self, filename, offset, count):
+        ''' Open the file.
+
+            @param filename: The file to send from
+            @param offset: The offset within the file
+            @param count: The number of bytes to send
+        '''
+        self.file = open(filename, 'rb')
+        if os.fstat(self.file.fileno()).st_size < offset + count:
+            self.file.close()
+            raise IOError(errno.EIO, 'The file is shorter than the data to '
+                    'send: {0}'.format(filename))
+        self.offset = offset
+        self.count = count
+
+    def send(self, sock):
+        ''' Send as much of the part as the socket takes without waiting.
+
+            @param sock: The non blocking socket
+        '''
+        if self.count == 0:
+            return
+        sent = send_file_part(sock, self.file.fileno(), self.offset,
+                self.count)
+        self.offset += sent
+        self.count -= sent
+
+    def close(self):
+        ''' Close the file. '''
+        self.file.close()
+
+
+def _close_pieces(pieces):
+    ''' Close the files of the pieces not sent.
+
+        @param pieces: The strings and _FileParts of an output queue
+    '''
+    for piece in pieces:
+        if isinstance(piece, _FilePart):
+            piece.close()
@@ -22,13 +22,17 @@
 '''
 
 import SocketServer
+import socket
+import threading
 import json
 import logging
 
 from snakebuild.i18n import _
-from snakebuild.communication.messages import prepare_sjson_data
+from snakebuild.common.sendfile import sendfile
+from snakebuild.communication.messages import prepare_sjson_data, \
+        prepare_binary_data, receive_data, BINARY_HEADER
 from snakebuild.communication.commandstructure import FUNCTION, PARAMETERS, \
-        SIGNED, prepare_error
+        SIGNED, prepare_error, DeferredAnswer, BinaryAnswer
 
 LOG = logging.getLogger('snakebuild.communication.messagehandler')
 
@@ -37,20 +41,86 @@ class MessageHandler(SocketServer.BaseRequestHandler):
     ''' Receive the messags from the client and handle the received command
         if the command is defined within the server.commands dictionary.
         If not log the message and ignore it. (Send error message)
+
+        The connection is kept open until the client closes it, therefore a
+        client can send multiple requests over the same connection. Requests
+        with an 'id' are handed over to the server (execute) and the answer
+        gets the same id, this way the answers might be sent in a different
+        order than the requests came in.
     '''
+    def setup(self):
+        ''' Prepare the lock to synchronize the answers sent and the list of
+            the deferred answers not yet sent.
+        '''
+        self.send_lock = threading.Lock()
+        self.pending = set()
+        self.closed = False
+
     def handle(self):
-        ''' Handle the data sent and check what to with it. '''
+        ''' Handle the data sent and check what to with it. If the client
+            closes the connection all the deferred answers not yet sent get
+            cancelled. If the server watches the idle connections itself
+            (suspend) only one request is handled and the connection is
+            handed back to the server afterwards.
+        '''
+        if hasattr(self.server, 'suspend'):
+            self.handle_next_request()
+            return
+
+        while self._handle_request():
+            pass
+        self.close()
+
+    def handle_next_request(self):
+        ''' Handle the next request of the connection and hand the
+            connection back to the server (suspend) to wait for the next one
+            without occupying a thread. A closed or broken connection gets
+            shut down.
+        '''
+        try:
+            alive = self._handle_request()
+        except socket.error, exc:
+            LOG.warning(_('Could not read the request from the client: '
+                    '{0}').format(exc))
+            alive = False
+
+        if alive:
+            self.server.suspend(self)
+        else:
+            self.close()
+            self.server.shutdown_request(self.request)
+
+    def close(self):
+        ''' Mark the connection as closed and cancel all the deferred
+            answers not yet sent.
+        '''
+        with self.send_lock:
+            self.closed = True
+            pending = list(self.pending)
+            self.pending.clear()
+        for deferred in pending:
+            deferred.cancel()
+
+    def _handle_request(self):
+        ''' Read the next request from the connection and handle it.
+
+            @return: True if the connection can be used for the next request
+                    and False if the connection is closed or broken.
+        '''
         data = self.request.recv(1)
         if not len(data) == 1:
-            return
+            return False
         if ord(data[0]) == 0x61:
-            self._parse_sjson_request()
+            return self._parse_sjson_request()
         elif ord(data[0]) == 0x62:
             self._parse_signed_request()
+            return False
+        elif ord(data[0]) == 0x63:
+            return self._parse_binary_request()
         else:
             LOG.error(_('The message type received is not supported. got: '
                     '0x{0:02x}').format(ord(data[0])))
-            return
+            return False
 
     def _parse_signed_request(self):
         ''' Check if the given request is correctly signed. If yes forward it
@@ -63,28 +133,66 @@ class MessageHandler(SocketServer.BaseRequestHandler):
 
     def _parse_sjson_request(self):
         ''' Get a sjson request and call the appropriate command if available.
+
+            @return: True if the message could be read completely and the
+                    connection can be used for the next request.
         '''
-        length_data = self.request.recv(4)
+        length_data = receive_data(self.request, 4)
         if not len(length_data) == 4:
             LOG.error(_('The message received did not return 4 bytes for the '
                     'length of the message: Got only: {0:d}').format(
                     len(length_data)))
-            return
+            return False
         length = ((ord(length_data[0]) << 24) + (ord(length_data[1]) << 16) +
                 (ord(length_data[2]) << 8) + ord(length_data[3]))
 
-        data = self.request.recv(length)
+        data = receive_data(self.request, length)
         if not len(data) == length:
             LOG.error(_('Wrong length of data received: Expected {0:d} but '
                     'got {1:d}').format(length, len(data)))
-            return
+            return False
         try:
             cmd = json.loads(data)
         except ValueError:
             LOG.error(_('Could not parse the received data. Not a valid json '
                     'string.'))
-            return
+            return True
         self._sjson_request_handler(cmd, False)
+        return True
+
+    def _parse_binary_request(self):
+        ''' Get a sjson request followed by binary data. The data is handed
+            to the command as the payload parameter.
+
+            @return: True if the message could be read completely and the
+                    connection can be used for the next request.
+        '''
+        header = receive_data(self.request, BINARY_HEADER.size)
+        if not len(header) == BINARY_HEADER.size:
+            LOG.error(_('The binary message received did not return the '
+                    'complete header.'))
+            return False
+        length, size = BINARY_HEADER.unpack(header)
+        data = receive_data(self.request, length)
+        payload = receive_data(self.request, size)
+        if not len(data) == length or not len(payload) == size:
+            LOG.error(_('Wrong length of data received: Expected {0:d} but '
+                    'got {1:d}').format(length + size,
+                    len(data) + len(payload)))
+            return False
+        try:
+            cmd = json.loads(data)
+        except ValueError:
+            LOG.error(_('Could not parse the received data. Not a valid json '
+                    'string.'))
+            return True
+        if not isinstance(cmd.get('parameters'), dict):
+            LOG.error(_("The binary message received did not have a "
+                    "'parameters' dictionary."))
+            return True
+        cmd['parameters']['payload'] = payload
+        self._sjson_request_handler(cmd, False)
+        return True
 
     def _sjson_request_handler(self, cmd, signed):
         ''' Check the cmd dictionary which was parsed from a sjson if it is a
@@ -103,13 +211,105 @@ class MessageHandler(SocketServer.BaseRequestHandler):
                 "key."))
             return
 
+        if 'id' in cmd:
+            self.server.execute(self._answer_request, cmd, signed)
+        else:
+            self._answer_request(cmd, signed)
+
+    def _answer_request(self, cmd, signed):
+        ''' Call the requested command and send the answer back to the
+            client. If the request has an id the answer gets the same id.
+            If the command returns a DeferredAnswer the answer is sent as
+            soon as it is available (handed to the server to execute), the
+            connection is not blocked while waiting for it. A client sending a request without id waits for
+            the answer before it sends the next request.
+
+            @param cmd: The loaded dictionary
+            @param signed: If set to true then the command was called with a
+                valid signature.
+        '''
         answer = _handle_cmd(cmd['cmd'], cmd['parameters'],
                 self.server.commands, self.server.data, signed)
 
-        answerdump = prepare_sjson_data({'cmd': cmd['cmd'],
-                'parameters': (answer)})
+        if not isinstance(answer, DeferredAnswer):
+            self._send_answer(cmd, answer)
+        else:
+            with self.send_lock:
+                closed = self.closed
+                if not closed:
+                    self.pending.add(answer)
+            if closed:
+                answer.cancel()
+            else:
+                # sent by the server (not by the thread setting the answer,
+                # a slow client must not block an other client or a timer)
+                answer.add_callback(lambda result: self.server.execute(
+                        self._send_deferred, cmd, answer, result))
+
+    def _send_deferred(self, cmd, deferred, answer):
+        ''' Send the answer of a DeferredAnswer as soon as it is available.
+            If the answer can not be sent the DeferredAnswer gets cancelled.
+
+            @param cmd: The loaded dictionary of the request
+            @param deferred: The DeferredAnswer object
+            @param answer: The answer of the command
+        '''
+        with self.send_lock:
+            self.pending.discard(deferred)
+        if not self._send_answer(cmd, answer):
+            deferred.cancel()
+
+    def _send_answer(self, cmd, answer):
+        ''' Send the answer for the given request to the client.
+
+            @param cmd: The loaded dictionary of the request
+            @param answer: The answer of the command
+            @return: True if the answer got sent
+        '''
+        if isinstance(answer, BinaryAnswer):
+            return self._send_binary_answer(cmd, answer)
+        message = {'cmd': cmd['cmd'], 'parameters': (answer)}
+        if 'id' in cmd:
+            message['id'] = cmd['id']
+        answerdump = prepare_sjson_data(message)
+
+        try:
+            with self.send_lock:
+                self.request.sendall(answerdump)
+        except socket.error, exc:
+            LOG.warning(_('Could not send the answer for the command {0} to '
+                    'the client: {1}').format(cmd['cmd'], exc))
+            return False
+        return True
+
+    def _send_binary_answer(self, cmd, answer):
+        ''' Send the answer followed by the part of the file. If the file
+            can not be sent completely the connection gets closed, the client
+            could not find the next answer otherwise.
+
+            @param cmd: The loaded dictionary of the request
+            @param answer: The BinaryAnswer object
+            @return: True if the answer got sent
+        '''
+        message = {'cmd': cmd['cmd'], 'parameters': answer.answer}
+        if 'id' in cmd:
+            message['id'] = cmd['id']
+        header = prepare_binary_data(message, answer.length)
 
-        self.request.send(answerdump)
+        with self.send_lock:
+            try:
+                self.request.sendall(header)
+                sendfile(self.request, answer.filename, answer.offset,
+                        answer.length)
+            except (socket.error, IOError, OSError), exc:
+                LOG.warning(_('Could not send the answer for the command {0} '
+                        'to the client: {1}').format(cmd['cmd'], exc))
+                try:
+                    self.request.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                return False
+        return True
 
 
 def _handle_cmd(cmd, parameters, commands, data, signed):
@@ -20,6 +20,11 @@
 '''
 
 import json
+import struct
+
+# the header of a binary message after the type: the length of the json
+# string and the length of the binary data following it
+BINARY_HEADER = struct.Struct('>IQ')
 
 
 def prepare_sjson_data(msg):
@@ -36,3 +41,38 @@ def prepare_sjson_data(msg):
 
     data += message
     return data
+
+
+def prepare_binary_data(msg, size):
+    ''' Prepare the header of a sjson message followed by binary data. The
+        binary data (size bytes) must be sent right after the header.
+
+        @param msg: The dictionary/list or basic type to transfer as a json
+                string.
+        @param size: The number of bytes of the binary data
+        @return: the message as a string including the header.
+    '''
+    message = json.dumps(msg)
+    return 'c' + BINARY_HEADER.pack(len(message), size) + message
+
+
+def receive_data(sock, length):
+    ''' Receive the given number of bytes from the socket. A single recv call
+        might return less data than requested for bigger messages, therefore
+        this function reads until all data is available or the connection got
+        closed.
+
+        @param sock: The socket to read the data from
+        @param length: The number of bytes to read
+        @return: the data received, might be shorter than length if the
+                connection got closed before all data was available.
+    '''
+    chunks = []
+    received = 0
+    while received < length:
+        chunk = sock.recv(length - received)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        received += len(chunk)
+    return ''.join(chunks)
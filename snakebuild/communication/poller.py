@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The Poller watches file descriptors with epoll (or poll if epoll is not
+    available). It is used by the server engines to watch the connections
+    without a thread for each of them.
+'''
+
+import errno
+import select
+
+READ = select.POLLIN | select.POLLPRI
+WRITE = select.POLLOUT
+ERROR = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+
+class Poller(object):
+    ''' A small wrapper around epoll and poll to use the same interface for
+        both. epoll is used if it is available.
+    '''
+
+    def __init__(self):
+        ''' Create the poll object. '''
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+            self.scale = 1
+        else:
+            self.poller = select.poll()
+            self.scale = 1000
+
+    def register(self, fileno, events):
+        ''' Watch the given file descriptor for the given events. '''
+        self.poller.register(fileno, events)
+
+    def modify(self, fileno, events):
+        ''' Change the events to watch for the given file descriptor. '''
+        self.poller.modify(fileno, events)
+
+    def unregister(self, fileno):
+        ''' Stop watching the given file descriptor. '''
+        self.poller.unregister(fileno)
+
+    def poll(self, timeout):
+        ''' Wait for events.
+
+            @param timeout: The maximum time to wait in seconds.
+            @return: A list with (fileno, event) tuples
+        '''
+        try:
+            return self.poller.poll(timeout * self.scale)
+        except (IOError, select.error), exc:
+            if exc.args[0] == errno.EINTR:
+                return []
+            raise
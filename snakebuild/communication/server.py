@@ -20,8 +20,22 @@
     the shutdown method is called. It will listen for clients and forward
     all connections to the MessageHandler. The Server requires a dictionary
     with all supported commands with a function to call.
+
+    There are different engines available to run the server:
+    threaded: Each connection and each request with an id gets its own
+        thread. The number of threads is not limited.
+    pool: A fixed number of threads handles the requests of the connections
+        and another one the requests with an id. The idle connections are
+        watched by one thread and only handed over to the pool if a request
+        arrives, commands returning a DeferredAnswer do not occupy any
+        thread while they wait.
+    eventloop: One thread handles all the connections with poll/epoll and
+        only the commands are executed on a fixed number of threads.
+        Commands returning a DeferredAnswer do not occupy any thread while
+        they wait.
 '''
 
+import os
 import threading
 import socket
 import time
@@ -31,6 +45,9 @@ import SocketServer
 from snakebuild.i18n import _
 from snakebuild.communication.messagehandler import MessageHandler
 from snakebuild.communication.commandstructure import command_register
+from snakebuild.communication.workerpool import WorkerPool
+from snakebuild.communication.eventloop import EventLoopTCPServer
+from snakebuild.communication.poller import Poller, READ, ERROR
 
 
 LOG = logging.getLogger('snakebuild.communication.messagehandler')
@@ -48,6 +65,7 @@ class ServerCommunicationException(BaseException):
 
 class ThreadedTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
     ''' Get a multithreaded socket server. '''
+    daemon_threads = True
 
     def __init__(self, server_address, RequestHandlerClass):
         ''' Init allow reusing the address for faster restart. '''
@@ -55,6 +73,171 @@ class ThreadedTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
         SocketServer.TCPServer.__init__(self, server_address,
                 RequestHandlerClass)
 
+    def execute(self, function, *args):
+        ''' Execute the given function within a new thread. This is used by
+            the MessageHandler for the requests with an id.
+
+            @param function: The function to call
+            @param args: The arguments for the function
+        '''
+        worker = threading.Thread(target=function, args=args)
+        worker.daemon = True
+        worker.start()
+
+
+class PooledTCPServer(SocketServer.TCPServer):
+    ''' A socket server which handles the requests with a fixed number of
+        threads. Between the requests the connections are watched by a
+        single thread (poll/epoll), an idle connection does not occupy a
+        thread of the pool. The requests with an id are executed by a second
+        pool of the same size, otherwise the connections could block each
+        other. The RequestHandlerClass must support suspend (MessageHandler).
+    '''
+
+    def __init__(self, server_address, RequestHandlerClass, worker_count,
+            backlog):
+        ''' Create the server and start the threads.
+
+            @param server_address: The (host, port) tuple to listen on
+            @param RequestHandlerClass: The handler class for the connections
+            @param worker_count: The number of threads for the connections
+                    and for the requests.
+            @param backlog: The number of connections which might wait to be
+                    accepted.
+        '''
+        self.allow_reuse_address = True
+        self.request_queue_size = backlog
+        SocketServer.TCPServer.__init__(self, server_address,
+                RequestHandlerClass)
+        self.connections = WorkerPool(worker_count, 'connection')
+        self.workers = WorkerPool(worker_count, 'request')
+
+        # the idle connections by file descriptor, the pipe wakes the
+        # watcher up to poll the newly suspended connections as well
+        self.suspended = {}
+        self.suspended_lock = threading.Lock()
+        self.poller = Poller()
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        self.poller.register(self.wakeup_read, READ)
+        self.watching = True
+        self.watcher = threading.Thread(target=self._watch_connections,
+                name='connection-watcher')
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def process_request(self, request, client_address):
+        ''' Hand the new connection over to the connection pool.
+
+            @param request: The socket of the connection
+            @param client_address: The address of the client
+        '''
+        self.connections.execute(self._process_request, request,
+                client_address)
+
+    def _process_request(self, request, client_address):
+        ''' Handle the first request of the connection, this runs within a
+            thread of the pool. The handler suspends the connection or shuts
+            it down.
+
+            @param request: The socket of the connection
+            @param client_address: The address of the client
+        '''
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+
+    def suspend(self, handler):
+        ''' Watch the connection of the given handler until the next request
+            arrives. This is called by the MessageHandler after a request.
+
+            @param handler: The MessageHandler of the connection
+        '''
+        fileno = handler.request.fileno()
+        with self.suspended_lock:
+            watching = self.watching
+            if watching:
+                self.suspended[fileno] = handler
+                self.poller.register(fileno, READ | ERROR)
+                os.write(self.wakeup_write, 'x')
+        if not watching:
+            handler.close()
+            self.shutdown_request(handler.request)
+
+    def _watch_connections(self):
+        ''' The main loop of the watcher thread. Hand the connections with
+            a new request (or closed by the client) over to the pool.
+        '''
+        while self.watching:
+            for fileno, event in self.poller.poll(0.5):
+                if fileno == self.wakeup_read:
+                    os.read(self.wakeup_read, 4096)
+                    continue
+                with self.suspended_lock:
+                    handler = self.suspended.pop(fileno, None)
+                    if handler is None:
+                        continue
+                    self.poller.unregister(fileno)
+                self.connections.execute(self._resume, handler)
+
+    def _resume(self, handler):
+        ''' Handle the next request of a suspended connection, this runs
+            within a thread of the pool.
+
+            @param handler: The MessageHandler of the connection
+        '''
+        try:
+            handler.handle_next_request()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            handler.close()
+            self.shutdown_request(handler.request)
+
+    def execute(self, function, *args):
+        ''' Execute the given function within the request pool. This is used
+            by the MessageHandler for the requests with an id.
+
+            @param function: The function to call
+            @param args: The arguments for the function
+        '''
+        self.workers.execute(function, *args)
+
+    def server_close(self):
+        ''' Close the listening socket, all the idle connections and stop
+            all the threads.
+        '''
+        SocketServer.TCPServer.server_close(self)
+        with self.suspended_lock:
+            self.watching = False
+            handlers = self.suspended.values()
+            self.suspended.clear()
+            os.write(self.wakeup_write, 'x')
+        self.watcher.join()
+        for handler in handlers:
+            handler.close()
+            self.shutdown_request(handler.request)
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+        self.connections.stop()
+        self.workers.stop()
+
+
+def get_engine(name):
+    ''' Get the server engine for the given name. This is used to read the
+        engine from the configuration.
+
+        @param name: The name of the engine (threaded, pool or eventloop)
+        @return: The engine value (Server.THREADED, Server.POOL,
+                Server.EVENT_LOOP)
+    '''
+    engines = {'threaded': Server.THREADED, 'pool': Server.POOL,
+            'eventloop': Server.EVENT_LOOP}
+    if not name.lower() in engines:
+        raise ServerCommunicationException(_('The given server engine is not '
+                'supported: {0}').format(name))
+    return engines[name.lower()]
+
 
 class Server(object):
     ''' This class is simple wrapper class for a server class which handles
@@ -67,8 +250,11 @@ class Server(object):
     '''
     # this defines the known message types
     SJSON, UNKNWON = range(2)
+    # this defines the supported server engines
+    THREADED, POOL, EVENT_LOOP = range(3)
 
-    def __init__(self, host, port, name, data=None):
+    def __init__(self, host, port, name, data=None, engine=THREADED,
+            worker_count=16, backlog=128, startup=None):
         ''' Create a server object with the given host and port. The server
             does not start listening until the run method is called.
 
@@ -77,11 +263,28 @@ class Server(object):
             @param name: This name is used for the identifier for the pid,
                     stdin, stdout and stederr files.
             @param data: The data object which has is required by the commands
+            @param engine: The server engine to use (THREADED, POOL,
+                    EVENT_LOOP)
+            @param worker_count: The number of threads used by the POOL and
+                    EVENT_LOOP engines.
+            @param backlog: The number of connections which might wait to be
+                    accepted.
+            @param startup: A function called (without parameters) within
+                    the process running the server, before it starts
+                    listening. Use it to start threads, which would not
+                    survive the fork to run the server as daemon.
         '''
+        if engine not in (self.THREADED, self.POOL, self.EVENT_LOOP):
+            raise ServerCommunicationException(_('The given server engine is '
+                    'not supported: {0}').format(engine))
         self.host = host
         self.port = port
+        self.engine = engine
+        self.worker_count = worker_count
+        self.backlog = backlog
         self.commands = REMOTE_COMMANDS
         self.data = data
+        self.startup = startup
         self.server = None
         self.server_running = True
 
@@ -94,6 +297,8 @@ class Server(object):
         ''' Start the server. This method will not return until the server
             gets stopped.
         '''
+        if self.startup is not None:
+            self.startup()
         srvr = threading.Thread(target=self.run_server)
         srvr.start()
 
@@ -114,8 +319,7 @@ class Server(object):
         self.server = None
         while self.server is None and self.server_running:
             try:
-                self.server = ThreadedTCPServer((self.host, self.port),
-                        MessageHandler)
+                self.server = self._create_server()
             except socket.error:
                 LOG.warning(_('Could not open network connection, will try '
                         'again within a few seconds.'))
@@ -128,6 +332,20 @@ class Server(object):
             self.server.serve_forever()
 
         LOG.info(_('Shutdown the server.'))
+        self.server.server_close()
+
+    def _create_server(self):
+        ''' Create the socket server for the configured engine.
+
+            @return: The socket server object
+        '''
+        if self.engine == self.POOL:
+            return PooledTCPServer((self.host, self.port), MessageHandler,
+                    self.worker_count, self.backlog)
+        elif self.engine == self.EVENT_LOOP:
+            return EventLoopTCPServer((self.host, self.port),
+                    self.worker_count, self.backlog)
+        return ThreadedTCPServer((self.host, self.port), MessageHandler)
 
     def shutdown(self):
         ''' This method gets called on shutdown. If the commands have a
@@ -137,3 +355,11 @@ class Server(object):
         if 'shutdown' in self.commands:
             self.commands['shutdown'][0](self.data)
         self.server.shutdown()
+
+    def reload(self):
+        ''' This method gets called on a reload request (SIGHUP). If the
+            commands have a reload command defined this will be called with no
+            parameters.
+        '''
+        if 'reload' in self.commands:
+            self.commands['reload'][0](self.data)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The WorkerPool runs tasks on a fixed number of threads. It is used by the
+    server engines to limit the number of threads used for handling
+    connections and commands.
+'''
+
+import Queue
+import logging
+import threading
+
+from snakebuild.i18n import _
+
+LOG = logging.getLogger('snakebuild.communication.workerpool')
+
+
+class WorkerPool(object):
+    ''' A fixed number of threads which execute the tasks added with the
+        execute method. The tasks are executed in the order they were added,
+        if all threads are busy the tasks wait until a thread is free.
+    '''
+
+    def __init__(self, size, name='worker'):
+        ''' Create the pool and start all the threads.
+
+            @param size: The number of threads to start (must be > 0)
+            @param name: The name prefix for the threads (for debugging)
+        '''
+        if size < 1:
+            raise ValueError(_('The size of a worker pool must be at least '
+                    '1. Got: {0}').format(size))
+        self.size = size
+        self.tasks = Queue.Queue()
+        self.workers = []
+        for cnt in range(size):
+            worker = threading.Thread(target=self._run,
+                    name='{0}-{1:d}'.format(name, cnt))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def execute(self, function, *args):
+        ''' Add a task to execute by the next free thread.
+
+            @param function: The function to call
+            @param args: The arguments to call the function with
+        '''
+        self.tasks.put((function, args))
+
+    def stop(self):
+        ''' Stop all the threads after the tasks already added are done. '''
+        for worker in self.workers:
+            self.tasks.put(None)
+
+    def _run(self):
+        ''' The main loop of each thread. Execute the tasks until stop
+            gets called.
+        '''
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            function, args = task
+            try:
+                function(*args)
+            except Exception, exc:
+                LOG.exception(_('A task of the worker pool failed: '
+                        '{0}').format(exc))
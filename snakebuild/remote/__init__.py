@@ -21,4 +21,5 @@
     Currently the following services are supported by this apis:
     - ResourceServer
     - BuildAgent
+    - BuildCache
 '''
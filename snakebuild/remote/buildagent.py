@@ -43,13 +43,20 @@ class BuildAgent(object):
         methods there is no knowledge of the protocol necessary.
     '''
 
-    def __init__(self, url, port):
+    def __init__(self, url, port, keep_alive=False):
         ''' Init the agent object to communicate with the agent later on
 
             @param url: The url of the server to connect to
             @param port: The network port where the server is listening.
+            @param keep_alive: If set to True one connection is kept open
+                    and used for all the calls, instead of opening a new
+                    connection for each call.
         '''
-        self.client = Client(url, port)
+        self.client = Client(url, port, keep_alive)
+
+    def close(self):
+        ''' Close the connection to the agent if it is kept open. '''
+        self.client.close()
 
     def get_status(self):
         ''' Get the status information about the build agent.
@@ -65,3 +72,48 @@ class BuildAgent(object):
             return answ['agent']
         raise BuildAgentRemoteError("[{0}]: {1}".format(cmd,
                 answ['message']))
+
+    def get_log(self, name, offset=0, size=None, wait=None):
+        ''' Get a piece of the log of a build step.
+
+            @param name: The name of the log
+            @param offset: The offset (in bytes) to read from
+            @param size: The maximum number of bytes to get (None for the
+                    maximum the agent supports)
+            @param wait: The maximum time in seconds the agent waits for the
+                    log to grow if there is nothing to read yet
+            @return: A dictionary with the data ('data'), the offset of the
+                    next piece ('offset'), the current size of the log
+                    ('size') and if the log is finished ('finished')
+        '''
+        if type(offset) is not int or offset < 0:
+            raise BuildAgentIllegalParameterError('The offset must be a '
+                    'positive integer: {0}'.format(offset))
+        param = {'name': name, 'offset': offset}
+        if size is not None:
+            param['size'] = size
+        if wait is not None:
+            param['wait'] = wait
+        cmd, answ = self.client.send(Client.SJSON, 'log_tail', param)
+        if answ['status'] == SUCCESS:
+            return answ
+        raise BuildAgentRemoteError("[{0}]: {1}".format(cmd,
+                answ['message']))
+
+    def follow_log(self, name, offset=0, wait=30):
+        ''' Follow the log of a build step while it gets written. This is a
+            generator returning the pieces of the log as soon as the agent
+            has them, it ends as soon as the log is finished.
+
+            @param name: The name of the log
+            @param offset: The offset (in bytes) to start at
+            @param wait: The maximum time in seconds one request waits
+            @return: The generator of the pieces of the log (strings)
+        '''
+        while True:
+            answer = self.get_log(name, offset, wait=wait)
+            offset = answer['offset']
+            if len(answer['data']) > 0:
+                yield answer['data']
+            elif answer['finished']:
+                return
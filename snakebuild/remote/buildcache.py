@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The following class BuildCache provides access to the build cache of the
+    build server without the need to know the detailed commands. The blobs
+    are transferred chunk by chunk as binary data following the messages,
+    only the chunks the other side does not have yet are sent. An
+    interrupted download continues from the offset already transferred.
+'''
+
+import os
+import hashlib
+
+from snakebuild.communication.client import Client
+from snakebuild.communication.commandstructure import SUCCESS
+from snakebuild.common.chunkstore import ChunkStoreException, \
+        get_file_manifest
+
+
+class BuildCacheError(BaseException):
+    ''' The base execpetion for all errors thrown within the BuildCache
+        class.
+    '''
+
+
+class BuildCacheRemoteError(BuildCacheError):
+    ''' The base exception of the errors of the remote server. '''
+
+
+class BuildCacheIllegalParameterError(BuildCacheError):
+    ''' The error thrown if a method is called with an illegal paramter. '''
+
+
+class BuildCache(object):
+    ''' This instance allows communicating with the build cache with simple
+        methods there is no knowledge of the protocol necessary.
+    '''
+
+    def __init__(self, url, port, keep_alive=False):
+        ''' Init the cache object to communicate with the server later on
+
+            @param url: The url of the server to connect to
+            @param port: The network port where the server is listening.
+            @param keep_alive: If set to True one connection is kept open
+                    and used for all the calls, instead of opening a new
+                    connection for each call.
+        '''
+        self.client = Client(url, port, keep_alive)
+
+    def close(self):
+        ''' Close the connection to the server if it is kept open. '''
+        self.client.close()
+
+    def has(self, keys=None, blobs=None, chunks=None):
+        ''' Check which of the given results, blobs and chunks are stored.
+
+            @param keys: The list of the keys of the results to check
+            @param blobs: The list of the hashes of the blobs to check
+            @param chunks: The list of the hashes of the chunks to check
+            @return: (keys, blobs, chunks) the lists of the ones stored
+        '''
+        param = {}
+        if keys is not None:
+            param['keys'] = keys
+        if blobs is not None:
+            param['blobs'] = blobs
+        if chunks is not None:
+            param['chunks'] = chunks
+        answ = self._send('cache_has', param)
+        return answ['keys'], answ['blobs'], answ['chunks']
+
+    def get_result(self, key):
+        ''' Get the result with the given key.
+
+            @param key: The key of the result
+            @return: The result dictionary or None if it is not stored
+        '''
+        if not self.has([key])[0]:
+            return None
+        return self._send('cache_get', {'key': key})['result']
+
+    def put_result(self, key, result):
+        ''' Store the result with the given key. The blobs of the log and the
+            artifacts must be uploaded before.
+
+            @param key: The key of the result
+            @param result: The result dictionary with the status ('status'),
+                    the output values ('output'), the hash of the log ('log')
+                    and the hashes of the artifacts by file name
+                    ('artifacts')
+        '''
+        self._send('cache_put', {'key': key, 'result': result})
+
+    def upload_blob(self, filename):
+        ''' Upload the given file as a blob. Only the chunks the server does
+            not have yet are sent, straight from the file.
+
+            @param filename: The file to upload
+            @return: The hash of the blob
+        '''
+        digest, manifest = get_file_manifest(filename)
+        if self.has(blobs=[digest])[1]:
+            return digest
+
+        sources = []
+        offset = 0
+        for chunk, size in manifest['chunks']:
+            sources.append((filename, offset))
+            offset += size
+        self._upload(digest, manifest, sources)
+        return digest
+
+    def push_blob(self, store, digest):
+        ''' Upload a blob of the given local ChunkStore. Only the chunks the
+            server does not have yet are sent, straight from the chunk files.
+
+            @param store: The ChunkStore with the blob
+            @param digest: The hash of the blob
+        '''
+        if self.has(blobs=[digest])[1]:
+            return
+        manifest = store.get_manifest(digest)
+        if manifest is None:
+            raise BuildCacheIllegalParameterError('The blob {0} is not '
+                    'stored locally.'.format(digest))
+        self._upload(digest, manifest, [(store.chunk_path(chunk), 0)
+                for chunk, size in manifest['chunks']])
+
+    def download_blob(self, digest, filename):
+        ''' Download the given blob into the file. If the file exists it is
+            taken as a partial download and only the rest gets downloaded.
+
+            @param digest: The hash of the blob
+            @param filename: The file to write the blob to
+        '''
+        offset = 0
+        if os.path.isfile(filename):
+            offset = os.path.getsize(filename)
+        with open(filename, 'ab') as bfl:
+            while True:
+                answ = self._send('blob_get', {'digest': digest,
+                        'offset': offset})
+                bfl.write(answ.get('payload', ''))
+                offset = answ['offset']
+                if answ['finished']:
+                    break
+        if _hash_file(filename) != digest:
+            os.remove(filename)
+            raise BuildCacheRemoteError('The downloaded blob {0} does not '
+                    'match its hash.'.format(digest))
+
+    def fetch_blob(self, store, digest):
+        ''' Download a blob into the given local ChunkStore. Only the chunks
+            the store does not have yet are downloaded.
+
+            @param store: The ChunkStore to add the blob to
+            @param digest: The hash of the blob
+        '''
+        if store.has(digest):
+            return
+        manifest = self._send('blob_manifest', {'digest': digest})['manifest']
+        try:
+            missing = set(store.missing([chunk
+                    for chunk, size in manifest['chunks']]))
+            offset = 0
+            for chunk, size in manifest['chunks']:
+                if chunk in missing:
+                    answ = self._send('blob_get', {'digest': digest,
+                            'offset': offset})
+                    store.add_chunk(chunk, answ.get('payload', ''))
+                    missing.discard(chunk)
+                offset += size
+            store.add_manifest(digest, manifest)
+        except ChunkStoreException, exc:
+            raise BuildCacheRemoteError('The blob {0} could not be '
+                    'downloaded: {1}'.format(digest, exc))
+
+    def _upload(self, digest, manifest, sources):
+        ''' Upload the chunks of a blob missing on the server followed by
+            the manifest.
+
+            @param digest: The hash of the blob
+            @param manifest: The manifest of the blob
+            @param sources: The (filename, offset) of each chunk
+        '''
+        stored = set(self.has(chunks=[chunk
+                for chunk, size in manifest['chunks']])[2])
+        for (chunk, size), (filename, offset) in zip(manifest['chunks'],
+                sources):
+            if chunk in stored:
+                continue
+            self._send('chunk_put', {'digest': chunk},
+                    (filename, offset, size))
+            stored.add(chunk)
+        self._send('blob_put', {'digest': digest, 'manifest': manifest})
+
+    def _send(self, cmd, param, payload=None):
+        ''' Send the command and check the answer.
+
+            @param cmd: The command to send
+            @param param: The parameters of the command
+            @param payload: The (filename, offset, length) of the binary data
+                    to send with the command or None
+            @return: The answer dictionary
+        '''
+        cmd, answ = self.client.send(Client.SJSON, cmd, param,
+                payload=payload)
+        if answ['status'] == SUCCESS:
+            return answ
+        raise BuildCacheRemoteError("[{0}]: {1}".format(cmd,
+                answ['message']))
+
+
+def _hash_file(path):
+    ''' Get the sha1 hash of the given file.
+
+        @param path: The file to read
+        @return: The hash as a hex string
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as bfl:
+        for data in iter(lambda: bfl.read(65536), ''):
+            digest.update(data)
+    return digest.hexdigest()
@@ -44,15 +44,22 @@ class ResourceServer(object):
         methods there is not knowledge of the protocol necessary.
     '''
 
-    def __init__(self, url, port):
+    def __init__(self, url, port, keep_alive=False):
         ''' Init the server object to communicate with the server later on
 
             @param url: The url of the server to connect to
             @param port: The network port where the server is listening.
+            @param keep_alive: If set to True one connection is kept open
+                    and used for all the calls, instead of opening a new
+                    connection for each call.
         '''
-        self.client = Client(url, port)
+        self.client = Client(url, port, keep_alive)
 
-    def get_status_list(self):
+    def close(self):
+        ''' Close the connection to the server if it is kept open. '''
+        self.client.close()
+
+    def get_status_list(self, tag=None):
         ''' Get the status information about all the configured resources.
 
             The answer of this command is a list if successfull otherwise an
@@ -65,15 +72,50 @@ class ResourceServer(object):
             free: The number of free slots
             users: The list of user names currently using the resource
 
+            @param tag: If set only the resources matching the given keyword
+                    or tag expression are listed.
             @return: If successfull it will return a list with a dictionary
                     for each resource.
         '''
-        cmd, answ = self.client.send(Client.SJSON, 'status_list', None)
+        if tag is None:
+            parameters = None
+        elif not (type(tag) is str or type(tag) is unicode):
+            raise ResourceServerIllegalParameterError(_('tag parameter '
+                    'requires a string as the value. {0}').format(type(tag)))
+        else:
+            parameters = {'tag': tag}
+        cmd, answ = self.client.send(Client.SJSON, 'status_list', parameters)
         if answ['status'] == SUCCESS:
             return answ['resources']
         raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
                 answ['message']))
 
+    def get_queue(self):
+        ''' Get the list of the requests waiting for a resource, in the order
+            they will be served.
+
+            The answer list has one entry for each waiting request stored
+            within a dictionary with the following informations (keys):
+            user: The name of the user waiting
+            tag: The tag requested (the tags separated by commas if multiple
+                resources are requested at once)
+            exclusive: The exclusive flag of the request (a list if
+                multiple resources are requested)
+            priority: The priority of the request
+            position: The position within the requests for the same tag
+            waiting: The time in seconds the request is waiting
+            estimate: The estimated remaining waiting time in seconds or None
+                if not known yet
+
+            @return: If successfull it will return a list with a dictionary
+                    for each waiting request.
+        '''
+        cmd, answ = self.client.send(Client.SJSON, 'queue', None)
+        if answ['status'] == SUCCESS:
+            return answ['queue']
+        raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
+                answ['message']))
+
     def get_resource_details(self, name):
         ''' Get the detail information about one resource.
 
@@ -100,7 +142,8 @@ class ResourceServer(object):
         raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
                 answ['message']))
 
-    def acquire_resource(self, name, tag, exclusive=False):
+    def acquire_resource(self, name, tag, exclusive=False, timeout=None,
+            nowait=False, priority=0):
         ''' Acquire a resource with a givne tag name. The name for the user to
             acquire the resource must be given. With the exclusive flag it is
             possible to acquire a resource exclusivly.
@@ -110,9 +153,150 @@ class ResourceServer(object):
             @param exclusive: If set to true then the resource is needed for
                 exclusive usage. Otherwise the number of parallel users is
                 specified within the config.
+            @param timeout: The maximum time in seconds to wait for the
+                resource. If None wait until a resource is available.
+            @param nowait: If set to true do not wait at all, if no resource
+                is available an error is raised.
+            @param priority: The priority of the request, if multiple
+                requests wait the one with the highest priority is served
+                first.
 
             @return: If successfull it will return the name of the resource
         '''
+        return self._acquire(name, tag, exclusive, timeout, nowait,
+                None, priority)['resource']
+
+    def acquire_lease(self, name, tag, ttl, exclusive=False, timeout=None,
+            nowait=False, priority=0):
+        ''' Acquire a resource with a lease. The lease must be renewed
+            (renew_lease) within the given ttl, otherwise the server releases
+            the resource.
+
+            @param name: The name of the user to acquire the given resource
+            @param tag: The tag of the resource to get.
+            @param ttl: The time to live of the lease in seconds
+            @param exclusive: If set to true then the resource is needed for
+                exclusive usage.
+            @param timeout: The maximum time in seconds to wait for the
+                resource. If None wait until a resource is available.
+            @param nowait: If set to true do not wait at all, if no resource
+                is available an error is raised.
+            @param priority: The priority of the request, if multiple
+                requests wait the one with the highest priority is served
+                first.
+
+            @return: If successfull it will return the name of the resource
+                and the lease id as a tuple
+        '''
+        if ttl is None:
+            raise ResourceServerIllegalParameterError(_('ttl parameter '
+                    'is required for a lease.'))
+        answ = self._acquire(name, tag, exclusive, timeout, nowait, ttl,
+                priority)
+        return answ['resource'], answ['lease']
+
+    def acquire_many(self, name, resources, timeout=None, nowait=False,
+            ttl=None, priority=0):
+        ''' Acquire multiple resources at once. Either all of them are
+            acquired or none, this way two clients can't block each other by
+            holding a part of the resources the other one needs.
+
+            @param name: The name of the user to acquire the resources
+            @param resources: A list with a (tag, exclusive) tuple for each
+                resource to acquire.
+            @param timeout: The maximum time in seconds to wait for the
+                resources. If None wait until they are available.
+            @param nowait: If set to true do not wait at all, if not all the
+                resources are available an error is raised.
+            @param ttl: If set each resource is acquired with a lease with
+                the given time to live in seconds (see renew_lease).
+            @param priority: The priority of the request, if multiple
+                requests wait the one with the highest priority is served
+                first.
+
+            @return: If successfull it will return the list with the names of
+                the resources (in the same order as requested). If a ttl is
+                given a tuple with the names and the lease ids is returned.
+        '''
+        if not (type(name) is str or type(name) is unicode):
+            raise ResourceServerIllegalParameterError(_('name parameter '
+                    'requires a string as the value. {0}').format(type(name)))
+        if not type(resources) in (list, tuple) or len(resources) == 0:
+            raise ResourceServerIllegalParameterError(_('resources parameter '
+                    'requires a list with (tag, exclusive) tuples. '
+                    '{0}').format(resources))
+        for item in resources:
+            if (not type(item) in (list, tuple) or len(item) != 2 or
+                    not type(item[0]) in (str, unicode) or
+                    type(item[1]) is not bool):
+                raise ResourceServerIllegalParameterError(_('resources '
+                        'parameter requires (tag, exclusive) tuples and not: '
+                        '{0}').format(item))
+        if timeout is not None and (type(timeout) not in (int, float) or
+                timeout < 0):
+            raise ResourceServerIllegalParameterError(_('timeout parameter '
+                    'must be a positive number and not: {0}').format(timeout))
+        if type(nowait) is not bool:
+            raise ResourceServerIllegalParameterError(_('nowait parameter '
+                    'must be a boolean value and not: {0}').format(
+                    type(nowait)))
+        if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+            raise ResourceServerIllegalParameterError(_('ttl parameter '
+                    'must be a positive number and not: {0}').format(ttl))
+        if type(priority) is not int:
+            raise ResourceServerIllegalParameterError(_('priority parameter '
+                    'must be an integer and not: {0}').format(type(priority)))
+
+        parameters = {'name': name,
+                'resources': [list(item) for item in resources]}
+        if timeout is not None:
+            parameters['timeout'] = timeout
+        if nowait:
+            parameters['nowait'] = nowait
+        if ttl is not None:
+            parameters['ttl'] = ttl
+        if priority != 0:
+            parameters['priority'] = priority
+        cmd, answ = self.client.send(Client.SJSON, 'acquire_many', parameters)
+        if answ['status'] != SUCCESS:
+            raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
+                    answ['message']))
+        if ttl is not None:
+            return answ['resources'], answ['leases']
+        return answ['resources']
+
+    def renew_lease(self, lease, ttl=None):
+        ''' Renew the lease of a resource acquired with acquire_lease.
+
+            @param lease: The id of the lease to renew
+            @param ttl: The new time to live in seconds, if None the ttl
+                given on acquire is used again.
+
+            @return: If successfull it will return the ttl of the lease
+        '''
+        if not (type(lease) is str or type(lease) is unicode):
+            raise ResourceServerIllegalParameterError(_('lease parameter '
+                    'requires a string as the value. {0}').format(
+                    type(lease)))
+        if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+            raise ResourceServerIllegalParameterError(_('ttl parameter '
+                    'must be a positive number and not: {0}').format(ttl))
+
+        parameters = {'lease': lease}
+        if ttl is not None:
+            parameters['ttl'] = ttl
+        cmd, answ = self.client.send(Client.SJSON, 'renew', parameters)
+        if answ['status'] == SUCCESS:
+            return answ['ttl']
+        raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
+                answ['message']))
+
+    def _acquire(self, name, tag, exclusive, timeout, nowait, ttl, priority):
+        ''' Check the parameters and send the acquire command.
+
+            @see acquire_lease
+            @return: The answer dictionary of the server
+        '''
         if not (type(name) is str or type(name) is unicode):
             raise ResourceServerIllegalParameterError(_('name parameter '
                     'requires a string as the value. {0}').format(type(name)))
@@ -123,11 +307,33 @@ class ResourceServer(object):
             raise ResourceServerIllegalParameterError(_('exclusive parameter '
                     'must be a boolean value and not: {0}').format(
                     type(exclusive)))
+        if timeout is not None and (type(timeout) not in (int, float) or
+                timeout < 0):
+            raise ResourceServerIllegalParameterError(_('timeout parameter '
+                    'must be a positive number and not: {0}').format(timeout))
+        if type(nowait) is not bool:
+            raise ResourceServerIllegalParameterError(_('nowait parameter '
+                    'must be a boolean value and not: {0}').format(
+                    type(nowait)))
+        if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+            raise ResourceServerIllegalParameterError(_('ttl parameter '
+                    'must be a positive number and not: {0}').format(ttl))
+        if type(priority) is not int:
+            raise ResourceServerIllegalParameterError(_('priority parameter '
+                    'must be an integer and not: {0}').format(type(priority)))
 
-        cmd, answ = self.client.send(Client.SJSON, 'acquire',
-                {'name': name, 'tag': tag, 'exclusive': exclusive})
+        parameters = {'name': name, 'tag': tag, 'exclusive': exclusive}
+        if timeout is not None:
+            parameters['timeout'] = timeout
+        if nowait:
+            parameters['nowait'] = nowait
+        if ttl is not None:
+            parameters['ttl'] = ttl
+        if priority != 0:
+            parameters['priority'] = priority
+        cmd, answ = self.client.send(Client.SJSON, 'acquire', parameters)
         if answ['status'] == SUCCESS:
-            return answ['resource']
+            return answ
         raise ResourceServerRemoteError("[{0}]: {1}".format(cmd,
                 answ['message']))
 
@@ -20,6 +20,9 @@
 '''
 
 import acquire
+import acquire_many
 import release
+import queue
+import renew
 import details
 import status
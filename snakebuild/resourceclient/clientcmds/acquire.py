@@ -31,6 +31,16 @@ from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
 @command('acquire', (
     (('--exclusive',), {'action': 'store_true', 'help': _('Set this flag to '
             'get a resource fro exclusive usage.'), 'default': False}),
+    (('--timeout',), {'type': float, 'help': _('The maximum time in seconds '
+            'to wait for a resource.'), 'default': None}),
+    (('--nowait',), {'action': 'store_true', 'help': _('Do not wait if no '
+            'resource is available.'), 'default': False}),
+    (('--ttl',), {'type': float, 'help': _('Acquire the resource with a '
+            'lease which must be renewed within the given time in seconds '
+            '(see renew).'), 'default': None}),
+    (('--priority',), {'type': int, 'help': _('The priority of the request, '
+            'if multiple requests wait the one with the highest priority is '
+            'served first.'), 'default': 0}),
     (('tag',), {'help': _('The tag to search for in a resource or a resource '
             'name.')})
     ))
@@ -48,7 +58,13 @@ def acquire(args, config):
     name = config.get_s('ResourceClient', 'clientname')
 
     try:
-        answer = srvr.acquire_resource(name, args.tag, args.exclusive)
+        if args.ttl is None:
+            answer = srvr.acquire_resource(name, args.tag, args.exclusive,
+                    args.timeout, args.nowait, args.priority)
+        else:
+            answer = _('{0} (lease: {1})').format(*srvr.acquire_lease(name,
+                    args.tag, args.ttl, args.exclusive, args.timeout,
+                    args.nowait, args.priority))
     except ResourceServerRemoteError, exc:
         output.error(_("Got error while talking with the server:\n "
                 "{0}").format(exc))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The acquire_many command to acquire multiple resources at once from the
+    resource server.
+'''
+
+from argparse import Action
+
+from snakebuild.i18n import _
+from snakebuild.common import output
+from snakebuild.communication import ClientCommunicationException
+from snakebuild.remote.resourceserver import ResourceServerRemoteError
+from snakebuild.resourceclient.clientcmds.common import get_resource_server
+from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
+
+
+class _TagAction(Action):
+    ''' The argparse action which appends the tags with the exclusive flag
+        (the const value) to the resources list, this way the resources
+        keep the order of the command line.
+    '''
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        ''' Append the tags to the resources of the namespace.
+
+            @param parser: The ArgumentParser
+            @param namespace: The namespace with the parsed arguments
+            @param values: A tag or the list of the tags
+            @param option_string: The option used (None for the positional)
+        '''
+        if not isinstance(values, list):
+            values = [values]
+        resources = list(getattr(namespace, 'resources', None) or [])
+        resources.extend((tag, self.const) for tag in values)
+        setattr(namespace, 'resources', resources)
+
+
+@command('acquire_many', (
+    (('tags',), {'nargs': '*', 'action': _TagAction, 'const': False,
+            'help': _('The tags of the resources to acquire (one resource '
+            'for each tag).')}),
+    (('--exclusive',), {'action': _TagAction, 'const': True,
+            'dest': 'resources', 'metavar': 'TAG', 'help': _('The tag of a '
+            'resource to get for exclusive usage. Might be given multiple '
+            'times.'), 'default': []}),
+    (('--timeout',), {'type': float, 'help': _('The maximum time in seconds '
+            'to wait for the resources.'), 'default': None}),
+    (('--nowait',), {'action': 'store_true', 'help': _('Do not wait if not '
+            'all resources are available.'), 'default': False}),
+    (('--ttl',), {'type': float, 'help': _('Acquire the resources with '
+            'leases which must be renewed within the given time in seconds '
+            '(see renew).'), 'default': None}),
+    (('--priority',), {'type': int, 'help': _('The priority of the request, '
+            'if multiple requests wait the one with the highest priority is '
+            'served first.'), 'default': 0}),
+    ))
+def acquire_many(args, config):
+    ''' Acquire multiple resources at once. Either all of them are acquired
+        or none.
+
+        @param args: The arguments provided to this command
+        @param config: The config object to use
+
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    # the (tag, exclusive) tuples in the order of the command line, the
+    # answer lists the resources in the same order
+    resources = args.resources
+    if len(resources) == 0:
+        output.error(_('At least one tag is required.'))
+        return False
+
+    srvr = get_resource_server(config)
+
+    name = config.get_s('ResourceClient', 'clientname')
+
+    try:
+        if args.ttl is None:
+            answer = srvr.acquire_many(name, resources, args.timeout,
+                    args.nowait, None, args.priority)
+            output.message(', '.join(answer))
+        else:
+            answer = srvr.acquire_many(name, resources, args.timeout,
+                    args.nowait, args.ttl, args.priority)
+            for resource, lease in zip(*answer):
+                output.message(_('{0} (lease: {1})').format(resource, lease))
+    except ResourceServerRemoteError, exc:
+        output.error(_("Got error while talking with the server:\n "
+                "{0}").format(exc))
+        return False
+    except ClientCommunicationException, exc:
+        output.error(exc)
+        return False
+
+    return True
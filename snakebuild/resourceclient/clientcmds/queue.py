@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The queue command to list the requests waiting for a resource on a
+    resource server.
+'''
+
+from snakebuild.i18n import _
+from snakebuild.common import output
+from snakebuild.communication import ClientCommunicationException
+from snakebuild.remote.resourceserver import ResourceServerRemoteError
+from snakebuild.resourceclient.clientcmds.common import get_resource_server
+from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
+
+
+@command('queue', ())
+def queue(options, config):
+    ''' This is the command to get the list of the waiting requests with
+        their position and estimated waiting time.
+
+        @param args: The arguments provided to this command
+        @param config: The config object to use.
+
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    srvr = get_resource_server(config)
+    try:
+        answer = srvr.get_queue()
+    except ResourceServerRemoteError, exc:
+        output.error(_("Got error while talking with the server:\n "
+                "{0}").format(exc))
+        return False
+    except ClientCommunicationException, exc:
+        output.error(exc)
+        return False
+
+    print _("Pos | Prio | Waiting | Estimate | User            | Tag")
+    for request in answer:
+        if request['estimate'] is None:
+            estimate = _('unknown')
+        else:
+            estimate = '{0:.0f}s'.format(request['estimate'])
+        print _("{0[position]:>3d} | {0[priority]:>4d} | {1:>7s} | {2:>8s} | "
+                "{0[user]:<15s} | {0[tag]}").format(request,
+                '{0:.0f}s'.format(request['waiting']), estimate)
+    return True
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The renew command to renew the lease of a resource acquired with a ttl.
+'''
+
+from snakebuild.i18n import _
+from snakebuild.common import output
+from snakebuild.communication import ClientCommunicationException
+from snakebuild.remote.resourceserver import ResourceServerRemoteError
+from snakebuild.resourceclient.clientcmds.common import get_resource_server
+from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
+
+
+@command('renew', (
+    (('lease',), {'help': _('The lease id returned by the acquire command')}),
+    (('--ttl',), {'type': float, 'help': _('The new time to live in seconds. '
+            'If not set the one given on acquire is used.'),
+            'default': None}),
+    ))
+def renew(args, config):
+    ''' Renew the lease of a resource acquired with a ttl.
+
+        @param args: The arguments provided to this command
+        @param config: The config object to use
+
+        @return True on success, False on error and nothing on wrong usage.
+    '''
+    srvr = get_resource_server(config)
+
+    try:
+        ttl = srvr.renew_lease(args.lease, args.ttl)
+    except ResourceServerRemoteError, exc:
+        output.error(_("Got error while talking with the server:\n "
+                "{0}").format(exc))
+        return False
+    except ClientCommunicationException, exc:
+        output.error(exc)
+        return False
+
+    output.message(_('Lease renewed for {0} seconds.').format(ttl))
+    return True
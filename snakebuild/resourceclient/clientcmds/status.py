@@ -28,7 +28,11 @@ from snakebuild.resourceclient.clientcmds.common import get_resource_server
 from snakebuild.resourceclient.commandlineparser import SHELL_COMMANDS, command
 
 
-@command('status', ())
+@command('status', (
+    (('--tag',), {'help': _('List only the resources matching the given '
+            'keyword or tag expression (for example "linux & !slow")'),
+            'default': None}),
+    ))
 def status(options, config):
     ''' This is the command to get a list with information about all the
         resources.
@@ -40,7 +44,7 @@ def status(options, config):
     '''
     srvr = get_resource_server(config)
     try:
-        answer = srvr.get_status_list()
+        answer = srvr.get_status_list(options.tag)
     except ResourceServerRemoteError, exc:
         output.error(_("Got error while talking with the server:\n "
                 "{0}").format(exc))
@@ -22,4 +22,8 @@
 
 from resource import Resource, init_resource_from_string, \
         init_resource_from_obj, ResourceException
+from resourcerequest import ResourceRequest, GangRequest
+from placement import PlacementPolicy, get_placement_policy
+from scheduler import Scheduler, get_scheduler
+from journal import Journal
 from resourcemanager import ResourceManager
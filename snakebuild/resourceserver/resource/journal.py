@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The Journal is a write-ahead log of the allocation state of the resource
+    server. Each acquire and release is appended as one line of json and the
+    answer to the client is only sent after the line is stored on disk,
+    therefore the resource server knows after a restart who holds what.
+
+    The lines are written by one thread (group commit): while one fsync is
+    running the new lines are collected and written with the next fsync.
+    This way many requests share one fsync.
+
+    After the given number of lines the journal gets compacted: the current
+    state is written as a snapshot to a new file which replaces the old one.
+    The snapshot is written by the journal thread as well.
+
+    If the journal can not be written it is marked as failed, the records
+    are not reported as stored and the write is retried until it works.
+'''
+
+import os
+import time
+import json
+import logging
+import threading
+
+from snakebuild.i18n import _
+
+LOG = logging.getLogger('snakebuild.resourceserver.resource.journal')
+
+# the seconds to wait before a failed write is retried
+RETRY_INTERVAL = 1.0
+
+
+class Journal(object):
+    ''' The append only journal file with the group commit thread. '''
+
+    def __init__(self, path, compact_limit=10000):
+        ''' Create the journal object, the file is opened with the first
+            compact call and the thread is started with the first record.
+
+            @param path: The path of the journal file
+            @param compact_limit: The number of records after which the
+                    journal should be compacted.
+        '''
+        self.path = path
+        self.compact_limit = compact_limit
+        self.condition = threading.Condition()
+        # held while writing to the file
+        self.write_lock = threading.Lock()
+        self.pending = []
+        # the records of the snapshot to write (see schedule_compact)
+        self.snapshot = None
+        self.seq = 0
+        self.synced = 0
+        # the number of records since the last compaction
+        self.count = 0
+        self.running = False
+        self.jfile = None
+        # the size of the journal file with all the stored records
+        self.size = 0
+        # the error of the last write, None as long as the writes work
+        self.failed = None
+        self.thread = None
+        # statistics: the records and fsyncs written and the time used
+        self.records = 0
+        self.syncs = 0
+        self.sync_time = 0.0
+
+    @property
+    def needs_compact(self):
+        ''' True if enough records are written to compact the journal. '''
+        return self.count >= self.compact_limit
+
+    def load(self):
+        ''' Read all the records of the journal file. A broken line at the
+            end (interrupted write) is ignored.
+
+            @return: The list of the records (dictionaries)
+        '''
+        if not os.path.isfile(self.path):
+            return []
+        records = []
+        with open(self.path, 'r') as jfile:
+            for number, line in enumerate(jfile):
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    LOG.warning(_('Ignore the broken journal entry at line '
+                            '{0} and all the following of: {1}').format(
+                            number + 1, self.path))
+                    break
+        return records
+
+    def append(self, record):
+        ''' Append a record to the journal. The record is written by the
+            journal thread (see wait).
+
+            @param record: The dictionary to store
+            @return: The sequence number of the record
+        '''
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.condition:
+            self.seq += 1
+            self.count += 1
+            self.pending.append(line)
+            self._start_thread()
+            self.condition.notify_all()
+            return self.seq
+
+    def wait(self, seq):
+        ''' Wait until the record with the given sequence number is stored
+            on disk. While the journal is failed this waits until a retry
+            of the write succeeded.
+
+            @param seq: The sequence number returned by append
+        '''
+        with self.condition:
+            while self.synced < seq and self.running:
+                self.condition.wait()
+
+    def compact(self, records):
+        ''' Replace the journal with the given records (the snapshot of the
+            current state) right away. The records appended before are
+            dropped since the snapshot contains them. Opens the journal if
+            not open yet.
+
+            @param records: The list of records describing the current state
+        '''
+        with self.write_lock:
+            with self.condition:
+                self.pending = []
+                self.snapshot = None
+                seq = self.seq
+                self.count = 0
+            self._write_snapshot(records)
+
+        with self.condition:
+            self.synced = max(self.synced, seq)
+            self.running = True
+            self.condition.notify_all()
+
+    def schedule_compact(self, records):
+        ''' Replace the journal with the given records (the snapshot of the
+            current state) within the journal thread. The records appended
+            before are dropped since the snapshot contains them, the ones
+            appended afterwards are written after the snapshot.
+
+            @param records: The list of records describing the current state
+        '''
+        with self.condition:
+            self.pending = []
+            self.snapshot = records
+            self.count = 0
+            self._start_thread()
+            self.condition.notify_all()
+
+    def close(self):
+        ''' Write the pending records and stop the journal thread. '''
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        if self.jfile is not None:
+            self.jfile.close()
+            self.jfile = None
+        if self.syncs > 0:
+            LOG.info(_('Journal: {0} records with {1} fsyncs, {2:.3f} ms per '
+                    'record').format(self.records, self.syncs,
+                    self.sync_time * 1000 / max(self.records, 1)))
+
+    def _start_thread(self):
+        ''' Start the journal thread if it is not running yet. The condition
+            must be held.
+        '''
+        if self.thread is None and self.running:
+            # started with the first record, not within the constructor
+            # since the server might fork into the background after it
+            self.thread = threading.Thread(target=self._run,
+                    name='resource-journal')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        ''' Write the pending records and snapshots to the journal file. '''
+        while True:
+            with self.condition:
+                while (len(self.pending) == 0 and self.snapshot is None and
+                        self.running):
+                    self.condition.wait()
+                if len(self.pending) == 0 and self.snapshot is None:
+                    return
+                if self.failed is not None and self.running:
+                    self.condition.wait(RETRY_INTERVAL)
+
+            with self.write_lock:
+                with self.condition:
+                    lines = self.pending
+                    self.pending = []
+                    snapshot = self.snapshot
+                    self.snapshot = None
+                    seq = self.seq
+                start = time.time()
+                try:
+                    if snapshot is not None:
+                        self._write_snapshot(snapshot)
+                    if len(lines) > 0:
+                        self._write_lines(lines)
+                except (IOError, OSError), exc:
+                    self._write_failed(exc, lines, snapshot)
+                    continue
+                self.sync_time += time.time() - start
+                self.records += len(lines)
+                self.syncs += 1
+
+            with self.condition:
+                if self.failed is not None:
+                    LOG.info(_('The journal {0} can be written again.'
+                            ).format(self.path))
+                    self.failed = None
+                self.synced = max(self.synced, seq)
+                self.condition.notify_all()
+
+    def _write_failed(self, exc, lines, snapshot):
+        ''' Mark the journal as failed and keep the lines and the snapshot
+            not written for the next try. The write lock must be held.
+
+            @param exc: The exception raised by the write
+            @param lines: The lines not written
+            @param snapshot: The snapshot not written or None
+        '''
+        with self.condition:
+            if self.failed is None:
+                LOG.error(_('Could not write the journal {0}, the answers '
+                        'wait until it can be written again: {1}').format(
+                        self.path, exc))
+            self.failed = str(exc)
+            if not self.running:
+                # stopped, the records are given up
+                self.pending = []
+                self.snapshot = None
+            elif self.snapshot is None:
+                # otherwise a new snapshot contains the lines already
+                self.snapshot = snapshot
+                self.pending = lines + self.pending
+
+    def _write_lines(self, lines):
+        ''' Append the lines to the journal file and sync it. The rest of a
+            failed write is cut off first. The write lock must be held.
+
+            @param lines: The list of the lines to write
+        '''
+        if self.failed is not None:
+            self.jfile.truncate(self.size)
+        self.jfile.write(''.join(lines))
+        os.fsync(self.jfile.fileno())
+        self.size = self.jfile.tell()
+
+    def _write_snapshot(self, records):
+        ''' Write the records to a new file which replaces the journal. The
+            write lock must be held.
+
+            @param records: The list of records describing the current state
+        '''
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as tmp_file:
+            for record in records:
+                tmp_file.write(json.dumps(record, separators=(',', ':')) +
+                        '\n')
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.rename(tmp_path, self.path)
+        _sync_directory(os.path.dirname(os.path.abspath(self.path)))
+        if self.jfile is not None:
+            self.jfile.close()
+        # unbuffered, nothing of a failed write stays within a buffer
+        self.jfile = open(self.path, 'a', 0)
+        self.jfile.seek(0, os.SEEK_END)
+        self.size = self.jfile.tell()
+
+
+def _sync_directory(path):
+    ''' Flush the directory entry after a rename to the disk.
+
+        @param path: The path of the directory
+    '''
+    try:
+        fdesc = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fdesc)
+    except OSError:
+        # not supported on all the platforms
+        pass
+    finally:
+        os.close(fdesc)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' A Lease is handed out together with a resource if the user requested a
+    time to live (ttl). The user has to renew the lease before the ttl is
+    over, otherwise the ResourceManager releases the resource again. This
+    way a resource does not stay acquired forever if the user crashed.
+'''
+
+import time
+import uuid
+
+
+class Lease(object):
+    ''' The lease for one acquired slot of a resource. '''
+
+    def __init__(self, resource, uname, ttl, lease_id=None):
+        ''' Create a new lease with a unique id.
+
+            @param resource: The name of the resource acquired
+            @param uname: The name of the user holding the resource
+            @param ttl: The time to live in seconds
+            @param lease_id: The id of the lease, if None a new one is
+                    created (used to restore a lease from the journal).
+        '''
+        if lease_id is None:
+            lease_id = uuid.uuid4().hex
+        self.lease_id = lease_id
+        self.resource = resource
+        self.uname = uname
+        self.ttl = ttl
+        self.expires = time.time() + ttl
+        self.timer = None
+
+    @property
+    def remaining(self):
+        ''' The time in seconds until the lease expires. '''
+        return self.expires - time.time()
+
+    def renew(self, ttl=None):
+        ''' Extend the lease, starting from now.
+
+            @param ttl: The new time to live in seconds, if None the ttl of
+                    the lease is used again.
+        '''
+        if ttl is not None:
+            self.ttl = ttl
+        self.expires = time.time() + self.ttl
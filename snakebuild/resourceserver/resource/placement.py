@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The placement policies decide which of the free resources a request gets
+    if there are multiple resources with the given keyword available. The
+    ResourceManager keeps an index of the free resources for each keyword
+    and hands it over to the policy, therefore the policies don't have to
+    look at all the resources.
+
+    Supported policies:
+    first_free: The resource which is free for the longest time.
+    round_robin: The resources are used one after the other.
+    least_loaded: The resource with the lowest ratio of used slots.
+    sticky: A user gets the same resource as last time if it is free,
+        otherwise the same as first_free.
+'''
+
+import heapq
+import itertools
+
+from snakebuild.i18n import _
+from snakebuild.resourceserver.resource.resource import ResourceException
+
+
+class PlacementPolicy(object):
+    ''' The base class of the placement policies. This one selects the
+        first usable resource of the index (first_free).
+    '''
+
+    def select(self, request, candidates, usable):
+        ''' Select the resource for the given request.
+
+            @param request: The ResourceRequest to select a resource for
+            @param candidates: The ordered dictionary with the names of the
+                    free resources for the keyword of the request as keys
+            @param usable: A function which returns False if the resource
+                    with the given name must not be used for this request.
+            @return: The name of the selected resource or None
+        '''
+        for name in candidates:
+            if usable(name):
+                return name
+        return None
+
+    def acquired(self, request, name):
+        ''' Called after the request acquired the given resource.
+
+            @param request: The ResourceRequest
+            @param name: The name of the resource acquired
+        '''
+        pass
+
+    def update(self, resource, keys):
+        ''' Called after the number of used slots of the resource changed.
+
+            @param resource: The Resource object
+            @param keys: The list of the keywords and the expressions in use
+                    for the resource (the keys of the index)
+        '''
+        pass
+
+    def forget(self, key):
+        ''' Called after an expression got removed from the index.
+
+            @param key: The normalized expression
+        '''
+        pass
+
+
+class RoundRobinPolicy(PlacementPolicy):
+    ''' Use the free resources one after the other. The selected resource is
+        moved to the end of the index of the keyword.
+    '''
+
+    def select(self, request, candidates, usable):
+        ''' Select the first usable resource and move it to the end.
+
+            @see PlacementPolicy.select
+        '''
+        name = PlacementPolicy.select(self, request, candidates, usable)
+        if name is not None:
+            candidates[name] = candidates.pop(name)
+        return name
+
+
+class StickyPolicy(PlacementPolicy):
+    ''' Give a user the same resource for a keyword as last time if it is
+        free.
+    '''
+
+    def __init__(self):
+        ''' Create the policy without any history. '''
+        self.last = {}
+
+    def select(self, request, candidates, usable):
+        ''' Select the resource used last time if possible.
+
+            @see PlacementPolicy.select
+        '''
+        name = self.last.get((request.uname, request.keyword))
+        if name in candidates and usable(name):
+            return name
+        return PlacementPolicy.select(self, request, candidates, usable)
+
+    def acquired(self, request, name):
+        ''' Remember the resource for the user and keyword.
+
+            @see PlacementPolicy.acquired
+        '''
+        self.last[(request.uname, request.keyword)] = name
+
+    def forget(self, key):
+        ''' Drop the resources remembered for the expression.
+
+            @see PlacementPolicy.forget
+        '''
+        for user_key in [user_key for user_key in self.last
+                if user_key[1] == key]:
+            del self.last[user_key]
+
+
+class LeastLoadedPolicy(PlacementPolicy):
+    ''' Select the resource with the lowest ratio of used slots. The policy
+        keeps a heap for each key of the index (keyword or expression). An
+        update pushes a new entry instead of
+        changing the old one, the old entries are dropped as soon as they
+        get to the top of the heap.
+    '''
+
+    def __init__(self):
+        ''' Create the policy with empty heaps. '''
+        self.heaps = {}
+        self.versions = {}
+        self.counter = itertools.count()
+
+    def update(self, resource, keys):
+        ''' Push a new entry with the current load of the resource.
+
+            @see PlacementPolicy.update
+        '''
+        version = self.counter.next()
+        self.versions[resource.name] = version
+        for key in keys:
+            heap = self.heaps.setdefault(key, [])
+            heapq.heappush(heap, (resource.load, version, resource.name))
+            if len(heap) > 4 * len(self.versions) + 16:
+                self._compact(heap)
+
+    def select(self, request, candidates, usable):
+        ''' Select the usable candidate with the lowest load.
+
+            @see PlacementPolicy.select
+        '''
+        heap = self.heaps.get(request.keyword, [])
+        skipped = []
+        selected = None
+        while len(heap) > 0:
+            entry = heap[0]
+            if self.versions.get(entry[2]) != entry[1]:
+                heapq.heappop(heap)
+                continue
+            if entry[2] in candidates and usable(entry[2]):
+                selected = entry[2]
+                break
+            skipped.append(heapq.heappop(heap))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return selected
+
+    def forget(self, key):
+        ''' Drop the heap of the expression.
+
+            @see PlacementPolicy.forget
+        '''
+        self.heaps.pop(key, None)
+
+    def _compact(self, heap):
+        ''' Remove all the outdated entries from the given heap.
+
+            @param heap: The heap list to compact
+        '''
+        heap[:] = [entry for entry in heap
+                if self.versions.get(entry[2]) == entry[1]]
+        heapq.heapify(heap)
+
+
+PLACEMENT_POLICIES = {'first_free': PlacementPolicy,
+        'round_robin': RoundRobinPolicy,
+        'sticky': StickyPolicy,
+        'least_loaded': LeastLoadedPolicy}
+
+
+def get_placement_policy(name):
+    ''' Create the placement policy with the given name.
+
+        @param name: The name of the policy (first_free, round_robin, sticky
+                or least_loaded)
+        @return: The new PlacementPolicy object
+    '''
+    if not name.lower() in PLACEMENT_POLICIES:
+        raise ResourceException(_('The given placement policy is not '
+                'supported: {0}').format(name))
+    return PLACEMENT_POLICIES[name.lower()]()
@@ -205,6 +205,32 @@ class Resource(object):
         ''' The counter used to see how many resources are free to be used. '''
         return self._current_count
 
+    @property
+    def available(self):
+        ''' True if the resource can be acquired (not exclusive). '''
+        return not self.exclusive and (self._parallel_count == 0 or
+                self._current_count > 0)
+
+    @property
+    def idle(self):
+        ''' True if no one uses the resource and it can be acquired
+            exclusive.
+        '''
+        return (not self.exclusive and
+                self._current_count == self._parallel_count)
+
+    @property
+    def load(self):
+        ''' The ratio of the used slots (0.0 - 1.0). A resource with an
+            unlimited number of slots is never loaded.
+        '''
+        if self.exclusive:
+            return 1.0
+        if self._parallel_count == 0:
+            return 0.0
+        return (float(self._parallel_count - self._current_count) /
+                self._parallel_count)
+
     def acquire(self, uname, exclusive, block):
         ''' Acquire the resource if available otherwise this method blocks
             until the resource gets free to be used or the server gets a shut
@@ -297,6 +323,26 @@ class Resource(object):
         self.release_listener.set()
         return True
 
+    def take_over(self, resource):
+        ''' Take over the users of the given resource, which is the previous
+            definition of this resource (for example before a reload). The
+            slots in use are kept, if the new parallel_count is lower than
+            the number of the current users no one gets the resource until
+            enough of them released it.
+
+            @param resource: The previous Resource object
+        '''
+        resource.count_lock.acquire()
+        self.count_lock.acquire()
+        self.users = list(resource.users)
+        self.exclusive = resource.exclusive
+        if self.exclusive:
+            self._current_count = 0
+        else:
+            self._current_count = self._parallel_count - len(self.users)
+        self.count_lock.release()
+        resource.count_lock.release()
+
     def do_shutdown(self):
         ''' Prepare the resource for shutdown. All new request will be
             rejected.
@@ -19,17 +19,74 @@
 ''' The file contains a class which is used as the resource manager. This
     instance will hold all the resources to be managed and will handle the
     scheduling of request to the different resources to have a good usage.
+
+    The requests which can't get a resource right away are queued for each
+    keyword. A release only looks at the queues of the keywords of the
+    released resource and hands the resource over to the best ranked waiting
+    request.
+
+    For each keyword an index with the resources which have a free slot
+    (available) and with the resources which are not used at all (idle) is
+    kept up to date on every acquire and release. The placement policy
+    selects the resource out of this index.
+
+    A request with a ttl gets a Lease together with the resource. The leases
+    are checked by the timer queue of the manager, an expired lease releases
+    its resource and the waiting requests get served.
+
+    A GangRequest acquires multiple resources at once or none of them. All
+    the state is protected by the one manager lock and the resources of a
+    gang are acquired in the order of their names, therefore acquiring
+    multiple resources can't dead lock. The waiting gangs are queued in
+    their own list (and for each of their keywords) and are ranked together
+    with the other requests.
+
+    The rank of the waiting requests is given by the Scheduler (priority,
+    aging and fair share), requests with the same rank are served in the
+    order they came in. Only the best ranked request waiting for one of the
+    keywords of a resource can get it, the others don't overtake it.
+
+    If a Journal is given every acquire and release is written to it and
+    the answers are only given after the journal is on the disk. On startup
+    the journal is replayed, this way the users keep their resources (and
+    leases) over a restart of the server. The waiting requests are not
+    stored, the clients have to request again. While the journal can not
+    be written new requests are refused.
+
+    A tag might be an expression of keywords (see tagexpression). The first
+    request for an expression adds it like a keyword to the resources it
+    matches, with its own queue and index. This way the requests for an
+    expression are served in the same way as the ones for a single keyword.
+    The expression is removed again as soon as no request waits for it and
+    none of its resources is in use.
+
+    The resources can be reloaded from the repository while running. Only
+    the files changed since the last load are read again. A changed resource
+    keeps its users, a removed one which is still in use is kept (retired)
+    until the last user released it, but it doesn't get new users. The
+    waiting requests stay in their queues.
 '''
 
 import threading
-import os.path
+import time
 import logging
 import json
+import collections
 
 from snakebuild.i18n import _
-from snakebuild.common.versioneddir import VersionedDirBase
+from snakebuild.common.versioneddir import VersionedDirBase, \
+        VersionedDirException
+from snakebuild.common.timerqueue import TimerQueue
 from snakebuild.resourceserver.resource import init_resource_from_obj
 from snakebuild.resourceserver.resource import ResourceException
+from snakebuild.resourceserver.resource.resourcerequest import \
+        ResourceRequest, GangRequest
+from snakebuild.resourceserver.resource.placement import PlacementPolicy
+from snakebuild.resourceserver.resource.lease import Lease
+from snakebuild.resourceserver.resource.scheduler import Scheduler, \
+        WaitQueue
+from snakebuild.resourceserver.resource.tagexpression import KeywordIndex, \
+        is_expression
 
 LOG = logging.getLogger('snakebuild.resourceserver.resource.resourcemanager')
 
@@ -41,7 +98,8 @@ class ResourceManager(object):
         it provides an interface to get information about the resources.
     '''
 
-    def __init__(self, resource_repo):
+    def __init__(self, resource_repo, policy=None, scheduler=None,
+            journal=None):
         ''' Constructor. Create the ResourceManager object and load the
             resources from the configured resource directory.
 
@@ -51,42 +109,173 @@ class ResourceManager(object):
             read and interpreted as a resource.
 
             @param resource_repo: The resource repository to load and change.
+            @param policy: The PlacementPolicy to select the resources, if
+                    None the first free resource is used.
+            @param scheduler: The Scheduler to rank the waiting requests, if
+                    None they are served by priority and in the order they
+                    came in.
+            @param journal: The Journal to store the allocations in and to
+                    restore them from, if None nothing is stored.
         '''
         LOG.debug(_('Initialize ResourceManager'))
         self.resources = {}
-        self.release_listener = threading.Event()
         self.keywords = {}
+        # the keywords and the expressions in use for each resource
+        self.resource_keys = {}
+        self.index = None
+        if policy is None:
+            policy = PlacementPolicy()
+        self.policy = policy
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
+        # the lock for the resources and the waiting requests per keyword,
+        # the waiting gangs are queued for each of their keywords as well
+        self.lock = threading.Lock()
+        self.waiting = {}
+        self.gangs = WaitQueue(scheduler)
+        self.gang_waiting = {}
+        # the index of the resources with free slots and the unused ones
+        self.available = {}
+        self.idle = {}
+        self.timers = TimerQueue('resource-timeout')
+        # the leases by id and by (resource name, user name)
+        self.leases = {}
+        self.holder_leases = {}
+        # set after the journal got replayed, the last record appended
+        self.journal = None
+        self.journal_seq = 0
         self.run = True
+        # the resource name of each file loaded, the revision loaded and the
+        # removed resources still in use
+        self.resource_files = {}
+        self.revision = None
+        self.retired = set()
+        self.reload_lock = threading.Lock()
 
         if not isinstance(resource_repo, VersionedDirBase):
             raise ResourceException('The resource location is not a versioned '
                     'directory. ResourceManager could not be created.')
         self.resources_respository = resource_repo
+        self.revision = resource_repo.get_revision()
         self._load_resources()
+        self._build_keys()
 
-        for name, resource in self.resources.iteritems():
-            for keyword in resource.keywords:
-                if keyword in self.keywords:
-                    if name in self.keywords[keyword]:
-                        # it is already here why?
-                        LOG.warning(_('A dupplicate keyword, resource name, '
-                                'this should not happen. Ignore it: '
-                                'Keyword={0}, ResoruceName={1}').format(
-                                keyword, name))
-                        continue
-                    self.keywords[keyword].append(name)
-                else:
-                    self.keywords[keyword] = [name]
+        if journal is not None:
+            self._replay(journal)
 
     def shutdown(self):
         ''' Shut down the resource manager. If there are any request waiting
             wake up the given thread and decline all questions for resources.
         '''
         LOG.info(_('Received shutdown signal.'))
-        self.run = False
-        self.release_listener.set()
-        for resource in self.resources.itervalues():
-            resource.do_shutdown()
+        with self.lock:
+            self.run = False
+            declined = []
+            for queue in self.waiting.itervalues():
+                declined.extend(queue)
+                queue.clear()
+            declined.extend(self.gangs)
+            self.gangs.clear()
+            self.gang_waiting.clear()
+            for resource in self.resources.itervalues():
+                resource.do_shutdown()
+        self.timers.stop()
+        if self.journal is not None:
+            self.journal.close()
+        self.resources_respository.close()
+
+        for request in declined:
+            request.finish(None)
+
+    def start(self, poll_interval=0):
+        ''' Start the timers of the manager. This must be called within the
+            process running the manager (after the fork to run as daemon),
+            since the timers restored from the journal are scheduled
+            before.
+
+            @param poll_interval: If greater than 0 the repository is checked
+                    for new resource definitions (see reload) each time this
+                    number of seconds passed.
+        '''
+        self.timers.start()
+        if poll_interval > 0:
+            self.timers.schedule(poll_interval, self._poll, poll_interval)
+
+    def reload(self, update=True):
+        ''' Load the resource definitions changed within the repository since
+            they got loaded the last time. The files changed are given by the
+            difference between the revision loaded and the current one, only
+            those are read again. All the changes are applied at once, the
+            users of the resources and the waiting requests are kept.
+
+            @param update: If True the changes are pulled from the remote
+                    repository first (if there is one).
+            @return: A dictionary with the revision loaded and the lists of
+                    the names of the resources added, removed and changed.
+        '''
+        repo = self.resources_respository
+        with self.reload_lock:
+            if (update and repo.has_remote() and
+                    repo.get_current_branch() is not None):
+                try:
+                    repo.pull_remote()
+                except VersionedDirException, exc:
+                    raise ResourceException(_('Could not update the resources: '
+                            '{0}').format(exc))
+
+            revision = repo.get_revision()
+            result = {'revision': revision, 'added': [], 'removed': [],
+                    'changed': []}
+            if revision == self.revision:
+                return result
+
+            try:
+                present = set(repo.list_files(revision))
+                if self.revision is None:
+                    files = present
+                else:
+                    files = [path for status, path in
+                            repo.get_changed_files(self.revision, revision)]
+            except VersionedDirException, exc:
+                raise ResourceException(_('Could not get the changed '
+                        'resources: {0}').format(exc))
+
+            loaded = {}
+            deleted = []
+            for filename in files:
+                if not _is_resource_file(filename):
+                    continue
+                if not filename in present:
+                    deleted.append(filename)
+                    continue
+                try:
+                    resource = self._load_resource(revision, filename)
+                except (VersionedDirException, ValueError,
+                        ResourceException), exc:
+                    LOG.error(_('Could not load the resource from the file '
+                            '{0}, keep the old definition: {1}').format(
+                            filename, exc))
+                    continue
+                if resource is not None:
+                    loaded[filename] = resource
+
+            with self.lock:
+                self._apply_resources(loaded, deleted, result)
+                self.revision = revision
+                granted = []
+                if self.run:
+                    for name in sorted(self.resources):
+                        granted.extend(self._serve_waiting(
+                                self.resources[name]))
+
+        self._sync()
+        for request in granted:
+            request.finish(request.resource)
+        LOG.info(_('Reloaded the resources of the revision {0}: added {1}, '
+                'removed {2}, changed {3}').format(revision, result['added'],
+                result['removed'], result['changed']))
+        return result
 
     def acquire(self, uname, keyword, exclusive):
         ''' Acquire a resource. This will return the resource acquired. This
@@ -100,20 +289,107 @@ class ResourceManager(object):
 
             @return: The name of the resource acquired or None if not available.
         '''
-        keyword = keyword.lower()
-        if not keyword in self.keywords:
-            LOG.warning(_('The user ({0}) tried to access a resource with the '
-                    'keyword "{1}". But this keyword does not exist.').format(
-                    uname, keyword))
-            return None
+        return self.request(uname, keyword, exclusive).wait()
 
-        while self.run:
-            names = self.keywords[keyword]
-            self.release_listener.clear()
-            for name in names:
-                if self.resources[name].acquire(uname, exclusive, False):
-                    return name
-            self.release_listener.wait()
+    def request(self, uname, keyword, exclusive, timeout=None, nowait=False,
+            ttl=None, priority=0):
+        ''' Request a resource without blocking. If a resource is available
+            and no one else is waiting for it the request is finished right
+            away, otherwise it is queued until it is its turn.
+
+            @param uname: The user name to use as the user of the resource
+            @param keyword: The keyword or the tag expression to search for
+                the resource
+            @param exclusive: Boolean value if set to True then the user will
+                use the resource exclusive no one else should be using it.
+            @param timeout: The maximum time in seconds to wait for the
+                resource, None waits until the resource is available.
+            @param nowait: If set to True the request is finished right away
+                even if no resource is available.
+            @param ttl: If set the resource is acquired with a Lease with the
+                given time to live in seconds (see renew).
+            @param priority: The priority of the request, the waiting request
+                with the highest priority is served first.
+
+            @return: The ResourceRequest object
+        '''
+        request = ResourceRequest(uname, keyword.lower(), exclusive, priority)
+        request.ttl = ttl
+
+        with self.lock:
+            self._check_journal()
+            request.keyword = self._resolve_tag(keyword)
+            if request.keyword is None:
+                LOG.warning(_('The user ({0}) tried to access a resource with '
+                        'the keyword "{1}". But this keyword does not '
+                        'exist.').format(uname, keyword))
+                resource = None
+            elif not self.run:
+                resource = None
+            else:
+                resource = self._acquire_free(request)
+                if resource is None and not nowait:
+                    self.waiting[request.keyword].append(request)
+                    if timeout is not None:
+                        request.timer = self.timers.schedule(timeout,
+                                self._expire, request)
+                    return request
+            if resource is None:
+                self._drop_unused_keys([request.keyword])
+
+        self._sync()
+        request.finish(resource)
+        return request
+
+    def request_many(self, uname, items, timeout=None, nowait=False,
+            ttl=None, priority=0):
+        ''' Request multiple resources at once. The request gets either all
+            the resources or none. If not all of them are available the
+            request is queued until it is its turn.
+
+            @param uname: The user name to use as the user of the resources
+            @param items: A list with a (keyword, exclusive) tuple for each
+                resource to acquire.
+            @param timeout: The maximum time in seconds to wait for the
+                resources, None waits until they are available.
+            @param nowait: If set to True the request is finished right away
+                even if not all resources are available.
+            @param ttl: If set each resource is acquired with a Lease with
+                the given time to live in seconds.
+            @param priority: The priority of the request
+
+            @return: The GangRequest object
+        '''
+        request = GangRequest(uname, items, priority)
+        for part in request.parts:
+            part.ttl = ttl
+
+        with self.lock:
+            self._check_journal()
+            unknown = []
+            for part in request.parts:
+                key = self._resolve_tag(part.keyword)
+                if key is None:
+                    unknown.append(part.keyword)
+                part.keyword = key
+            request.keywords = set(part.keyword for part in request.parts)
+            if len(request.parts) == 0 or len(unknown) > 0:
+                LOG.warning(_('The user ({0}) tried to access resources with '
+                        'the keywords "{1}". But this keywords do not '
+                        'exist.').format(uname, ', '.join(unknown)))
+            elif (self.run and not self._acquire_gang(request) and
+                    not nowait):
+                self._add_gang(request)
+                if timeout is not None:
+                    request.timer = self.timers.schedule(timeout,
+                            self._expire, request)
+                return request
+            if request.resource is None:
+                self._drop_unused_keys(request.keywords)
+
+        self._sync()
+        request.finish(request.resource)
+        return request
 
     def release(self, resourcename, uname, exclusive):
         ''' Release a given resource. If the resource wasn't locked by the
@@ -132,48 +408,856 @@ class ResourceManager(object):
             @return: True if released and otherwise a ResoruceException is
                     raised
         '''
-        if not resourcename in self.resources:
-            LOG.error(_('Release command called for a not existing resource '
-                    '{0} User: {1}').format(resourcename, uname))
-            raise ResourceException(_('Release command called for a not '
-                    'existing resource {0} User: {1}').format(resourcename,
-                    uname))
+        with self.lock:
+            resource = self.resources.get(resourcename)
+            if resource is None:
+                LOG.error(_('Release command called for a not existing '
+                        'resource {0} User: {1}').format(resourcename, uname))
+                raise ResourceException(_('Release command called for a not '
+                        'existing resource {0} User: {1}').format(
+                        resourcename, uname))
+            self._release(resource, uname, exclusive)
+            granted = self._serve_waiting(resource)
+            self._drop_unused_keys(self.resource_keys.get(resourcename, []))
 
-        self.resources[resourcename].release(uname, exclusive)
-        self.release_listener.set()
+        self._sync()
+        for request in granted:
+            request.finish(request.resource)
         return True
 
-    def _load_resources(self):
-        ''' Load all the resources from the given directory.
+    def renew(self, lease_id, ttl=None):
+        ''' Renew the lease with the given id.
+
+            @param lease_id: The id of the lease to renew
+            @param ttl: The new time to live in seconds, if None the ttl
+                    given on acquire is used.
+            @return: The Lease object or None if the lease does not exist
+                    (anymore)
+        '''
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is not None:
+                # the timer is not moved, it checks the expire time again
+                lease.renew(ttl)
+            return lease
+
+    def cancel(self, request):
+        ''' Withdraw the given request, for example because the client is
+            gone. A waiting request is removed from the queue, if the request
+            already got a resource the resource is released again.
+
+            @param request: The ResourceRequest to cancel
+            @return: True if the request got cancelled, False if it was
+                    cancelled before.
+        '''
+        with self.lock:
+            if request.cancelled:
+                return False
+            request.cancelled = True
+            if request.timer is not None:
+                request.timer.cancel()
+
+            keys = list(_request_keywords(request))
+            if self._remove_waiting(request):
+                granted = self._serve_keywords(request)
+                granted.append(request)
+            elif request.resource is not None:
+                if isinstance(request, GangRequest):
+                    parts = request.parts
+                else:
+                    parts = [request]
+                granted = []
+                for part in parts:
+                    resource = self.resources.get(part.resource)
+                    if resource is None:
+                        # a removed resource which got released already
+                        continue
+                    keys.extend(self.resource_keys[part.resource])
+                    try:
+                        self._release(resource, part.uname, False,
+                                self.leases.get(part.lease))
+                    except ResourceException:
+                        # the user released it already
+                        LOG.debug(_('The cancelled request was already '
+                                'released: {0}').format(part.resource))
+                    granted.extend(self._serve_waiting(resource))
+            else:
+                granted = []
+            self._drop_unused_keys(keys)
+
+        self._sync()
+        for other in granted:
+            if other is request:
+                other.finish(None)
+            else:
+                other.finish(other.resource)
+        return True
+
+    def get_queue(self):
+        ''' Get the waiting requests in the order they will be served (as
+            far as known now).
+
+            @return: A list with a (request, position, estimate) tuple for
+                    each waiting request. The position is the number of
+                    requests for the same keyword served before (including
+                    the request itself) and the estimate the estimated
+                    waiting time in seconds (None if unknown).
+        '''
+        with self.lock:
+            now = time.time()
+            waiters = [request for queue in self.waiting.itervalues()
+                    for request in queue]
+            waiters.extend(self.gangs)
+            waiters.sort(key=lambda request: self.scheduler.rank(request,
+                    now))
+
+            positions = {}
+            result = []
+            for request in waiters:
+                position = 0
+                estimate = 0
+                for key in _request_keywords(request):
+                    positions[key] = positions.get(key, 0) + 1
+                    position = max(position, positions[key])
+                    key_estimate = self.scheduler.estimate(key,
+                            positions[key])
+                    if key_estimate is None or estimate is None:
+                        estimate = None
+                    else:
+                        estimate = max(estimate, key_estimate)
+                result.append((request, position, estimate))
+            return result
+
+    def match(self, tag):
+        ''' Get the names of the resources matching the given tag.
+
+            @param tag: The keyword or the tag expression
+            @return: The sorted list of the resource names, raises a
+                    TagExpressionException if the expression is not valid.
+        '''
+        with self.lock:
+            if not is_expression(tag):
+                return sorted(self.keywords.get(tag.lower(), []))
+            return self.index.match(tag)
+
+    def _resolve_tag(self, tag):
+        ''' Get the key of the queue and the index for the given tag. An
+            expression used for the first time gets added to the resources
+            it matches. The manager lock must be held.
+
+            @param tag: The keyword or the tag expression
+            @return: The key or None if no resource matches the tag, raises a
+                    TagExpressionException if the expression is not valid.
+        '''
+        if not is_expression(tag):
+            key = tag.lower()
+            if key in self.keywords:
+                return key
+            return None
+
+        bitset, key = self.index.evaluate(tag)
+        if key in self.keywords:
+            return key
+        if bitset == 0:
+            return None
+        self._add_key(key, self.index.resource_names(bitset))
+        for name in self.keywords[key]:
+            self._update_index(self.resources[name])
+        return key
+
+    def _poll(self, interval):
+        ''' Called from the timer to reload the resources and to schedule the
+            next check.
+
+            @param interval: The time in seconds until the next check
+        '''
+        try:
+            self.reload()
+        except ResourceException, exc:
+            LOG.error(_('Could not reload the resources: {0}').format(exc))
+        if self.run:
+            self.timers.schedule(interval, self._poll, interval)
+
+    def _apply_resources(self, loaded, deleted, result):
+        ''' Replace the resources with the ones loaded and remove the ones of
+            the deleted files. Afterwards the keywords and the index are built
+            again. The manager lock must be held.
+
+            @param loaded: A dictionary with the Resource object for each file
+                    loaded
+            @param deleted: The list of the files deleted
+            @param result: The dictionary to add the names of the resources
+                    added, removed and changed to (see reload)
+        '''
+        for filename in sorted(deleted):
+            name = self.resource_files.pop(filename, None)
+            if name is not None:
+                self._retire(name)
+                result['removed'].append(name)
+
+        for filename, resource in sorted(loaded.iteritems()):
+            name = self.resource_files.get(filename)
+            if name is not None and name != resource.name:
+                # the file defines an other resource now
+                del self.resource_files[filename]
+                self._retire(name)
+                result['removed'].append(name)
+            if (resource.name in self.resource_files.values() and
+                    self.resource_files.get(filename) != resource.name):
+                LOG.warning(_('A resource with name "{0}" already exists. '
+                        'Ignore it. Filename: {1}').format(resource.name,
+                        filename))
+                continue
+
+            old = self.resources.get(resource.name)
+            if old is None:
+                result['added'].append(resource.name)
+            else:
+                resource.take_over(old)
+                self.retired.discard(resource.name)
+                if resource.name in result['removed']:
+                    # moved to an other file
+                    result['removed'].remove(resource.name)
+                result['changed'].append(resource.name)
+            self.resources[resource.name] = resource
+            self.resource_files[filename] = resource.name
+        self._build_keys()
+
+    def _retire(self, name):
+        ''' Remove the given resource, if it is still in use it is kept until
+            the last user released it. The manager lock must be held.
+
+            @param name: The name of the resource
+        '''
+        resource = self.resources[name]
+        if len(resource.users) > 0:
+            self.retired.add(name)
+        else:
+            del self.resources[name]
+
+    def _build_keys(self):
+        ''' Build the keywords, the expressions and the index out of the
+            current resources. The waiting requests are kept, a keyword or
+            an expression without resources is kept as long as requests are
+            waiting for it. The manager lock must be held (except within the
+            constructor).
+        '''
+        keys = set(self.keywords)
+        waiting = self.waiting
+        self.keywords = {}
+        self.waiting = {}
+        self.available = {}
+        self.idle = {}
+        self.resource_keys = dict((name, []) for name in self.resources)
+
+        active = dict((name, resource) for name, resource in
+                self.resources.iteritems() if not name in self.retired)
+        self.index = KeywordIndex(active)
+        for name, resource in sorted(active.iteritems()):
+            for keyword in resource.keywords:
+                if not keyword in self.keywords:
+                    self._add_key(keyword, [])
+                elif name in self.keywords[keyword]:
+                    # it is already here why?
+                    LOG.warning(_('A dupplicate keyword, resource name, '
+                            'this should not happen. Ignore it: '
+                            'Keyword={0}, ResoruceName={1}').format(
+                            keyword, name))
+                    continue
+                self.keywords[keyword].append(name)
+                self.resource_keys[name].append(keyword)
+
+        used = set()
+        for gang in self.gangs:
+            used.update(gang.keywords)
+        for key in sorted(keys):
+            if key in self.keywords:
+                pass
+            elif is_expression(key) and self.index.evaluate(key)[0] != 0:
+                self._add_key(key, self.index.resource_names(
+                        self.index.evaluate(key)[0]))
+            elif len(waiting[key]) > 0 or key in used:
+                self._add_key(key, [])
+            else:
+                continue
+            self.waiting[key] = waiting[key]
+
+        for name in sorted(self.resources):
+            self._update_index(self.resources[name])
+        self._drop_unused_keys(list(self.keywords))
+
+    def _add_key(self, key, names):
+        ''' Add a keyword or an expression with its queue and index for the
+            given resources. The manager lock must be held (except within
+            the constructor).
+
+            @param key: The keyword or the normalized expression
+            @param names: The list of the resource names
+        '''
+        self.keywords[key] = names
+        self.waiting[key] = WaitQueue(self.scheduler)
+        self.available[key] = collections.OrderedDict()
+        self.idle[key] = collections.OrderedDict()
+        for name in names:
+            self.resource_keys[name].append(key)
+
+    def _drop_unused_keys(self, keys):
+        ''' Remove the given expressions if no request waits for them and
+            none of their resources is in use. The next request for such an
+            expression adds it again. The keywords of the resources are
+            always kept. The manager lock must be held.
+
+            @param keys: The keywords and expressions to check
+        '''
+        for key in set(keys):
+            if not key in self.keywords or not is_expression(key):
+                continue
+            if self._has_waiting(key):
+                continue
+            names = self.keywords[key]
+            if any(len(self.resources[name].users) > 0 for name in names
+                    if name in self.resources):
+                continue
+            for name in names:
+                if key in self.resource_keys.get(name, []):
+                    self.resource_keys[name].remove(key)
+            del self.keywords[key]
+            del self.waiting[key]
+            del self.available[key]
+            del self.idle[key]
+            self.policy.forget(key)
+            self.scheduler.forget(key)
+
+    def _expire(self, request):
+        ''' Called from the timer if the request waited too long. If the
+            request is still waiting it gets finished without a resource.
+
+            @param request: The ResourceRequest which timed out
+        '''
+        with self.lock:
+            if not self._remove_waiting(request):
+                return
+            request.timed_out = True
+            granted = self._serve_keywords(request)
+            self._drop_unused_keys(_request_keywords(request))
+
+        self._sync()
+        request.finish(None)
+        for other in granted:
+            other.finish(other.resource)
 
-            @param dirname: The full path to the resource to load
+    def _check_lease(self, lease_id):
+        ''' Called from the timer to check if the lease expired. If it got
+            renewed in the meantime the check is scheduled again, otherwise
+            the resource gets released.
+
+            @param lease_id: The id of the lease to check
+        '''
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is None:
+                return
+            if lease.remaining > 0:
+                lease.timer = self.timers.schedule(lease.remaining,
+                        self._check_lease, lease_id)
+                return
+
+            LOG.warning(_('The lease of the user {0} for the resource {1} '
+                    'expired. Release the resource.').format(lease.uname,
+                    lease.resource))
+            resource = self.resources[lease.resource]
+            try:
+                self._release(resource, lease.uname, False, lease)
+            except ResourceException:
+                LOG.debug(_('The expired lease was already released: '
+                        '{0}').format(lease.resource))
+            granted = self._serve_waiting(resource)
+            self._drop_unused_keys(self.resource_keys.get(lease.resource,
+                    []))
+
+        self._sync()
+        for request in granted:
+            request.finish(request.resource)
+
+    def _release(self, resource, uname, exclusive, lease=None):
+        ''' Release the given resource and drop the lease of the user for
+            this resource. The manager lock must be held.
+
+            @param resource: The Resource object to release
+            @param uname: The user name how owns the lock
+            @param exclusive: Switch on/off the exclusive release of the lock
+            @param lease: The Lease to drop, if None the oldest lease of the
+                    user for the resource is dropped.
+        '''
+        if lease is not None:
+            self._drop_lease(lease)
+        resource.release(uname, exclusive)
+        if not exclusive:
+            self.scheduler.released(uname)
+        if not exclusive and lease is None:
+            holder = self.holder_leases.get((resource.name, uname))
+            if holder:
+                lease = holder[0]
+                self._drop_lease(lease)
+        record = {'op': 'release', 'resource': resource.name, 'user': uname,
+                'exclusive': exclusive}
+        if lease is not None:
+            record['lease'] = lease.lease_id
+        self._journal(record)
+        self._update_index(resource)
+        if resource.name in self.retired and len(resource.users) == 0:
+            LOG.info(_('The removed resource {0} is not used anymore.').format(
+                    resource.name))
+            self.retired.discard(resource.name)
+            del self.resources[resource.name]
+
+    def _create_lease(self, resource, uname, ttl, lease_id=None):
+        ''' Create a new lease and start its timer. The manager lock must be
+            held.
+
+            @param resource: The name of the resource acquired
+            @param uname: The name of the user holding the resource
+            @param ttl: The time to live in seconds
+            @param lease_id: The id of the lease to restore or None
+            @return: The new Lease object
+        '''
+        lease = Lease(resource, uname, ttl, lease_id)
+        self.leases[lease.lease_id] = lease
+        self.holder_leases.setdefault((resource, uname), []).append(lease)
+        lease.timer = self.timers.schedule(ttl, self._check_lease,
+                lease.lease_id)
+        return lease
+
+    def _drop_lease(self, lease):
+        ''' Remove the given lease. The manager lock must be held.
+
+            @param lease: The Lease object to remove
+        '''
+        if self.leases.pop(lease.lease_id, None) is None:
+            return
+        lease.timer.cancel()
+        holder = self.holder_leases[(lease.resource, lease.uname)]
+        holder.remove(lease)
+        if len(holder) == 0:
+            del self.holder_leases[(lease.resource, lease.uname)]
+
+    def _remove_waiting(self, request):
+        ''' Remove the given request from the waiting queue. The manager lock
+            must be held.
+
+            @param request: The ResourceRequest to remove
+            @return: True if the request was waiting
+        '''
+        if isinstance(request, GangRequest):
+            if not request in self.gangs:
+                return False
+            self._remove_gang(request)
+            return True
+        queue = self.waiting.get(request.keyword)
+        if queue is None or not request in queue:
+            return False
+        queue.remove(request)
+        return True
+
+    def _add_gang(self, request):
+        ''' Queue the given GangRequest for all its keywords. The manager
+            lock must be held.
+
+            @param request: The GangRequest to queue
+        '''
+        self.gangs.append(request)
+        for key in request.keywords:
+            if not key in self.gang_waiting:
+                self.gang_waiting[key] = WaitQueue(self.scheduler)
+            self.gang_waiting[key].append(request)
+
+    def _remove_gang(self, request):
+        ''' Remove the given waiting GangRequest from all the queues. The
+            manager lock must be held.
+
+            @param request: The waiting GangRequest
+        '''
+        self.gangs.remove(request)
+        for key in request.keywords:
+            queue = self.gang_waiting[key]
+            queue.remove(request)
+            if len(queue) == 0:
+                del self.gang_waiting[key]
+
+    def _serve_keywords(self, request):
+        ''' Serve the waiting requests for all the resources of the keywords
+            of the given request. This is required after a waiting request
+            got removed, since the removed one might have blocked the others.
+            The manager lock must be held.
+
+            @param request: The removed ResourceRequest
+            @return: The list of requests which acquired a resource
+        '''
+        granted = []
+        for keyword in _request_keywords(request):
+            for name in self.keywords[keyword]:
+                granted.extend(self._serve_waiting(self.resources[name]))
+        return granted
+
+    def _acquire_free(self, request):
+        ''' Try to acquire one of the resources for the given request. A
+            resource is skipped if an older request waits for one of its
+            keywords, this way the waiting requests don't get overtaken.
+            The manager lock must be held.
+
+            @param request: The ResourceRequest to acquire a resource for
+            @return: The name of the resource acquired or None
+        '''
+        now = time.time()
+        rank = self.scheduler.rank(request, now)
+        if request.exclusive:
+            candidates = self.idle[request.keyword]
+        else:
+            candidates = self.available[request.keyword]
+
+        name = self.policy.select(request, candidates,
+                lambda name: self._is_unreserved(name, rank, now))
+        if name is None or not self._acquire(request, self.resources[name]):
+            return None
+        return name
+
+    def _acquire_gang(self, request):
+        ''' Try to acquire all the resources of the given GangRequest. First
+            a resource is selected for each part and only if there is one
+            for all of them they get acquired (in the order of their names).
+            The manager lock must be held.
+
+            @param request: The GangRequest to acquire the resources for
+            @return: True if all the resources got acquired
+        '''
+        now = time.time()
+        rank = self.scheduler.rank(request, now)
+        plan = []
+        # the number of slots planned for each resource, None if exclusive
+        planned = {}
+        for part in request.parts:
+            if part.exclusive:
+                candidates = self.idle[part.keyword]
+            else:
+                candidates = self.available[part.keyword]
+            name = self.policy.select(part, candidates,
+                    lambda name: self._is_unreserved(name, rank, now) and
+                    self._has_capacity(name, part.exclusive, planned))
+            if name is None:
+                return False
+            plan.append((name, part))
+            if part.exclusive:
+                planned[name] = None
+            else:
+                planned[name] = planned.get(name, 0) + 1
+
+        acquired = []
+        for name, part in sorted(plan, key=lambda entry: entry[0]):
+            if not self._acquire(part, self.resources[name]):
+                for other in acquired:
+                    self._release(self.resources[other.resource],
+                            other.uname, False, self.leases.get(other.lease))
+                return False
+            acquired.append(part)
+
+        request.resource = [part.resource for part in request.parts]
+        if request.timer is not None:
+            request.timer.cancel()
+        return True
+
+    def _has_capacity(self, name, exclusive, planned):
+        ''' Check if the resource has a slot left for a part of a gang,
+            after the slots already planned for the other parts.
+
+            @param name: The name of the resource
+            @param exclusive: True if the part needs the resource exclusive
+            @param planned: The dictionary with the planned slots
+            @return: True if the resource can be used
+        '''
+        if not name in planned:
+            return True
+        if planned[name] is None or exclusive:
+            return False
+        resource = self.resources[name]
+        return (resource.parallel_count == 0 or
+                resource.current_count > planned[name])
+
+    def _acquire(self, request, resource):
+        ''' Acquire the given resource for the request and update the
+            index. The manager lock must be held.
+
+            @param request: The ResourceRequest to acquire the resource for
+            @param resource: The Resource object
+            @return: True if the resource was acquired
+        '''
+        if not resource.acquire(request.uname, request.exclusive, False):
+            return False
+        self.scheduler.acquired(request.uname)
+        request.resource = resource.name
+        if request.timer is not None:
+            request.timer.cancel()
+        record = {'op': 'acquire', 'resource': resource.name,
+                'user': request.uname, 'exclusive': request.exclusive}
+        if request.ttl is not None:
+            request.lease = self._create_lease(resource.name, request.uname,
+                    request.ttl).lease_id
+            record['lease'] = request.lease
+            record['ttl'] = request.ttl
+        self._journal(record)
+        self._update_index(resource)
+        self.policy.acquired(request, resource.name)
+        return True
+
+    def _is_unreserved(self, name, rank, now):
+        ''' Check if no request with a better rank than the given one waits
+            for one of the keywords of the given resource.
+
+            @param name: The name of the resource
+            @param rank: The rank of the request (see Scheduler.rank)
+            @param now: The current time
+            @return: True if the resource might be used by the request
+        '''
+        best = self._best_waiting(self.resource_keys[name], now)
+        return best is None or not best[1] < rank
+
+    def _update_index(self, resource):
+        ''' Update the index of the available and idle resources for all the
+            keywords of the given resource. The manager lock must be held.
+
+            @param resource: The Resource object which changed
+        '''
+        for key in self.resource_keys[resource.name]:
+            for index, add in ((self.available[key], resource.available),
+                    (self.idle[key], resource.idle)):
+                if not add:
+                    index.pop(resource.name, None)
+                elif not resource.name in index:
+                    index[resource.name] = None
+        self.policy.update(resource, self.resource_keys[resource.name])
+
+    def _serve_waiting(self, resource):
+        ''' Hand the given resource over to the waiting requests. Only the
+            best ranked request waiting for one of the keywords of the
+            resource can get it. If this one can't get it none of the others
+            get it either. The manager lock must be held.
+
+            @param resource: The Resource object which got released
+            @return: The list of requests which acquired the resource, they
+                    must be finished after the lock got released.
+        '''
+        keywords = self.resource_keys[resource.name]
+        now = time.time()
+        granted = []
+        others = []
+        while self.run:
+            best = self._best_waiting(keywords, now)
+            if best is None:
+                break
+            request = best[0]
+            if isinstance(request, GangRequest):
+                if not self._acquire_gang(request):
+                    break
+                self._remove_gang(request)
+                # the gang might have blocked the requests for its other
+                # resources as well
+                others.extend(name for name in request.resource
+                        if name != resource.name)
+            else:
+                if not self._acquire(request, resource):
+                    break
+                self.waiting[request.keyword].remove(request)
+            granted.append(request)
+            for key in _request_keywords(request):
+                self.scheduler.served(key, now, self._has_waiting(key))
+        for name in others:
+            granted.extend(self._serve_waiting(self.resources[name]))
+        return granted
+
+    def _best_waiting(self, keywords, now):
+        ''' Get the best ranked request waiting for one of the given
+            keywords. The manager lock must be held.
+
+            @param keywords: The list of keywords
+            @param now: The current time
+            @return: A tuple with the request and its rank or None
+        '''
+        best = None
+        for key in keywords:
+            for queue in (self.waiting[key], self.gang_waiting.get(key)):
+                if queue is None:
+                    continue
+                first = queue.best(now)
+                if first is not None and (best is None or
+                        first[1] < best[1]):
+                    best = first
+        return best
+
+    def _has_waiting(self, keyword):
+        ''' Check if a request waits for the given keyword. The manager lock
+            must be held.
+
+            @param keyword: The keyword (or expression)
+            @return: True if a request or a gang waits for the keyword
+        '''
+        return (len(self.waiting[keyword]) > 0 or
+                keyword in self.gang_waiting)
+
+    def _journal(self, record):
+        ''' Append the given record to the journal (if there is one) and
+            compact the journal if it got too long. The manager lock must be
+            held.
+
+            @param record: The record dictionary
         '''
-        LOG.info(_('Loading resources from: {0}').format(
-                self.resources_respository.path))
-        for element in os.listdir(self.resources_respository.path):
-            if element.startswith('.') or element.endswith('bkp'):
+        if self.journal is None:
+            return
+        self.journal_seq = self.journal.append(record)
+        if self.journal.needs_compact:
+            # written by the journal thread, not under the manager lock
+            self.journal.schedule_compact(self._snapshot())
+
+    def _check_journal(self):
+        ''' Refuse new requests while the journal can not be written, the
+            resources acquired could not be answered.
+        '''
+        if self.journal is not None and self.journal.failed is not None:
+            raise ResourceException(_('The journal of the resource server '
+                    'can not be written, no resources are given out: '
+                    '{0}').format(self.journal.failed))
+
+    def _sync(self):
+        ''' Wait until all the records appended are stored on the disk. This
+            must be called after the manager lock got released, before
+            the answers are given.
+        '''
+        if self.journal is not None:
+            self.journal.wait(self.journal_seq)
+
+    def _snapshot(self):
+        ''' Get the records describing the current allocations of all the
+            resources. The manager lock must be held.
+
+            @return: The list of acquire records
+        '''
+        records = []
+        for name, resource in sorted(self.resources.iteritems()):
+            leases = {}
+            for uname in resource.users:
+                if not uname in leases:
+                    leases[uname] = list(self.holder_leases.get((name, uname),
+                            []))
+                record = {'op': 'acquire', 'resource': name, 'user': uname,
+                        'exclusive': resource.exclusive}
+                if len(leases[uname]) > 0:
+                    lease = leases[uname].pop(0)
+                    record['lease'] = lease.lease_id
+                    record['ttl'] = lease.ttl
+                records.append(record)
+        return records
+
+    def _replay(self, journal):
+        ''' Restore the allocations stored within the journal and start
+            using the journal afterwards. The restored leases start with
+            their full ttl.
+
+            @param journal: The Journal object
+        '''
+        records = journal.load()
+        for record in records:
+            try:
+                self._replay_record(record)
+            except (KeyError, ResourceException), exc:
+                LOG.warning(_('Ignore the journal entry {0}: {1}').format(
+                        record, exc))
+        for resource in self.resources.itervalues():
+            self._update_index(resource)
+        LOG.info(_('Restored {0} journal entries from {1}').format(
+                len(records), journal.path))
+
+        journal.compact(self._snapshot())
+        self.journal = journal
+
+    def _replay_record(self, record):
+        ''' Apply one record of the journal.
+
+            @param record: The record dictionary
+        '''
+        resource = self.resources.get(record['resource'])
+        if resource is None:
+            raise ResourceException(_('The resource does not exist '
+                    'anymore.'))
+        uname = record['user']
+        if record['op'] == 'acquire':
+            if not resource.acquire(uname, record['exclusive'], False):
+                raise ResourceException(_('The resource is not available.'))
+            self.scheduler.acquired(uname)
+            if 'lease' in record:
+                self._create_lease(resource.name, uname, record['ttl'],
+                        record['lease'])
+        elif record['op'] == 'release':
+            self._release(resource, uname, record['exclusive'],
+                    self.leases.get(record.get('lease')))
+
+    def _load_resources(self):
+        ''' Load all the resources of the current revision of the resource
+            repository. The files are read from the repository, the files
+            within the directory are not used.
+        '''
+        LOG.info(_('Loading resources from: {0} ({1})').format(
+                self.resources_respository.path, self.revision))
+        if self.revision is None:
+            LOG.warning(_('The resource repository has no revision yet.'))
+            return
+        for element in self.resources_respository.list_files(self.revision):
+            if not _is_resource_file(element):
                 # ignore hidden files
                 continue
-            if os.path.isfile(self.resources_respository.get_full_path(
-                    element)):
-                self._load_resource(self.resources_respository.get_full_path(
+            resource = self._load_resource(self.revision, element)
+            if resource is None:
+                continue
+            if resource.name in self.resources:
+                LOG.warning(_('A resource with name "{0}" already exists. '
+                        'Ignore it. Filename: {1}').format(resource.name,
                         element))
+                continue
+            self.resources[resource.name] = resource
+            self.resource_files[element] = resource.name
 
-    def _load_resource(self, filename):
+    def _load_resource(self, revision, filename):
         ''' Load the given resource from the given file.
 
-            @param filename: The name of the file (full path)
+            @param revision: The revision of the repository to read from
+            @param filename: The name of the file within the repository
+            @return: The Resource object or None
         '''
         LOG.debug(_('Load resource from file: {0}').format(filename))
-        resource_desc = json.load(open(filename, 'r'))
+        resource_desc = json.loads(self.resources_respository.read_file(
+                revision, filename))
         resource = init_resource_from_obj(resource_desc)
-        if resource is not None:
-            if resource.name in self.resources:
-                LOG.warning(_('A resource with name "{0}" already exists. '
-                        'Ignore it. Filename: {1}').format(resource.name,
-                        filename))
-                return
-            self.resources[resource.name] = resource
-        else:
+        if resource is None:
             LOG.error(_('Could not load resource from given file: '
                     '{0}').format(filename))
+        return resource
+
+
+def _is_resource_file(filename):
+    ''' Check if the given file (path within the repository) is a resource
+        definition. Hidden files, backup files and the files within sub
+        directories are not.
+
+        @param filename: The path of the file
+        @return: True if the file defines a resource
+    '''
+    return not (filename.startswith('.') or filename.endswith('bkp') or
+            '/' in filename)
+
+
+def _request_keywords(request):
+    ''' Get the keywords of the given request.
+
+        @param request: The ResourceRequest or GangRequest
+        @return: The list (or set) of the keywords
+    '''
+    if isinstance(request, GangRequest):
+        return request.keywords
+    return [request.keyword]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The ResourceRequest is the ticket a user gets from the ResourceManager
+    while waiting for a resource. The requests are queued in the order they
+    came in and get the resource assigned as soon as it is their turn.
+'''
+
+import threading
+import itertools
+import time
+
+# the ticket numbers of all requests, used to find the oldest request
+_TICKETS = itertools.count(1)
+
+
+class ResourceRequest(object):
+    ''' A request for a resource with the given keyword. The ResourceManager
+        finishes the request with the name of the resource acquired or with
+        None if no resource could be acquired.
+    '''
+
+    def __init__(self, uname, keyword, exclusive, priority=0):
+        ''' Create a new request with the next ticket number.
+
+            @param uname: The user name to acquire the resource for
+            @param keyword: The keyword of the resource requested
+            @param exclusive: True if the resource is requested exclusively
+            @param priority: The priority of the request, higher is served
+                    first (see Scheduler)
+        '''
+        self.ticket = _TICKETS.next()
+        self.created = time.time()
+        self.uname = uname
+        self.keyword = keyword
+        self.exclusive = exclusive
+        self.priority = priority
+        # set by the ResourceManager while holding its lock
+        self.resource = None
+        self.cancelled = False
+        self.timed_out = False
+        self.timer = None
+        # the time to live of the lease and the lease id once acquired
+        self.ttl = None
+        self.lease = None
+
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._callbacks = []
+
+    @property
+    def done(self):
+        ''' True if the request is finished. '''
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        ''' Wait until the request is finished.
+
+            @param timeout: The maximum time to wait in seconds, None waits
+                    until the request is finished.
+            @return: The name of the resource acquired or None
+        '''
+        self._finished.wait(timeout)
+        return self.resource
+
+    def add_done_callback(self, callback):
+        ''' Register a function to call with the name of the resource as
+            soon as the request is finished. If it is already finished the
+            function is called right away.
+
+            @param callback: The function to call with the resource name (or
+                    None) as the only parameter.
+        '''
+        with self._lock:
+            if not self._finished.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.resource)
+
+    def finish(self, resource):
+        ''' Finish the request and inform the waiting threads and callbacks.
+            This must not be called while holding the lock of the
+            ResourceManager since the callbacks might call it again.
+
+            @param resource: The name of the resource acquired or None
+        '''
+        with self._lock:
+            if self._finished.is_set():
+                return
+            self.resource = resource
+            self._finished.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        for callback in callbacks:
+            callback(resource)
+
+
+class GangRequest(ResourceRequest):
+    ''' A request for multiple resources at once. The ResourceManager
+        acquires either all the resources or none of them. The request is
+        finished with the list of the resource names, in the same order as
+        requested.
+    '''
+
+    def __init__(self, uname, items, priority=0):
+        ''' Create a new request with the next ticket number.
+
+            @param uname: The user name to acquire the resources for
+            @param items: A list with a (keyword, exclusive) tuple for each
+                    resource requested.
+            @param priority: The priority of the request
+        '''
+        ResourceRequest.__init__(self, uname, None, False, priority)
+        # one request for each resource, used to acquire the single ones
+        self.parts = [ResourceRequest(uname, keyword.lower(), exclusive)
+                for keyword, exclusive in items]
+        self.keywords = set(part.keyword for part in self.parts)
+
+    @property
+    def leases(self):
+        ''' The lease ids of the resources acquired (if acquired with a
+            ttl).
+        '''
+        return [part.lease for part in self.parts]
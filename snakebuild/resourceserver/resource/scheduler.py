@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The Scheduler decides which of the waiting requests gets the next free
+    slot of a resource. Each request is ranked by:
+
+    priority: The priority given with the request (default 0, higher is
+        more urgent).
+    aging: A waiting request gains one priority level for every aging
+        seconds it waits, this way a request with a low priority does not
+        starve.
+    fair share: If weights are configured the number of slots a user (or
+        the group of the user) holds, divided by its weight, is subtracted
+        from the priority. A user holding many slots has to wait behind the
+        users holding only a few.
+
+    The requests with the same rank are served in the order they came in.
+    Within one fair share group the order of the waiting requests does not
+    change over time (all of them age the same way), therefore a WaitQueue
+    keeps a heap for each group and only the first requests of the groups
+    have to be ranked to find the best one.
+    The scheduler also keeps the average time between two waiting requests
+    served (EWMA) for each keyword to estimate the remaining waiting time.
+'''
+
+import heapq
+import collections
+
+from snakebuild.i18n import _
+from snakebuild.resourceserver.resource.resource import ResourceException
+
+# the weight of the last interval for the average interval between two
+# waiting requests served
+_EWMA_ALPHA = 0.3
+
+
+class Scheduler(object):
+    ''' Rank the waiting requests and keep the statistics for the waiting
+        time estimation.
+    '''
+
+    def __init__(self, aging=0, weights=None, groups=None):
+        ''' Create the scheduler.
+
+            @param aging: The number of seconds a request has to wait to gain
+                    one priority level, 0 disables the aging.
+            @param weights: The dictionary with the fair share weight for each
+                    user or group name, if None or empty fair share is off.
+            @param groups: The dictionary with the list of the user names
+                    for each group name.
+        '''
+        self.aging = aging
+        self.weights = weights or {}
+        self.groups = {}
+        for group, members in (groups or {}).iteritems():
+            for uname in members:
+                self.groups[uname] = group
+        # the number of slots held for each user or group
+        self.usage = {}
+        # the average interval and the last time served for each keyword
+        self.intervals = {}
+        self.last_served = {}
+
+    def share(self, uname):
+        ''' Get the name the fair share is accounted to.
+
+            @param uname: The user name
+            @return: The group name of the user or the user name
+        '''
+        return self.groups.get(uname, uname)
+
+    def rank(self, request, now):
+        ''' Get the rank of the given request, the request with the lowest
+            rank is served first.
+
+            @param request: The waiting ResourceRequest (or GangRequest)
+            @param now: The current time
+            @return: The rank (a tuple which can be compared)
+        '''
+        priority = request.priority
+        if self.aging > 0:
+            priority += (now - request.created) / self.aging
+        if len(self.weights) > 0:
+            share = self.share(request.uname)
+            priority -= (float(self.usage.get(share, 0)) /
+                    self.weights.get(share, 1))
+        return (-priority, request.ticket)
+
+    def order(self, request):
+        ''' Get the part of the rank of the given request which does not
+            change while the request waits. Within the requests of one fair
+            share group (see group) the order is the same as the one of the
+            ranks.
+
+            @param request: The ResourceRequest (or GangRequest)
+            @return: The order (a tuple which can be compared)
+        '''
+        priority = request.priority
+        if self.aging > 0:
+            priority -= request.created / self.aging
+        return (-priority, request.ticket)
+
+    def group(self, request):
+        ''' Get the fair share group of the given request. The requests of
+            one group are ranked the same way (see order).
+
+            @param request: The ResourceRequest (or GangRequest)
+            @return: The name the fair share is accounted to or None if fair
+                    share is off.
+        '''
+        if len(self.weights) == 0:
+            return None
+        return self.share(request.uname)
+
+    def acquired(self, uname):
+        ''' Called after the user acquired a slot of a resource.
+
+            @param uname: The user name
+        '''
+        share = self.share(uname)
+        self.usage[share] = self.usage.get(share, 0) + 1
+
+    def released(self, uname):
+        ''' Called after the user released a slot of a resource.
+
+            @param uname: The user name
+        '''
+        share = self.share(uname)
+        count = self.usage.get(share, 0) - 1
+        if count > 0:
+            self.usage[share] = count
+        else:
+            self.usage.pop(share, None)
+
+    def served(self, keyword, now, backlog):
+        ''' Called after a waiting request for the keyword got a resource.
+            Only the intervals while requests are waiting are used for the
+            average, otherwise an idle time would count as waiting time.
+
+            @param keyword: The keyword (or expression) of the request
+            @param now: The current time
+            @param backlog: True if other requests still wait for the keyword
+        '''
+        last = self.last_served.pop(keyword, None)
+        if last is not None:
+            interval = now - last
+            average = self.intervals.get(keyword)
+            if average is None:
+                self.intervals[keyword] = interval
+            else:
+                self.intervals[keyword] = (_EWMA_ALPHA * interval +
+                        (1 - _EWMA_ALPHA) * average)
+        if backlog:
+            self.last_served[keyword] = now
+
+    def forget(self, keyword):
+        ''' Drop the statistics of the given expression, it is not used
+            anymore.
+
+            @param keyword: The normalized expression
+        '''
+        self.intervals.pop(keyword, None)
+        self.last_served.pop(keyword, None)
+
+    def estimate(self, keyword, position):
+        ''' Estimate the waiting time of a request.
+
+            @param keyword: The keyword (or expression) of the request
+            @param position: The position of the request within the waiting
+                    requests of the keyword (starting with 1)
+            @return: The estimated time in seconds or None if there are no
+                    statistics yet.
+        '''
+        interval = self.intervals.get(keyword)
+        if interval is None:
+            return None
+        return position * interval
+
+
+class WaitQueue(object):
+    ''' The requests waiting for a keyword in the order they came in. For
+        each fair share group the requests are kept in a heap by their order
+        (see Scheduler.order) as well. A removed request stays within its
+        heap until it gets to the top or until the heaps get compacted.
+    '''
+
+    def __init__(self, scheduler):
+        ''' Create the empty queue.
+
+            @param scheduler: The Scheduler to rank the requests
+        '''
+        self.scheduler = scheduler
+        self.requests = collections.OrderedDict()
+        self.heaps = {}
+        self.removed = 0
+
+    def __len__(self):
+        ''' Get the number of waiting requests. '''
+        return len(self.requests)
+
+    def __iter__(self):
+        ''' Iterate over the waiting requests in the order they came in. '''
+        return iter(self.requests)
+
+    def __contains__(self, request):
+        ''' Check if the given request is waiting. '''
+        return request in self.requests
+
+    def append(self, request):
+        ''' Add the given request to the queue.
+
+            @param request: The ResourceRequest (or GangRequest)
+        '''
+        self.requests[request] = None
+        heap = self.heaps.setdefault(self.scheduler.group(request), [])
+        heapq.heappush(heap, (self.scheduler.order(request), request))
+
+    def remove(self, request):
+        ''' Remove the given request from the queue.
+
+            @param request: The waiting ResourceRequest (or GangRequest)
+        '''
+        del self.requests[request]
+        self.removed += 1
+        if self.removed > len(self.requests) + 16:
+            self._compact()
+
+    def clear(self):
+        ''' Remove all the requests. '''
+        self.requests.clear()
+        self.heaps.clear()
+        self.removed = 0
+
+    def best(self, now):
+        ''' Get the best ranked request of the queue.
+
+            @param now: The current time
+            @return: A tuple with the request and its rank or None
+        '''
+        best = None
+        for group, heap in self.heaps.items():
+            while len(heap) > 0 and not heap[0][1] in self.requests:
+                heapq.heappop(heap)
+                self.removed -= 1
+            if len(heap) == 0:
+                del self.heaps[group]
+                continue
+            rank = self.scheduler.rank(heap[0][1], now)
+            if best is None or rank < best[1]:
+                best = (heap[0][1], rank)
+        return best
+
+    def _compact(self):
+        ''' Build the heaps again without the removed requests. '''
+        self.heaps = {}
+        for request in self.requests:
+            self.heaps.setdefault(self.scheduler.group(request), []).append(
+                    (self.scheduler.order(request), request))
+        for heap in self.heaps.itervalues():
+            heapq.heapify(heap)
+        self.removed = 0
+
+
+def get_scheduler(aging=0, weights='', groups=''):
+    ''' Create the scheduler from the config values.
+
+        @param aging: The number of seconds to gain one priority level
+        @param weights: The fair share weights as a string in the form
+                "name=weight, name=weight" (name of a user or a group)
+        @param groups: The groups as a string in the form
+                "group=user user; group=user"
+        @return: The Scheduler object, raises a ResourceException if the
+                values are not valid.
+    '''
+    if aging < 0:
+        raise ResourceException(_('The priority aging must not be negative: '
+                '{0}').format(aging))
+    share_weights = {}
+    for entry in _split(weights, ','):
+        name, weight = _split_entry(entry)
+        try:
+            share_weights[name] = float(weight)
+        except ValueError:
+            share_weights[name] = 0.0
+        if share_weights[name] <= 0:
+            raise ResourceException(_('The fair share weight must be a '
+                    'positive number: {0}').format(entry))
+    share_groups = {}
+    for entry in _split(groups, ';'):
+        name, members = _split_entry(entry)
+        share_groups[name] = members.split()
+    return Scheduler(aging, share_weights, share_groups)
+
+
+def _split(value, separator):
+    ''' Split the config value into its not empty entries.
+
+        @param value: The config value
+        @param separator: The separator of the entries
+        @return: The list of the entries
+    '''
+    return [entry.strip() for entry in value.split(separator)
+            if len(entry.strip()) > 0]
+
+
+def _split_entry(entry):
+    ''' Split a "name=value" entry.
+
+        @param entry: The entry string
+        @return: The name and the value, raises a ResourceException if the
+                entry has no name.
+    '''
+    name, sep, value = entry.partition('=')
+    if len(name.strip()) == 0 or len(sep) == 0:
+        raise ResourceException(_('Invalid entry within the scheduler '
+                'config: {0}').format(entry))
+    return name.strip(), value.strip()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' A tag can be a single keyword or an expression combining keywords with
+    & (and), | (or), ! (not) and parentheses, for example:
+
+        linux & arm & !slow
+
+    The KeywordIndex holds a bitset (an integer) for each keyword with one
+    bit for each resource. An expression is evaluated with the bit
+    operations on these sets and the result is kept until the index gets
+    built again (only the most recently used expressions are kept).
+'''
+
+import re
+import collections
+
+from snakebuild.i18n import _
+from snakebuild.resourceserver.resource.resource import ResourceException
+
+_TOKEN = re.compile(r'\s*(?:([&|!()])|([^\s&|!()]+))')
+# the number of evaluated expressions kept by the KeywordIndex
+_CACHE_SIZE = 256
+
+
+class TagExpressionException(ResourceException):
+    ''' The exception raised if a tag expression is not valid. '''
+
+
+def is_expression(tag):
+    ''' Check if the given tag is an expression and not a single keyword.
+
+        @param tag: The tag string
+        @return: True if the tag contains an operator or a parenthesis
+    '''
+    for char in '&|!() ':
+        if char in tag:
+            return True
+    return False
+
+
+class KeywordIndex(object):
+    ''' The index of the resources by keyword. Each resource gets a bit
+        number and each keyword a bitset with the bits of its resources.
+    '''
+
+    def __init__(self, resources):
+        ''' Build the index for the given resources.
+
+            @param resources: The dictionary with the Resource objects by name
+        '''
+        self.names = sorted(resources.iterkeys())
+        self.all = (1 << len(self.names)) - 1
+        self.bits = {}
+        for bit, name in enumerate(self.names):
+            for keyword in resources[name].keywords:
+                self.bits[keyword] = self.bits.get(keyword, 0) | (1 << bit)
+        # the evaluated expressions: tag -> (bitset, normalized expression)
+        # the least recently used first
+        self.cache = collections.OrderedDict()
+
+    def evaluate(self, tag):
+        ''' Evaluate the given tag expression.
+
+            @param tag: The tag expression (or a single keyword)
+            @return: A tuple with the bitset of the matching resources and
+                    the normalized expression (the same for expressions
+                    which differ only in the whitespace, the parentheses
+                    or the order of the operands of & and |).
+        '''
+        result = self.cache.pop(tag, None)
+        if result is None:
+            parser = _Parser(tag.lower(), self)
+            result = parser.parse()
+            if len(self.cache) >= _CACHE_SIZE:
+                self.cache.popitem(False)
+        self.cache[tag] = result
+        return result
+
+    def match(self, tag):
+        ''' Get the names of the resources matching the given tag
+            expression.
+
+            @param tag: The tag expression (or a single keyword)
+            @return: The list of the resource names (sorted)
+        '''
+        return self.resource_names(self.evaluate(tag)[0])
+
+    def resource_names(self, bitset):
+        ''' Get the names of the resources of the given bitset.
+
+            @param bitset: The bitset of the resources
+            @return: The list of the resource names (sorted)
+        '''
+        names = []
+        bit = 0
+        while bitset:
+            if bitset & 1:
+                names.append(self.names[bit])
+            bitset >>= 1
+            bit += 1
+        return names
+
+
+class _Parser(object):
+    ''' A recursive descent parser for the tag expressions which evaluates
+        the expression while parsing it. The precedence is ! before & before
+        |.
+    '''
+
+    def __init__(self, tag, index):
+        ''' Split the tag into its tokens.
+
+            @param tag: The tag expression (lower case)
+            @param index: The KeywordIndex to evaluate the keywords
+        '''
+        self.tag = tag
+        self.index = index
+        self.tokens = []
+        pos = 0
+        tag = tag.rstrip()
+        while pos < len(tag):
+            match = _TOKEN.match(tag, pos)
+            if match is None:
+                raise TagExpressionException(_('Invalid tag expression: '
+                        '"{0}"').format(self.tag))
+            self.tokens.append(match.group(1) or match.group(2))
+            pos = match.end()
+        self.pos = 0
+
+    def parse(self):
+        ''' Parse and evaluate the expression.
+
+            @return: A tuple with the bitset and the normalized expression
+        '''
+        bitset, operator, operands = self._parse_or()
+        if self.pos < len(self.tokens):
+            self._error()
+        return bitset, _join(operator, operands)
+
+    def _next(self):
+        ''' Get the next token without consuming it (None at the end). '''
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def _error(self):
+        ''' Raise the exception for an unexpected token. '''
+        raise TagExpressionException(_('Unexpected "{0}" in the tag '
+                'expression: "{1}"').format(self._next() or _('end'),
+                self.tag))
+
+    def _parse_or(self):
+        ''' expression := term ('|' term)*
+
+            @return: A tuple with the bitset, the operator and the list of
+                    the normalized operands (see _add_operand)
+        '''
+        bitset, operator, operands = self._parse_and()
+        if self._next() != '|':
+            return bitset, operator, operands
+        operands = _add_operand([], '|', operator, operands)
+        while self._next() == '|':
+            self.pos += 1
+            other, other_operator, other_operands = self._parse_and()
+            bitset |= other
+            _add_operand(operands, '|', other_operator, other_operands)
+        return bitset, '|', operands
+
+    def _parse_and(self):
+        ''' term := factor ('&' factor)*
+
+            @return: A tuple with the bitset, the operator and the list of
+                    the normalized operands (see _add_operand)
+        '''
+        bitset, operator, operands = self._parse_not()
+        if self._next() != '&':
+            return bitset, operator, operands
+        operands = _add_operand([], '&', operator, operands)
+        while self._next() == '&':
+            self.pos += 1
+            other, other_operator, other_operands = self._parse_not()
+            bitset &= other
+            _add_operand(operands, '&', other_operator, other_operands)
+        return bitset, '&', operands
+
+    def _parse_not(self):
+        ''' factor := '!' factor | '(' expression ')' | keyword
+
+            @return: A tuple with the bitset, the operator and the list of
+                    the normalized operands (see _add_operand)
+        '''
+        token = self._next()
+        if token == '!':
+            self.pos += 1
+            bitset, operator, operands = self._parse_not()
+            return (self.index.all & ~bitset, None,
+                    ['!' + _join(operator, operands)])
+        if token == '(':
+            self.pos += 1
+            result = self._parse_or()
+            if self._next() != ')':
+                self._error()
+            self.pos += 1
+            return result
+        if token is None or token in '&|)':
+            self._error()
+        self.pos += 1
+        return self.index.bits.get(token, 0), None, [token]
+
+
+def _add_operand(operands, operator, other_operator, other_operands):
+    ''' Add an operand to the operands of the given operator. An operand
+        using the same operator is merged ((a&b)&c is the same as a&(b&c)).
+
+        @param operands: The list of the normalized operands to extend
+        @param operator: The operator ('&' or '|') of the operands
+        @param other_operator: The operator of the operand to add (None for
+                a keyword or a negation)
+        @param other_operands: The normalized operands of the operand to add
+        @return: The extended list of operands
+    '''
+    if other_operator == operator:
+        operands.extend(other_operands)
+    else:
+        operands.append(_join(other_operator, other_operands))
+    return operands
+
+
+def _join(operator, operands):
+    ''' Get the normalized expression of the operands. The operands are
+        sorted since the order does not change the result (a&b is the same
+        as b&a).
+
+        @param operator: The operator ('&' or '|') or None for a single
+                operand
+        @param operands: The list of the normalized operands
+        @return: The normalized expression
+    '''
+    if operator is None:
+        return operands[0]
+    return '({0})'.format(operator.join(sorted(operands)))
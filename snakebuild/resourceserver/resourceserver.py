@@ -28,9 +28,10 @@ from snakebuild.common.versioneddir import VersionedDirException, \
         ReposConfig, remote_repo_existing, create_new_repo, clone_repo, \
         get_versioned_directory
 from snakebuild.commands import handle_cmd
-from snakebuild.communication import Server
+from snakebuild.communication import Server, get_engine
 from snakebuild.resourceserver.servercmds import *
-from snakebuild.resourceserver.resource import ResourceManager
+from snakebuild.resourceserver.resource import ResourceManager, \
+        get_placement_policy, get_scheduler, Journal
 from snakebuild.resourceserver.commandlineparser import command, SHELL_COMMANDS
 
 
@@ -70,6 +71,26 @@ def stop_server(args, config):
     return True
 
 
+@command('reload', (
+    (('--name',), {'help': _('The name of the resourceserver to reload.'),
+        'default': 'resourceserver'}),
+    ))
+def reload_server(args, config):
+    ''' Let the running resource server reload the resources changed within
+        the resource repository.
+
+        @param args: The arguments provided with the command
+        @param config: The config object to use
+
+        @return true or false depends on success or failure
+    '''
+    host = config.get_s('resourceserver', 'hostname')
+    port = config.get_s('resourceserver', 'port')
+
+    Daemon(Server(host, port, args.name), Daemon.RELOAD)
+    return True
+
+
 @command('start', (
     (('--background',), {'action': 'store_true',
         'help': _('Run the build agent as a daemon (background)'),
@@ -90,6 +111,9 @@ def start_server_now(args, config):
     host = config.get_s('resourceserver', 'hostname')
     port = config.get_s('resourceserver', 'port')
     name = 'resourceserver'
+    engine = get_engine(config.get_s('resourceserver', 'server_engine'))
+    worker_count = config.get_s('resourceserver', 'worker_count')
+    backlog = config.get_s('resourceserver', 'backlog')
 
     repos_name = config.get_s('resourceserver', 'resource_repos_name')
     repos_type = config.get_s('resourceserver', 'repository_type')
@@ -118,12 +142,26 @@ def start_server_now(args, config):
         # if nothing is specified always go for the master
         versioned_dir.update("master")
 
-    resourcemanager = ResourceManager(versioned_dir)
+    policy = get_placement_policy(config.get_s('resourceserver',
+            'placement_policy'))
+    scheduler = get_scheduler(config.get_s('resourceserver',
+            'priority_aging'), config.get_s('resourceserver',
+            'fair_share_weights'), config.get_s('resourceserver',
+            'fair_share_groups'))
+    journal_file = config.get_s('resourceserver', 'journal_file')
+    if len(journal_file) > 0:
+        journal = Journal(journal_file, config.get_s('resourceserver',
+                'journal_compact'))
+    else:
+        journal = None
+    resourcemanager = ResourceManager(versioned_dir, policy, scheduler,
+            journal)
+    reload_interval = config.get_s('resourceserver', 'reload_interval')
+    server = Server(host, port, name, resourcemanager, engine, worker_count,
+            backlog, lambda: resourcemanager.start(reload_interval))
     if args.background:
-        Daemon(Server(host, port, name, resourcemanager),
-                Daemon.START)
+        Daemon(server, Daemon.START)
     else:
-        Daemon(Server(host, port, name, resourcemanager),
-                Daemon.FOREGROUND)
+        Daemon(server, Daemon.FOREGROUND)
 
     return True
@@ -21,7 +21,11 @@
 '''
 
 import snakebuild.resourceserver.servercmds.acquire
+import snakebuild.resourceserver.servercmds.acquire_many
+import snakebuild.resourceserver.servercmds.queue
 import snakebuild.resourceserver.servercmds.release
+import snakebuild.resourceserver.servercmds.reload
+import snakebuild.resourceserver.servercmds.renew
 import snakebuild.resourceserver.servercmds.shutdown
 import snakebuild.resourceserver.servercmds.status_list
 import snakebuild.resourceserver.servercmds.resource_details
@@ -24,31 +24,83 @@ import logging
 
 from snakebuild.i18n import _
 from snakebuild.communication.commandstructure import prepare_answer, \
-        prepare_error
+        prepare_error, DeferredAnswer
 from snakebuild.communication.server import remote_command
+from snakebuild.resourceserver.resource import ResourceException
 
 LOG = logging.getLogger('snakebuild.resourcesserver.commands')
 
 
 @remote_command('acquire', False)
-def acquire(res_mgr, name, tag, exclusive=False):
+def acquire(res_mgr, name, tag, exclusive=False, timeout=None, nowait=False,
+        ttl=None, priority=0):
     ''' This command acquires a resource of the given tag. If the tag or
-        resource doesn't exist it will return an error. This command might
-        wait if no resource is available.
+        resource doesn't exist it will return an error. If no resource is
+        available the answer is deferred until the request gets a resource.
+        If the client is gone before it got the answer the request is
+        cancelled.
 
         @param res_mgr: The resource manager instance
         @param name: The name of the user to get this resource
-        @param tag: The tag of the resource to get
+        @param tag: The tag of the resource to get, a keyword or an
+            expression of keywords (for example "linux & !slow")
         @param exclusive: Should the resource be acquired exclusivly True
             if yes
+        @param timeout: The maximum time in seconds to wait for a resource
+        @param nowait: If True return an error right away if no resource is
+            available.
+        @param ttl: If set the resource is acquired with a lease which
+            must be renewed within the given time in seconds (see renew).
+            The answer contains the lease id.
+        @param priority: The priority of the request, if multiple requests
+            wait the one with the highest priority is served first.
+        @return: the answer object to return to the client or a
+            DeferredAnswer if the request has to wait
+    '''
+    if timeout is not None and (type(timeout) not in (int, float) or
+            timeout < 0):
+        return prepare_error(_('Illegal value for the timeout. Expected a '
+                'positive number but got {0}').format(timeout))
+    if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+        return prepare_error(_('Illegal value for the ttl. Expected a '
+                'positive number but got {0}').format(ttl))
+    if type(priority) is not int:
+        return prepare_error(_('Illegal value for the priority. Expected an '
+                'integer but got {0}').format(priority))
+
+    try:
+        request = res_mgr.request(name, tag, exclusive, timeout, nowait, ttl,
+                priority)
+    except ResourceException, exc:
+        return prepare_error(str(exc))
+    if request.done:
+        return _prepare_acquire_answer(tag, request)
+
+    deferred = DeferredAnswer()
+    deferred.add_cancel_callback(lambda: res_mgr.cancel(request))
+    request.add_done_callback(lambda resource: deferred.set_answer(
+            _prepare_acquire_answer(tag, request)))
+    return deferred
+
+
+def _prepare_acquire_answer(tag, request):
+    ''' Create the answer for an acquire request.
+
+        @param tag: The tag requested
+        @param request: The finished ResourceRequest
         @return: the answer object to return to the client
     '''
-    resource = res_mgr.acquire(name, tag, exclusive)
-    if resource is None:
+    if request.resource is None:
+        if request.timed_out:
+            return prepare_error(_("No resource with the given tag ({0}) "
+                    "could be acquired within the timeout.").format(tag))
         return prepare_error(_("No resource with the given tag ({0}) could be "
                 "acquired.").format(tag))
 
     answer = prepare_answer()
-    answer['resource'] = resource
+    answer['resource'] = request.resource
+    if request.lease is not None:
+        answer['lease'] = request.lease
+        answer['ttl'] = request.ttl
 
     return answer
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.resourceserver.servercmd acquire_many. This command
+    acquires multiple resources at once.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error, DeferredAnswer
+from snakebuild.communication.server import remote_command
+from snakebuild.resourceserver.resource import ResourceException
+
+LOG = logging.getLogger('snakebuild.resourcesserver.commands')
+
+
+@remote_command('acquire_many', False)
+def acquire_many(res_mgr, name, resources, timeout=None, nowait=False,
+        ttl=None, priority=0):
+    ''' This command acquires multiple resources at once. Either all of the
+        resources are acquired or none, a client does not hold some of the
+        resources while waiting for the others. If not all of them are
+        available the answer is deferred until the request gets them.
+
+        @param res_mgr: The resource manager instance
+        @param name: The name of the user to get the resources for
+        @param resources: A list with a [tag, exclusive] pair for each
+            resource to acquire.
+        @param timeout: The maximum time in seconds to wait for the resources
+        @param nowait: If True return an error right away if not all the
+            resources are available.
+        @param ttl: If set each resource is acquired with a lease which must
+            be renewed within the given time in seconds (see renew).
+        @param priority: The priority of the request
+        @return: the answer object to return to the client or a
+            DeferredAnswer if the request has to wait
+    '''
+    if type(resources) is not list or len(resources) == 0:
+        return prepare_error(_('Illegal value for the resources. Expected a '
+                'list with [tag, exclusive] pairs but got {0}').format(
+                resources))
+    for item in resources:
+        if (type(item) is not list or len(item) != 2 or
+                not type(item[0]) in (str, unicode) or
+                type(item[1]) is not bool):
+            return prepare_error(_('Illegal value within the resources. '
+                    'Expected a [tag, exclusive] pair but got {0}').format(
+                    item))
+    if timeout is not None and (type(timeout) not in (int, float) or
+            timeout < 0):
+        return prepare_error(_('Illegal value for the timeout. Expected a '
+                'positive number but got {0}').format(timeout))
+    if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+        return prepare_error(_('Illegal value for the ttl. Expected a '
+                'positive number but got {0}').format(ttl))
+    if type(priority) is not int:
+        return prepare_error(_('Illegal value for the priority. Expected an '
+                'integer but got {0}').format(priority))
+
+    try:
+        request = res_mgr.request_many(name, resources, timeout, nowait, ttl,
+                priority)
+    except ResourceException, exc:
+        return prepare_error(str(exc))
+    if request.done:
+        return _prepare_acquire_many_answer(resources, request)
+
+    deferred = DeferredAnswer()
+    deferred.add_cancel_callback(lambda: res_mgr.cancel(request))
+    request.add_done_callback(lambda resource: deferred.set_answer(
+            _prepare_acquire_many_answer(resources, request)))
+    return deferred
+
+
+def _prepare_acquire_many_answer(resources, request):
+    ''' Create the answer for an acquire_many request.
+
+        @param resources: The list with the requested [tag, exclusive] pairs
+        @param request: The finished GangRequest
+        @return: the answer object to return to the client
+    '''
+    if request.resource is None:
+        tags = ', '.join(item[0] for item in resources)
+        if request.timed_out:
+            return prepare_error(_("The resources with the given tags ({0}) "
+                    "could not be acquired within the timeout.").format(tags))
+        return prepare_error(_("The resources with the given tags ({0}) "
+                "could not be acquired.").format(tags))
+
+    answer = prepare_answer()
+    answer['resources'] = request.resource
+    if request.parts[0].ttl is not None:
+        answer['leases'] = request.leases
+        answer['ttl'] = request.parts[0].ttl
+
+    return answer
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.resourceserver.servercmd queue. This command lists the
+    requests waiting for a resource.
+'''
+
+import time
+import logging
+
+from snakebuild.communication.commandstructure import prepare_answer
+from snakebuild.communication.server import remote_command
+from snakebuild.resourceserver.resource import GangRequest
+
+LOG = logging.getLogger('snakebuild.resourcesserver.commands')
+
+
+@remote_command('queue', False)
+def queue(res_mgr):
+    ''' This command returns the list of the waiting requests in the order
+        they will be served. For each request the position within the
+        requests for the same tag and the estimated waiting time is returned.
+
+        @param res_mgr: The resource manager instance
+        @return: the answer object to return to the client
+    '''
+    now = time.time()
+    answer = prepare_answer()
+    answer['queue'] = []
+    for request, position, estimate in res_mgr.get_queue():
+        if isinstance(request, GangRequest):
+            tag = ', '.join(part.keyword for part in request.parts)
+            exclusive = [part.exclusive for part in request.parts]
+        else:
+            tag = request.keyword
+            exclusive = request.exclusive
+        values = {'user': request.uname,
+                'tag': tag,
+                'exclusive': exclusive,
+                'priority': request.priority,
+                'position': position,
+                'waiting': now - request.created,
+                'estimate': estimate}
+        answer['queue'].append(values)
+
+    return answer
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.resourceserver.servercmd reload. This command reloads the
+    resource definitions changed within the resource repository.
+'''
+
+import logging
+
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+from snakebuild.resourceserver.resource import ResourceException
+
+LOG = logging.getLogger('snakebuild.resourcesserver.servercmds.reload')
+
+
+@remote_command('reload', True)
+def reload_resources(res_mgr):
+    ''' This method is called on a reload request. The changes of the
+        resource repository are pulled and applied without a restart.
+
+        @param res_mgr: The ResourceManager instance
+        @return: the answer object with the revision loaded and the names of
+            the resources added, removed and changed.
+    '''
+    try:
+        result = res_mgr.reload()
+    except ResourceException, exc:
+        return prepare_error(str(exc))
+
+    return prepare_answer(result)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The snakebuild.resourceserver.servercmd renew. This command renews the
+    lease of an acquired resource.
+'''
+
+import logging
+
+from snakebuild.i18n import _
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
+from snakebuild.communication.server import remote_command
+
+LOG = logging.getLogger('snakebuild.resourcesserver.commands')
+
+
+@remote_command('renew', False)
+def renew(res_mgr, lease, ttl=None):
+    ''' This command renews the lease of a resource acquired with a ttl. The
+        lease has to be renewed before the ttl is over, otherwise the
+        resource gets released.
+
+        @param res_mgr: The resource manager instance
+        @param lease: The id of the lease to renew
+        @param ttl: The new time to live in seconds, if not set the ttl
+            given on acquire is used.
+        @return: the answer object to return to the client
+    '''
+    if ttl is not None and (type(ttl) not in (int, float) or ttl <= 0):
+        return prepare_error(_('Illegal value for the ttl. Expected a '
+                'positive number but got {0}').format(ttl))
+
+    renewed = res_mgr.renew(lease, ttl)
+    if renewed is None:
+        return prepare_error(_('The lease does not exist or is already '
+                'expired: {0}').format(lease))
+
+    answer = prepare_answer()
+    answer['resource'] = renewed.resource
+    answer['ttl'] = renewed.ttl
+
+    return answer
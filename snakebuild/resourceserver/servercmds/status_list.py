@@ -22,29 +22,47 @@
 
 import logging
 
-from snakebuild.communication.commandstructure import prepare_answer
+from snakebuild.communication.commandstructure import prepare_answer, \
+        prepare_error
 from snakebuild.communication.server import remote_command
+from snakebuild.resourceserver.resource import ResourceException
 
 LOG = logging.getLogger('snakebuild.resourcesserver.commands')
 
 
 @remote_command('status_list', False)
-def status_list(res_mgr):
+def status_list(res_mgr, tag=None):
     ''' This command returns a list with all the configured resources. In
         addtion to the name we return the current status and the keywords
         of all the resources.
 
         @param res_mgr: The resource manager instance
+        @param tag: If set only the resources matching the given keyword or
+            tag expression are returned.
         @return: the answer object to return to the client
     '''
+    if tag is not None:
+        try:
+            names = res_mgr.match(tag)
+        except ResourceException, exc:
+            return prepare_error(str(exc))
+
     answer = prepare_answer()
     answer['resources'] = []
-    for res in res_mgr.resources.itervalues():
-        values = {'name': res.name,
-                'keywords': res.keywords,
-                'slots': res.parallel_count,
-                'free': res.current_count,
-                'users': res.users}
-        answer['resources'].append(values)
+    # take a snapshot, the resources change while the answer gets sent
+    with res_mgr.lock:
+        if tag is None:
+            names = res_mgr.resources.keys()
+        for name in names:
+            res = res_mgr.resources.get(name)
+            if res is None:
+                # removed since the tag got matched
+                continue
+            values = {'name': res.name,
+                    'keywords': list(res.keywords),
+                    'slots': res.parallel_count,
+                    'free': res.current_count,
+                    'users': list(res.users)}
+            answer['resources'].append(values)
 
     return answer
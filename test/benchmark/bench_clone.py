@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' Compare a cold and a warm clone of a synthetic large repository with
+    clone_repo. The cold clone creates the local mirror, the warm clone
+    fetches only the new commits into the mirror and takes the objects
+    from it (--reference). A clone without a mirror is timed as well.
+
+    Git hard links the objects of a clone within the same file system, put
+    the source repository onto another file system (--repos) to measure the
+    copying of the objects.
+
+    Usage: python bench_clone.py [--commits N] [--size BYTES] [--keep DIR]
+            [--repos DIR]
+'''
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(
+        os.path.realpath(sys.argv[0])), '..', '..')))
+
+from snakebuild.common.filetools import disk_usage
+from snakebuild.common.versioneddir import ReposConfig, clone_repo
+
+
+def main():
+    ''' Build the repository, run the clones and print the results. '''
+    parser = argparse.ArgumentParser(description='Benchmark the clones '
+            'with and without the local mirror.')
+    parser.add_argument('--commits', type=int, default=1500,
+            help='the number of commits of the synthetic repository')
+    parser.add_argument('--size', type=int, default=40000,
+            help='the number of bytes each commit adds')
+    parser.add_argument('--keep', default=None,
+            help='the directory to work in, kept afterwards (default: a '
+            'temporary directory which gets removed)')
+    parser.add_argument('--repos', default=None,
+            help='the directory to create the source repository in '
+            '(default: within the working directory)')
+    args = parser.parse_args()
+
+    directory = args.keep
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='sb_bench_clone_')
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+    repos = args.repos
+    if repos is None:
+        repos = os.path.join(directory, 'repos')
+    try:
+        _run(directory, repos, args.commits, args.size)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(directory)
+            if args.repos is not None:
+                shutil.rmtree(os.path.join(repos, 'bench.git'))
+
+
+def _run(directory, repos, commits, size):
+    ''' Run the benchmark within the given directory.
+
+        @param directory: The empty directory to work in
+        @param repos: The directory to create the source repository in
+        @param commits: The number of commits of the repository
+        @param size: The number of bytes each commit adds
+    '''
+    source = os.path.join(repos, 'bench.git')
+    os.makedirs(source)
+    subprocess.check_call(['git', 'init', '-q', '--bare', source])
+
+    start = time.time()
+    _import_commits(source, 0, commits, size)
+    print 'synthetic repository: {0} commits, {1:.1f} MB, created in ' \
+            '{2:.1f} s'.format(commits, disk_usage(source) / 1048576.0,
+            time.time() - start)
+
+    mirrors = os.path.join(directory, 'mirrors')
+    plain = ReposConfig('git', repos)
+    mirrored = ReposConfig('git', repos, mirrors)
+    results = [('no mirror', _clone(plain, directory, 'plain'))]
+    results.append(('cold mirror', _clone(mirrored, directory, 'cold')))
+    # a few new commits the warm mirror has to fetch
+    _import_commits(source, commits, 10, size)
+    results.append(('warm mirror', _clone(mirrored, directory, 'warm')))
+
+    print '{0:<12} {1:>10} {2:>12} {3:>12}'.format('clone', 'seconds',
+            '.git MB', 'mirror MB')
+    for name, (duration, git_size, mirror_size) in results:
+        print '{0:<12} {1:>10.2f} {2:>12.2f} {3:>12.2f}'.format(name,
+                duration, git_size / 1048576.0, mirror_size / 1048576.0)
+
+
+def _clone(config, directory, name):
+    ''' Clone the repository and measure it.
+
+        @param config: The ReposConfig to clone with
+        @param directory: The directory to create the clone in
+        @param name: The name of the clone directory
+        @return: (seconds, bytes within the .git directory of the clone,
+                bytes of the mirror)
+    '''
+    target = os.path.join(directory, name)
+    start = time.time()
+    clone_repo('bench', target, config)
+    duration = time.time() - start
+    mirror_size = 0
+    if config.mirror_path is not None:
+        mirror_size = disk_usage(config.mirror_path)
+    return duration, disk_usage(os.path.join(target, '.git')), mirror_size
+
+
+def _import_commits(repo, first, count, size):
+    ''' Add commits with a new file of random data each with git
+        fast-import (much faster than a commit command per commit).
+
+        @param repo: The bare repository
+        @param first: The number of the first commit
+        @param count: The number of commits to add
+        @param size: The number of bytes of each file
+    '''
+    importer = subprocess.Popen(['git', 'fast-import', '--quiet'],
+            stdin=subprocess.PIPE, cwd=repo)
+    stream = importer.stdin
+    for number in range(first, first + count):
+        data = os.urandom(size)
+        stream.write('commit refs/heads/master\n')
+        stream.write('committer Bench <bench@localhost> {0} +0000\n'.format(
+                1300000000 + number))
+        message = 'commit {0}'.format(number)
+        stream.write('data {0}\n{1}\n'.format(len(message), message))
+        if number == first and first > 0:
+            # continue the existing branch, the stream tracks it afterwards
+            stream.write('from refs/heads/master^0\n')
+        stream.write('M 644 inline dir{0}/file{1}\n'.format(number % 20,
+                number))
+        stream.write('data {0}\n'.format(len(data)))
+        stream.write(data)
+        stream.write('\n')
+    stream.close()
+    if importer.wait() != 0:
+        raise SystemExit('git fast-import failed')
+
+
+if __name__ == '__main__':
+    main()
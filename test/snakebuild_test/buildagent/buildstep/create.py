@@ -22,6 +22,10 @@ import unittest
 
 from test_buildstep import TestBuildStep
 from test_shellbuildstep import TestShellBuildStep
+from test_logchecker import TestLogChecker
+from test_multibuildstep import TestMultiBuildStep
+from test_stepcache import TestStepCache
+from test_outputchannel import TestOutputChannel
 
 
 def suite():
@@ -29,5 +33,12 @@ def suite():
     buildstep = unittest.TestLoader().loadTestsFromTestCase(TestBuildStep)
     shellbuildstep = unittest.TestLoader().loadTestsFromTestCase(
             TestShellBuildStep)
+    logchecker = unittest.TestLoader().loadTestsFromTestCase(TestLogChecker)
+    multibuildstep = unittest.TestLoader().loadTestsFromTestCase(
+            TestMultiBuildStep)
+    stepcache = unittest.TestLoader().loadTestsFromTestCase(TestStepCache)
+    outputchannel = unittest.TestLoader().loadTestsFromTestCase(
+            TestOutputChannel)
 
-    return unittest.TestSuite([buildstep, shellbuildstep])
+    return unittest.TestSuite([buildstep, shellbuildstep, logchecker,
+            multibuildstep, stepcache, outputchannel])
@@ -26,7 +26,8 @@ import shutil
 
 from snakebuild.buildagent.buildstep import BuildStepException, load_step
 from snakebuild.buildagent.buildstep.buildstep import _is_valid, \
-        _get_env_values, _check_value, _parse_output_file, _check_input_values
+        _get_env_values, _check_value, _check_output_values, \
+        _check_input_values
 
 
 class TestBuildStep(unittest.TestCase):
@@ -446,8 +447,8 @@ class TestBuildStep(unittest.TestCase):
         with self.assertRaises(BuildStepException):
             value = _check_input_values({'NO_DEFAULT': 'test'}, test)
 
-    def test_parse_output_file(self):
-        ''' Test the parse output file helper function. '''
+    def test_check_output_values(self):
+        ''' Test the check output values helper function. '''
         test = {'INT1': {
                     'type': 'int',
                     'default': 12,
@@ -509,21 +510,12 @@ class TestBuildStep(unittest.TestCase):
                     'description': ''
                 }
             }
-        tempfile_name = ''
-        with tempfile.NamedTemporaryFile(delete=False) as resultfile:
-            tempfile_name = resultfile.name
-            resultfile.write('INT2=42\n')
-            resultfile.write('INT3=12\n')
-            resultfile.write('FLOAT2=12.3\n')
-            resultfile.write('FLOAT3=33\n')
-            resultfile.write('FLOAT4=231.111\n')
-            resultfile.write('BOOL2=True\n')
-            resultfile.write('BOOL3=False\n')
-            resultfile.write('BOOL4=1\n')
-            resultfile.write('BOOL5=0\n')
-            resultfile.write('STR2=HELLO\n')
-
-        value = _parse_output_file(tempfile_name, test)
+        values = {'INT2': '42', 'INT3': 12, 'FLOAT2': '12.3', 'FLOAT3': '33',
+                'FLOAT4': 231.111, 'BOOL2': 'True', 'BOOL3': False,
+                'BOOL4': '1', 'BOOL5': '0', 'STR2': 'HELLO=\nWORLD',
+                'OTHER': 'x'}
+
+        value = _check_output_values(values, test)
         self.assertTrue(value['INT1'] == 12)
         self.assertTrue(value['INT2'] == 42)
         self.assertTrue(value['INT3'] == 12)
@@ -537,19 +529,16 @@ class TestBuildStep(unittest.TestCase):
         self.assertTrue(value['BOOL4'] is True)
         self.assertTrue(value['BOOL5'] is False)
         self.assertTrue(value['STR1'] == 'TEST')
-        self.assertTrue(value['STR2'] == 'HELLO')
+        self.assertTrue(value['STR2'] == 'HELLO=\nWORLD')
+        self.assertTrue(value['OTHER'] == 'x')
+        self.assertTrue(values['INT2'] == '42')
 
-        with open(tempfile_name, 'a') as resultfile:
-            resultfile.write('INT2=gg42\n')
+        values['INT2'] = 'gg42'
         with self.assertRaises(BuildStepException):
-            value = _parse_output_file(tempfile_name, test)
+            value = _check_output_values(values, test)
 
-        with open(tempfile_name, 'w') as resultfile:
-            resultfile.write('INT2=42\n')
         with self.assertRaises(BuildStepException):
-            value = _parse_output_file(tempfile_name, test)
-
-        os.remove(tempfile_name)
+            value = _check_output_values({'INT2': '42'}, test)
 
     def test_check_value(self):
         ''' Test the internal _check_value function. '''
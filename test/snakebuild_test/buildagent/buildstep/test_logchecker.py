@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the shell build step object and the helper functions. '''
+''' The unit test for the log checker of the build steps. '''
+
+import unittest
+
+from snakebuild.buildagent.buildstep import BuildStepException, LogChecker
+from snakebuild.buildagent.buildstep import logchecker
+
+
+class TestLogChecker(unittest.TestCase):
+    ''' The unit test for the snake build LogChecker class. '''
+
+    def test_check(self):
+        ''' Test the matches found within the output given in pieces. '''
+        checker = LogChecker(['^error:', r'(\d+) errors? found'],
+                ['warning', 'deprecated'])
+        self.assertFalse(checker.check('compile a.c\nwarn'))
+        self.assertFalse(checker.check('ing: unused\ncompile b.c\n'))
+        self.assertTrue(checker.check('error: missing ; warning\n'
+                'deprecated call\n3 errors found'))
+        self.assertTrue(checker.warnings == 2)
+        self.assertTrue(checker.errors == 1)
+        self.assertTrue(checker.finish())
+        self.assertFalse(checker.finish())
+        self.assertTrue(checker.errors == 2)
+        self.assertTrue(checker.pattern_counts == {'^error:': 1,
+                r'(\d+) errors? found': 1, 'warning': 1, 'deprecated': 1})
+        self.assertTrue(checker.matches == [
+                ('warning', 2, 'warning', 'warning: unused'),
+                ('error', 4, '^error:', 'error: missing ; warning'),
+                ('warning', 5, 'deprecated', 'deprecated call'),
+                ('error', 6, r'(\d+) errors? found', '3 errors found')])
+
+        # no patterns
+        checker = LogChecker([], [])
+        self.assertFalse(checker.check('error: anything\n'))
+        self.assertTrue(checker.errors == 0)
+
+        self.assertRaises(BuildStepException, LogChecker, ['(unclosed'], [])
+
+    def test_not_combinable(self):
+        ''' Test the patterns which do not work within one regular
+            expression.
+        '''
+        # the same group name in two patterns
+        checker = LogChecker([r'(?P<f>\S+): error', r'(?P<f>\S+): fatal'],
+                [])
+        self.assertFalse(checker.check('a.c: warning\n'))
+        self.assertTrue(checker.check('a.c: fatal\n'))
+        self.assertTrue(checker.errors == 1)
+
+        # backreferences get renumbered if joined
+        checker = LogChecker([r'(a)\1', r'(b)\1'], ['(?i)warn'])
+        self.assertTrue(checker.check('bb\n'))
+        self.assertFalse(checker.check('ab\nWARNING\nWarn\n'))
+        self.assertTrue(checker.errors == 1)
+        self.assertTrue(checker.warnings == 2)
+        self.assertTrue(checker.pattern_counts[r'(b)\1'] == 1)
+
+        # combined with the other patterns in the given order
+        checker = LogChecker(['ab', r'(a)\1', 'x'], [])
+        self.assertTrue(checker.check('aab\n'))
+        self.assertTrue(checker.check('aa\n'))
+        self.assertTrue(checker.check('x\n'))
+        self.assertFalse(checker.check('y\n'))
+        self.assertTrue([match[2] for match in checker.matches] ==
+                ['ab', r'(a)\1', 'x'])
+
+    def test_bounded(self):
+        ''' Test that the memory used does not grow with the output. '''
+        checker = LogChecker(['error'], ['warning'])
+        line = 'x' * 1000
+        for cnt in range(200):
+            checker.check(line)
+            checker.check('warning\n')
+        self.assertTrue(len(checker.rest) <= logchecker.MAX_LINE_LENGTH)
+        self.assertTrue(len(checker.matches) == logchecker.MAX_MATCHES)
+        self.assertTrue(checker.warnings == 200)
+        self.assertTrue(all(len(match[3]) <= logchecker.MAX_MATCH_LENGTH
+                for match in checker.matches))
+        self.assertTrue(checker.line_number == 200)
+
+        # a long line without newline gets checked in pieces
+        checker.check('error' + 'x' * logchecker.MAX_LINE_LENGTH)
+        self.assertTrue(checker.rest == '')
+        self.assertTrue(checker.errors == 1)
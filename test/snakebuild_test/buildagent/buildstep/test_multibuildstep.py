@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the multi build step running the sub steps in
+    parallel.
+'''
+
+import unittest
+import tempfile
+import json
+import os
+import time
+import shutil
+
+from snakebuild.buildagent.buildstep import BuildStep, \
+        BuildStepException, MultiBuildStep, StepCache, load_step
+
+
+class TestMultiBuildStep(unittest.TestCase):
+    ''' The unit test for the snake build MultiBuildStep class. '''
+    def setUp(self):
+        ''' Create a directory with the step files of the sub steps. '''
+        self.directory = tempfile.mkdtemp()
+        self._create_step('produce', '#!/bin/sh\n'
+                'echo produce $NAME\n'
+                'sleep 1\n'
+                'sb_set VALUE "$NAME"\n',
+                {'NAME': {'type': 'str', 'default': 'x', 'description': ''}},
+                {'VALUE': {'type': 'str', 'description': ''}})
+        self._create_step('consume', '#!/bin/sh\n'
+                'echo consume $INPUT\n'
+                'sb_set RESULT "$INPUT-done"\n',
+                {'INPUT': {'type': 'str', 'description': ''}},
+                {'RESULT': {'type': 'str', 'description': ''}})
+        self._create_step('fail', '#!/bin/sh\n'
+                'echo FAILED\n',
+                {}, {'VALUE': {'type': 'str', 'default': 'none',
+                'description': ''}}, 'continue')
+        self._create_step('fail_abort', '#!/bin/sh\n'
+                'echo FAILED\n',
+                {}, {'VALUE': {'type': 'str', 'default': 'none',
+                'description': ''}}, 'abort')
+
+    def tearDown(self):
+        ''' Remove the temporary directory with all its files. '''
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def test_parallel(self):
+        ''' Test that independent steps run at the same time and the outputs
+            are passed to the steps depending on them.
+        '''
+        step = self._create_multi('parallel', [
+                {'name': 'first', 'type': 'produce',
+                    'input': {'NAME': '$NAME'}},
+                {'name': 'second', 'type': 'produce',
+                    'input': {'NAME': 'two'}},
+                {'name': 'use', 'type': 'consume',
+                    'input': {'INPUT': '$first.VALUE'}}],
+                {'OUT': '$use.RESULT', 'NAME': '$NAME'})
+        self.assertTrue(isinstance(step, MultiBuildStep))
+        self.assertTrue(step.dependencies == {'first': [], 'second': [],
+                'use': ['first']})
+
+        logfile = os.path.join(self.directory, 'parallel.log')
+        finished = []
+        step.log_callback = finished.append
+        start = time.time()
+        result = step.run({'NAME': 'one'}, logfile)
+        self.assertTrue(time.time() - start < 1.9)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'OUT': 'one-done',
+                'NAME': 'one'}))
+        self.assertTrue(step.run_status == BuildStep.FINISHED)
+
+        report = step.report
+        self.assertTrue(report['critical_path'] == ['first', 'use'])
+        self.assertTrue(report['cancelled'] == [])
+        self.assertTrue(report['steps']['use']['start'] >=
+                report['steps']['first']['end'])
+        self.assertTrue(report['steps']['second']['start'] <
+                report['steps']['first']['end'])
+        self.assertTrue(1 <= report['critical_duration'] <=
+                report['duration'])
+
+        with open(os.path.join(self.directory, 'parallel.use.log')) as logf:
+            self.assertTrue(logf.read() == 'consume one\n')
+        with open(logfile) as logf:
+            self.assertTrue('critical path' in logf.read())
+        # the log of each sub step is reported as soon as it is complete
+        self.assertTrue(sorted(finished) == [os.path.join(self.directory,
+                'parallel.{0}.log'.format(name)) for name in ('first',
+                'second', 'use')])
+
+        # with one worker the steps run one after the other
+        step.workers = 1
+        start = time.time()
+        result = step.run({'NAME': 'one'}, logfile)
+        self.assertTrue(time.time() - start >= 2)
+        self.assertTrue(result[0] == BuildStep.SUCCESS)
+
+    def test_stream(self):
+        ''' Test that a streaming step starts as soon as the values it uses
+            are set.
+        '''
+        self._create_step('slow', '#!/bin/sh\n'
+                'sb_set VALUE "early"\n'
+                'sleep 1\n',
+                {}, {'VALUE': {'type': 'str', 'description': ''}})
+        step = self._create_multi('stream', [
+                {'name': 'first', 'type': 'slow', 'input': {}},
+                {'name': 'use', 'type': 'consume', 'stream': True,
+                    'input': {'INPUT': '$first.VALUE'}}],
+                {'OUT': '$use.RESULT', 'NAME': '$NAME'})
+        received = []
+        step.output_callback = lambda name, value: received.append((name,
+                value, time.time()))
+
+        logfile = os.path.join(self.directory, 'stream.log')
+        start = time.time()
+        result = step.run({}, logfile)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'OUT': 'early-done',
+                'NAME': 'x'}))
+        report = step.report
+        self.assertTrue(report['steps']['use']['end'] <
+                report['steps']['first']['end'])
+        self.assertTrue(len(received) == 1)
+        self.assertTrue(received[0][:2] == ('OUT', 'early-done'))
+        self.assertTrue(received[0][2] - start < 0.9)
+
+    def test_cache(self):
+        ''' Test that the sub steps take the results from the cache. '''
+        step = self._create_multi('cached', [
+                {'name': 'first', 'type': 'produce',
+                    'input': {'NAME': '$NAME'}},
+                {'name': 'use', 'type': 'consume',
+                    'input': {'INPUT': '$first.VALUE'}}],
+                {'OUT': '$use.RESULT', 'NAME': '$NAME'})
+        step.cache = StepCache(os.path.join(self.directory, 'cache'))
+        step.revision = 'abc'
+        logfile = os.path.join(self.directory, 'cached.log')
+        step.run({'NAME': 'one'}, logfile)
+        start = time.time()
+        result = step.run({'NAME': 'one'}, logfile)
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'OUT': 'one-done',
+                'NAME': 'one'}))
+        self.assertTrue(len(step.cache.entries) == 2)
+
+    def test_failure(self):
+        ''' Test that a failed step cancels the steps depending on it. '''
+        entries = [{'name': 'broken', 'type': 'fail', 'input': {}},
+                {'name': 'use', 'type': 'consume',
+                    'input': {'INPUT': '$broken.VALUE'}},
+                {'name': 'later', 'type': 'consume',
+                    'input': {'INPUT': '$use.RESULT'}},
+                {'name': 'other', 'type': 'produce', 'input': {},
+                    'after': []}]
+        step = self._create_multi('continue', entries, {'NAME': '$NAME'})
+        logfile = os.path.join(self.directory, 'continue.log')
+        result = step.run({}, logfile)
+        self.assertTrue(result == (BuildStep.ERROR, {'NAME': 'x',
+                'OUT': ''}))
+        self.assertTrue(sorted(step.report['steps']) == ['broken', 'other'])
+        self.assertTrue(step.report['cancelled'] == ['use', 'later'])
+
+        # abort cancels all the steps not yet started
+        entries[0]['type'] = 'fail_abort'
+        entries[3]['after'] = ['broken']
+        step = self._create_multi('abort', entries, {})
+        result = step.run({}, logfile)
+        self.assertTrue(result[0] == BuildStep.ERROR)
+        self.assertTrue(step.report['steps'].keys() == ['broken'])
+        self.assertTrue(step.report['cancelled'] == ['use', 'later', 'other'])
+
+    def test_invalid(self):
+        ''' Test the invalid references between the steps. '''
+        consume = {'name': 'use', 'type': 'consume',
+                'input': {'INPUT': '$first.VALUE'}}
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [consume], {})
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [consume, {'name': 'first', 'type': 'produce', 'input': {}}],
+                {})
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [{'name': 'first', 'type': 'produce', 'input': {}},
+                {'name': 'first', 'type': 'produce', 'input': {}}], {})
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [{'name': 'first', 'type': 'produce',
+                'input': {'NAME': '$UNKNOWN'}}], {})
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [{'name': 'first', 'type': 'produce',
+                'input': {'VALUE': 'x'}}], {})
+        self.assertRaises(BuildStepException, self._create_multi, 'invalid',
+                [{'name': 'first', 'type': 'produce', 'input': {}}],
+                {'NAME': '$first.UNKNOWN'})
+
+    def _create_step(self, name, script, inputs, outputs, on_error='abort'):
+        ''' Create the step file and the script of a shell build step.
+
+            @param name: The name of the step file (without extension)
+            @param script: The content of the script
+            @param inputs: The input variables
+            @param outputs: The output variables
+            @param on_error: The on_error entry of the checks
+        '''
+        script_filename = os.path.join(self.directory, name + '.sh')
+        with open(script_filename, 'w') as sfl:
+            sfl.write(script)
+        buildstep = {'name': name, 'description': '', 'type': 'shell',
+                'script': script_filename, 'input': inputs,
+                'output': outputs,
+                'checks': {'log_check': 'full', 'on_error': on_error,
+                'error_patterns': ['^FAILED']}}
+        with open(os.path.join(self.directory, name + '.step'), 'w') as cfl:
+            cfl.write(json.dumps(buildstep))
+
+    def _create_multi(self, name, entries, results):
+        ''' Create and load a multi build step.
+
+            @param name: The name of the step file (without extension)
+            @param entries: The build_steps entries
+            @param results: The results mapping of the output values
+            @return: The loaded step
+        '''
+        buildstep = {'name': name, 'description': '', 'type': 'multi',
+                'script': '',
+                'input': {'NAME': {'type': 'str', 'default': 'x',
+                    'description': ''}},
+                'output': {'OUT': {'type': 'str', 'default': '',
+                    'description': ''},
+                    'NAME': {'type': 'str', 'description': ''}},
+                'checks': {'log_check': 'none', 'on_error': 'abort'},
+                'build_steps': entries, 'results': results, 'workers': 4}
+        filename = os.path.join(self.directory, name + '.step')
+        with open(filename, 'w') as cfl:
+            cfl.write(json.dumps(buildstep))
+        return load_step(filename)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the output channel of the build steps. '''
+
+import os
+import socket
+import shutil
+import tempfile
+import unittest
+
+from snakebuild.buildagent.buildstep.outputchannel import OutputChannel, \
+        encode_record, RECORD_HEADER, MAX_RECORD_SIZE
+
+
+class TestOutputChannel(unittest.TestCase):
+    ''' The unit test for the snake build OutputChannel class. '''
+    def setUp(self):
+        ''' Create the channel within a temporary directory. '''
+        self.directory = tempfile.mkdtemp()
+        self.received = []
+        self.channel = OutputChannel(os.path.join(self.directory, 'output'),
+                lambda name, value: self.received.append((name, value)))
+
+    def tearDown(self):
+        ''' Close the channel and remove the temporary directory. '''
+        self.channel.close()
+        shutil.rmtree(self.directory)
+
+    def test_records(self):
+        ''' Test that the records are parsed as soon as they are complete.
+        '''
+        first = self._connect()
+        second = self._connect()
+        record = encode_record('TEXT', u'a=b\nc\xe4')
+        first.sendall(record[:3])
+        second.sendall(encode_record('NUMBER', 3) + '\x00\x00\x00\x05{"na')
+        self._handle()
+        self.assertTrue(self.received == [('NUMBER', 3)])
+
+        first.sendall(record[3:])
+        self._handle()
+        self.assertTrue(self.received[1] == ('TEXT', 'a=b\nc\xc3\xa4'))
+        self.assertTrue(self.channel.values == {'NUMBER': 3,
+                'TEXT': 'a=b\nc\xc3\xa4'})
+
+        # the invalid records are ignored
+        second.sendall('me"}' + RECORD_HEADER.pack(2) + '[]')
+        first.close()
+        second.close()
+        self.channel.drain(1)
+        self.assertTrue(len(self.received) == 2)
+        self.assertTrue(self.channel.connections == {})
+
+    def test_too_big(self):
+        ''' Test that a connection sending a too big record gets closed. '''
+        sock = self._connect()
+        sock.sendall(RECORD_HEADER.pack(MAX_RECORD_SIZE + 1))
+        self._handle()
+        self.assertTrue(self.channel.connections == {})
+        self.assertTrue(self.received == [])
+        sock.close()
+
+    def _connect(self):
+        ''' Open a connection to the channel.
+
+            @return: The socket
+        '''
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.channel.path)
+        self.channel.handle(self.channel.listener)
+        return sock
+
+    def _handle(self):
+        ''' Read the data sent to all the connections. '''
+        for sock in self.channel.connections.keys():
+            self.channel.handle(sock)
@@ -22,6 +22,7 @@ import unittest
 import tempfile
 import json
 import os
+import time
 import shutil
 
 from snakebuild.buildagent.buildstep import BuildStep, \
@@ -72,6 +73,7 @@ class TestShellBuildStep(unittest.TestCase):
             sfl.write(script)
         with open(self.step_filename, 'w') as cfl:
             cfl.write(json.dumps(buildstep))
+        self.buildstep = buildstep
 
     def tearDown(self):
         ''' Remove the temporary directory with all its files. '''
@@ -104,3 +106,118 @@ class TestShellBuildStep(unittest.TestCase):
             # illegal value for VAR2
             result = step.run({'VAR2': 'TEST'},
                     os.path.dirname(self.step_filename))
+
+    def test_wait(self):
+        ''' Test that waiting for the script does not use CPU time and
+            that a process left running by the script does not block the
+            step.
+        '''
+        directory = os.path.dirname(self.step_filename)
+        step = self._create_step('wait', '#!/bin/sh\n'
+                'echo start\n'
+                'sleep 1\n'
+                'echo end\n'
+                '(sleep 10 &)\n')
+        logfile = os.path.join(directory, 'wait.log')
+
+        cpu = sum(os.times()[:2])
+        start = time.time()
+        result = step.run({}, logfile)
+        self.assertTrue(result[0] == BuildStep.SUCCESS)
+        self.assertTrue(1 <= time.time() - start < 5)
+        self.assertTrue(sum(os.times()[:2]) - cpu < 0.3)
+        with open(logfile, 'r') as lfl:
+            self.assertTrue(lfl.read() == 'start\nend\n')
+
+    def test_log_check(self):
+        ''' Test the errors and warnings found within the output. '''
+        directory = os.path.dirname(self.step_filename)
+        checks = {'pre_condition': {}, 'post_condition': {},
+                'log_check': 'full', 'on_error': 'continue',
+                'error_patterns': ['^ERROR'], 'warning_patterns': ['^WARN']}
+        step = self._create_step('warn', '#!/bin/sh\n'
+                'echo WARN one\n'
+                'echo fine\n', checks)
+        result = step.run({}, os.path.join(directory, 'warn.log'))
+        self.assertTrue(result[0] == BuildStep.WARNING)
+        self.assertTrue(step.log_checker.warnings == 1)
+
+        # the step gets stopped with the first error
+        checks['on_error'] = 'abort'
+        step = self._create_step('abort', '#!/bin/sh\n'
+                'echo ERROR one\n'
+                'sleep 10\n'
+                'echo end\n', checks)
+        start = time.time()
+        result = step.run({}, os.path.join(directory, 'abort.log'))
+        self.assertTrue(time.time() - start < 5)
+        self.assertTrue(result[0] == BuildStep.ERROR)
+        self.assertTrue(step.log_checker.errors == 1)
+        with open(os.path.join(directory, 'abort.log'), 'r') as lfl:
+            self.assertTrue(lfl.read() == 'ERROR one\n')
+
+        checks['error_patterns'] = ['(unclosed']
+        step = self._create_step('invalid', '#!/bin/sh\n', checks)
+        with self.assertRaises(BuildStepException):
+            step.run({}, os.path.join(directory, 'invalid.log'))
+
+    def test_exit_code(self):
+        ''' Test that a script ending with an exit code other than 0 fails
+            even if the output does not show any error.
+        '''
+        directory = os.path.dirname(self.step_filename)
+        checks = {'pre_condition': {}, 'post_condition': {},
+                'log_check': 'full', 'on_error': 'abort',
+                'error_patterns': ['^ERROR'], 'warning_patterns': ['^WARN']}
+        for on_error in ('abort', 'continue'):
+            checks['on_error'] = on_error
+            step = self._create_step('exit', '#!/bin/sh\n'
+                    'exit 1\n', checks)
+            result = step.run({}, os.path.join(directory, 'exit.log'))
+            self.assertTrue(result == (BuildStep.ERROR, {}))
+            self.assertTrue(step.log_checker.errors == 0)
+
+        step = self._create_step('exit', '#!/bin/sh\n'
+                'echo WARN one\n'
+                'exit 0\n', checks)
+        result = step.run({}, os.path.join(directory, 'exit.log'))
+        self.assertTrue(result[0] == BuildStep.WARNING)
+
+    def test_output(self):
+        ''' Test the output values received while the script runs. '''
+        directory = os.path.dirname(self.step_filename)
+        step = self._create_step('output', '#!/bin/sh\n'
+                'sb_set TEXT "a=b\nc"\n'
+                'sb_set --json COUNT 3\n'
+                'sb_set --json LIST \'[1, "x"]\'\n'
+                'sb_set COUNT "x"\n'
+                'sleep 1\n')
+        step.output_vars = {'COUNT': {'type': 'int', 'description': ''},
+                'TEXT': {'type': 'str', 'description': ''}}
+        received = []
+        step.output_callback = lambda name, value: received.append((name,
+                value, time.time()))
+
+        start = time.time()
+        result = step.run({}, os.path.join(directory, 'output.log'))
+        self.assertTrue(result == (BuildStep.SUCCESS, {'TEXT': 'a=b\nc',
+                'COUNT': 3, 'LIST': [1, 'x']}))
+        # the illegal value is ignored
+        self.assertTrue([(name, value) for name, value, when in received] ==
+                [('TEXT', 'a=b\nc'), ('COUNT', 3), ('LIST', [1, 'x'])])
+        self.assertTrue(all(when - start < 0.9 for name, value, when
+                in received))
+
+    def _create_step(self, name, script, checks=None):
+        ''' Create a build step running the given script. '''
+        directory = os.path.dirname(self.step_filename)
+        buildstep = dict(self.buildstep, name=name, input={},
+                script=os.path.join(directory, '{0}.sh'.format(name)))
+        if checks is not None:
+            buildstep['checks'] = checks
+        with open(buildstep['script'], 'w') as sfl:
+            sfl.write(script)
+        step_filename = os.path.join(directory, '{0}.step'.format(name))
+        with open(step_filename, 'w') as cfl:
+            cfl.write(json.dumps(buildstep))
+        return load_step(step_filename)
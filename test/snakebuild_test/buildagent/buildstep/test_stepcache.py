@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the cache of the build step results. '''
+
+import unittest
+import tempfile
+import json
+import os
+import shutil
+
+from snakebuild.buildagent.buildstep import BuildStep, StepCache, load_step
+
+
+class TestStepCache(unittest.TestCase):
+    ''' The unit test for the snake build StepCache class. '''
+    def setUp(self):
+        ''' Create the directory with the step, its working directory and the
+            cache.
+        '''
+        self.directory = tempfile.mkdtemp()
+        self.workdir = os.path.join(self.directory, 'work')
+        self.cachedir = os.path.join(self.directory, 'cache')
+        os.makedirs(self.workdir)
+        self.script = os.path.join(self.directory, 'step.sh')
+        with open(self.script, 'w') as sfl:
+            sfl.write('#!/bin/sh\n'
+                    'echo run $VAR\n'
+                    'echo run >> {0}/runs\n'
+                    'mkdir -p {0}/out\n'
+                    'echo $VAR > {0}/out/result.txt\n'
+                    'sb_set VALUE "$VAR"\n'.format(self.workdir))
+        self.logfile = os.path.join(self.directory, 'step.log')
+
+    def tearDown(self):
+        ''' Remove the temporary directory with all its files. '''
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def test_run(self):
+        ''' Test that a step with the same input does not run again. '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+
+        result = cache.run(step, {'VAR': 'one'}, self.logfile, 'abc',
+                self.workdir)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        self.assertTrue(self._runs() == 1)
+        key = cache.get_key(step, {'VAR': 'one'}, 'abc')
+        self.assertTrue(cache.has(key))
+
+        # the cached result restores the log and the artifacts
+        os.remove(self.logfile)
+        shutil.rmtree(os.path.join(self.workdir, 'out'))
+        result = cache.run(step, {'VAR': 'one', 'OTHER': 'x'}, self.logfile,
+                'abc', self.workdir)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        self.assertTrue(isinstance(result[1]['VALUE'], str))
+        self.assertTrue(self._runs() == 1)
+        self.assertTrue(step.output_dictionary == {'VALUE': 'one'})
+        with open(self.logfile, 'r') as lfl:
+            self.assertTrue(lfl.read() == 'run one\n')
+        with open(os.path.join(self.workdir, 'out', 'result.txt')) as rfl:
+            self.assertTrue(rfl.read() == 'one\n')
+
+        # other values, revision or script run the step
+        cache.run(step, {'VAR': 'two'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 2)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'def', self.workdir)
+        self.assertTrue(self._runs() == 3)
+        with open(self.script, 'a') as sfl:
+            sfl.write('echo changed\n')
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 4)
+
+        # the results stored are found again
+        cache = StepCache(self.cachedir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 4)
+        self.assertTrue(len(cache.entries) == 4)
+
+    def test_not_cacheable(self):
+        ''' Test the step which opts out of the cache. '''
+        step = self._create_step(False)
+        cache = StepCache(self.cachedir)
+        self.assertTrue(cache.get_key(step, {'VAR': 'one'}, 'abc') is None)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 2)
+        self.assertTrue(cache.entries == {})
+
+        # without the revision of the sources nothing is cached
+        step = self._create_step()
+        self.assertTrue(cache.get_key(step, {'VAR': 'one'}) is None)
+        cache.run(step, {'VAR': 'one'}, self.logfile, None, self.workdir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, None, self.workdir)
+        self.assertTrue(self._runs() == 4)
+        self.assertTrue(cache.entries == {})
+
+    def test_evict(self):
+        ''' Test that the least recently used results get removed. '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        size = cache.size
+        cache.max_size = size * 2
+
+        cache.run(step, {'VAR': 'two'}, self.logfile, 'abc', self.workdir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 2)
+        cache.run(step, {'VAR': 'six'}, self.logfile, 'abc', self.workdir)
+        self.assertTrue(self._runs() == 3)
+        self.assertTrue(cache.size <= size * 2)
+        self.assertTrue(cache.has(cache.get_key(step, {'VAR': 'one'}, 'abc')))
+        self.assertFalse(cache.has(cache.get_key(step, {'VAR': 'two'}, 'abc')))
+        self.assertFalse(os.path.isdir(cache._get_path(cache.get_key(step,
+                {'VAR': 'two'}, 'abc'))))
+
+    def test_dedup(self):
+        ''' Test that the same log and artifacts are stored only once. '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        size = cache.blob_store.size
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'def', self.workdir)
+        self.assertTrue(self._runs() == 2)
+        self.assertTrue(len(cache.entries) == 2)
+        self.assertTrue(cache.blob_store.size == size)
+
+        # the blobs are kept as long as a result uses them
+        cache.max_size = 1
+        cache._evict()
+        self.assertTrue(cache.entries == {})
+        self.assertTrue(cache.blob_store.size == 0)
+        self.assertTrue(cache.blobs == {})
+
+    def test_restore_pinned(self):
+        ''' Test that the result is extracted without the lock held and is
+            not evicted while it gets restored.
+        '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        key = cache.get_key(step, {'VAR': 'one'}, 'abc')
+        extract = cache.blob_store.extract
+
+        def evicting_extract(digest, target):
+            ''' Evict all results while the first blob gets extracted. '''
+            self.assertTrue(cache.lock.acquire(False))
+            try:
+                if cache.max_size == 0:
+                    cache.max_size = 1
+                    cache._evict()
+                    self.assertTrue(key in cache.entries)
+            finally:
+                cache.lock.release()
+            extract(digest, target)
+
+        cache.blob_store.extract = evicting_extract
+        os.remove(self.logfile)
+        result = cache.restore(key, step, self.logfile, self.workdir)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        with open(self.logfile, 'r') as lfl:
+            self.assertTrue(lfl.read() == 'run one\n')
+
+        # the result is evicted as soon as the restore is done
+        self.assertTrue(cache.pinned == {})
+        self.assertFalse(cache.has(key))
+        self.assertTrue(cache.size == 0)
+        self.assertTrue(cache.entries_size == 0)
+
+    def test_store_failed(self):
+        ''' Test that the blobs of a result which could not be stored are
+            removed again.
+        '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+        add_file = cache.blob_store.add_file
+
+        def failing_add_file(path):
+            ''' Fail to add the log after the artifacts got added. '''
+            if path == self.logfile:
+                raise IOError('disk full')
+            return add_file(path)
+
+        cache.blob_store.add_file = failing_add_file
+        result = cache.run(step, {'VAR': 'one'}, self.logfile, 'abc',
+                self.workdir)
+        self.assertTrue(result == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        self.assertTrue(cache.entries == {})
+        self.assertTrue(cache.blob_store.size == 0)
+        for dirpath, dirnames, filenames in os.walk(os.path.join(
+                self.cachedir, 'store')):
+            self.assertTrue(filenames == [])
+
+    def test_stray_files(self):
+        ''' Test that the files not created by the cache are ignored. '''
+        step = self._create_step()
+        cache = StepCache(self.cachedir)
+        cache.run(step, {'VAR': 'one'}, self.logfile, 'abc', self.workdir)
+        with open(os.path.join(self.cachedir, 'README'), 'w') as rfl:
+            rfl.write('the cache of the build steps\n')
+        os.makedirs(os.path.join(self.cachedir, 'other'))
+
+        cache = StepCache(self.cachedir)
+        self.assertTrue(len(cache.entries) == 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.cachedir,
+                'README')))
+        self.assertTrue(os.path.isdir(os.path.join(self.cachedir, 'other')))
+
+    def _create_step(self, cache=True):
+        ''' Create the build step.
+
+            @param cache: The cache entry of the step
+            @return: The loaded step
+        '''
+        filename = os.path.join(self.directory, 'step.step')
+        buildstep = {'name': 'cached', 'description': '', 'type': 'shell',
+                'script': self.script,
+                'input': {'VAR': {'type': 'str', 'description': ''}},
+                'output': {'VALUE': {'type': 'str', 'description': ''}},
+                'checks': {'log_check': 'none', 'on_error': 'abort'},
+                'artifacts': ['out/*.txt'], 'cache': cache}
+        with open(filename, 'w') as cfl:
+            cfl.write(json.dumps(buildstep))
+        return load_step(filename)
+
+    def _runs(self):
+        ''' Get the number of times the step ran.
+
+            @return: The number of runs
+        '''
+        with open(os.path.join(self.workdir, 'runs'), 'r') as rfl:
+            return len(rfl.readlines())
@@ -23,6 +23,7 @@ import unittest
 from test_buildagent import TestBuildAgent
 import buildstep
 from test_commands import TestCommands
+from test_logtail import TestLogTail
 
 
 def suite():
@@ -30,5 +31,6 @@ def suite():
     agent = unittest.TestLoader().loadTestsFromTestCase(TestBuildAgent)
     buildstep_test = buildstep.suite()
     commands = unittest.TestLoader().loadTestsFromTestCase(TestCommands)
+    logtail = unittest.TestLoader().loadTestsFromTestCase(TestLogTail)
 
-    return unittest.TestSuite([agent, buildstep_test, commands])
+    return unittest.TestSuite([agent, buildstep_test, commands, logtail])
@@ -18,19 +18,105 @@
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 ''' The unit test for the build agent instance commands. '''
 
+import os
+import shutil
 import unittest
 
+from snakebuild.common.appdirs import tmp_data_dir
+from snakebuild.common.versioneddir import ReposConfig
+from snakebuild.buildagent.buildagent import BuildAgent
+from test_helpers.versioneddir_helper import create_versioned_dir_all, \
+        remove_versioned_dir
+
 
 class TestBuildAgent(unittest.TestCase):
     ''' The unit test for the snake build build agent instance.
     '''
     def setUp(self):
-        ''' Setup the test case. Create a directory for the test resources. If
-            it allready exists remove it.
+        ''' Setup the test case. Create a repository for the job and a
+            directory for the agent. If it allready exists remove it.
         '''
-        pass
+        self.repo, self.base_dir = create_versioned_dir_all('agentjob')
+        self.path = os.path.join(tmp_data_dir(), 'snakebuild_agent_local')
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+
+        tfile = open(self.repo.get_local_path('build.sh'), 'w')
+        tfile.write('make')
+        tfile.close()
+        self.repo.add('build.sh')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'added build.sh')
+        self.repo.tag('v1.0', 'Tester', 'test@snakebuild.org', 'first')
+        self.repo.push_remote()
+        self.repo.close()
+
+    def tearDown(self):
+        remove_versioned_dir('agentjob')
+        shutil.rmtree(self.path, True)
 
     def test_agent(self):
         ''' Test the agent
         '''
-        pass
+        agent = BuildAgent(ReposConfig(ReposConfig.GIT, self.base_dir),
+                self.path)
+        self.assertTrue(agent.start_build('agentjob', 'v1.0'))
+        self.assertTrue(agent.status())
+        path = agent.get_worktree('agentjob').path
+        self.assertTrue(os.path.isfile(os.path.join(path, 'build.sh')))
+        agent.finish_build('agentjob')
+        self.assertFalse(agent.status())
+        self.assertTrue(agent.get_worktree('agentjob') is None)
+
+        # the checkout gets reused
+        self.assertTrue(agent.start_build('agentjob', 'master'))
+        self.assertTrue(agent.get_worktree('agentjob').path == path)
+        agent.finish_build('agentjob')
+
+        self.assertFalse(agent.start_build('agentjob', 'unknown'))
+        self.assertFalse(agent.status())
+        agent.shutdown()
+        self.assertFalse(os.path.exists(path))
+
+    def test_parallel_builds(self):
+        ''' Test multiple builds of the same job at once, each build gets
+            its own checkout.
+        '''
+        agent = BuildAgent(ReposConfig(ReposConfig.GIT, self.base_dir),
+                self.path)
+        self.assertTrue(agent.start_build('agentjob', 'v1.0', 1))
+        self.assertTrue(agent.start_build('agentjob', 'v1.0', 2))
+        self.assertFalse(agent.start_build('agentjob', 'v1.0', 2))
+        first = agent.get_worktree(1).path
+        second = agent.get_worktree(2).path
+        self.assertTrue(first != second)
+
+        agent.finish_build(1)
+        self.assertTrue(agent.status())
+        self.assertTrue(agent.get_worktree(2).path == second)
+        # the released checkout is used for the next build
+        self.assertTrue(agent.start_build('agentjob', 'master', 3))
+        self.assertTrue(agent.get_worktree(3).path == first)
+
+        agent.abort_build(2)
+        agent.shutdown()
+        self.assertFalse(agent.status())
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+    def test_mirror(self):
+        ''' Test that the job gets cloned through the mirror if the
+            repository config has a mirror path.
+        '''
+        mirror_path = os.path.join(self.path, 'mirrors')
+        os.makedirs(mirror_path)
+        agent = BuildAgent(ReposConfig(ReposConfig.GIT, self.base_dir,
+                mirror_path), os.path.join(self.path, 'jobs'))
+        self.assertTrue(agent.start_build('agentjob', 'v1.0'))
+        self.assertTrue(os.path.isdir(os.path.join(mirror_path,
+                'agentjob.git')))
+        with open(os.path.join(self.path, 'jobs', 'agentjob', '.git',
+                'objects', 'info', 'alternates')) as alternates:
+            self.assertTrue(mirror_path in alternates.read())
+        agent.finish_build('agentjob')
+        agent.shutdown()
@@ -18,12 +18,17 @@
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 ''' The unit test for the resource server commands. '''
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from snakebuild.communication.server import REMOTE_COMMANDS
 # this needs to be imported to fill the REMOTE_COMMANDS
 import snakebuild.buildagent.agentcmds
-from snakebuild.communication.commandstructure import FUNCTION, SUCCESS, ERROR
+from snakebuild.buildagent.buildagent import BuildAgent
+from snakebuild.communication.commandstructure import FUNCTION, SUCCESS, \
+        ERROR, DeferredAnswer
 
 
 class TestCommands(unittest.TestCase):
@@ -46,3 +51,47 @@ class TestCommands(unittest.TestCase):
         self.assertTrue(len(result) == 1)
         self.assertTrue(type(result) == dict)
         self.assertTrue(result['status'] == SUCCESS)
+
+    def test_log_tail_cmd(self):
+        ''' Test the log_tail command.
+        '''
+        directory = tempfile.mkdtemp()
+        agent = BuildAgent(None, log_dir=directory)
+        log_tail = REMOTE_COMMANDS['log_tail'][FUNCTION]
+        try:
+            with open(os.path.join(directory, 'step.log'), 'w') as logf:
+                logf.write('output\n')
+
+            result = log_tail(agent, 'step.log')
+            self.assertTrue(result['status'] == SUCCESS)
+            self.assertTrue(result['data'] == 'output\n')
+            self.assertTrue(result['offset'] == 7)
+
+            # wait for the log to grow
+            result = log_tail(agent, 'step.log', 7, wait=5)
+            self.assertTrue(isinstance(result, DeferredAnswer))
+            self.assertFalse(result.done)
+            with open(os.path.join(directory, 'step.log'), 'a') as logf:
+                logf.write('more\n')
+            answer = result.wait(5)
+            self.assertTrue(answer['data'] == 'more\n')
+            self.assertTrue(answer['offset'] == 12)
+
+            # a cancelled request stops waiting
+            result = log_tail(agent, 'step.log', 12, wait=5)
+            result.cancel()
+            self.assertTrue(agent.logs.files == {})
+
+            # no wait time, no waiting
+            result = log_tail(agent, 'step.log', 12)
+            self.assertTrue(result['data'] == '')
+
+            for args in (('missing.log',), ('step.log', -1),
+                    ('step.log', 0, 0), ('step.log', 0, 10, 'x')):
+                result = log_tail(agent, *args)
+                self.assertTrue(result['status'] == ERROR)
+            result = log_tail(BuildAgent(None), 'step.log')
+            self.assertTrue(result['status'] == ERROR)
+        finally:
+            agent.shutdown()
+            shutil.rmtree(directory)
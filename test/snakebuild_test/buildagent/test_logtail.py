@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the build agent instance commands. '''
+''' The unit test for the access to the logs of the build steps. '''
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from snakebuild.buildagent.logtail import LogTail, LogTailException
+from snakebuild.buildagent.buildagent import BuildAgent as LocalBuildAgent
+from snakebuild.buildagent.buildstep import BuildStep, load_step
+from snakebuild.remote.buildagent import BuildAgent
+from snakebuild.communication.server import ThreadedTCPServer, \
+        REMOTE_COMMANDS
+from snakebuild.communication.messagehandler import MessageHandler
+# this needs to be imported to fill the REMOTE_COMMANDS
+import snakebuild.buildagent.agentcmds
+
+
+class TestLogTail(unittest.TestCase):
+    ''' The unit test for the snake build LogTail class. '''
+    def setUp(self):
+        ''' Create a directory with a log. '''
+        self.directory = tempfile.mkdtemp()
+        self.logfile = open(os.path.join(self.directory, 'step.log'), 'w')
+        self.tails = []
+
+    def tearDown(self):
+        for tail in self.tails:
+            tail.close()
+        self.logfile.close()
+        shutil.rmtree(self.directory)
+
+    def test_read(self):
+        ''' Test reading the log piece by piece. '''
+        tail = self._create_tail()
+        self._write('first line\n\xc3\xa4\n')
+        answer = tail.read('step.log')
+        self.assertTrue(answer == {'data': u'first line\n\xe4\n',
+                'offset': 14, 'size': 14, 'finished': False})
+
+        # a piece does not end within a character
+        answer = tail.read('step.log', 0, 12)
+        self.assertTrue(answer['data'] == 'first line\n')
+        self.assertTrue(answer['offset'] == 11)
+        answer = tail.read('step.log', 11, 2)
+        self.assertTrue(answer['data'] == u'\xe4')
+        self.assertTrue(tail.read('step.log', 20)['data'] == '')
+        self.assertTrue(tail.read('step.log', 20)['offset'] == 14)
+
+        tail.finish('step.log')
+        self.assertFalse(tail.read('step.log', 0, 5)['finished'])
+        self.assertTrue(tail.read('step.log', 14)['finished'])
+
+        for name in ('missing.log', '../step.log', '/etc/passwd'):
+            with self.assertRaises(LogTailException):
+                tail.read(name)
+
+    def test_partial_character(self):
+        ''' Test that the start of a character at the end of a log which is
+            written is read with the rest of the character.
+        '''
+        tail = self._create_tail()
+        self._write('abc\xc3')
+        answer = tail.read('step.log')
+        self.assertTrue(answer['data'] == 'abc')
+        self.assertTrue(answer['offset'] == 3)
+        self.assertTrue(answer['size'] == 4)
+
+        called = threading.Event()
+        tail.wait('step.log', 3, called.set)
+        self.assertFalse(called.wait(0.3))
+        self._write('\xa9')
+        self.assertTrue(called.wait(5))
+        answer = tail.read('step.log', 3)
+        self.assertTrue(answer['data'] == u'\xe9')
+        self.assertTrue(answer['offset'] == 5)
+
+        # the log ends with a broken character
+        self._write('\xc3')
+        self.assertTrue(tail.read('step.log', 5)['data'] == '')
+        tail.finish('step.log')
+        answer = tail.read('step.log', 5)
+        self.assertTrue(answer['data'] == u'\ufffd')
+        self.assertTrue(answer['finished'])
+
+    def test_wait(self):
+        ''' Test waiting for the log with inotify. '''
+        self._test_wait(self._create_tail())
+
+    def test_wait_polling(self):
+        ''' Test waiting for the log without inotify. '''
+        self._test_wait(self._create_tail(False))
+
+    def _test_wait(self, tail):
+        ''' Test waiting for the log. '''
+        called = [threading.Event() for cnt in range(4)]
+        first = tail.wait('step.log', 0, called[0].set)
+        second = tail.wait('step.log', 0, called[1].set)
+        # both share one file
+        self.assertTrue(first.logfile is second.logfile)
+        self.assertTrue(len(tail.files) == 1)
+        self.assertFalse(called[0].is_set())
+
+        self._write('line\n')
+        self.assertTrue(called[0].wait(5))
+        self.assertTrue(called[1].wait(5))
+        self.assertTrue(tail.files == {})
+
+        # timeout, cancel and finish
+        start = time.time()
+        tail.wait('step.log', 5, called[2].set, 0.2)
+        self.assertTrue(called[2].wait(5))
+        self.assertTrue(time.time() - start >= 0.2)
+        cancelled = tail.wait('step.log', 5, lambda: self.fail('called'))
+        cancelled.cancel()
+        tail.wait('step.log', 5, called[3].set)
+        tail.finish('step.log')
+        self.assertTrue(called[3].wait(5))
+        self.assertTrue(tail.files == {})
+
+    def test_follow(self):
+        ''' Test following the log remotely while it gets written. '''
+        agent, server, remote = self._create_agent()
+        pieces = []
+
+        def writer():
+            ''' Write the log in pieces and finish it. '''
+            for cnt in range(5):
+                time.sleep(0.05)
+                self._write('line {0}\n'.format(cnt))
+            agent.logs.finish('step.log')
+
+        try:
+            write = threading.Thread(target=writer)
+            write.start()
+            for data in remote.follow_log('step.log', 0, 5):
+                pieces.append(data)
+            write.join()
+            self.assertTrue(''.join(pieces) == ''.join('line {0}\n'.format(
+                    cnt) for cnt in range(5)))
+            self.assertTrue(len(pieces) > 1)
+            answer = remote.get_log('step.log', 7)
+            self.assertTrue(answer['data'] == ''.join(pieces)[7:])
+            self.assertTrue(answer['finished'])
+        finally:
+            remote.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_follow_step(self):
+        ''' Test that following the log of a build step ends as soon as the
+            step is finished.
+        '''
+        agent, server, remote = self._create_agent()
+        step = self._create_step('for cnt in 0 1 2 3 4; do\n'
+                '  echo line $cnt\n  sleep 0.05\ndone\n')
+        pieces = []
+        result = []
+
+        def follower():
+            ''' Follow the log until it is finished. '''
+            for data in remote.follow_log('run.log', 0, 5):
+                pieces.append(data)
+
+        try:
+            run = threading.Thread(target=lambda: result.append(
+                    agent.run_step(step, {}, 'run.log')))
+            run.start()
+            while not os.path.exists(os.path.join(self.directory,
+                    'run.log')):
+                time.sleep(0.01)
+            follow = threading.Thread(target=follower)
+            follow.daemon = True
+            follow.start()
+            run.join()
+            follow.join(10)
+            self.assertFalse(follow.is_alive())
+            self.assertTrue(result[0][0] == BuildStep.SUCCESS)
+            self.assertTrue(''.join(pieces) == ''.join('line {0}\n'.format(
+                    cnt) for cnt in range(5)))
+
+            # the next run writes the log again, it is not finished
+            self.assertTrue(remote.get_log('run.log')['finished'])
+            with open(os.path.join(self.directory, 'run.log'), 'w') as logf:
+                logf.write('again\n')
+            self.assertFalse(remote.get_log('run.log')['finished'])
+        finally:
+            remote.close()
+            server.shutdown()
+            server.server_close()
+
+    def _create_agent(self):
+        ''' Create the build agent for the directory and a remote client
+            for it.
+
+            @return: (local agent, server, remote agent)
+        '''
+        agent = LocalBuildAgent(None, log_dir=self.directory)
+        self.tails.append(agent.logs)
+        server = ThreadedTCPServer(('localhost', 0), MessageHandler)
+        server.commands = REMOTE_COMMANDS
+        server.data = agent
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return agent, server, BuildAgent('localhost',
+                server.server_address[1], True)
+
+    def _create_step(self, script):
+        ''' Create a shell build step running the given script.
+
+            @param script: The shell script
+            @return: The BuildStep object
+        '''
+        step_dir = os.path.join(self.directory, 'steps')
+        os.mkdir(step_dir)
+        script_file = os.path.join(step_dir, 'run.sh')
+        with open(script_file, 'w') as sfl:
+            sfl.write(script)
+        step_file = os.path.join(step_dir, 'run.step')
+        with open(step_file, 'w') as cfl:
+            cfl.write(json.dumps({'name': 'Run', 'description': 'Run it',
+                    'type': 'shell', 'shell': '/bin/sh',
+                    'script': script_file, 'input': {}, 'output': {},
+                    'checks': {'pre_condition': {}, 'post_condition': {},
+                    'log_check': 'none', 'on_error': 'abort'}}))
+        return load_step(step_file)
+
+    def _create_tail(self, use_inotify=True):
+        ''' Create the LogTail object for the directory. '''
+        tail = LogTail(self.directory, 0.05, use_inotify)
+        self.tails.append(tail)
+        return tail
+
+    def _write(self, data):
+        ''' Append the data to the log. '''
+        self.logfile.write(data)
+        self.logfile.flush()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the build cache of the build server and its commands.
+'''
+
+import hashlib
+import shutil
+import tempfile
+import unittest
+
+from snakebuild.communication.server import REMOTE_COMMANDS
+# this needs to be imported to fill the REMOTE_COMMANDS
+import snakebuild.buildserver.servercmds
+from snakebuild.communication.commandstructure import FUNCTION, SUCCESS, \
+        ERROR, BinaryAnswer
+from snakebuild.buildserver.buildcache import BuildCache, \
+        BuildCacheException
+
+
+class TestBuildCache(unittest.TestCase):
+    ''' The unit test for the snake build BuildCache class. '''
+    def setUp(self):
+        ''' Create the cache within a temporary directory. '''
+        self.directory = tempfile.mkdtemp()
+        self.cache = BuildCache(self.directory)
+
+    def tearDown(self):
+        ''' Remove the temporary directory with all its files. '''
+        shutil.rmtree(self.directory)
+
+    def test_blobs(self):
+        ''' Test storing the blobs from chunks. '''
+        first, second = 'artifact ', 'data\n'
+        digest = hashlib.sha1(first + second).hexdigest()
+        chunks = [hashlib.sha1(first).hexdigest(),
+                hashlib.sha1(second).hexdigest()]
+        manifest = {'size': 14, 'chunks': [[chunks[0], 9], [chunks[1], 5]]}
+        self.assertTrue(self.cache.get_manifest(digest) is None)
+
+        # all the chunks must be stored first
+        self.cache.put_chunk(chunks[0], first)
+        self.assertTrue(self.cache.has(blobs=[digest], chunks=chunks) ==
+                ([], [], [chunks[0]]))
+        self.assertRaises(BuildCacheException, self.cache.put_blob, digest,
+                manifest)
+        self.cache.put_chunk(chunks[1], second)
+        self.cache.put_blob(digest, manifest)
+        self.assertTrue(self.cache.has(blobs=[digest]) == ([], [digest], []))
+        self.assertTrue(self.cache.get_manifest(digest) == manifest)
+
+        path, offset, length, size = self.cache.locate(digest, 11)
+        self.assertTrue((offset, length, size) == (2, 3, 14))
+        with open(path, 'rb') as cfl:
+            self.assertTrue(cfl.read() == second)
+
+        # the data must match the hash
+        self.assertRaises(BuildCacheException, self.cache.put_chunk,
+                hashlib.sha1('other').hexdigest(), 'wrong')
+        self.assertRaises(BuildCacheException, self.cache.put_blob,
+                hashlib.sha1('other').hexdigest(), manifest)
+        self.assertRaises(BuildCacheException, self.cache.put_chunk,
+                '../../etc', 'wrong')
+        self.assertRaises(BuildCacheException, self.cache.locate,
+                hashlib.sha1('other').hexdigest(), 0)
+
+    def test_results(self):
+        ''' Test storing the results. '''
+        key = hashlib.sha1('key').hexdigest()
+        log = hashlib.sha1('log').hexdigest()
+        result = {'status': 5, 'output': {'VALUE': 'x'}, 'log': log,
+                'artifacts': {}}
+        self.assertTrue(self.cache.get_result(key) is None)
+        # the blobs must be stored first
+        self.assertRaises(BuildCacheException, self.cache.put_result, key,
+                result)
+        self.cache.put_chunk(log, 'log')
+        self.cache.put_blob(log, {'size': 3, 'chunks': [[log, 3]]})
+        self.cache.put_result(key, result)
+        self.assertTrue(self.cache.get_result(key) == result)
+        self.assertTrue(self.cache.has([key, log]) == ([key], [], []))
+        self.assertRaises(BuildCacheException, self.cache.put_result, key,
+                {'status': 'x'})
+        for invalid in ('../../etc/passwd', key.upper(), None):
+            self.assertRaises(BuildCacheException, self.cache.get_result,
+                    invalid)
+            self.assertRaises(BuildCacheException, self.cache.put_result,
+                    invalid, result)
+
+    def test_commands(self):
+        ''' Test the commands of the build cache. '''
+        key = hashlib.sha1('key').hexdigest()
+        digest = hashlib.sha1('log data').hexdigest()
+        chunk = hashlib.sha1('log data').hexdigest()
+        chunk_put = REMOTE_COMMANDS['chunk_put'][FUNCTION]
+        blob_put = REMOTE_COMMANDS['blob_put'][FUNCTION]
+        blob_get = REMOTE_COMMANDS['blob_get'][FUNCTION]
+        blob_manifest = REMOTE_COMMANDS['blob_manifest'][FUNCTION]
+        manifest = {'size': 8, 'chunks': [[chunk, 8]]}
+
+        self.assertTrue(blob_put(self.cache, digest, manifest)['status'] ==
+                ERROR)
+        self.assertTrue(chunk_put(self.cache, chunk)['status'] == ERROR)
+        self.assertTrue(chunk_put(self.cache, chunk, 'wrong')['status'] ==
+                ERROR)
+        self.assertTrue(chunk_put(self.cache, chunk, 'log data')['status'] ==
+                SUCCESS)
+        self.assertTrue(blob_put(self.cache, digest, manifest)['status'] ==
+                SUCCESS)
+        result = blob_manifest(self.cache, digest)
+        self.assertTrue(result['manifest'] == manifest)
+        self.assertTrue(blob_manifest(self.cache, key)['status'] == ERROR)
+
+        result = blob_get(self.cache, digest, 4)
+        self.assertTrue(isinstance(result, BinaryAnswer))
+        self.assertTrue(result.answer['status'] == SUCCESS)
+        self.assertTrue(result.read() == 'data')
+        self.assertTrue(result.answer['offset'] == 8)
+        self.assertTrue(result.answer['size'] == 8)
+        self.assertTrue(result.answer['finished'])
+        result = blob_get(self.cache, digest, 8)
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['finished'])
+        self.assertTrue(blob_get(self.cache, digest, -1)['status'] == ERROR)
+        self.assertTrue(blob_get(self.cache, key)['status'] == ERROR)
+
+        result = REMOTE_COMMANDS['cache_get'][FUNCTION](self.cache, key)
+        self.assertTrue(result['status'] == ERROR)
+        result = REMOTE_COMMANDS['cache_put'][FUNCTION](self.cache, key,
+                {'status': 5, 'output': {}, 'log': digest, 'artifacts': {}})
+        self.assertTrue(result['status'] == SUCCESS)
+        result = REMOTE_COMMANDS['cache_get'][FUNCTION](self.cache, key)
+        self.assertTrue(result['result']['log'] == digest)
+        result = REMOTE_COMMANDS['cache_has'][FUNCTION](self.cache, [key],
+                [digest, key], [chunk, key])
+        self.assertTrue(result['keys'] == [key])
+        self.assertTrue(result['blobs'] == [digest])
+        self.assertTrue(result['chunks'] == [chunk])
+        result = REMOTE_COMMANDS['cache_has'][FUNCTION](self.cache, 'x')
+        self.assertTrue(result['status'] == ERROR)
@@ -25,6 +25,13 @@ from test_output import TestOutput
 from test_appdirs import TestAppdirs
 from test_filetools import TestFileTools
 from test_versioneddir import TestVersionedDir
+from test_timerqueue import TestTimerQueue
+from test_gitobjects import TestGitObjects
+from test_gitrefs import TestGitRefs
+from test_worktreepool import TestWorktreePool
+from test_commitbatcher import TestCommitBatcher
+from test_inotify import TestInotify
+from test_chunkstore import TestChunkStore
 
 
 def suite():
@@ -34,5 +41,14 @@ def suite():
     app = unittest.TestLoader().loadTestsFromTestCase(TestAppdirs)
     ftools = unittest.TestLoader().loadTestsFromTestCase(TestFileTools)
     verd = unittest.TestLoader().loadTestsFromTestCase(TestVersionedDir)
+    timers = unittest.TestLoader().loadTestsFromTestCase(TestTimerQueue)
+    objects = unittest.TestLoader().loadTestsFromTestCase(TestGitObjects)
+    refs = unittest.TestLoader().loadTestsFromTestCase(TestGitRefs)
+    pool = unittest.TestLoader().loadTestsFromTestCase(TestWorktreePool)
+    batcher = unittest.TestLoader().loadTestsFromTestCase(
+            TestCommitBatcher)
+    inotify = unittest.TestLoader().loadTestsFromTestCase(TestInotify)
+    chunks = unittest.TestLoader().loadTestsFromTestCase(TestChunkStore)
 
-    return unittest.TestSuite([conf, out, app, ftools, verd])
+    return unittest.TestSuite([conf, out, app, ftools, verd, timers,
+            objects, refs, pool, batcher, inotify, chunks])
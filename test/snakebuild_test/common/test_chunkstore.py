@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the snake build common ChunkStore class. '''
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from snakebuild.common import chunkstore
+from snakebuild.common.chunkstore import ChunkStore, ChunkStoreException, \
+        get_file_manifest
+
+
+class TestChunkStore(unittest.TestCase):
+    ''' The unit test for the snake build common ChunkStore class. '''
+    def setUp(self):
+        ''' Create the store within a temporary directory with small chunks.
+        '''
+        self.directory = tempfile.mkdtemp()
+        self.chunk_size = chunkstore.CHUNK_SIZE
+        chunkstore.CHUNK_SIZE = 10
+        self.store = ChunkStore(os.path.join(self.directory, 'store'))
+
+    def tearDown(self):
+        ''' Remove the temporary directory with all its files. '''
+        chunkstore.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def test_add_file(self):
+        ''' Test that the chunks the files have in common are stored once.
+        '''
+        first = self._write('first', 'a' * 10 + 'b' * 10 + 'a' * 10 + 'c')
+        second = self._write('second', 'b' * 10 + 'd' * 5)
+        digest = self.store.add_file(first)
+        self.assertTrue(digest == hashlib.sha1('a' * 10 + 'b' * 10 +
+                'a' * 10 + 'c').hexdigest())
+        self.assertTrue((digest, self.store.get_manifest(digest)) ==
+                get_file_manifest(first))
+        self.assertTrue(self.store.size == 21)
+        other = self.store.add_file(second)
+        self.assertTrue(self.store.size == 26)
+        self.assertTrue(self.store.has(digest) and self.store.has(other))
+
+        # reading from an offset stops at the end of the chunk
+        self.assertTrue(self.store.read(digest, 15, 100) == 'b' * 5)
+        self.assertTrue(self.store.read(digest, 31, 100) == '')
+        path, offset, length, size = self.store.locate(digest, 30)
+        self.assertTrue((offset, length, size) == (0, 1, 31))
+        self.store.extract(digest, os.path.join(self.directory, 'copy'))
+        with open(os.path.join(self.directory, 'copy'), 'rb') as cfl:
+            with open(first, 'rb') as ffl:
+                self.assertTrue(cfl.read() == ffl.read())
+
+        # the chunks are removed with the last blob using them
+        self.store.remove(digest)
+        self.assertFalse(self.store.has(digest))
+        self.assertTrue(self.store.size == 15)
+        self.assertTrue(self.store.read(other, 0, 100) == 'b' * 10)
+
+        # a store opened again knows the chunks used
+        store = ChunkStore(os.path.join(self.directory, 'store'))
+        self.assertTrue(store.size == 15)
+        self.assertTrue(store.refs == self.store.refs)
+
+    def test_add_manifest(self):
+        ''' Test adding a blob from the chunks received. '''
+        source = ChunkStore(os.path.join(self.directory, 'source'))
+        digest = source.add_file(self._write('file', 'x' * 15))
+        manifest = source.get_manifest(digest)
+        chunks = [chunk for chunk, size in manifest['chunks']]
+        self.assertTrue(self.store.missing(chunks) == chunks)
+
+        self.store.add_chunk(chunks[0], 'x' * 10)
+        self.assertRaises(ChunkStoreException, self.store.add_manifest,
+                digest, manifest)
+        self.assertRaises(ChunkStoreException, self.store.add_chunk,
+                chunks[1], 'y' * 5)
+        self.store.add_chunk(chunks[1], 'x' * 5)
+        self.assertTrue(self.store.missing(chunks) == [])
+        self.assertRaises(ChunkStoreException, self.store.add_manifest,
+                hashlib.sha1('other').hexdigest(), manifest)
+        self.assertRaises(ChunkStoreException, self.store.add_manifest,
+                digest, {'size': 'x'})
+        self.store.add_manifest(digest, manifest)
+        self.assertTrue(self.store.read(digest, 0, 100) == 'x' * 10)
+
+        # the chunks without a blob are removed on the next start
+        self.store.add_chunk(hashlib.sha1('left').hexdigest(), 'left')
+        store = ChunkStore(os.path.join(self.directory, 'store'))
+        self.assertTrue(store.missing([hashlib.sha1('left').hexdigest()]) ==
+                [hashlib.sha1('left').hexdigest()])
+        self.assertRaises(ChunkStoreException, store.chunk_path, '../etc')
+
+    def test_concurrent_remove(self):
+        ''' Test that a blob removed while another blob using the same
+            chunks gets added does not take the chunks with it.
+        '''
+        first = self.store.add_file(self._write('first', 'a' * 10 + 'b'))
+        add_manifest = self.store._add_manifest
+
+        def remove_first(digest, manifest, counted=False):
+            ''' remove the first blob between the chunks and the manifest '''
+            self.store.remove(first)
+            add_manifest(digest, manifest, counted)
+
+        self.store._add_manifest = remove_first
+        second = self.store.add_file(self._write('second', 'a' * 10 + 'c'))
+        self.store._add_manifest = add_manifest
+        self.assertFalse(self.store.has(first))
+        self.assertTrue(self.store.read(second, 0, 100) == 'a' * 10)
+        self.assertTrue(self.store.size == 11)
+
+        # the chunks received get checked again while adding the manifest
+        source = ChunkStore(os.path.join(self.directory, 'source'))
+        digest = source.add_file(self._write('third', 'a' * 10 + 'd'))
+        manifest = source.get_manifest(digest)
+        self.store.add_chunk(manifest['chunks'][1][0], 'd')
+        self.store._add_manifest = lambda digest, manifest: (
+                self.store.remove(second), add_manifest(digest, manifest))
+        self.assertRaises(ChunkStoreException, self.store.add_manifest,
+                digest, manifest)
+        self.store._add_manifest = add_manifest
+        self.assertFalse(self.store.has(digest))
+
+    def _write(self, name, data):
+        ''' Write a file within the temporary directory.
+
+            @param name: The name of the file
+            @param data: The content of the file
+            @return: The path of the file
+        '''
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as tfl:
+            tfl.write(data)
+        return path
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the GitRefCache. '''
+''' The unit test for the snake build common CommitBatcher class. '''
+
+import os
+import unittest
+import subprocess
+
+from snakebuild.common.commitbatcher import CommitBatcher
+from snakebuild.common.versioneddir import VersionedDirException
+from test_helpers.versioneddir_helper import create_versioned_dir_all, \
+        remove_versioned_dir
+
+
+class TestCommitBatcher(unittest.TestCase):
+    ''' The unit test for the snake build common CommitBatcher class. '''
+    def setUp(self):
+        ''' Create a repository with one commit. '''
+        self.repo, base_dir = create_versioned_dir_all('batcher')
+        self.bare = os.path.join(base_dir, 'batcher.git')
+        tfile = open(self.repo.get_local_path('file1'), 'w')
+        tfile.write('file1')
+        tfile.close()
+        self.repo.add('file1')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'added file1')
+        self.repo.push_remote()
+        self.batcher = None
+
+    def tearDown(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        self.repo.close()
+        remove_versioned_dir('batcher')
+
+    def test_window(self):
+        ''' Test the changes commited together after the time window. '''
+        self.batcher = CommitBatcher(self.repo, 'Tester',
+                'test@snakebuild.org', 0.2)
+        first = self.batcher.write('conf/one', 'one', 'changed one')
+        second = self.batcher.write('conf/two', 'two')
+        third = self.batcher.remove('file1', 'removed file1')
+        self.assertTrue(first is second and second is third)
+
+        revision = first.wait(10)
+        self.assertTrue(revision is not None)
+        self.assertTrue(revision == self.repo.get_revision())
+        self.assertTrue(first.wait_pushed(10))
+        self.assertTrue(self._git(self.bare, 'rev-parse', 'master') ==
+                revision)
+        self.assertTrue(self._git(self.repo.path, 'log', '-1',
+                '--format=%B') == 'changed one\nremoved file1')
+        self.assertTrue(len(self.repo.short_log()) == 2)
+        self.assertFalse(os.path.exists(self.repo.get_local_path('file1')))
+
+        # nothing changed, no new commit
+        called = []
+        result = self.batcher.write('conf/one', 'one')
+        result.add_callback(called.append)
+        self.assertTrue(self.batcher.flush() is result)
+        self.assertTrue(called == [result])
+        self.assertTrue(result.wait() == revision)
+        self.assertTrue(len(self.repo.short_log()) == 2)
+
+    def test_max_changes(self):
+        ''' Test the commit as soon as the batch is full. '''
+        self.batcher = CommitBatcher(self.repo, 'Tester',
+                'test@snakebuild.org', 60, 3, False)
+        results = [self.batcher.write('file{0}'.format(cnt), str(cnt))
+                for cnt in range(5)]
+        revision = results[0].wait(10)
+        self.assertTrue(revision is not None)
+        self.assertFalse(results[0].wait_pushed(1))
+        self.assertTrue(results[3] is results[4])
+        self.assertTrue(results[3] is not results[0])
+        self.assertTrue(results[3].wait(0) is None)
+        self.batcher.close()
+        self.assertTrue(results[3].wait(0) == self.repo.get_revision())
+        self.assertTrue(results[3].wait(0) != revision)
+        self.assertTrue(self._git(self.bare, 'rev-parse', 'master') !=
+                revision)
+        self.batcher = None
+
+    def test_failed_write(self):
+        ''' Test that a file which can not be written fails the batch and
+            the changes do not get into the next batch.
+        '''
+        self.batcher = CommitBatcher(self.repo, 'Tester',
+                'test@snakebuild.org', 60, 100, False)
+        os.makedirs(self.repo.get_local_path(['conf', 'x']))
+        revision = self.repo.get_revision()
+        self.batcher.write('conf/one', 'one')
+        result = self.batcher.write('conf/x', 'x')
+        self.assertTrue(self.batcher.flush() is result)
+        self.assertTrue(result.wait(10) is None)
+        self.assertTrue(result.error is not None)
+        self.assertFalse(result.wait_pushed(10))
+        self.assertFalse(self.repo.has_changes())
+
+        result = self.batcher.write('conf/two', 'two')
+        self.batcher.flush()
+        self.assertTrue(result.wait(10) != revision)
+        self.assertTrue(self._git(self.repo.path, 'show', '--name-only',
+                '--format=', 'HEAD') == 'conf/two')
+
+    def test_invalid_name(self):
+        ''' Test that the files outside of the repository are refused. '''
+        self.batcher = CommitBatcher(self.repo, 'Tester',
+                'test@snakebuild.org', 60)
+        for name in ('../x', 'conf/../../x', '/tmp/x', '.git/config'):
+            self.assertRaises(VersionedDirException, self.batcher.write,
+                    name, 'x')
+            self.assertRaises(VersionedDirException, self.batcher.remove,
+                    name)
+        self.assertTrue(self.batcher.flush() is None)
+
+    def _git(self, path, *args):
+        ''' Call git within the given repository and get the output. '''
+        return subprocess.Popen(['git'] + list(args), cwd=path,
+                stdout=subprocess.PIPE).communicate()[0].strip()
@@ -68,6 +68,18 @@ class TestFileTools(unittest.TestCase):
         self.assertTrue(filetools.read_full_line(rfile) == 'Test\n')
         self.assertTrue(filetools.read_full_line(rfile) == None)
 
+    def test_disk_usage(self):
+        ''' Test the disk usage of the files within a directory. '''
+        os.makedirs(os.path.join(self.tmpdir, 'sub'))
+        for name, size in (('one', 10), ('.git', 5), ('sub/two', 20),
+                ('sub/.git', 7)):
+            with open(os.path.join(self.tmpdir, name), 'w') as wfile:
+                wfile.write('x' * size)
+        self.assertTrue(filetools.disk_usage(self.tmpdir) == 42)
+        self.assertTrue(filetools.disk_usage(self.tmpdir, ('.git',)) == 37)
+        self.assertTrue(filetools.disk_usage(os.path.join(self.tmpdir,
+                'missing')) == 0)
+
     def test_tail(self):
         ''' Test the tail function. This function allows getting the last
             few lines of a file. Depending on your configuration.
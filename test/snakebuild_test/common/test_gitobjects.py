@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the GitObjectReader. '''
+
+import unittest
+import os
+
+from snakebuild.common.gitobjects import GitObjectReader, GitObjectException
+from snakebuild.common.versioneddir import VersionedDirException
+from test_helpers.versioneddir_helper import create_versioned_dir, \
+        remove_versioned_dir
+
+
+class TestGitObjects(unittest.TestCase):
+    ''' The unit test for the snake build common GitObjectReader class and
+        the read only access of the VersionedGitDir.
+    '''
+    def setUp(self):
+        ''' Create a repository with two revisions. '''
+        self.repo = create_versioned_dir('objects')
+        self._write('file1', 'first')
+        os.mkdir(self.repo.get_local_path('dir1'))
+        self._write(['dir1', 'file2'], 'second')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'first')
+        self.first = self.repo.get_revision()
+        self._write('file1', 'changed')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'second')
+
+    def tearDown(self):
+        self.repo.close()
+        remove_versioned_dir('objects')
+
+    def test_reader(self):
+        ''' Test the reader with files, directories and the cache. '''
+        reader = GitObjectReader(self.repo.path)
+        self.assertTrue(reader.read_blob('HEAD', 'file1') == 'changed')
+        self.assertTrue(reader.read_blob(self.first, 'file1') == 'first')
+        self.assertTrue(reader.read_blob('master', 'dir1/file2') == 'second')
+        self.assertTrue(reader.read_blob('master', 'dir1') is None)
+        self.assertTrue(reader.read_blob('master', 'unknown') is None)
+        self.assertTrue(reader.read_blob('unknown', 'file1') is None)
+
+        entries = reader.list_tree('master')
+        self.assertTrue([(name, is_dir) for name, is_dir, object_id in
+                entries] == [('dir1', True), ('file1', False)])
+        self.assertTrue(reader.list_tree('master', 'file1') is None)
+        self.assertTrue(reader.resolve('master:file1') == (entries[1][2],
+                'blob'))
+
+        # the content is cached by the object id
+        self.assertTrue(entries[1][2] in reader.cache)
+        self.assertTrue(reader.read(entries[1][2]) == ('blob', 'changed'))
+        reader.cache_size = 0
+        self.assertTrue(reader.list_tree('master', 'dir1')[0][0] == 'file2')
+        self.assertTrue(reader.cache.keys() == [reader.resolve(
+                'master:dir1')[0]])
+
+        self.assertRaises(GitObjectException, reader.resolve, 'a\nb')
+        self.assertRaises(GitObjectException, reader.read, '0' * 40)
+
+        # the processes are started again after close
+        reader.close()
+        self.assertTrue(reader.read_blob('HEAD', 'file1') == 'changed')
+        reader.close()
+
+    def test_versioneddir(self):
+        ''' Test the read only access of the versioned directory. '''
+        self.assertTrue(self.repo.list_files('master') == ['file1'])
+        self.assertTrue(self.repo.list_files(self.first, 'dir1') == ['file2'])
+        self.assertTrue(self.repo.read_file(self.first, ['dir1', 'file2']) ==
+                'second')
+        self.assertTrue(self.repo.read_file('master', 'file1') == 'changed')
+        self.assertRaises(VersionedDirException, self.repo.read_file,
+                'master', 'unknown')
+        self.assertRaises(VersionedDirException, self.repo.list_files,
+                'master', 'file1')
+
+    def _write(self, name, content):
+        ''' Write the given file and add it to the repository. '''
+        tfile = open(self.repo.get_local_path(name), 'w')
+        tfile.write(content)
+        tfile.close()
+        self.repo.add(name)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the GitRefCache. '''
+
+import unittest
+import subprocess
+
+from snakebuild.common.gitrefs import GitRefCache, GitRefException
+from test_helpers.versioneddir_helper import create_versioned_dir, \
+        remove_versioned_dir
+
+
+class TestGitRefs(unittest.TestCase):
+    ''' The unit test for the snake build common GitRefCache class. '''
+    def setUp(self):
+        ''' Create a repository with one commit. '''
+        self.repo = create_versioned_dir('refs')
+        self._commit('file1')
+        self.repo.push_remote()
+
+    def tearDown(self):
+        self.repo.close()
+        remove_versioned_dir('refs')
+
+    def test_refs(self):
+        ''' Test the references read and the update of the cache. '''
+        refs = GitRefCache(self.repo.path)
+        first = self._git('rev-parse', 'HEAD')
+        self.assertTrue(refs.get_head() == ('refs/heads/master', first))
+        self.assertTrue(refs.get_refs('refs/heads/') == {'master': first})
+        self.assertTrue(refs.get_refs('refs/remotes/origin/')['master'] ==
+                first)
+        self.assertTrue(refs.get_remotes() == ['origin'])
+
+        # new commit, branch and tag
+        self._commit('file2')
+        second = self._git('rev-parse', 'HEAD')
+        self._git('branch', 'feature/one')
+        self._git('tag', 'v1.0', first)
+        self.assertTrue(refs.get_head() == ('refs/heads/master', second))
+        self.assertTrue(refs.get_refs('refs/heads/') == {'master': second,
+                'feature/one': second})
+        self.assertTrue(refs.get_refs('refs/tags/') == {'v1.0': first})
+
+        # packed references
+        self._git('pack-refs', '--all')
+        self.assertTrue(refs.get_refs('refs/heads/') == {'master': second,
+                'feature/one': second})
+        self.assertTrue(refs.get_refs('refs/tags/') == {'v1.0': first})
+
+        # detached
+        self._git('checkout', '-q', 'v1.0')
+        self.assertTrue(refs.get_head() == (None, first))
+        self._git('checkout', '-q', 'master')
+        self._git('remote', 'rm', 'origin')
+        self.assertTrue(refs.get_remotes() == [])
+        self.assertTrue(refs.get_refs('refs/remotes/') == {})
+
+        self.assertRaises(GitRefException, GitRefCache, '/')
+
+    def test_worktree(self):
+        ''' Test the references of a linked working tree. HEAD belongs to
+            the working tree, the other references are shared.
+        '''
+        path = self.repo.path + '_worktree'
+        self._git('worktree', 'add', '-q', '-b', 'feature', path)
+        try:
+            first = self._git('rev-parse', 'HEAD')
+            refs = GitRefCache(path)
+            main = GitRefCache(self.repo.path)
+            self.assertTrue(refs.get_head() == ('refs/heads/feature', first))
+            self.assertTrue(main.get_head() == ('refs/heads/master', first))
+            self.assertTrue(refs.get_refs('refs/heads/') == {'master': first,
+                    'feature': first})
+            self.assertTrue(refs.get_remotes() == ['origin'])
+
+            # a commit within the main working tree
+            self._commit('file2')
+            second = self._git('rev-parse', 'HEAD')
+            self._git('tag', 'v1.0')
+            self.assertTrue(refs.get_head() == ('refs/heads/feature', first))
+            self.assertTrue(refs.get_refs('refs/heads/') == {
+                    'master': second, 'feature': first})
+            self.assertTrue(refs.get_refs('refs/tags/') == {'v1.0': second})
+        finally:
+            self._git('worktree', 'remove', '--force', path)
+
+    def test_versioneddir(self):
+        ''' Test the branches and tags of the versioned directory. '''
+        self.assertTrue(self.repo.get_current_branch() == 'master')
+        self.assertTrue(self.repo.get_branchs() == ['master'])
+        self.assertTrue(self.repo.get_current_tag() is None)
+        self.repo.tag('v1.0', 'Tester', 'test@snakebuild.org', 'first')
+        self._git('tag', 'light')
+        self.assertTrue(self.repo.get_tags() == ['light', 'v1.0'])
+        self.assertTrue(self.repo.get_current_tag() == 'v1.0')
+        self.assertTrue(self.repo.has_remote())
+
+    def _commit(self, name):
+        ''' Add a new file and commit it. '''
+        tfile = open(self.repo.get_local_path(name), 'w')
+        tfile.write(name)
+        tfile.close()
+        self.repo.add(name)
+        self.repo.commit('Tester', 'test@snakebuild.org', 'added ' + name)
+
+    def _git(self, *args):
+        ''' Call git within the repository and get the output. '''
+        return subprocess.Popen(['git'] + list(args), cwd=self.repo.path,
+                stdout=subprocess.PIPE).communicate()[0].strip()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the GitRefCache. '''
+''' The unit test for the snake build common inotify access. '''
+
+import os
+import select
+import shutil
+import tempfile
+import unittest
+
+from snakebuild.common.inotify import Inotify, InotifyException, IN_MODIFY, \
+        IN_CLOSE_WRITE, IN_IGNORED
+
+
+class TestInotify(unittest.TestCase):
+    ''' The unit test for the snake build common Inotify class. '''
+    def setUp(self):
+        ''' Create a directory with a file to watch. '''
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'watched')
+        open(self.filename, 'w').close()
+        try:
+            self.inotify = Inotify()
+        except InotifyException:
+            self.inotify = None
+
+    def tearDown(self):
+        if self.inotify is not None:
+            self.inotify.close()
+        shutil.rmtree(self.directory)
+
+    def test_events(self):
+        ''' Test the events of a watched file. '''
+        if self.inotify is None:
+            # not available on this system
+            return
+        wdesc = self.inotify.add_watch(self.filename,
+                IN_MODIFY | IN_CLOSE_WRITE)
+        self.assertTrue(self.inotify.read_events() == [])
+
+        with open(self.filename, 'a') as wfile:
+            wfile.write('changed')
+        self.assertTrue(len(select.select([self.inotify], [], [], 5)[0]) ==
+                1)
+        events = self.inotify.read_events()
+        self.assertTrue((wdesc, IN_MODIFY, '') in events)
+        self.assertTrue((wdesc, IN_CLOSE_WRITE, '') in events)
+
+        self.inotify.rm_watch(wdesc)
+        events = self.inotify.read_events()
+        self.assertTrue(events == [(wdesc, IN_IGNORED, '')])
+
+        with self.assertRaises(InotifyException):
+            self.inotify.add_watch(os.path.join(self.directory, 'missing'),
+                    IN_MODIFY)
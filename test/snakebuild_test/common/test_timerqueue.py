@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the TimerQueue. '''
+
+import unittest
+import threading
+
+from snakebuild.common.timerqueue import TimerQueue
+
+
+class TestTimerQueue(unittest.TestCase):
+    ''' The unit test for the snake build common TimerQueue class. '''
+    def setUp(self):
+        self.queue = TimerQueue()
+        self.called = []
+        self.event = threading.Event()
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def test_order(self):
+        ''' Test that the timers are called in the order they are due. '''
+        self.queue.schedule(0.2, self._call, 'last')
+        self.queue.schedule(0.05, self._call, 'first')
+        self.queue.schedule(0.1, self._call, 'second')
+        self.event.wait(5)
+        self.assertTrue(self.called == ['first', 'second', 'last'])
+
+    def test_cancel(self):
+        ''' Test that a cancelled timer is not called. '''
+        timer = self.queue.schedule(0.05, self._call, 'cancelled')
+        self.queue.schedule(0.1, self._call, 'last')
+        timer.cancel()
+        self.event.wait(5)
+        self.assertTrue(self.called == ['last'])
+
+    def test_cancel_many(self):
+        ''' Test that the cancelled timers don't stay within the queue. '''
+        timers = [self.queue.schedule(1000, self._call, 'never')
+                for cnt in range(100)]
+        self.queue.schedule(0.1, self._call, 'last')
+        for timer in timers[:60]:
+            timer.cancel()
+            timer.cancel()
+            self.assertTrue(self.queue.cancelled * 2 <=
+                    len(self.queue.timers))
+        self.assertTrue(len(self.queue.timers) < 60)
+        for timer in timers[60:]:
+            timer.cancel()
+        self.assertTrue(self.event.wait(5))
+        self.assertTrue(self.called == ['last'])
+        self.assertTrue(len(self.queue.timers) <= 1)
+
+    def test_stop(self):
+        ''' Test that no timer is called after stop. '''
+        self.queue.schedule(0.05, self._call, 'last')
+        self.queue.stop()
+        self.queue.schedule(0.01, self._call, 'last')
+        self.assertFalse(self.event.wait(0.2))
+        self.assertTrue(self.called == [])
+
+    def test_restart(self):
+        ''' Test that the thread gets started again if it is gone (like
+            within the child of a fork).
+        '''
+        self.queue.schedule(0.05, self._call, 'last')
+        self.queue.stop()
+        self.queue.thread.join(5)
+        self.queue.running = True
+        self.queue.schedule(0.05, self._call, 'last')
+        self.queue.start()
+        self.assertTrue(self.event.wait(5))
+        self.assertTrue(self.called == ['last'])
+
+    def _call(self, value):
+        ''' Used as the timer function. '''
+        self.called.append(value)
+        if value == 'last':
+            self.event.set()
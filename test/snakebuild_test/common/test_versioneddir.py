@@ -24,6 +24,7 @@ import stat
 import time
 import shutil
 import subprocess
+import threading
 
 import snakebuild.common.versioneddir as vd
 from snakebuild.common.appdirs import tmp_data_dir
@@ -524,6 +525,55 @@ class TestVersionedDir(unittest.TestCase):
                     os.path.join(tmp_data_dir(), 'snakebuild_git_test_clone1'),
                     rconf)
 
+    def test_clone_mirror(self):
+        ''' Clone a repository through a local mirror and test the shallow
+            and sparse clones.
+        '''
+        basedir = os.path.join(tmp_data_dir(), 'snakebuild_git_test_mirror')
+        _create_clone(self.tempgitdir, os.path.join(basedir, 'repo.git'),
+                True)
+        mirror = os.path.join(basedir, 'mirrors', 'repo.git')
+        rconf = vd.ReposConfig(vd.ReposConfig.GIT, basedir,
+                os.path.join(basedir, 'mirrors'))
+        try:
+            vd.clone_repo('repo', os.path.join(basedir, 'clone1'), rconf)
+            clone1 = vd.get_versioned_directory(os.path.join(basedir,
+                    'clone1'))
+            alternates = open(os.path.join(clone1.path, '.git', 'objects',
+                    'info', 'alternates')).read()
+            self.assertTrue(alternates.strip() == os.path.join(mirror,
+                    'objects'))
+            self.assertTrue(clone1.get_tags() == ['v1.0', 'v1.1', 'v2.0'])
+
+            # the changes get fetched into the mirror
+            for name in ('docs', 'src'):
+                os.mkdir(clone1.get_local_path(name))
+                _create_file(clone1.get_local_path([name, 'file']), name)
+                clone1.add('{0}/file'.format(name))
+            clone1.commit('Tester', 'test@snakebuild.org', 'added files')
+            clone1.push_remote()
+            vd.clone_repo('repo', os.path.join(basedir, 'clone2'), rconf, 1,
+                    ['docs'])
+            self.assertTrue(_git_output(mirror, 'rev-parse', 'master') ==
+                    clone1.get_revision())
+
+            clone2 = vd.get_versioned_directory(os.path.join(basedir,
+                    'clone2'))
+            self.assertTrue(clone2.get_revision() == clone1.get_revision())
+            self.assertTrue(_git_output(clone2.path, 'rev-list', '--count',
+                    'HEAD') == '1')
+            self.assertTrue(os.path.isfile(clone2.get_local_path(['docs',
+                    'file'])))
+            self.assertFalse(os.path.exists(clone2.get_local_path('src')))
+            clone1.close()
+            clone2.close()
+
+            with self.assertRaises(vd.VersionedDirException):
+                vd.clone_repo('missing', os.path.join(basedir, 'clone3'),
+                        rconf)
+        finally:
+            shutil.rmtree(basedir)
+
     def test_branch(self):
         ''' Test the branch function to create new branches. '''
         newgitdir = os.path.join(tmp_data_dir(), 'snakebuild_git_test_clone1')
@@ -706,6 +756,86 @@ class TestVersionedDir(unittest.TestCase):
         self.assertTrue(os.path.isfile(clone2.get_local_path(['test',
                 'file3'])))
 
+    def test_concurrent_use(self):
+        ''' Stress test the use of several repositories and of one
+            repository from multiple threads at the same time.
+        '''
+        clonedirs = [os.path.join(tmp_data_dir(),
+                'snakebuild_git_test_thread{0}'.format(cnt))
+                for cnt in range(4)]
+        for clonedir in clonedirs:
+            _create_clone(self.tempgitdir, clonedir)
+        shared = vd.get_versioned_directory(clonedirs[0])
+        shared.update('master')
+        cwd = os.getcwd()
+        errors = []
+        # the files expected (True) or not (False) for each tag
+        expected = {'v1.0': {'two': True, 'three': False, 'four': False},
+                'v1.1': {'two': True, 'three': True, 'four': False},
+                'v2.0': {'two': True, 'three': False, 'four': True}}
+
+        def update_versions(clonedir, offset):
+            ''' Switch the versions of the own repository. '''
+            versioned = vd.get_versioned_directory(clonedir)
+            tags = sorted(expected)
+            for cnt in range(15):
+                tag = tags[(cnt + offset) % len(tags)]
+                versioned.update(tag)
+                if versioned.get_current_tag() != tag:
+                    errors.append('{0} not at {1}'.format(clonedir, tag))
+                for name, exists in expected[tag].iteritems():
+                    if os.path.isfile(versioned.get_local_path(name)) != \
+                            exists:
+                        errors.append('{0} wrong at {1}: {2}'.format(
+                                clonedir, tag, name))
+
+        def commit_files(thread):
+            ''' Add and commit files to the shared repository. '''
+            versioned = vd.get_versioned_directory(clonedirs[0])
+            for cnt in range(5):
+                name = 'thread{0}_{1}'.format(thread, cnt)
+                with versioned.lock:
+                    _create_file(versioned.get_local_path(name), name)
+                    versioned.add(name)
+                    versioned.commit('Tester', 'test@test.com', name)
+
+        threads = [threading.Thread(target=_catch_errors, args=(errors,
+                update_versions, clonedir, cnt))
+                for cnt, clonedir in enumerate(clonedirs[1:])]
+        threads.extend(threading.Thread(target=_catch_errors, args=(errors,
+                commit_files, cnt)) for cnt in range(3))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(120)
+
+        try:
+            self.assertTrue(errors == [])
+            self.assertTrue(os.getcwd() == cwd)
+            self.assertTrue(len(shared.short_log()) == 3 + 15)
+            for cnt in range(3):
+                self.assertTrue(os.path.isfile(shared.get_local_path(
+                        'thread{0}_4'.format(cnt))))
+        finally:
+            for clonedir in clonedirs:
+                shutil.rmtree(clonedir)
+
+
+def _catch_errors(errors, function, *args):
+    ''' Call the given function and store the exceptions raised within the
+        given list.
+    '''
+    try:
+        function(*args)
+    except BaseException, exc:
+        errors.append('{0}: {1}'.format(function.__name__, exc))
+
+
+def _git_output(path, *args):
+    ''' Call git within the given repository and get the output. '''
+    return subprocess.Popen(['git'] + list(args), cwd=path,
+            stdout=subprocess.PIPE).communicate()[0].strip()
+
 
 def _create_clone(origin, clonedir, bare=False):
     ''' Create a clone from an existing repository. Remove the existing
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the GitRefCache. '''
+''' The unit test for the snake build common WorktreePool class. '''
+
+import os
+import shutil
+import unittest
+import subprocess
+
+from snakebuild.common.appdirs import tmp_data_dir
+from snakebuild.common.versioneddir import VersionedDirException
+from snakebuild.common.worktreepool import WorktreePool
+from test_helpers.versioneddir_helper import create_versioned_dir, \
+        remove_versioned_dir
+
+
+class TestWorktreePool(unittest.TestCase):
+    ''' The unit test for the snake build common WorktreePool class. '''
+    def setUp(self):
+        ''' Create a repository with a tag and a branch. '''
+        self.repo = create_versioned_dir('worktrees')
+        self.directory = os.path.join(tmp_data_dir(),
+                'snakebuild_worktrees_pool')
+        self._commit('file1', 'one')
+        self.repo.tag('v1.0', 'Tester', 'test@snakebuild.org', 'first')
+        self._commit('file1', 'two')
+        self.repo.push_remote()
+
+    def tearDown(self):
+        self.repo.close()
+        remove_versioned_dir('worktrees')
+        shutil.rmtree(self.directory, True)
+
+    def test_acquire(self):
+        ''' Test the checkouts given out and their reuse. '''
+        pool = WorktreePool(self.repo, self.directory)
+        first = pool.acquire('v1.0')
+        second = pool.acquire('master')
+        self.assertTrue(first.path != second.path)
+        self.assertTrue(self._read(first, 'file1') == 'one')
+        self.assertTrue(self._read(second, 'file1') == 'two')
+        self.assertTrue(first.revision == self._git('rev-parse', 'v1.0^0'))
+
+        # the same version gets the same clean checkout again
+        self._write(first, 'file1', 'changed')
+        self._write(first, 'output', 'build')
+        pool.release(first)
+        third = pool.acquire('v1.0')
+        self.assertTrue(third is first)
+        self.assertTrue(self._read(third, 'file1') == 'one')
+        self.assertFalse(os.path.exists(os.path.join(third.path, 'output')))
+
+        # an unused checkout gets reset to a different version
+        pool.release(third)
+        fourth = pool.acquire('master')
+        self.assertTrue(fourth is first)
+        self.assertTrue(self._read(fourth, 'file1') == 'two')
+
+        # a branch only available on the remote
+        self._git('branch', 'feature', 'v1.0')
+        self._git('push', '-q', 'origin', 'feature')
+        self._git('branch', '-D', 'feature')
+        fifth = pool.acquire('feature')
+        self.assertTrue(self._read(fifth, 'file1') == 'one')
+        self.assertTrue(len(pool.worktrees) == 3)
+
+        self.assertRaises(VersionedDirException, pool.acquire, 'unknown')
+        for worktree in (second, fourth, fifth):
+            pool.release(worktree)
+        pool.close()
+        self.assertTrue(pool.worktrees == [])
+        self.assertTrue(os.listdir(self.directory) == [])
+        self.assertTrue(self._git('worktree', 'list').count('\n') == 0)
+
+    def test_disk_budget(self):
+        ''' Test the removal of the least recently used checkouts. '''
+        pool = WorktreePool(self.repo, self.directory, 1)
+        pool.prepare('v1.0', 2)
+        self.assertTrue(len(pool.worktrees) == 0)
+
+        pool.disk_budget = 4
+        first = pool.acquire('v1.0')
+        second = pool.acquire('master')
+        pool.release(first)
+        pool.release(second)
+        self.assertTrue(pool.worktrees == [second])
+        self.assertFalse(os.path.exists(first.path))
+        self.assertTrue(self._git('worktree', 'list').count('\n') == 1)
+
+        # left over checkouts get removed by a new pool
+        pool = WorktreePool(self.repo, self.directory)
+        self.assertTrue(os.listdir(self.directory) == [])
+        self.assertTrue(self._git('worktree', 'list').count('\n') == 0)
+
+    def _commit(self, name, content):
+        ''' Write the file and commit it. '''
+        tfile = open(self.repo.get_local_path(name), 'w')
+        tfile.write(content)
+        tfile.close()
+        self.repo.add(name)
+        self.repo.commit('Tester', 'test@snakebuild.org', 'changed ' + name)
+
+    def _read(self, worktree, name):
+        ''' Read the file of the checkout. '''
+        tfile = open(os.path.join(worktree.path, name))
+        content = tfile.read()
+        tfile.close()
+        return content
+
+    def _write(self, worktree, name, content):
+        ''' Write the file within the checkout. '''
+        tfile = open(os.path.join(worktree.path, name), 'w')
+        tfile.write(content)
+        tfile.close()
+
+    def _git(self, *args):
+        ''' Call git within the repository and get the output. '''
+        return subprocess.Popen(['git'] + list(args), cwd=self.repo.path,
+                stdout=subprocess.PIPE).communicate()[0].strip()
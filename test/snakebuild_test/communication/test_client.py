@@ -18,11 +18,20 @@
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 ''' The unit tests for the Client object and its methods. '''
 
+import os
 import unittest
 import json
+import shutil
+import tempfile
+import threading
 
 from snakebuild.communication.client import Client, _receive, \
         ClientCommunicationException, _parse_sjson_data
+from snakebuild.communication.commandstructure import prepare_answer, \
+        BinaryAnswer, ERROR
+from snakebuild.communication.messagehandler import MessageHandler
+from snakebuild.communication.server import ThreadedTCPServer
+from snakebuild.communication.eventloop import EventLoopTCPServer
 
 from test_helpers.dummysocket import DummySocket
 
@@ -38,6 +47,127 @@ class TestClient(unittest.TestCase):
         with self.assertRaises(ClientCommunicationException):
             cli.send(4, 'test', 12)
 
+    def test_client_keep_alive(self):
+        ''' Test the Client object with a connection that is kept open for
+            multiple requests. A blocking request must not block the other
+            requests sent over the same connection.
+        '''
+        release = threading.Event()
+
+        def echo(data, value):
+            ''' return the given value '''
+            return prepare_answer({'value': value})
+
+        def wait(data):
+            ''' block until the test releases it '''
+            release.wait(5)
+            return prepare_answer({'value': 'released'})
+
+        server = ThreadedTCPServer(('localhost', 0), MessageHandler)
+        server.commands = {'echo': (echo, ['value'], False),
+                'wait': (wait, [], False)}
+        server.data = None
+        srvr = threading.Thread(target=server.serve_forever)
+        srvr.daemon = True
+        srvr.start()
+
+        cli = Client('localhost', server.server_address[1], True)
+        try:
+            results = []
+            waiter = threading.Thread(target=lambda: results.append(
+                    cli.send(Client.SJSON, 'wait', None)))
+            waiter.start()
+            for value in range(10):
+                cmd, answer = cli.send(Client.SJSON, 'echo',
+                        {'value': value})
+                self.assertTrue(cmd == 'echo')
+                self.assertTrue(answer['value'] == value)
+            self.assertTrue(waiter.is_alive())
+
+            release.set()
+            waiter.join(5)
+            self.assertFalse(waiter.is_alive())
+            self.assertTrue(results[0][1]['value'] == 'released')
+
+            # the connection must be reopened after closing it
+            connection = cli._connection
+            cli.close()
+            cmd, answer = cli.send(Client.SJSON, 'echo', {'value': 'new'})
+            self.assertTrue(answer['value'] == 'new')
+            self.assertFalse(connection is cli._connection)
+        finally:
+            cli.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_client_binary(self):
+        ''' Test sending and receiving binary data following the messages,
+            with a new connection for each request and with one kept open.
+        '''
+        self._check_binary(ThreadedTCPServer(('localhost', 0),
+                MessageHandler))
+
+    def test_client_binary_eventloop(self):
+        ''' Test the binary data sent by the event loop server, the data
+            does not fit into the socket buffer at once.
+        '''
+        self._check_binary(EventLoopTCPServer(('localhost', 0), 2, 16),
+                4 << 20)
+
+    def _check_binary(self, server, size=200000):
+        ''' Check sending and receiving binary data with the given server.
+
+            @param server: The socket server to test
+            @param size: The size of the file to send
+        '''
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, 'data')
+        data = ''.join(chr(cnt % 256) for cnt in range(256)) * (size / 256)
+        with open(filename, 'wb') as dfl:
+            dfl.write(data)
+
+        def put(srv_data, name, payload=None):
+            ''' return the length of the payload '''
+            return prepare_answer({'name': name, 'size': len(payload)})
+
+        def get(srv_data, offset, length):
+            ''' return a part of the file as binary data '''
+            return BinaryAnswer(prepare_answer({'offset': offset}), filename,
+                    offset, length)
+
+        server.commands = {'put': (put, ['name', '[payload]'], False),
+                'get': (get, ['offset', 'length'], False)}
+        server.data = None
+        srvr = threading.Thread(target=server.serve_forever)
+        srvr.daemon = True
+        srvr.start()
+
+        try:
+            for keep_alive in (False, True):
+                cli = Client('localhost', server.server_address[1],
+                        keep_alive)
+                cmd, answer = cli.send(Client.SJSON, 'put', {'name': 'x'},
+                        payload=(filename, 1000, 150000))
+                self.assertTrue(answer['name'] == 'x')
+                self.assertTrue(answer['size'] == 150000)
+                cmd, answer = cli.send(Client.SJSON, 'get', {'offset': 10,
+                        'length': size - 20000})
+                self.assertTrue(answer['offset'] == 10)
+                self.assertTrue(answer['payload'] == data[10:size - 19990])
+                cmd, answer = cli.send(Client.SJSON, 'get', {'offset': 5,
+                        'length': 0})
+                self.assertTrue(answer['payload'] == '')
+                if isinstance(server, EventLoopTCPServer):
+                    # beyond the end of the file
+                    cmd, answer = cli.send(Client.SJSON, 'get',
+                            {'offset': 5, 'length': size})
+                    self.assertTrue(answer['status'] == ERROR)
+                cli.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(directory)
+
     def test_parse_sjson_data(self):
         ''' Test the private method _parse_sjson_data.
 
@@ -24,7 +24,7 @@ import unittest
 
 from snakebuild.communication.commandstructure import prepare_error, \
         prepare_answer, FUNCTION, PARAMETERS, SIGNED, ERROR, SUCCESS, \
-        CommandStructureError
+        CommandStructureError, DeferredAnswer
 
 
 class TestCommandStructure(unittest.TestCase):
@@ -87,6 +87,35 @@ class TestCommandStructure(unittest.TestCase):
         with self.assertRaises(CommandStructureError):
             value = prepare_answer(12)
 
+    def test_deferred_answer(self):
+        ''' Test the DeferredAnswer callbacks and the cancel. '''
+        answers = []
+        cancelled = []
+        deferred = DeferredAnswer()
+        deferred.add_callback(answers.append)
+        deferred.add_cancel_callback(lambda: cancelled.append(True))
+        self.assertFalse(deferred.done)
+        self.assertTrue(deferred.wait(0) is None)
+        self.assertTrue(deferred.set_answer(prepare_answer()))
+        self.assertFalse(deferred.set_answer(prepare_answer()))
+        self.assertTrue(deferred.done)
+        self.assertTrue(len(answers) == 1)
+        deferred.add_callback(answers.append)
+        self.assertTrue(len(answers) == 2)
+
+        # the answer could not be delivered
+        self.assertTrue(deferred.cancel())
+        self.assertFalse(deferred.cancel())
+        self.assertTrue(cancelled == [True])
+
+        deferred = DeferredAnswer()
+        deferred.add_callback(answers.append)
+        deferred.cancel()
+        self.assertTrue(deferred.cancelled)
+        self.assertFalse(deferred.set_answer(prepare_answer()))
+        self.assertTrue(len(answers) == 2)
+        self.assertTrue(deferred.wait() is None)
+
     def test_enum_values(self):
         ''' Test if the enum values have the expected value. The value must be
             the same as described in the documentation.
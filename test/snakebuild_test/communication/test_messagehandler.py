@@ -22,7 +22,8 @@ import json
 import os
 
 from snakebuild.communication.messagehandler import MessageHandler, _handle_cmd
-from snakebuild.communication.commandstructure import prepare_answer
+from snakebuild.communication.commandstructure import prepare_answer, \
+        DeferredAnswer
 
 from test_helpers.dummysocket import DummySocket
 from test_helpers.dummycontainer import DummyContainer
@@ -65,6 +66,79 @@ class TestMessageHandler(unittest.TestCase):
         self.assertTrue(self.got_handled['Other'] == 'Quack')
         self.assertTrue(self.got_handled['data'] == 'PING')
 
+    def test_handle_request_with_id(self):
+        ''' Test the handle method with multiple requests which have an id.
+            The answers must have the id of the request.
+        '''
+        dummy = DummySocket()
+
+        hdlr = MessageHandler(dummy, None, None)
+        hdlr.server = DummyContainer()
+        hdlr.server.commands = {'test': (self._handle_call_back,
+                ['Test', 'Other'], False)}
+        hdlr.server.data = "PING"
+        hdlr.server.execute = self._execute
+        for request_id in (3, 7):
+            msg = json.dumps({'cmd': 'test', 'parameters': {'Test': [1, 2],
+                    'Other': 'Quack'}, 'id': request_id})
+            length = len(msg)
+            dummy.add_data('a' + chr((length >> 24) % 256) +
+                    chr((length >> 16) % 256) + chr((length >> 8) % 256) +
+                    chr(length % 256) + msg)
+        hdlr.handle()
+
+        self.assertTrue(len(dummy.sent_data) == 2)
+        ids = [json.loads(answer[5:])['id'] for answer in dummy.sent_data]
+        self.assertTrue(sorted(ids) == [3, 7])
+
+    def test_handle_deferred_answer(self):
+        ''' Test a command which returns a DeferredAnswer. The answer is sent
+            as soon as it gets set. If the connection is closed before the
+            answer is available it gets cancelled.
+        '''
+        dummy = DummySocket()
+        deferred = [DeferredAnswer(), DeferredAnswer()]
+
+        hdlr = MessageHandler(dummy, None, None)
+        hdlr.server = DummyContainer()
+        hdlr.server.commands = {'wait': (lambda data: deferred.pop(0), [],
+                False)}
+        hdlr.server.data = None
+        tasks = []
+        hdlr.server.execute = lambda function, *args: tasks.append(
+                (function, args))
+        # the handler got closed within the constructor, open it again
+        hdlr.setup()
+
+        first = deferred[0]
+        hdlr._answer_request({'cmd': 'wait', 'parameters': {}, 'id': 5},
+                False)
+        self.assertTrue(len(dummy.sent_data) == 0)
+        # the answer is sent by the server, not by the thread setting it
+        first.set_answer(prepare_answer({'value': 42}))
+        self.assertTrue(len(dummy.sent_data) == 0)
+        self.assertTrue(len(tasks) == 1)
+        function, args = tasks.pop()
+        function(*args)
+        self.assertTrue(len(dummy.sent_data) == 1)
+        answer = json.loads(dummy.sent_data[0][5:])
+        self.assertTrue(answer['id'] == 5)
+        self.assertTrue(answer['parameters']['value'] == 42)
+        self.assertFalse(first.cancelled)
+
+        second = deferred[0]
+        msg = json.dumps({'cmd': 'wait', 'parameters': {}, 'id': 6})
+        length = len(msg)
+        dummy.add_data('a' + chr((length >> 24) % 256) +
+                chr((length >> 16) % 256) + chr((length >> 8) % 256) +
+                chr(length % 256) + msg)
+        hdlr.handle()
+        while len(tasks) > 0:
+            function, args = tasks.pop(0)
+            function(*args)
+        self.assertTrue(second.cancelled)
+        self.assertTrue(len(dummy.sent_data) == 1)
+
     def test_handle_request_unsuported_type(self):
         ''' Test the handle method of the message handler use an unsupported
             type.
@@ -74,7 +148,7 @@ class TestMessageHandler(unittest.TestCase):
         self.got_handled = {'cmd': None, 'parameters': None}
         msg = json.dumps(data)
         length = len(msg)
-        message_string = ('c' + chr((length >> 24) % 256) +
+        message_string = ('d' + chr((length >> 24) % 256) +
                 chr((length >> 16) % 256) + chr((length >> 8) % 256) +
                 chr(length % 256)) + msg
 
@@ -88,7 +162,7 @@ class TestMessageHandler(unittest.TestCase):
         dummy.add_data(message_string)
         hdlr.handle()
         self.assertTrue(check_log_file(self.logfile, 'The message type '
-                'received is not supported. got: 0x63'))
+                'received is not supported. got: 0x64'))
 
     def test_parse_sjson_request(self):
         ''' Test the private method _parse_sjson_request. '''
@@ -308,3 +382,7 @@ class TestMessageHandler(unittest.TestCase):
         self.got_handled['p3'] = p3
         self.got_handled['data'] = data
         return prepare_answer()
+
+    def _execute(self, function, *args):
+        ''' Used as the execute method of the server, runs it right away. '''
+        function(*args)
@@ -17,13 +17,256 @@
 # You should have received a copy of the GNU General Public License
 # along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
 
+import json
 import unittest
+import threading
+import socket
 
 from snakebuild.communication.server import Server, \
-        ServerCommunicationException
+        ServerCommunicationException, ThreadedTCPServer, PooledTCPServer, \
+        get_engine
+from snakebuild.communication.eventloop import EventLoopTCPServer
+from snakebuild.communication.messagehandler import MessageHandler
+from snakebuild.communication.commandstructure import prepare_answer, \
+        DeferredAnswer
+from snakebuild.communication.client import Client
+from snakebuild.communication.messages import prepare_sjson_data, \
+        receive_data
 
 
 class TestServer(unittest.TestCase):
     ''' The unit test for the snake build communication Server class. '''
     def setUp(self):
-        pass
+        self.deferred = []
+
+    def test_get_engine(self):
+        ''' Test the get_engine function and the engine check of the
+            Server.
+        '''
+        self.assertTrue(get_engine('threaded') == Server.THREADED)
+        self.assertTrue(get_engine('Pool') == Server.POOL)
+        self.assertTrue(get_engine('eventloop') == Server.EVENT_LOOP)
+        self.assertRaises(ServerCommunicationException, get_engine, 'forks')
+        self.assertRaises(ServerCommunicationException, Server, 'localhost',
+                0, 'test', None, 7)
+
+    def test_threaded_engine(self):
+        ''' Test the requests and deferred answers with the threaded server.
+        '''
+        self._check_engine(ThreadedTCPServer(('localhost', 0),
+                MessageHandler))
+
+    def test_pool_engine(self):
+        ''' Test the requests and deferred answers with the pool server. '''
+        self._check_engine(PooledTCPServer(('localhost', 0), MessageHandler,
+                2, 16))
+
+    def test_eventloop_engine(self):
+        ''' Test the requests and deferred answers with the event loop
+            server.
+        '''
+        self._check_engine(EventLoopTCPServer(('localhost', 0), 2, 16))
+
+    def test_eventloop_many_waiting(self):
+        ''' Test the event loop server with more waiting requests than
+            worker threads. The deferred answers must not block the workers.
+        '''
+        server = self._start_server(EventLoopTCPServer(('localhost', 0), 1,
+                16))
+        cli = Client('localhost', server.server_address[1], True)
+        try:
+            results = []
+            waiters = []
+            for cnt in range(5):
+                waiter = threading.Thread(target=lambda: results.append(
+                        cli.send(Client.SJSON, 'wait', None)))
+                waiter.start()
+                waiters.append(waiter)
+            cmd, answer = cli.send(Client.SJSON, 'echo', {'value': 'x'})
+            self.assertTrue(answer['value'] == 'x')
+            self.assertTrue(len(results) == 0)
+
+            self._wait_for_deferred(5)
+            for deferred in list(self.deferred):
+                deferred.set_answer(prepare_answer({'value': 'released'}))
+            for waiter in waiters:
+                waiter.join(5)
+            self.assertTrue(len(results) == 5)
+        finally:
+            cli.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_eventloop_split_requests(self):
+        ''' Test the event loop server with a large request arriving in
+            small pieces and with multiple requests within one piece.
+        '''
+        server = self._start_server(EventLoopTCPServer(('localhost', 0), 2,
+                16))
+        sock = socket.create_connection(('localhost',
+                server.server_address[1]))
+        try:
+            value = 'x' * 300000
+            data = prepare_sjson_data({'cmd': 'echo', 'parameters':
+                    {'value': value}, 'id': 1})
+            for pos in range(0, len(data), 1000):
+                sock.sendall(data[pos:pos + 1000])
+            answer = _read_answer(sock)
+            self.assertTrue(answer['id'] == 1)
+            self.assertTrue(answer['parameters']['value'] == value)
+
+            sock.sendall(''.join(prepare_sjson_data({'cmd': 'echo',
+                    'parameters': {'value': cnt}}) for cnt in range(3)) +
+                    prepare_sjson_data({'cmd': 'echo',
+                    'parameters': {'value': 3}})[:4])
+            sock.sendall(prepare_sjson_data({'cmd': 'echo',
+                    'parameters': {'value': 3}})[4:])
+            for cnt in range(4):
+                self.assertTrue(_read_answer(sock)['parameters']['value'] ==
+                        cnt)
+        finally:
+            sock.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_pool_many_waiting(self):
+        ''' Test the pool server with more clients waiting for a deferred
+            answer (without id, a new connection per request) than threads
+            in the pool. The waiting clients must not block the others.
+        '''
+        server = self._start_server(PooledTCPServer(('localhost', 0),
+                MessageHandler, 2, 16))
+        port = server.server_address[1]
+        try:
+            results = []
+            waiters = []
+            for cnt in range(5):
+                waiter = threading.Thread(target=lambda: results.append(
+                        Client('localhost', port).send(Client.SJSON, 'wait',
+                        None)))
+                waiter.start()
+                waiters.append(waiter)
+            self._wait_for_deferred(5)
+            self.assertTrue(len(self.deferred) == 5)
+
+            cmd, answer = Client('localhost', port).send(Client.SJSON,
+                    'echo', {'value': 'x'})
+            self.assertTrue(answer['value'] == 'x')
+            self.assertTrue(len(results) == 0)
+
+            for deferred in list(self.deferred):
+                deferred.set_answer(prepare_answer({'value': 'released'}))
+            for waiter in waiters:
+                waiter.join(5)
+            self.assertTrue(len(results) == 5)
+            self.assertTrue(all(answer['value'] == 'released'
+                    for cmd, answer in results))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_cancel_on_disconnect(self):
+        ''' Test that the deferred answers get cancelled if the client closes
+            the connection before it got the answer.
+        '''
+        for server in (ThreadedTCPServer(('localhost', 0), MessageHandler),
+                PooledTCPServer(('localhost', 0), MessageHandler, 2, 16),
+                EventLoopTCPServer(('localhost', 0), 2, 16)):
+            self.deferred = []
+            self._start_server(server)
+            try:
+                for request in ({'cmd': 'wait', 'parameters': {}, 'id': 1},
+                        {'cmd': 'wait', 'parameters': {}}):
+                    sock = socket.create_connection(('localhost',
+                            server.server_address[1]))
+                    sock.sendall(prepare_sjson_data(request))
+                    self._wait_for_deferred(len(self.deferred) + 1)
+                    sock.close()
+
+                    deferred = self.deferred[-1]
+                    for cnt in range(500):
+                        if deferred.cancelled:
+                            break
+                        threading.Event().wait(0.01)
+                    self.assertTrue(deferred.cancelled)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    def _check_engine(self, server):
+        ''' Check that the given socket server answers the requests over a
+            new connection per request and over a connection which is kept
+            open. A deferred answer must not block the other requests.
+
+            @param server: The socket server to test
+        '''
+        self._start_server(server)
+        port = server.server_address[1]
+        try:
+            cmd, answer = Client('localhost', port).send(Client.SJSON,
+                    'echo', {'value': 'single'})
+            self.assertTrue(cmd == 'echo')
+            self.assertTrue(answer['value'] == 'single')
+
+            cli = Client('localhost', port, True)
+            try:
+                results = []
+                waiter = threading.Thread(target=lambda: results.append(
+                        cli.send(Client.SJSON, 'wait', None)))
+                waiter.start()
+                for value in range(10):
+                    cmd, answer = cli.send(Client.SJSON, 'echo',
+                            {'value': value})
+                    self.assertTrue(answer['value'] == value)
+                self.assertTrue(waiter.is_alive())
+
+                self._wait_for_deferred(1)
+                self.deferred[0].set_answer(prepare_answer(
+                        {'value': 'released'}))
+                waiter.join(5)
+                self.assertFalse(waiter.is_alive())
+                self.assertTrue(results[0][1]['value'] == 'released')
+            finally:
+                cli.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _start_server(self, server):
+        ''' Start the given socket server with the test commands.
+
+            @param server: The socket server to start
+            @return: The socket server
+        '''
+        server.commands = {'echo': (self._echo, ['value'], False),
+                'wait': (self._wait, [], False)}
+        server.data = None
+        srvr = threading.Thread(target=server.serve_forever)
+        srvr.daemon = True
+        srvr.start()
+        return server
+
+    def _wait_for_deferred(self, count):
+        ''' Wait until the given number of deferred answers got created. '''
+        for cnt in range(500):
+            if len(self.deferred) >= count:
+                return
+            threading.Event().wait(0.01)
+
+    def _echo(self, data, value):
+        ''' Used as command which returns the given value. '''
+        return prepare_answer({'value': value})
+
+    def _wait(self, data):
+        ''' Used as command which returns a deferred answer. '''
+        deferred = DeferredAnswer()
+        self.deferred.append(deferred)
+        return deferred
+
+
+def _read_answer(sock):
+    ''' Read one sjson answer from the given socket. '''
+    header = receive_data(sock, 5)
+    length = ((ord(header[1]) << 24) + (ord(header[2]) << 16) +
+            (ord(header[3]) << 8) + ord(header[4]))
+    return json.loads(receive_data(sock, length))
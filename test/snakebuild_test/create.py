@@ -26,6 +26,7 @@ import commands
 import resourceserver
 import resourceclient
 import buildagent
+import buildserver
 import remote
 
 
@@ -37,8 +38,9 @@ def suite():
     resourceserver_test = resourceserver.suite()
     resourceclient_test = resourceclient.suite()
     buildagent_test = buildagent.suite()
+    buildserver_test = buildserver.suite()
     remote_test = remote.suite()
 
     return unittest.TestSuite([communication_test, common_test, commands_test,
             resourceserver_test, resourceclient_test, buildagent_test,
-            remote_test])
+            buildserver_test, remote_test])
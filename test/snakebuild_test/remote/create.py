@@ -22,6 +22,7 @@ import unittest
 
 from test_resourceserver import TestResourceServer
 from test_buildagent import TestBuildAgent
+from test_buildcache import TestBuildCache
 
 
 def suite():
@@ -30,5 +31,7 @@ def suite():
             TestResourceServer)
     buildagent = unittest.TestLoader().loadTestsFromTestCase(
             TestBuildAgent)
+    buildcache = unittest.TestLoader().loadTestsFromTestCase(
+            TestBuildCache)
 
-    return unittest.TestSuite([resourceserver, buildagent])
+    return unittest.TestSuite([resourceserver, buildagent, buildcache])
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the build cache remote library calls. '''
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from snakebuild.common import chunkstore
+from snakebuild.common.chunkstore import ChunkStore
+from snakebuild.remote.buildcache import BuildCache, BuildCacheRemoteError
+from snakebuild.buildserver.buildcache import BuildCache as LocalBuildCache
+from snakebuild.buildagent.buildstep import BuildStep, StepCache, load_step
+from snakebuild.communication.server import ThreadedTCPServer, \
+        REMOTE_COMMANDS
+from snakebuild.communication.messagehandler import MessageHandler
+# this needs to be imported to fill the REMOTE_COMMANDS
+import snakebuild.buildserver.servercmds
+
+
+class TestBuildCache(unittest.TestCase):
+    ''' The unit test for the snake build cache remote commands. '''
+    def setUp(self):
+        ''' Start a server with the build cache in a temporary directory.
+        '''
+        self.directory = tempfile.mkdtemp()
+        self.server = ThreadedTCPServer(('localhost', 0), MessageHandler)
+        self.server.commands = REMOTE_COMMANDS
+        self.server.data = LocalBuildCache(os.path.join(self.directory,
+                'server'))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.remote = BuildCache('localhost', self.server.server_address[1],
+                True)
+
+    def tearDown(self):
+        ''' Stop the server and remove the temporary directory. '''
+        self.remote.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_blobs(self):
+        ''' Test uploading and downloading the blobs in chunks. '''
+        source = os.path.join(self.directory, 'source')
+        data = ''.join(chr(cnt % 256) for cnt in range(100000))
+        with open(source, 'wb') as sfl:
+            sfl.write(data)
+
+        chunk_size = chunkstore.CHUNK_SIZE
+        chunkstore.CHUNK_SIZE = 30000
+        try:
+            digest = self.remote.upload_blob(source)
+            self.assertTrue(self.remote.has(blobs=[digest])[1] == [digest])
+            # uploading it again does not send the data
+            self.assertTrue(self.remote.upload_blob(source) == digest)
+
+            # a partial download gets continued
+            target = os.path.join(self.directory, 'target')
+            with open(target, 'wb') as tfl:
+                tfl.write(data[:1000])
+            self.remote.download_blob(digest, target)
+            with open(target, 'rb') as tfl:
+                self.assertTrue(tfl.read() == data)
+
+            # only the chunks missing get transferred
+            changed = data[:60000] + 'changed'
+            with open(source, 'wb') as sfl:
+                sfl.write(changed)
+            store = ChunkStore(os.path.join(self.directory, 'local'))
+            store.add_file(target)
+            other = self.remote.upload_blob(source)
+            manifest = self.server.data.get_manifest(other)
+            self.assertTrue(manifest['chunks'][:2] ==
+                    self.server.data.get_manifest(digest)['chunks'][:2])
+            self.remote.fetch_blob(store, other)
+            self.assertTrue(store.has(other))
+            self.assertTrue(store.size == len(data) + len('changed'))
+            store.extract(other, target)
+            with open(target, 'rb') as tfl:
+                self.assertTrue(tfl.read() == changed)
+        finally:
+            chunkstore.CHUNK_SIZE = chunk_size
+
+        self.assertRaises(BuildCacheRemoteError, self.remote.download_blob,
+                '0' * 40, target)
+        self.assertRaises(BuildCacheRemoteError, self.remote.fetch_blob,
+                store, '0' * 40)
+
+    def test_results(self):
+        ''' Test storing and getting the results. '''
+        key = 'a' * 40
+        self.assertTrue(self.remote.get_result(key) is None)
+        log = os.path.join(self.directory, 'log')
+        with open(log, 'w') as lfl:
+            lfl.write('log\n')
+        result = {'status': BuildStep.SUCCESS, 'output': {'VALUE': 'x'},
+                'log': self.remote.upload_blob(log), 'artifacts': {}}
+        self.remote.put_result(key, result)
+        self.assertTrue(self.remote.get_result(key) == result)
+        self.assertRaises(BuildCacheRemoteError, self.remote.put_result, key,
+                {'status': 5})
+
+    def test_step_cache(self):
+        ''' Test that an agent takes the result of a step from the shared
+            cache.
+        '''
+        workdir = os.path.join(self.directory, 'work')
+        os.makedirs(workdir)
+        script = os.path.join(self.directory, 'step.sh')
+        with open(script, 'w') as sfl:
+            sfl.write('#!/bin/sh\n'
+                    'echo run >> {0}/runs\n'
+                    'echo $VAR > {0}/result.txt\n'
+                    'sb_set VALUE "$VAR"\n'.format(workdir))
+        filename = os.path.join(self.directory, 'step.step')
+        with open(filename, 'w') as cfl:
+            cfl.write(json.dumps({'name': 'shared', 'description': '',
+                    'type': 'shell', 'script': script,
+                    'input': {'VAR': {'type': 'str', 'description': ''}},
+                    'output': {'VALUE': {'type': 'str', 'description': ''}},
+                    'checks': {'log_check': 'none', 'on_error': 'abort'},
+                    'artifacts': ['*.txt']}))
+        step = load_step(filename)
+        logfile = os.path.join(self.directory, 'step.log')
+
+        first = StepCache(os.path.join(self.directory, 'first'),
+                remote=self.remote)
+        self.assertTrue(first.run(step, {'VAR': 'one'}, logfile, 'abc',
+                workdir) == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        key = first.get_key(step, {'VAR': 'one'}, 'abc')
+        self.assertTrue(self.remote.has([key])[0] == [key])
+
+        # another agent gets the result from the shared cache
+        os.remove(os.path.join(workdir, 'result.txt'))
+        os.remove(logfile)
+        second = StepCache(os.path.join(self.directory, 'second'),
+                remote=self.remote)
+        self.assertTrue(second.run(step, {'VAR': 'one'}, logfile, 'abc',
+                workdir) == (BuildStep.SUCCESS, {'VALUE': 'one'}))
+        self.assertTrue(second.has(key))
+        with open(os.path.join(workdir, 'runs')) as rfl:
+            self.assertTrue(rfl.read() == 'run\n')
+        with open(os.path.join(workdir, 'result.txt')) as rfl:
+            self.assertTrue(rfl.read() == 'one\n')
+        with open(logfile) as lfl:
+            self.assertTrue(lfl.read() == '')
+
+        # without the server the step runs
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote.close()
+        third = StepCache(os.path.join(self.directory, 'third'),
+                remote=BuildCache('localhost', self.server.server_address[1]))
+        self.assertTrue(third.run(step, {'VAR': 'one'}, logfile, 'abc',
+                workdir)[0] == BuildStep.SUCCESS)
+        with open(os.path.join(workdir, 'runs')) as rfl:
+            self.assertTrue(rfl.read() == 'run\nrun\n')
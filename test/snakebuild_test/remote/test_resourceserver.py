@@ -70,6 +70,13 @@ class TestResourceServer(unittest.TestCase):
         self.assertTrue(type(rsrc_srvr.get_status_list()) == list)
         # TODO check in more details
 
+        result = rsrc_srvr.get_status_list('mytest & !run')
+        self.assertTrue([res['name'] for res in result] == ['Test1'])
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.get_status_list(1)
+        with self.assertRaises(ResourceServerRemoteError):
+            rsrc_srvr.get_status_list('mytest &')
+
         self.assertTrue(0 == subprocess.call([self.server_bin, 'stop']))
 
     def test_get_resource_details(self):
@@ -110,6 +117,10 @@ class TestResourceServer(unittest.TestCase):
             rsrc_srvr.acquire_resource('mytest', True, False)
         with self.assertRaises(ResourceServerIllegalParameterError):
             rsrc_srvr.acquire_resource('mytest', 'test1', 12)
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.acquire_resource('mytest', 'test1', False, -1)
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.acquire_resource('mytest', 'test1', False, None, 1)
         # the same for the release command
         with self.assertRaises(ResourceServerIllegalParameterError):
             rsrc_srvr.release_resource(12.2, 'test1', False)
@@ -143,6 +154,37 @@ class TestResourceServer(unittest.TestCase):
         with self.assertRaises(ResourceServerRemoteError):
             name = rsrc_srvr.release_resource('mytest', 'test1', False)
 
+        # a busy resource with nowait and timeout
+        name = rsrc_srvr.acquire_resource('mytest', 'test1', True)
+        with self.assertRaises(ResourceServerRemoteError):
+            rsrc_srvr.acquire_resource('mytest2', 'test1', False, None, True)
+        with self.assertRaises(ResourceServerRemoteError):
+            rsrc_srvr.acquire_resource('mytest2', 'test1', False, 0.2)
+        rsrc_srvr.release_resource('mytest', name, False)
+        name = rsrc_srvr.acquire_resource('mytest2', 'test1', False, 0.2)
+        self.assertTrue(name == 'Test1')
+
+        # leases
+        name, lease = rsrc_srvr.acquire_lease('mytest3', 'test1', 10)
+        self.assertTrue(name == 'Test1')
+        self.assertTrue(rsrc_srvr.renew_lease(lease, 20) == 20)
+        rsrc_srvr.release_resource('mytest3', name, False)
+        with self.assertRaises(ResourceServerRemoteError):
+            rsrc_srvr.renew_lease(lease)
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.renew_lease(12)
+
+        # multiple resources at once
+        names = rsrc_srvr.acquire_many('mytest4', [('test1', False),
+                ('test2', True)])
+        self.assertTrue(names == ['Test1', 'Test2'])
+        with self.assertRaises(ResourceServerRemoteError):
+            rsrc_srvr.acquire_many('mytest5', [('test2', False)], None, True)
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.acquire_many('mytest5', [('test2', 1)])
+        with self.assertRaises(ResourceServerIllegalParameterError):
+            rsrc_srvr.acquire_many('mytest5', [])
+
         self.assertTrue(0 == subprocess.call([self.server_bin, 'stop']))
 
 
@@ -57,6 +57,7 @@ class TestArgumentParser(unittest.TestCase):
         '''
         result = parse_command_line(['status'], 'TestingV')
         self.assertTrue(result.command == 'status')
+        self.assertTrue(result.tag == None)
         self.assertTrue(result.configfile == None)
         self.assertTrue(result.username == None)
         self.assertTrue(result.server == None)
@@ -64,8 +65,10 @@ class TestArgumentParser(unittest.TestCase):
 
         result = parse_command_line(['--configfile', 'testfile',
                 '--username', 'Arther', '--server', 'remote',
-                '--port', '1234', 'status'], 'TestingV')
+                '--port', '1234', 'status', '--tag', 'linux & !slow'],
+                'TestingV')
         self.assertTrue(result.command == 'status')
+        self.assertTrue(result.tag == 'linux & !slow')
         self.assertTrue(result.configfile == 'testfile')
         self.assertTrue(result.username == 'Arther')
         self.assertTrue(result.server == 'remote')
@@ -83,6 +86,16 @@ class TestArgumentParser(unittest.TestCase):
         self.assertTrue(result.server == None)
         self.assertTrue(result.port == None)
 
+        self.assertTrue(result.timeout == None)
+        self.assertTrue(result.nowait == False)
+        self.assertTrue(result.priority == 0)
+
+        result = parse_command_line(['acquire', 'Test1', '--timeout', '2.5',
+                '--nowait', '--priority', '10'], 'TestingV')
+        self.assertTrue(result.timeout == 2.5)
+        self.assertTrue(result.nowait)
+        self.assertTrue(result.priority == 10)
+
         result = parse_command_line(['acquire', 'Test1', '--exclusive'],
                 'TestingV')
         self.assertTrue(result.command == 'acquire')
@@ -116,6 +129,52 @@ class TestArgumentParser(unittest.TestCase):
         self.assertTrue(result.server == 'remote')
         self.assertTrue(result.port == 1234)
 
+    def test_arguments_renew(self):
+        ''' Test the argumentparser for the renew command of the client. '''
+        result = parse_command_line(['renew', 'abc'], 'TestingV')
+        self.assertTrue(result.command == 'renew')
+        self.assertTrue(result.lease == 'abc')
+        self.assertTrue(result.ttl == None)
+
+        result = parse_command_line(['renew', 'abc', '--ttl', '30'],
+                'TestingV')
+        self.assertTrue(result.lease == 'abc')
+        self.assertTrue(result.ttl == 30)
+
+        result = parse_command_line(['acquire', 'Test1', '--ttl', '30'],
+                'TestingV')
+        self.assertTrue(result.ttl == 30)
+
+    def test_arguments_acquire_many(self):
+        ''' Test the argumentparser for the acquire_many command. '''
+        result = parse_command_line(['acquire_many', 'board', 'switch',
+                '--exclusive', 'power', '--nowait'], 'TestingV')
+        self.assertTrue(result.command == 'acquire_many')
+        self.assertTrue(result.resources == [('board', False),
+                ('switch', False), ('power', True)])
+        self.assertTrue(result.nowait)
+        self.assertTrue(result.timeout == None)
+        self.assertTrue(result.ttl == None)
+        self.assertTrue(result.priority == 0)
+
+        result = parse_command_line(['acquire_many', 'board', '--priority',
+                '-1'], 'TestingV')
+        self.assertTrue(result.priority == -1)
+
+        # the resources keep the order of the command line
+        result = parse_command_line(['acquire_many', '--exclusive', 'power',
+                'board', 'switch', '--exclusive', 'scope'], 'TestingV')
+        self.assertTrue(result.resources == [('power', True),
+                ('board', False), ('switch', False), ('scope', True)])
+
+        result = parse_command_line(['acquire_many'], 'TestingV')
+        self.assertTrue(result.resources == [])
+
+    def test_arguments_queue(self):
+        ''' Test the argumentparser for the queue command of the client. '''
+        result = parse_command_line(['queue'], 'TestingV')
+        self.assertTrue(result.command == 'queue')
+
     def test_arguments_release(self):
         ''' Test the argumentparser for the release command of the client.
         '''
@@ -91,3 +91,4 @@ class DummyArgs(object):
         self.username = username
         self.server = server
         self.port = port
+        self.tag = None
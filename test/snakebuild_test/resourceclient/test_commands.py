@@ -61,13 +61,21 @@ class TestCommands(unittest.TestCase):
     def test_status_cmd(self):
         ''' Test the status command function.
         '''
+        args = _Options()
+        args.tag = None
+
         self.assertTrue('status' in SHELL_COMMANDS)
-        self.assertFalse(SHELL_COMMANDS['status'][0](None, self.config))
+        self.assertFalse(SHELL_COMMANDS['status'][0](args, self.config))
         self.assertTrue(0 == subprocess.call([self.server_bin, '-f',
                 '{0:s}'.format(os.path.join(self.config_dir, 'server.conf')),
                 'start', '--background']))
         time.sleep(0.2)
-        self.assertTrue(SHELL_COMMANDS['status'][0](None, self.config))
+        self.assertTrue(SHELL_COMMANDS['status'][0](args, self.config))
+
+        args.tag = 'mytest & !run'
+        self.assertTrue(SHELL_COMMANDS['status'][0](args, self.config))
+        args.tag = 'mytest & ('
+        self.assertFalse(SHELL_COMMANDS['status'][0](args, self.config))
 
         self.assertTrue(0 == subprocess.call([self.server_bin, 'stop']))
 
@@ -99,12 +107,17 @@ class TestCommands(unittest.TestCase):
         args.tag = 'Test1'
         args.name = 'Test1'
         args.exclusive = False
+        args.timeout = None
+        args.nowait = False
+        args.ttl = None
+        args.priority = 0
 
         self.assertTrue('acquire' in SHELL_COMMANDS)
         self.assertTrue('release' in SHELL_COMMANDS)
 
         self.assertFalse(SHELL_COMMANDS['acquire'][0](args, self.config))
         self.assertFalse(SHELL_COMMANDS['release'][0](args, self.config))
+        self.assertFalse(SHELL_COMMANDS['queue'][0](args, self.config))
 
         self.assertTrue(0 == subprocess.call([self.server_bin, '-f',
                 '{0:s}'.format(os.path.join(self.config_dir, 'server.conf')),
@@ -118,6 +131,14 @@ class TestCommands(unittest.TestCase):
         # exclusive acquire, release
         args.exclusive = True
         self.assertTrue(SHELL_COMMANDS['acquire'][0](args, self.config))
+        # the resource is busy
+        args.nowait = True
+        self.assertFalse(SHELL_COMMANDS['acquire'][0](args, self.config))
+        args.nowait = False
+        args.timeout = 0.1
+        self.assertFalse(SHELL_COMMANDS['acquire'][0](args, self.config))
+        args.timeout = None
+        self.assertTrue(SHELL_COMMANDS['queue'][0](args, self.config))
         self.assertTrue(SHELL_COMMANDS['release'][0](args, self.config))
         args.exclusive = False
         self.assertTrue(SHELL_COMMANDS['release'][0](args, self.config))
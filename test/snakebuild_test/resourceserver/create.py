@@ -22,6 +22,10 @@ import unittest
 
 from test_resource import TestResource
 from test_resourcemanager import TestResourceManager
+from test_placement import TestPlacement
+from test_tagexpression import TestTagExpression
+from test_scheduler import TestScheduler
+from test_journal import TestJournal
 from test_commands import TestCommands
 from test_argumentparser import TestArgumentParser
 
@@ -30,7 +34,12 @@ def suite():
     ''' Get the test suite for the resourceserver snakebuild classes. '''
     res = unittest.TestLoader().loadTestsFromTestCase(TestResource)
     res_mgr = unittest.TestLoader().loadTestsFromTestCase(TestResourceManager)
+    placement = unittest.TestLoader().loadTestsFromTestCase(TestPlacement)
+    tagexpr = unittest.TestLoader().loadTestsFromTestCase(TestTagExpression)
+    scheduler = unittest.TestLoader().loadTestsFromTestCase(TestScheduler)
+    journal = unittest.TestLoader().loadTestsFromTestCase(TestJournal)
     commands = unittest.TestLoader().loadTestsFromTestCase(TestCommands)
     parser = unittest.TestLoader().loadTestsFromTestCase(TestArgumentParser)
 
-    return unittest.TestSuite([res, res_mgr, commands, parser])
+    return unittest.TestSuite([res, res_mgr, placement, tagexpr, scheduler,
+            journal, commands, parser])
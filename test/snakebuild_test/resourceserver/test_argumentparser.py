@@ -67,3 +67,15 @@ class TestArgumentParser(unittest.TestCase):
         self.assertTrue(result.command == 'stop')
         self.assertTrue(result.name == 'name_one')
         self.assertTrue(result.configfile == 'testfile')
+
+    def test_arguments_reload(self):
+        ''' Test the argumentparser for the reload command of the server.
+        '''
+        result = parse_command_line(['reload'], 'TestingV')
+        self.assertTrue(result.command == 'reload')
+        self.assertTrue(result.name == 'resourceserver')
+
+        result = parse_command_line(['reload', '--name', 'name_one'],
+                'TestingV')
+        self.assertTrue(result.command == 'reload')
+        self.assertTrue(result.name == 'name_one')
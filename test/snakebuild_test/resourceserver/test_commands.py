@@ -23,7 +23,8 @@ import json
 
 from snakebuild.communication.server import REMOTE_COMMANDS
 from snakebuild.resourceserver.servercmds import *
-from snakebuild.communication.commandstructure import FUNCTION, SUCCESS, ERROR
+from snakebuild.communication.commandstructure import FUNCTION, SUCCESS, \
+        ERROR, SIGNED, DeferredAnswer
 from snakebuild.resourceserver.resource import ResourceManager
 from test_helpers.versioneddir_helper import create_versioned_dir
 
@@ -102,6 +103,31 @@ class TestCommands(unittest.TestCase):
                 self._checkresource(res, 'Test2', ['test2', 'mytest', 'build',
                         'run'], 4, 1, ['Ford', 'Beeblebrox', 'Zaphod'])
 
+    def test_status_list_tag(self):
+        ''' Test the status_list command with a tag expression.
+        '''
+        mgr = ResourceManager(self.repo)
+        result = REMOTE_COMMANDS['status_list'][FUNCTION](mgr, 'build & !run')
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(len(result['resources']) == 1)
+        self._checkresource(result['resources'][0], 'Test1', ['test1',
+                'mytest', 'build'], 2, 2, [])
+
+        result = REMOTE_COMMANDS['status_list'][FUNCTION](mgr, 'unknown')
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['resources'] == [])
+
+        result = REMOTE_COMMANDS['status_list'][FUNCTION](mgr, 'build &')
+        self.assertTrue(result['status'] == ERROR)
+
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Ford',
+                'mytest & !(run)')
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['resource'] == 'Test1')
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Ford', '!(run')
+        self.assertTrue(result['status'] == ERROR)
+        mgr.shutdown()
+
     def test_resource_details_cmd(self):
         ''' Test the resource_details command
         '''
@@ -192,6 +218,120 @@ class TestCommands(unittest.TestCase):
         self.assertTrue(result['status'] == ERROR)
         self.assertTrue(len(result['message']) > 0)
 
+    def test_queue_cmd(self):
+        ''' Test the queue command and the priority of the acquire command.
+        '''
+        mgr = ResourceManager(self.repo)
+        result = REMOTE_COMMANDS['queue'][FUNCTION](mgr)
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['queue'] == [])
+
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingg', 'Test1',
+                True)
+        self.assertTrue(result['status'] == SUCCESS)
+        low = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Ford', 'Test1')
+        high = REMOTE_COMMANDS['acquire_many'][FUNCTION](mgr, 'Zaphod',
+                [['Test1', False], ['run', True]], None, False, None, 3)
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Ford', 'Test1',
+                False, None, False, None, 'high')
+        self.assertTrue(result['status'] == ERROR)
+
+        result = REMOTE_COMMANDS['queue'][FUNCTION](mgr)
+        self.assertTrue(result['status'] == SUCCESS)
+        queue = result['queue']
+        self.assertTrue(len(queue) == 2)
+        self.assertTrue(queue[0]['user'] == 'Zaphod')
+        self.assertTrue(queue[0]['tag'] == 'test1, run')
+        self.assertTrue(queue[0]['exclusive'] == [False, True])
+        self.assertTrue(queue[0]['priority'] == 3)
+        self.assertTrue(queue[0]['position'] == 1)
+        self.assertTrue(queue[1]['user'] == 'Ford')
+        self.assertTrue(queue[1]['tag'] == 'test1')
+        self.assertTrue(queue[1]['position'] == 2)
+        self.assertTrue(queue[1]['estimate'] is None)
+        self.assertTrue(queue[1]['waiting'] >= 0)
+
+        mgr.shutdown()
+        self.assertTrue(low.wait()['status'] == ERROR)
+        self.assertTrue(high.wait()['status'] == ERROR)
+
+    def test_acquire_deferred_cmd(self):
+        ''' Test the acquire command if it has to wait for the resource. '''
+        mgr = ResourceManager(self.repo)
+
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingg', 'Test1',
+                True)
+        self.assertTrue(result['status'] == SUCCESS)
+
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingu', 'Test1')
+        self.assertTrue(isinstance(result, DeferredAnswer))
+        self.assertFalse(result.done)
+
+        REMOTE_COMMANDS['release'][FUNCTION](mgr, 'Pingg', 'Test1')
+        self.assertTrue(result.done)
+        answer = result.wait()
+        self.assertTrue(answer['status'] == SUCCESS)
+        self.assertTrue(answer['resource'] == 'Test1')
+
+        # a waiting request gets an error on shutdown
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingg', 'Test1',
+                True)
+        self.assertFalse(result.done)
+        mgr.shutdown()
+        self.assertTrue(result.wait()['status'] == ERROR)
+
+    def test_lease_cmds(self):
+        ''' Test the acquire command with a ttl and the renew command. '''
+        mgr = ResourceManager(self.repo)
+
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingg', 'Test1',
+                False, None, False, 30)
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['resource'] == 'Test1')
+        self.assertTrue(result['ttl'] == 30)
+        lease = result['lease']
+
+        result = REMOTE_COMMANDS['renew'][FUNCTION](mgr, lease, 60)
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['resource'] == 'Test1')
+        self.assertTrue(result['ttl'] == 60)
+
+        result = REMOTE_COMMANDS['renew'][FUNCTION](mgr, lease, -1)
+        self.assertTrue(result['status'] == ERROR)
+        result = REMOTE_COMMANDS['acquire'][FUNCTION](mgr, 'Pingg', 'Test1',
+                False, None, False, 'long')
+        self.assertTrue(result['status'] == ERROR)
+
+        REMOTE_COMMANDS['release'][FUNCTION](mgr, 'Pingg', 'Test1')
+        result = REMOTE_COMMANDS['renew'][FUNCTION](mgr, lease)
+        self.assertTrue(result['status'] == ERROR)
+        mgr.shutdown()
+
+    def test_acquire_many_cmd(self):
+        ''' Test the acquire_many command. '''
+        mgr = ResourceManager(self.repo)
+
+        result = REMOTE_COMMANDS['acquire_many'][FUNCTION](mgr, 'Pingg',
+                [['Test1', True], ['Test2', False]])
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['resources'] == ['Test1', 'Test2'])
+
+        result = REMOTE_COMMANDS['acquire_many'][FUNCTION](mgr, 'Pingu',
+                [['Test1', False], ['Test2', False]])
+        self.assertTrue(isinstance(result, DeferredAnswer))
+        REMOTE_COMMANDS['release'][FUNCTION](mgr, 'Pingg', 'Test1')
+        self.assertTrue(result.wait(0)['resources'] == ['Test1', 'Test2'])
+
+        result = REMOTE_COMMANDS['acquire_many'][FUNCTION](mgr, 'Pingu',
+                [['Test1', True]], None, True)
+        self.assertTrue(result['status'] == ERROR)
+        for resources in ([], 'Test1', [['Test1']], [[12, False]],
+                [['Test1', 'yes']]):
+            result = REMOTE_COMMANDS['acquire_many'][FUNCTION](mgr, 'Pingu',
+                    resources)
+            self.assertTrue(result['status'] == ERROR)
+        mgr.shutdown()
+
     def test_shutdown_cmd(self):
         ''' Test the private shutdown function. '''
         mgr = ResourceManager(self.repo)
@@ -204,6 +344,30 @@ class TestCommands(unittest.TestCase):
         self.assertTrue(result['status'] == SUCCESS)
         self.assertTrue(mgr.run == False)
 
+    def test_reload_cmd(self):
+        ''' Test the reload command with a new resource. '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(REMOTE_COMMANDS['reload'][SIGNED])
+
+        data = {"name": "Test3",
+                "parallel_count": 1,
+                "keywords": ["run"],
+                "parameters": {}}
+        tfile = open(self.repo.get_local_path('test3.resource'), 'w')
+        tfile.write(json.dumps(data))
+        tfile.close()
+        self.repo.add('test3.resource')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'added Test3')
+        self.repo.push_remote()
+
+        result = REMOTE_COMMANDS['reload'][FUNCTION](mgr)
+        self.assertTrue(result['status'] == SUCCESS)
+        self.assertTrue(result['added'] == ['Test3'])
+        self.assertTrue(result['removed'] == [])
+        self.assertTrue(result['changed'] == [])
+        self.assertTrue(mgr.match('run') == ['Test2', 'Test3'])
+        mgr.shutdown()
+
     def _checkresource(self, res, name, keywords, slots, free, users):
         ''' Check if the given resource full fills the following criteries.
 
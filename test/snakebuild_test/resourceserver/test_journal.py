@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the journal of the resource server '''
+
+import unittest
+import tempfile
+import shutil
+import threading
+import os.path
+
+from snakebuild.resourceserver.resource import Journal
+from snakebuild.resourceserver.resource import journal as journal_module
+
+
+class TestJournal(unittest.TestCase):
+    ''' The unit test for the snake build resourceserver journal.
+    '''
+    def setUp(self):
+        ''' Setup the test case. Create a directory for the journal. '''
+        self.journal_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.journal_dir, 'resources.journal')
+
+    def tearDown(self):
+        ''' Clean up the directory '''
+        shutil.rmtree(self.journal_dir)
+
+    def test_append_load(self):
+        ''' Test that the records appended are stored after the wait. '''
+        journal = Journal(self.path)
+        self.assertTrue(journal.load() == [])
+        journal.compact([{'op': 'acquire', 'user': 'Arther'}])
+        seq = 0
+        for cnt in range(100):
+            seq = journal.append({'op': 'release', 'count': cnt})
+        journal.wait(seq)
+        records = Journal(self.path).load()
+        self.assertTrue(len(records) == 101)
+        self.assertTrue(records[0] == {'op': 'acquire', 'user': 'Arther'})
+        self.assertTrue(records[100]['count'] == 99)
+        # the records share the fsyncs
+        self.assertTrue(journal.records == 100)
+        self.assertTrue(journal.syncs <= 100)
+        journal.close()
+
+    def test_compact(self):
+        ''' Test that the compaction replaces all the records. '''
+        journal = Journal(self.path, 3)
+        journal.compact([])
+        for cnt in range(3):
+            self.assertFalse(journal.needs_compact)
+            seq = journal.append({'count': cnt})
+        self.assertTrue(journal.needs_compact)
+        journal.compact([{'count': 'all'}])
+        self.assertFalse(journal.needs_compact)
+        journal.wait(seq)
+        self.assertTrue(journal.load() == [{'count': 'all'}])
+        journal.wait(journal.append({'count': 3}))
+        self.assertTrue(journal.load() == [{'count': 'all'}, {'count': 3}])
+        journal.close()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_schedule_compact(self):
+        ''' Test the compaction written by the journal thread. '''
+        journal = Journal(self.path, 3)
+        journal.compact([])
+        seq = journal.append({'count': 0})
+        journal.schedule_compact([{'count': 'all'}])
+        self.assertFalse(journal.needs_compact)
+        seq = journal.append({'count': 1})
+        journal.wait(seq)
+        self.assertTrue(journal.load() == [{'count': 'all'}, {'count': 1}])
+        journal.close()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_failed_write(self):
+        ''' Test that the records are not reported as stored while the
+            journal can not be written and are written on the retry.
+        '''
+        interval = journal_module.RETRY_INTERVAL
+        journal_module.RETRY_INTERVAL = 0.05
+        try:
+            journal = Journal(self.path)
+            journal.compact([{'count': 0}])
+            journal.jfile = _BrokenFile(journal.jfile)
+            seq = journal.append({'count': 1})
+            done = threading.Event()
+            waiter = threading.Thread(target=lambda: (journal.wait(seq),
+                    done.set()))
+            waiter.start()
+            self.assertFalse(done.wait(0.3))
+            self.assertTrue(journal.failed is not None)
+            self.assertTrue(journal.load() == [{'count': 0}])
+
+            journal.jfile.broken = False
+            self.assertTrue(done.wait(5))
+            waiter.join()
+            self.assertTrue(journal.failed is None)
+            # the part of the failed write is gone
+            self.assertTrue(journal.load() == [{'count': 0}, {'count': 1}])
+            journal.close()
+        finally:
+            journal_module.RETRY_INTERVAL = interval
+
+    def test_broken_entry(self):
+        ''' Test that an interrupted write at the end is ignored. '''
+        jfile = open(self.path, 'w')
+        jfile.write('{"count": 1}\n{"count": 2}\n{"coun')
+        jfile.close()
+        self.assertTrue(Journal(self.path).load() == [{'count': 1},
+                {'count': 2}])
+
+
+class _BrokenFile(object):
+    ''' A journal file which writes a part of the data and fails until
+        broken is set to False.
+    '''
+    def __init__(self, jfile):
+        self.jfile = jfile
+        self.broken = True
+
+    def write(self, data):
+        ''' Write the data or a part of it and fail. '''
+        if self.broken:
+            self.jfile.write(data[:len(data) / 2])
+            raise IOError(28, 'No space left on device')
+        self.jfile.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.jfile, name)
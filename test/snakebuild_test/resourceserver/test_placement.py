@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the placement policies '''
+
+import unittest
+import json
+
+from snakebuild.resourceserver.resource import ResourceManager, \
+        ResourceException, get_placement_policy
+from test_helpers.versioneddir_helper import create_versioned_dir, \
+        remove_versioned_dir
+
+
+class TestPlacement(unittest.TestCase):
+    ''' The unit test for the snake build resourceserver placement policies.
+    '''
+    def setUp(self):
+        ''' Setup the test case. Create three resources with the same
+            keyword.
+        '''
+        self.repo = create_versioned_dir('presources')
+
+        for name, count in (('A', 2), ('B', 2), ('C', 4)):
+            data = {"name": name,
+                    "parallel_count": count,
+                    "keywords": ["build"],
+                    "parameters": {}}
+            tfile = open(self.repo.get_local_path(name + '.resource'), 'w')
+            tfile.write(json.dumps(data))
+            tfile.close()
+            self.repo.add(name + '.resource')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'added '
+                'placement tests')
+        self.repo.push_remote()
+
+    def tearDown(self):
+        ''' Clean up the directories '''
+        remove_versioned_dir('presources')
+
+    def test_get_placement_policy(self):
+        ''' Test the creation of the policies by name. '''
+        for name in ('first_free', 'round_robin', 'sticky', 'least_loaded',
+                'Least_Loaded'):
+            self.assertTrue(get_placement_policy(name) is not None)
+        self.assertRaises(ResourceException, get_placement_policy, 'random')
+
+    def test_index(self):
+        ''' Test the index of the available and idle resources. '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(list(mgr.available['build']) == ['A', 'B', 'C'])
+        self.assertTrue(list(mgr.idle['build']) == ['A', 'B', 'C'])
+
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+        self.assertTrue(list(mgr.available['build']) == ['A', 'B', 'C'])
+        self.assertTrue(list(mgr.idle['build']) == ['B', 'C'])
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+        self.assertTrue(list(mgr.available['build']) == ['B', 'C'])
+
+        self.assertTrue(mgr.acquire('Ford', 'build', True) == 'B')
+        self.assertTrue(list(mgr.available['build']) == ['C'])
+        self.assertTrue(list(mgr.idle['build']) == ['C'])
+
+        mgr.release('A', 'Arther', False)
+        mgr.release('B', 'Ford', False)
+        self.assertTrue(list(mgr.available['build']) == ['C', 'A', 'B'])
+        self.assertTrue(list(mgr.idle['build']) == ['C', 'B'])
+
+    def test_round_robin(self):
+        ''' Test the round robin policy. '''
+        mgr = ResourceManager(self.repo, get_placement_policy('round_robin'))
+        names = [mgr.acquire('Arther', 'build', False) for cnt in range(4)]
+        self.assertTrue(names == ['A', 'B', 'C', 'A'])
+
+    def test_least_loaded(self):
+        ''' Test the least loaded policy. '''
+        mgr = ResourceManager(self.repo, get_placement_policy('least_loaded'))
+        names = [mgr.acquire('Arther', 'build', False) for cnt in range(4)]
+        self.assertTrue(names == ['A', 'B', 'C', 'C'])
+        mgr.release('A', 'Arther', False)
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+
+    def test_least_loaded_expression(self):
+        ''' Test the least loaded policy with the requests for a tag
+            expression and the gangs.
+        '''
+        mgr = ResourceManager(self.repo, get_placement_policy('least_loaded'))
+        names = [mgr.request('Arther', 'build & !slow', False,
+                nowait=True).wait() for cnt in range(4)]
+        self.assertTrue(names == ['A', 'B', 'C', 'C'])
+
+        for name in names:
+            mgr.release(name, 'Arther', False)
+        self.assertTrue(mgr.request('Ford', 'build', False,
+                nowait=True).wait() == 'A')
+        names = mgr.request_many('Ford', [('build & !slow', False),
+                ('build', True)], nowait=True).wait()
+        self.assertTrue(names == ['B', 'C'])
+
+    def test_sticky(self):
+        ''' Test the sticky policy. '''
+        mgr = ResourceManager(self.repo, get_placement_policy('sticky'))
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+        self.assertTrue(mgr.acquire('Ford', 'build', False) == 'B')
+        self.assertTrue(mgr.acquire('Ford', 'build', False) == 'B')
+        self.assertTrue(mgr.acquire('Marvin', 'build', False) == 'C')
+        for name, user in (('C', 'Marvin'), ('A', 'Arther'), ('A', 'Arther'),
+                ('B', 'Ford'), ('B', 'Ford')):
+            mgr.release(name, user, False)
+        self.assertTrue(list(mgr.available['build']) == ['C', 'A', 'B'])
+
+        self.assertTrue(mgr.acquire('Ford', 'build', False) == 'B')
+        self.assertTrue(mgr.acquire('Arther', 'build', False) == 'A')
+        self.assertTrue(mgr.acquire('Zaphod', 'build', False) == 'C')
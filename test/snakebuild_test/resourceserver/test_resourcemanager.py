@@ -21,10 +21,13 @@
 import unittest
 import json
 import time
+import tempfile
+import shutil
+import os.path
 from threading import Thread
 
 from snakebuild.resourceserver.resource import ResourceManager, \
-        ResourceException
+        ResourceException, Scheduler, Journal
 from test_helpers.versioneddir_helper import create_versioned_dir, \
         remove_versioned_dir
 
@@ -163,6 +166,381 @@ class TestResourceManager(unittest.TestCase):
         tobj.join(0.5)
         self.assertFalse(tobj.is_alive())
 
+    def test_request_fifo_order(self):
+        ''' Test that the waiting requests get the resource in the order they
+            came in and that a waiting exclusive request does not get
+            overtaken by younger requests.
+        '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(mgr.acquire('Arther', 'test1', False) == 'Test1')
+        self.assertTrue(mgr.acquire('Arther', 'test1', False) == 'Test1')
+
+        granted = []
+        exclusive = mgr.request('Zaphod', 'test1', True)
+        exclusive.add_done_callback(lambda name: granted.append('Zaphod'))
+        first = mgr.request('Ford', 'build', False)
+        first.add_done_callback(lambda name: granted.append('Ford'))
+        second = mgr.request('Marvin', 'test1', False)
+        second.add_done_callback(lambda name: granted.append('Marvin'))
+        self.assertFalse(exclusive.done)
+        # Test2 has free slots and no one waits for it
+        self.assertTrue(first.done)
+        self.assertTrue(first.resource == 'Test2')
+        self.assertFalse(second.done)
+
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertFalse(exclusive.done)
+        self.assertFalse(second.done)
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(exclusive.wait(0) == 'Test1')
+        self.assertFalse(second.done)
+        self.assertTrue(mgr.release('Test1', 'Zaphod', False))
+        self.assertTrue(second.wait(0) == 'Test1')
+        self.assertTrue(granted == ['Ford', 'Zaphod', 'Marvin'])
+
+    def test_request_priority(self):
+        ''' Test that a waiting request with a higher priority is served
+            first and that a request waiting long enough gains priority.
+        '''
+        mgr = ResourceManager(self.repo, None, Scheduler(0.1))
+        self.assertTrue(mgr.acquire('Arther', 'test1', True) == 'Test1')
+
+        low = mgr.request('Ford', 'test1', True)
+        high = mgr.request('Zaphod', 'test1', True, None, False, None, 5)
+        # a higher priority does not help if nothing is free
+        self.assertTrue(mgr.request('Marvin', 'test1', False, None, True,
+                None, 10).wait(0) is None)
+        queue = mgr.get_queue()
+        self.assertTrue([entry[0] for entry in queue] == [high, low])
+        self.assertTrue([entry[1] for entry in queue] == [1, 2])
+        self.assertTrue(queue[0][2] is None)
+
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(high.wait(0) == 'Test1')
+        self.assertFalse(low.done)
+
+        # after 1s the low request has gained 10 priority levels
+        time.sleep(1)
+        high = mgr.request('Zaphod', 'test1', True, None, False, None, 5)
+        self.assertTrue(mgr.release('Test1', 'Zaphod', False))
+        self.assertTrue(low.wait(0) == 'Test1')
+        self.assertFalse(high.done)
+        self.assertTrue(mgr.get_queue()[0][2] is not None)
+        self.assertTrue(mgr.cancel(high))
+        mgr.shutdown()
+
+    def test_request_fair_share(self):
+        ''' Test that a user holding slots waits behind the others. '''
+        mgr = ResourceManager(self.repo, None, Scheduler(0, {'nightly': 1},
+                {'nightly': ['Ford', 'Marvin']}))
+        self.assertTrue(mgr.acquire('Ford', 'test1', False) == 'Test1')
+        self.assertTrue(mgr.acquire('Arther', 'test1', False) == 'Test1')
+
+        nightly = mgr.request('Marvin', 'test1', False)
+        other = mgr.request('Zaphod', 'test1', False)
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        # the group of Marvin holds one slot already
+        self.assertTrue(other.wait(0) == 'Test1')
+        self.assertFalse(nightly.done)
+        self.assertTrue(mgr.scheduler.usage == {'nightly': 1, 'Zaphod': 1})
+        self.assertTrue(mgr.release('Test1', 'Ford', False))
+        self.assertTrue(nightly.wait(0) == 'Test1')
+        mgr.shutdown()
+
+    def test_request_shutdown(self):
+        ''' Test that the waiting requests are declined on shutdown. '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(mgr.acquire('Arther', 'test1', True) == 'Test1')
+        request = mgr.request('Ford', 'test1', False)
+        self.assertFalse(request.done)
+        mgr.shutdown()
+        self.assertTrue(request.done)
+        self.assertTrue(request.resource is None)
+        self.assertTrue(mgr.request('Ford', 'run', False).wait(0) is None)
+        self.assertTrue(mgr.request('Ford', 'unknown', False).wait(0) is None)
+
+    def test_request_timeout_and_cancel(self):
+        ''' Test the nowait and timeout of a request and the cancel of
+            waiting and granted requests.
+        '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(mgr.acquire('Arther', 'test1', True) == 'Test1')
+
+        request = mgr.request('Ford', 'test1', False, None, True)
+        self.assertTrue(request.done)
+        self.assertTrue(request.resource is None)
+
+        request = mgr.request('Ford', 'test1', False, 0.1)
+        self.assertTrue(request.wait(5) is None)
+        self.assertTrue(request.timed_out)
+        self.assertTrue(len(mgr.waiting['test1']) == 0)
+
+        # a cancelled exclusive request must not block the others
+        exclusive = mgr.request('Zaphod', 'test1', True)
+        waiting = mgr.request('Marvin', 'test1', False)
+        self.assertTrue(mgr.cancel(exclusive))
+        self.assertFalse(mgr.cancel(exclusive))
+        self.assertTrue(exclusive.wait(0) is None)
+        self.assertFalse(waiting.done)
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(waiting.wait(0) == 'Test1')
+
+        # a cancelled request which got the resource releases it
+        self.assertTrue(mgr.cancel(waiting))
+        self.assertTrue(mgr.resources['Test1'].users == [])
+        mgr.shutdown()
+
+    def test_lease(self):
+        ''' Test that an expired lease releases the resource for the next
+            request and that a renewed lease keeps it.
+        '''
+        mgr = ResourceManager(self.repo)
+        request = mgr.request('Arther', 'test1', True, None, False, 0.3)
+        self.assertTrue(request.wait(0) == 'Test1')
+        self.assertTrue(request.lease in mgr.leases)
+
+        waiting = mgr.request('Ford', 'test1', True)
+        for cnt in range(3):
+            time.sleep(0.15)
+            self.assertTrue(mgr.renew(request.lease) is not None)
+        self.assertFalse(waiting.done)
+
+        self.assertTrue(waiting.wait(5) == 'Test1')
+        self.assertTrue(mgr.renew(request.lease) is None)
+        self.assertTrue(mgr.resources['Test1'].users == ['Ford'])
+        self.assertTrue(len(mgr.leases) == 0)
+
+        # a release drops the lease
+        self.assertTrue(mgr.release('Test1', 'Ford', False))
+        request = mgr.request('Arther', 'test1', False, None, False, 10)
+        self.assertTrue(len(mgr.leases) == 1)
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(len(mgr.leases) == 0)
+        self.assertTrue(len(mgr.holder_leases) == 0)
+        mgr.shutdown()
+
+    def test_journal(self):
+        ''' Test that a new resource manager restores the allocations and
+            the leases from the journal.
+        '''
+        journal_dir = tempfile.mkdtemp()
+        path = os.path.join(journal_dir, 'resources.journal')
+        try:
+            mgr = ResourceManager(self.repo, None, None, Journal(path, 5))
+            self.assertTrue(mgr.acquire('Arther', 'test1', True) == 'Test1')
+            self.assertTrue(mgr.release('Test1', 'Arther', True))
+            lease = mgr.request('Ford', 'test1', False, None, False, 60).lease
+            for cnt in range(3):
+                self.assertTrue(mgr.acquire('Zaphod', 'test2', False) ==
+                        'Test2')
+            self.assertTrue(mgr.release('Test2', 'Zaphod', False))
+            mgr.shutdown()
+
+            mgr = ResourceManager(self.repo, None, None, Journal(path, 5))
+            self.assertTrue(mgr.resources['Test1'].users == ['Arther',
+                    'Ford'])
+            self.assertTrue(mgr.resources['Test1'].current_count == 0)
+            self.assertTrue(mgr.resources['Test2'].users == ['Zaphod',
+                    'Zaphod'])
+            self.assertTrue(mgr.leases[lease].uname == 'Ford')
+            self.assertTrue(mgr.scheduler.usage == {'Arther': 1, 'Ford': 1,
+                    'Zaphod': 2})
+            self.assertTrue(mgr.request('Marvin', 'test1', False, None,
+                    True).wait(0) is None)
+            self.assertTrue(list(mgr.available['test2']) == ['Test2'])
+            self.assertTrue(mgr.release('Test1', 'Ford', False))
+            self.assertTrue(len(mgr.leases) == 0)
+            mgr.shutdown()
+
+            mgr = ResourceManager(self.repo, None, None, Journal(path))
+            self.assertTrue(mgr.resources['Test1'].users == ['Arther'])
+            # no new resources while the journal can not be written
+            mgr.journal.failed = 'No space left on device'
+            self.assertRaises(ResourceException, mgr.request, 'Marvin',
+                    'test2', False)
+            self.assertRaises(ResourceException, mgr.request_many, 'Marvin',
+                    [('test2', False)])
+            mgr.journal.failed = None
+            self.assertTrue(mgr.acquire('Marvin', 'test2', False) == 'Test2')
+            mgr.shutdown()
+        finally:
+            shutil.rmtree(journal_dir)
+
+    def test_request_many(self):
+        ''' Test the atomic acquire of multiple resources. A waiting gang
+            holds none of its resources and does not get overtaken.
+        '''
+        mgr = ResourceManager(self.repo)
+        request = mgr.request_many('Arther', [('test1', True),
+                ('test2', False)])
+        self.assertTrue(request.wait(0) == ['Test1', 'Test2'])
+        self.assertTrue(mgr.resources['Test2'].current_count == 3)
+
+        gang = mgr.request_many('Ford', [('test1', False), ('run', False),
+                ('run', False)])
+        self.assertFalse(gang.done)
+        # nothing of the gang is acquired while waiting
+        self.assertTrue(mgr.resources['Test2'].current_count == 3)
+        # a younger request must wait behind the gang
+        single = mgr.request('Zaphod', 'run', False)
+        self.assertFalse(single.done)
+
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(gang.wait(0) == ['Test1', 'Test2', 'Test2'])
+        self.assertTrue(single.wait(0) == 'Test2')
+        self.assertTrue(mgr.resources['Test2'].current_count == 0)
+
+        # not all available
+        request = mgr.request_many('Marvin', [('test1', False),
+                ('test2', False)], None, True)
+        self.assertTrue(request.wait(0) is None)
+        request = mgr.request_many('Marvin', [('test1', False),
+                ('unknown', False)])
+        self.assertTrue(request.wait(0) is None)
+
+        # a cancelled gang which got its resources releases all of them
+        self.assertTrue(mgr.cancel(gang))
+        self.assertTrue(mgr.resources['Test1'].current_count == 2)
+        self.assertTrue(mgr.resources['Test2'].current_count == 2)
+        mgr.shutdown()
+
+    def test_request_expression(self):
+        ''' Test the requests with a tag expression. The requests for an
+            expression and for a single keyword share the waiting order.
+        '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(mgr.match('build') == ['Test1', 'Test2'])
+        self.assertTrue(mgr.match('mytest & !run') == ['Test1'])
+        self.assertTrue(mgr.match('unknown') == [])
+        self.assertRaises(ResourceException, mgr.match, 'mytest & (run')
+
+        first = mgr.request('Arther', 'build & !run', True)
+        self.assertTrue(first.wait(0) == 'Test1')
+        second = mgr.request('Ford', 'Build&(!RUN)', False)
+        self.assertFalse(second.done)
+        self.assertTrue(second.keyword == first.keyword)
+        # the younger request for a keyword doesn't overtake the expression
+        third = mgr.request('Zaphod', 'test1', False, None, True)
+        self.assertTrue(third.wait(0) is None)
+        self.assertTrue(mgr.acquire('Zaphod', 'run | unknown', False) ==
+                'Test2')
+
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(second.wait(0) == 'Test1')
+
+        self.assertTrue(mgr.request('Marvin', 'run & !mytest',
+                False).wait(0) is None)
+        self.assertRaises(ResourceException, mgr.request, 'Marvin', 'run &',
+                False)
+        request = mgr.request_many('Marvin', [('mytest & !run', False),
+                ('build & run', True)], None, True)
+        self.assertTrue(request.wait(0) is None)
+        request = mgr.request_many('Marvin', [('mytest & !run', False),
+                ('build', False)])
+        self.assertTrue(request.wait(0) == ['Test1', 'Test2'])
+        mgr.shutdown()
+
+    def test_expression_cleanup(self):
+        ''' Test that an expression is removed as soon as no request waits
+            for it and none of its resources is in use.
+        '''
+        mgr = ResourceManager(self.repo)
+        keys = dict((name, list(keys)) for name, keys in
+                mgr.resource_keys.iteritems())
+        self.assertTrue(mgr.request('Arther', 'build & !run', False,
+                nowait=True).wait(0) == 'Test1')
+        key = mgr.index.evaluate('build & !run')[1]
+        mgr.release('Test1', 'Arther', False)
+        self.assertFalse(key in mgr.keywords)
+
+        first = mgr.request('Arther', 'build & !run', True)
+        self.assertTrue(first.wait(0) == 'Test1')
+        self.assertTrue(key in mgr.resource_keys['Test1'])
+        second = mgr.request('Ford', 'build & !run', True, 60)
+        self.assertFalse(second.done)
+        mgr.release('Test1', 'Arther', False)
+        self.assertTrue(second.wait(0) == 'Test1')
+        self.assertTrue(key in mgr.keywords)
+        mgr.release('Test1', 'Ford', False)
+        self.assertFalse(key in mgr.keywords)
+        self.assertFalse(key in mgr.waiting)
+
+        # a request without result and a cancelled one
+        self.assertTrue(mgr.acquire('Arther', 'test1', True) == 'Test1')
+        self.assertTrue(mgr.request('Ford', 'build & !run', False,
+                nowait=True).wait(0) is None)
+        waiting = mgr.request_many('Ford', [('build & !run', False),
+                ('run', False)])
+        self.assertTrue(key in mgr.keywords)
+        mgr.cancel(waiting)
+        mgr.release('Test1', 'Arther', False)
+        self.assertFalse(key in mgr.keywords)
+        self.assertTrue(mgr.resource_keys == keys)
+        mgr.shutdown()
+
+    def test_reload(self):
+        ''' Test the reload of the changed resources. The users of a changed
+            or removed resource and the waiting requests are kept.
+        '''
+        mgr = ResourceManager(self.repo)
+        self.assertTrue(mgr.reload() == {'revision': mgr.revision,
+                'added': [], 'removed': [], 'changed': []})
+        for cnt in range(2):
+            self.assertTrue(mgr.acquire('Arther', 'test1', False) == 'Test1')
+        self.assertTrue(mgr.acquire('Marvin', 'test2', True) == 'Test2')
+        waiting = mgr.request('Ford', 'test1', False)
+        gang = mgr.request_many('Zaphod', [('test1', False),
+                ('run', False)])
+
+        # more slots for Test1, Test2 removed and Test3 added
+        self._write_resource('test1.resource', 'Test1', 3, ['myTest'])
+        self._write_resource('test3.resource', 'Test3', 1, ['run'])
+        self.repo.remove('test2.resource')
+        self.repo.commit('Tester', 'test@snakebuild.org', 'changed')
+        result = mgr.reload(False)
+        self.assertTrue(result['added'] == ['Test3'])
+        self.assertTrue(result['removed'] == ['Test2'])
+        self.assertTrue(result['changed'] == ['Test1'])
+        self.assertTrue(result['revision'] == self.repo.get_revision())
+
+        self.assertTrue(waiting.wait(0) == 'Test1')
+        self.assertFalse(gang.done)
+        self.assertTrue(mgr.resources['Test1'].users == ['Arther', 'Arther',
+                'Ford'])
+        self.assertTrue(mgr.resources['Test1'].parallel_count == 3)
+        self.assertFalse('build' in mgr.keywords)
+        self.assertTrue(mgr.keywords['run'] == ['Test3'])
+        self.assertFalse('test2' in mgr.keywords)
+        # the removed resource is kept until it got released
+        self.assertTrue('Test2' in mgr.resources)
+        # the new resource is kept for the waiting gang
+        self.assertTrue(mgr.request('Trillian', 'run', False,
+                None, True).wait(0) is None)
+        self.assertTrue(mgr.release('Test2', 'Marvin', False))
+        self.assertFalse('Test2' in mgr.resources)
+
+        # less slots than users
+        self._write_resource('test1.resource', 'Test1', 1, ['myTest'])
+        self.repo.commit('Tester', 'test@snakebuild.org', 'changed')
+        self.assertTrue(mgr.reload(False)['changed'] == ['Test1'])
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertTrue(mgr.release('Test1', 'Arther', False))
+        self.assertFalse(gang.done)
+        self.assertTrue(mgr.release('Test1', 'Ford', False))
+        self.assertTrue(gang.wait(0) == ['Test1', 'Test3'])
+        mgr.shutdown()
+
+    def _write_resource(self, filename, name, parallel_count, keywords):
+        ''' Write the given resource to the repository and add it. '''
+        data = {"name": name,
+                "parallel_count": parallel_count,
+                "keywords": keywords,
+                "parameters": {}}
+        tfile = open(self.repo.get_local_path(filename), 'w')
+        tfile.write(json.dumps(data))
+        tfile.close()
+        self.repo.add(filename)
+
     def test_loading_invalid_resources(self):
         ''' Test a repository with illegal resources. '''
         # create a custom versioned repos with three files
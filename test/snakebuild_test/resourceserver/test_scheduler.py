@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2011 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the scheduler of the waiting requests '''
+
+import unittest
+
+from snakebuild.resourceserver.resource import ResourceRequest, \
+        ResourceException, Scheduler, get_scheduler
+from snakebuild.resourceserver.resource.scheduler import WaitQueue
+
+
+class TestScheduler(unittest.TestCase):
+    ''' The unit test for the snake build resourceserver scheduler.
+    '''
+    def test_rank(self):
+        ''' Test the rank by priority and ticket. '''
+        scheduler = Scheduler()
+        first = ResourceRequest('Arther', 'build', False)
+        second = ResourceRequest('Ford', 'build', False)
+        urgent = ResourceRequest('Zaphod', 'build', False, 5)
+        now = first.created + 1000
+        self.assertTrue(scheduler.rank(first, now) <
+                scheduler.rank(second, now))
+        self.assertTrue(scheduler.rank(urgent, now) <
+                scheduler.rank(first, now))
+
+    def test_aging(self):
+        ''' Test that a waiting request gains priority. '''
+        scheduler = Scheduler(60)
+        old = ResourceRequest('Arther', 'build', False)
+        urgent = ResourceRequest('Zaphod', 'build', False, 5)
+        urgent.created = old.created
+        self.assertTrue(scheduler.rank(urgent, old.created) <
+                scheduler.rank(old, old.created))
+        old.created -= 6 * 60
+        self.assertTrue(scheduler.rank(old, urgent.created) <
+                scheduler.rank(urgent, urgent.created))
+
+    def test_fair_share(self):
+        ''' Test the fair share by user and group. '''
+        scheduler = Scheduler(0, {'nightly': 2, 'Arther': 1},
+                {'nightly': ['Ford', 'Marvin']})
+        arther = ResourceRequest('Arther', 'build', False)
+        ford = ResourceRequest('Ford', 'build', False)
+        now = ford.created
+        scheduler.acquired('Arther')
+        scheduler.acquired('Marvin')
+        self.assertTrue(scheduler.usage == {'Arther': 1, 'nightly': 1})
+        # Arther -1, nightly -0.5
+        self.assertTrue(scheduler.rank(ford, now) <
+                scheduler.rank(arther, now))
+        scheduler.released('Arther')
+        self.assertTrue(scheduler.usage == {'nightly': 1})
+        self.assertTrue(scheduler.rank(arther, now) <
+                scheduler.rank(ford, now))
+
+    def test_wait_queue(self):
+        ''' Test that the wait queue finds the best ranked request with
+            aging and fair share.
+        '''
+        scheduler = Scheduler(60, {'nightly': 2, 'Arther': 1},
+                {'nightly': ['Ford', 'Marvin']})
+        queue = WaitQueue(scheduler)
+        requests = []
+        for cnt, uname in enumerate(['Arther', 'Ford', 'Marvin', 'Zaphod'] *
+                5):
+            request = ResourceRequest(uname, 'build', False, cnt % 3)
+            request.created -= cnt * 50
+            queue.append(request)
+            requests.append(request)
+        self.assertTrue(list(queue) == requests)
+
+        def check(now):
+            best = min(requests, key=lambda request: scheduler.rank(request,
+                    now))
+            self.assertTrue(queue.best(now) == (best,
+                    scheduler.rank(best, now)))
+
+        now = requests[0].created
+        check(now)
+        scheduler.acquired('Arther')
+        scheduler.acquired('Marvin')
+        check(now + 600)
+        removed = requests[::2]
+        for request in removed:
+            queue.remove(request)
+            requests.remove(request)
+            check(now)
+        self.assertTrue(len(queue) == 10)
+        self.assertFalse(removed[0] in queue)
+        self.assertTrue(requests[0] in queue)
+        queue.clear()
+        self.assertTrue(queue.best(now) is None)
+
+    def test_estimate(self):
+        ''' Test the average interval between the requests served. '''
+        scheduler = Scheduler()
+        self.assertTrue(scheduler.estimate('build', 1) is None)
+        scheduler.served('build', 100, True)
+        self.assertTrue(scheduler.estimate('build', 1) is None)
+        scheduler.served('build', 110, True)
+        self.assertTrue(scheduler.estimate('build', 3) == 30)
+        scheduler.served('build', 130, False)
+        self.assertTrue(abs(scheduler.estimate('build', 1) - 13) < 0.0001)
+        # the time without waiting requests does not count
+        scheduler.served('build', 1000, True)
+        self.assertTrue(abs(scheduler.estimate('build', 1) - 13) < 0.0001)
+
+    def test_get_scheduler(self):
+        ''' Test the creation of the scheduler from the config values. '''
+        scheduler = get_scheduler(300, 'hotfix=4, nightly = 1',
+                'nightly=jenkins buildbot; hotfix=Arther')
+        self.assertTrue(scheduler.aging == 300)
+        self.assertTrue(scheduler.weights == {'hotfix': 4, 'nightly': 1})
+        self.assertTrue(scheduler.share('buildbot') == 'nightly')
+        self.assertTrue(scheduler.share('Arther') == 'hotfix')
+        self.assertTrue(scheduler.share('Ford') == 'Ford')
+
+        scheduler = get_scheduler(0, '', '')
+        self.assertTrue(scheduler.weights == {})
+        self.assertRaises(ResourceException, get_scheduler, -1, '', '')
+        self.assertRaises(ResourceException, get_scheduler, 0, 'nightly', '')
+        self.assertRaises(ResourceException, get_scheduler, 0, 'nightly=0',
+                '')
+        self.assertRaises(ResourceException, get_scheduler, 0, 'a=b', '')
+        self.assertRaises(ResourceException, get_scheduler, 0, '', '=a b')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2006-2012 Mathias Weber <mathew.weber@gmail.com>
+#
+# This file is part of Snake-Build.
+#
+# Snake-Build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Snake-Build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snake-Build.  If not, see <http://www.gnu.org/licenses/>
+''' The unit test for the tag expressions '''
+
+import unittest
+
+from snakebuild.resourceserver.resource import init_resource_from_obj
+from snakebuild.resourceserver.resource.tagexpression import KeywordIndex, \
+        TagExpressionException, is_expression
+
+
+class TestTagExpression(unittest.TestCase):
+    ''' The unit test for the snake build resourceserver tag expressions.
+    '''
+    def setUp(self):
+        ''' Setup the test case. Create the index for four resources. '''
+        resources = {}
+        for name, keywords in (('A', ['linux', 'arm']),
+                ('B', ['linux', 'arm', 'slow']),
+                ('C', ['linux', 'x86']),
+                ('D', ['windows', 'x86', 'slow'])):
+            resources[name] = init_resource_from_obj({'name': name,
+                    'parallel_count': 1, 'keywords': keywords,
+                    'parameters': {}})
+        self.index = KeywordIndex(resources)
+
+    def test_is_expression(self):
+        ''' Test the check for single keywords. '''
+        self.assertFalse(is_expression('linux'))
+        self.assertFalse(is_expression('my-test_1.0'))
+        self.assertTrue(is_expression('linux&arm'))
+        self.assertTrue(is_expression('!slow'))
+        self.assertTrue(is_expression('(linux)'))
+        self.assertTrue(is_expression('linux arm'))
+
+    def test_match(self):
+        ''' Test the evaluation of the expressions. '''
+        self.assertTrue(self.index.match('linux') == ['A', 'B', 'C'])
+        self.assertTrue(self.index.match('linux & arm & !slow') == ['A'])
+        self.assertTrue(self.index.match('arm | windows') == ['A', 'B', 'D'])
+        self.assertTrue(self.index.match('!linux') == ['D'])
+        self.assertTrue(self.index.match('!!linux') == ['A', 'B', 'C'])
+        self.assertTrue(self.index.match('x86 & (linux | slow)') ==
+                ['C', 'D'])
+        self.assertTrue(self.index.match('x86 & linux | slow') ==
+                ['B', 'C', 'D'])
+        self.assertTrue(self.index.match('LINUX&X86') == ['C'])
+        self.assertTrue(self.index.match('a & linux') == ['A'])
+        self.assertTrue(self.index.match('unknown') == [])
+        self.assertTrue(self.index.match('!unknown') == ['A', 'B', 'C', 'D'])
+
+    def test_normalized(self):
+        ''' Test that equal expressions get the same key and are cached. '''
+        bitset, key = self.index.evaluate('linux & arm & !slow')
+        self.assertTrue(self.index.evaluate('(linux&arm)&!slow') ==
+                (bitset, key))
+        self.assertTrue(self.index.evaluate('(linux)')[1] == 'linux')
+        self.assertTrue(self.index.evaluate('!slow & arm & linux') ==
+                (bitset, key))
+        self.assertTrue(self.index.evaluate('linux & (!slow & arm)') ==
+                (bitset, key))
+        self.assertTrue(self.index.evaluate('x86 & (linux | slow)')[1] ==
+                self.index.evaluate('(slow | linux) & x86')[1])
+        self.assertTrue(self.index.evaluate('arm & linux | slow')[1] ==
+                self.index.evaluate('slow | linux & arm')[1])
+        self.assertTrue(self.index.evaluate('!(arm | linux)')[1] ==
+                self.index.evaluate('!(linux | arm)')[1])
+        self.assertFalse(self.index.evaluate('linux & arm | slow')[1] ==
+                self.index.evaluate('linux & (arm | slow)')[1])
+        self.assertTrue('linux & arm & !slow' in self.index.cache)
+
+    def test_cache_size(self):
+        ''' Test that only the recently used expressions are cached. '''
+        self.index.evaluate('linux & arm')
+        for cnt in range(300):
+            self.index.evaluate('linux | tag{0}'.format(cnt))
+            self.index.evaluate('linux & arm')
+        self.assertTrue(len(self.index.cache) == 256)
+        self.assertTrue('linux & arm' in self.index.cache)
+        self.assertTrue('linux | tag299' in self.index.cache)
+        self.assertFalse('linux | tag0' in self.index.cache)
+
+    def test_invalid(self):
+        ''' Test the invalid expressions. '''
+        for tag in ('', 'linux &', '& linux', 'linux | | arm', '(linux',
+                'linux)', 'linux arm', '()', '!'):
+            self.assertRaises(TagExpressionException, self.index.evaluate,
+                    tag)
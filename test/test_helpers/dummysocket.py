@@ -58,6 +58,12 @@ class DummySocket(object):
         '''
         self.sent_data.append(data)
 
+    def sendall(self, data):
+        '''' This method simulates the sendall method form the socket class.
+            As the send method it only stores the data in sent_data
+        '''
+        self.sent_data.append(data)
+
     def close(self):
         ''' Simulate the close method of the socket. Clear the data buffer. '''
         self.data = ''